@@ -140,6 +140,21 @@ class GFMixin1(object):
 
         return q
 
+    @classmethod
+    def select_by_window(cls, session, query, chrom, window_start, window_end,
+                         start, end, location="overlapping", bins=[]):
+        """
+        Query objects starting within a window that are located in a range
+        (i.e. to walk large ranges in chunks).
+        """
+        q = cls.make_query(session, query)
+        regionIDs = [r.uid for r in Region.select_by_start_range(
+            session, chrom, window_start, window_end, start, end, location,
+            bins)]
+        q = q.filter(cls.region_id.in_(regionIDs))
+
+        return q, len(regionIDs)
+
     @classmethod
     def select_by_chrom(cls, session, query, chrom):
         """
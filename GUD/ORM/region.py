@@ -67,6 +67,28 @@ class Region(Base):
             q = q.filter(cls.bin.in_(bins))
         return q.all()
 
+    @classmethod
+    def select_by_start_range(cls, session, chrom, window_start, window_end,
+                              start, end, location="overlapping", bins=[]):
+        """
+        Query the uids of objects starting within a window that are located
+        (i.e. exact, within or overlapping) in a range. This allows walking
+        large ranges (e.g. whole chromosomes) in chunks. If no bins are
+        provided, use the bins overlapping the window.
+        """
+        if not bins:
+            bins = cls._compute_bins(window_start, window_end)
+        q = session.query(cls.uid)\
+            .filter(cls.chrom == chrom, cls.bin.in_(bins),
+                    cls.start >= window_start, cls.start < window_end)
+        if location == "exact":
+            q = q.filter(cls.start == start, cls.end == end)
+        elif location == "within":
+            q = q.filter(cls.start >= start, cls.end <= end)
+        elif location == "overlapping":
+            q = q.filter(cls.start < end, cls.end > start)
+        return q
+
     @classmethod
     def _compute_bins(cls, start, end):
         return list(set(
@@ -15,7 +15,7 @@ __version__ = "22.12.1"
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
 
-__all__ = ["ORM", "parsers"]
+__all__ = ["ORM", "parsers", "tiles"]
 
 class GUDUtilities:
     """
@@ -3,6 +3,10 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from GUD import GUDUtils
 from GUD.api.api_helpers import set_db
+from GUD.api.prefetch import init_prefetcher
+from GUD.api.singleflight import init_single_flight
+from GUD.tiles import TileStore
+import os
 from werkzeug.exceptions import BadRequest
 
 app = Flask(__name__)
@@ -13,6 +17,9 @@ limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["5 per second"]
 )
+single_flight = init_single_flight(app.config)
+prefetcher = init_prefetcher(app.config)
+tile_store = TileStore(app.config.get("TILES_DIR", os.path.join(app.static_folder, "tiles")))
 set_db("hg19")
 engine_hg19, Session_hg19 = GUDUtils.get_engine_session(GUDUtils._get_db_name())
 
@@ -1,14 +1,23 @@
-from flask import request, jsonify
+from binning import containing_bins
+from flask import request, jsonify, g, Response, stream_with_context
+from flask.json import dumps
 from GUD import GUDUtils
+from GUD.ORM import Chrom, Region
 from werkzeug.exceptions import NotFound, BadRequest
 import math
 import re
 from sqlalchemy import func
 from GUD.ORM import ShortTandemRepeat
+from urllib.parse import urlencode
 import time
 
+# streamed ranges are walked in windows the size of the smallest bin (128kb)
+STREAM_WINDOW = 2**17
+
 ## HELPER FUNCTIONS ##
 def get_result_from_query(query, request, resource, page_size=20, result_tuple_type="simple", luid = 0):
+    if is_stream():
+        return stream_result_from_query(query, request, resource, page_size, result_tuple_type)
     if (luid == 0):
         last_uid = request.args.get('last_uid', default=0, type=int)
     elif (luid is None):
@@ -17,8 +26,13 @@ def get_result_from_query(query, request, resource, page_size=20, result_tuple_t
         last_uid = luid
     if query is None:
         raise BadRequest('query not specified correctly')
-    results = query.filter(type(resource).uid > last_uid)\
-        .order_by(type(resource).uid).limit(page_size) 
+    query = query.filter(type(resource).uid > last_uid)
+    max_uid = request.args.get('max_uid', default=None, type=int)
+    if max_uid is not None:  # i.e. a partition
+        query = query.filter(type(resource).uid <= max_uid)
+    if is_partitions():
+        return get_partitions(query, request, resource)
+    results = query.order_by(type(resource).uid).limit(page_size) 
     print(results.statement.compile(compile_kwargs={"literal_binds": True}))
     # serialize and get uids of first and last element returned
     try:
@@ -32,9 +46,115 @@ def get_result_from_query(query, request, resource, page_size=20, result_tuple_t
         results = [resource.as_genomic_feature(e) for e in results]
     results = [e.serialize() for e in results]
     results = create_page(results, last_uid, page_size, request.url)
+    g.next_page = results.get('next')  # i.e. for prefetching, without parsing the page
     return jsonify(results)
 
 
+def is_stream():
+    """whether the current request is a streaming query"""
+    return g.get('stream', False)
+
+
+def stream_result_from_query(query, request, resource, page_size=1000, result_tuple_type="genomic_feature"):
+    """
+    streams all results of a query as newline-delimited JSON, walking the
+    queried range in bin-aligned windows and fetching each window with a
+    server-side cursor, so memory use does not grow with the range; rows
+    are sorted by the start and end of their regions (i.e. through the
+    join) within each window, so the stream is in genomic order
+    """
+    if query is None:
+        raise BadRequest('query not specified correctly')
+    if result_tuple_type != "genomic_feature":
+        raise BadRequest('only genomic features can be streamed')
+    keys = get_mixin1_keys(request)
+    session = query.session
+    size = Chrom.chrom_sizes(session, [keys['chrom']]).get(keys['chrom'])
+    if size is None:
+        raise NotFound('No results from this query')
+    if keys['end'] is None:  # whole chromosome
+        keys['end'] = size
+    cls = type(resource)
+
+    def generate():
+        for window_start, window_end, bins in get_stream_windows(keys['start'], min(keys['end'], size), keys['location']):
+            q, n = cls.select_by_window(session, query, keys['chrom'], window_start, window_end,
+                                        keys['start'], keys['end'], keys['location'], bins)
+            if n == 0:
+                continue
+            q = q.order_by(Region.start, Region.end, cls.uid)
+            results = q.execution_options(stream_results=True).yield_per(page_size)
+            for e in results:
+                yield dumps(resource.as_genomic_feature(e).serialize()) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def get_stream_windows(start, end, location, window=STREAM_WINDOW):
+    """
+    yields (window start, window end, bins) covering all features located in
+    a range, in genomic order; features belong to the window where they start
+    """
+    if location == "exact":
+        yield start, start + 1, []
+        return
+    if location == "overlapping" and start > 0:
+        # features starting upstream overlap the range only if they contain its first base
+        yield 0, start, containing_bins(start, start + 1)
+    window_start = start
+    while window_start < end:
+        window_end = min((window_start // window + 1) * window, end)
+        yield window_start, window_end, []
+        window_start = window_end
+
+
+def is_partitions():
+    """whether the current request is for the partitions of a query"""
+    return g.get('partitions', False)
+
+
+def get_partitions(query, request, resource, max_partitions=64, resolution=16):
+    """
+    splits the results of a query into k uid ranges (i.e. partitions) of
+    similar size, with their sizes and the url of their first page;
+    partitions are independent, so they can be fetched concurrently
+    """
+    try:
+        k = int(request.args.get('k', default=8))
+    except:
+        raise BadRequest("k should be formatted as an integer")
+    if k < 1 or k > max_partitions:
+        raise BadRequest("k must be between 1 and " + str(max_partitions))
+    uid = type(resource).uid
+    first_uid, last_uid = query.with_entities(func.min(uid), func.max(uid)).one()
+    if first_uid is None:
+        raise NotFound('No results from this query')
+    # histogram of uids (i.e. one pass) to balance the partitions
+    width = int(math.ceil((last_uid - first_uid + 1) / float(k * resolution)))
+    bucket = func.floor((uid - first_uid) / width).label('bucket')
+    histogram = query.with_entities(bucket, func.count(uid)).group_by('bucket').order_by('bucket').all()
+    count = sum(n for b, n in histogram)
+    args = [(a, v) for a, v in request.args.items(multi=True) if a not in ['k', 'last_uid', 'max_uid']]
+    url = request.base_url[:-len('/partitions')]
+    partitions = []
+    start = first_uid
+    size = 0
+    total = 0
+    for i, (b, n) in enumerate(histogram):
+        size += n
+        total += n
+        if total * k < count * (len(partitions) + 1) and i < len(histogram) - 1:
+            continue
+        end = min(first_uid + (int(b) + 1) * width - 1, last_uid)
+        partitions.append({'first_uid': start,
+                           'last_uid': end,
+                           'estimated_size': size,
+                           'url': url + '?' + urlencode(args + [('last_uid', start - 1), ('max_uid', end)])})
+        start = end + 1
+        size = 0
+    return jsonify({'count': count, 'partitions': partitions})
+
+
 def create_page(results, last_uid, page_size, url) -> dict:
     """
     returns 404 error or a page
@@ -79,6 +199,12 @@ def genomic_feature_mixin1_queries(session, resource, request):
     # location query
     keys = get_mixin1_keys(request)
     q = resource.select_all(session,None)
+    if is_stream():  # location is applied per window when streaming
+        if keys['uids'] is not None:
+            q = resource.select_by_uids(session, q, keys['uids'])
+        if keys['sources'] is not None:
+            q = resource.select_by_sources(session, q, keys['sources'])
+        return q, 0
 # all location
     if (keys['start'] is not None and keys['end'] is not None and keys['location'] is not None and keys['chrom'] is not None):
         q = resource.select_by_location(
@@ -147,6 +273,15 @@ def get_mixin1_keys(request):
             if keys['uids'][i].isdigit():
                 keys['uids'][i] = int(keys['uids'][i])
     
+    # streaming queries may cover whole chromosomes
+    if is_stream() and keys['chrom'] is not None and keys['start'] is None and keys['end'] is None and keys['location'] is None:
+        if re.fullmatch('^(X|Y|[1-9]|1[0-9]|2[0-2])$', keys['chrom']) == None:
+            raise BadRequest(
+                "chromosome should be formatted as Z where Z is X, Y, or 1-22")
+        keys['start'] = 0
+        keys['location'] = 'overlapping'
+        return keys
+
     # check that location is specified
     if (keys['start'] is None or keys['end'] is None or keys['location'] is None or keys['chrom'] is None):
         raise BadRequest("parameter list must include a region to query (start, end, chrom, location)")
@@ -158,8 +293,8 @@ def get_mixin1_keys(request):
             keys['end'] = int(keys['end'].replace(',', ''))
         except:
             raise BadRequest("start and end should be formatted as integers")
-        if (keys['end']-keys['start'] > 4000000): # check limit 
-            raise BadRequest("region must be less than 4,000,000bp")
+        if (keys['end']-keys['start'] > 4000000) and not is_stream(): # check limit 
+            raise BadRequest("region must be less than 4,000,000bp (stream larger regions from /stream)")
         if re.fullmatch('^(X|Y|[1-9]|1[0-9]|2[0-2])$', keys['chrom']) == None:
             raise BadRequest(
                 "chromosome should be formatted as Z where Z is X, Y, or 1-22")
@@ -176,3 +311,95 @@ def get_mixin2_keys(request):
         request.args.get('experiments', default=None))
     keys['samples'] = check_split(request.args.get('samples', default=None))
     return keys
+
+
+def get_tiles(store, db, resource, request, max_tiles=1000):
+    """returns the precomputed summary tiles of a table"""
+    if db not in ["hg19", "hg38", "test", "test_hg38_chr22"]:
+        raise BadRequest(
+            'database must be hg19 or hg38 or test or test_hg38_chr22')
+    index = store.get_index(db, resource)
+    if index is None:
+        raise BadRequest(resource + ' has no tiles')
+    keys = get_tile_keys(request, index, max_tiles)
+    tile_size = index["tile_size"] << keys['zoom']
+    results = []
+    for track in sorted(index["tracks"]):
+        source = index["tracks"][track]["source"]
+        sample = index["tracks"][track]["sample"]
+        if keys['sources'] is not None and source not in keys['sources']:
+            continue
+        if keys['samples'] is not None and sample not in keys['samples']:
+            continue
+        first, tiles = store.read_tiles(db, resource, track, keys['chrom'],
+                                        keys['zoom'], keys['start'], keys['end'])
+        if len(tiles) == 0:
+            continue
+        results.append({'source': source,
+                        'sample': sample,
+                        'tiles': [serialize_tile(keys['chrom'], (first+i)*tile_size,
+                                                 tile_size, t) for i, t in enumerate(tiles)]})
+    if len(results) == 0:
+        raise NotFound('No results from this query')
+    return jsonify({'tile_size': tile_size, 'zoom': keys['zoom'], 'results': results})
+
+
+def serialize_tile(chrom, start, tile_size, tile):
+    """serialize a tile"""
+    def value(v):
+        return None if math.isnan(v) else float(v)
+    return {'chrom': chrom,
+            'start': start,
+            'end': start + tile_size,
+            'count': int(tile['count']),
+            'coverage': value(tile['coverage']),
+            'mean': value(tile['mean']),
+            'max': value(tile['max'])}
+
+
+def get_tile_keys(request, index, max_tiles=1000):
+    keys = {}
+    keys['chrom'] = request.args.get('chrom', default=None, type=str)
+    keys['start'] = request.args.get('start', default=None)
+    keys['end'] = request.args.get('end', default=None)
+    keys['zoom'] = request.args.get('zoom', default=None)
+    keys['sources'] = check_split(request.args.get('sources', default=None))
+    keys['samples'] = check_split(request.args.get('samples', default=None))
+
+    if keys['chrom'] is None:
+        raise BadRequest("parameter list must include a chrom")
+    if keys['chrom'] not in index["chroms"]:
+        raise BadRequest(
+            "chromosome should be formatted as Z where Z is X, Y, or 1-22")
+    # whole chromosome by default
+    try:
+        if keys['start'] is None:
+            keys['start'] = 0
+        else:
+            keys['start'] = int(keys['start'].replace(',', '')) - 1
+        if keys['end'] is None:
+            keys['end'] = index["chroms"][keys['chrom']]
+        else:
+            keys['end'] = int(keys['end'].replace(',', ''))
+    except:
+        raise BadRequest("start and end should be formatted as integers")
+    if keys['start'] < 0 or keys['end'] <= keys['start']:
+        raise BadRequest("end must be greater than start")
+    if keys['zoom'] is None:
+        # lowest zoom level with no more than max_tiles tiles
+        keys['zoom'] = 0
+        while keys['zoom'] < index["zooms"] - 1 and \
+                (keys['end'] - keys['start']) / (index["tile_size"] << keys['zoom']) > max_tiles:
+            keys['zoom'] += 1
+    else:
+        try:
+            keys['zoom'] = int(keys['zoom'])
+        except:
+            raise BadRequest("zoom should be formatted as an integer")
+        if keys['zoom'] < 0 or keys['zoom'] >= index["zooms"]:
+            raise BadRequest(
+                "zoom must be between 0 and " + str(index["zooms"] - 1))
+        if (keys['end'] - keys['start']) / (index["tile_size"] << keys['zoom']) > max_tiles * 10:
+            raise BadRequest(
+                "region must be less than " + str(max_tiles * 10) + " tiles")
+    return keys
@@ -0,0 +1,156 @@
+"""
+Speculative prefetch of the next page of paginated (i.e. last_uid) queries
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class Prefetcher(object):
+    """
+    Computes pages in the background, in a bounded pool of worker threads,
+    and caches them until they are requested (or expire). To prevent
+    prefetching from starving foreground queries, a page is not scheduled
+    if it is already cached or in flight, if the number of pending pages
+    reaches max_pending, or if the number of pending pages of the client
+    reaches max_pending_per_client (i.e. pages are dropped, not queued).
+
+    The cache is per process (e.g. per worker of a WSGI server).
+    """
+
+    enabled = True
+
+    def __init__(self, workers=2, max_pending=4, max_pending_per_client=1,
+                 cache_size=128, ttl=60):
+
+        self.max_pending = max_pending
+        self.max_pending_per_client = max_pending_per_client
+        self.cache_size = cache_size
+        self.ttl = ttl
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._pending = {}
+
+    def get(self, key):
+        """
+        Returns a cached page or None.
+        """
+
+        with self._lock:
+            return(self._get(key))
+
+    def _get(self, key):
+
+        entry = self._cache.get(key)
+
+        if entry is None:
+            return(None)
+
+        expires, value = entry
+        if expires < time.time():
+            del self._cache[key]
+            return(None)
+
+        # Least recently used last
+        self._cache.move_to_end(key)
+
+        return(value)
+
+    def _put(self, key, value):
+
+        self._cache[key] = (time.time() + self.ttl, value)
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def prefetch(self, key, client, func, *args, **kwargs):
+        """
+        Schedules func to compute a page in the background; its result is
+        cached unless it is None (i.e. nothing to cache) or an error.
+
+        @return: {bool} whether the page was scheduled
+        """
+
+        with self._lock:
+            if key in self._pending or self._get(key) is not None:
+                return(False)
+            if len(self._pending) >= self.max_pending:
+                return(False)
+            if list(self._pending.values()).count(client) >= \
+               self.max_pending_per_client:
+                return(False)
+            self._pending[key] = client
+
+        try:
+            self._executor.submit(self._run, key, func, *args, **kwargs)
+        except RuntimeError:
+            # i.e. the pool has been shut down
+            with self._lock:
+                del self._pending[key]
+            return(False)
+
+        return(True)
+
+    def _run(self, key, func, *args, **kwargs):
+
+        try:
+            value = func(*args, **kwargs)
+        except Exception:
+            value = None
+
+        with self._lock:
+            if value is not None:
+                self._put(key, value)
+            del self._pending[key]
+
+    def shutdown(self, wait=True):
+
+        self._executor.shutdown(wait=wait)
+
+
+class NoPrefetcher(object):
+    """
+    Prefetches nothing (i.e. prefetch disabled).
+    """
+
+    enabled = False
+
+    def get(self, key):
+
+        return(None)
+
+    def prefetch(self, key, client, func, *args, **kwargs):
+
+        return(False)
+
+    def shutdown(self, wait=True):
+
+        pass
+
+
+def init_prefetcher(config):
+    """
+    Returns a prefetcher from the app configuration:
+    PREFETCH = True or False (default)
+    PREFETCH_WORKERS = number of worker threads (default = 2)
+    PREFETCH_MAX_PENDING = max. pages pending (default = 4)
+    PREFETCH_MAX_PENDING_PER_CLIENT = max. pages pending per client (default = 1)
+    PREFETCH_CACHE_SIZE = max. pages cached (default = 128)
+    PREFETCH_TTL = seconds a page is cached (default = 60)
+    """
+
+    if not config.get("PREFETCH", False):
+        return(NoPrefetcher())
+
+    return(Prefetcher(
+        workers=config.get("PREFETCH_WORKERS", 2),
+        max_pending=config.get("PREFETCH_MAX_PENDING", 4),
+        max_pending_per_client=config.get("PREFETCH_MAX_PENDING_PER_CLIENT", 1),
+        cache_size=config.get("PREFETCH_CACHE_SIZE", 128),
+        ttl=config.get("PREFETCH_TTL", 60)
+    ))
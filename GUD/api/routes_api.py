@@ -1,11 +1,15 @@
 # instructions for adding more API Routes start with '# API_ADDITION(step):'
-from GUD.api import app, get_engine_session
-from flask import request, jsonify
+from GUD.api import app, get_engine_session, prefetcher, single_flight, tile_store
+from flask import request, jsonify, g
+from flask_limiter.util import get_remote_address
 # API_ADDITION(1): import feature that you would like to add
 from GUD.ORM import (Gene, ShortTandemRepeat, CNV, ClinVar, Conservation, CpGIsland,
                      DNAAccessibility, Enhancer, HistoneModification, RepeatMask, TAD,
                      TFBinding, TSS, Chrom, Sample, Experiment, Source, Expression)
 from GUD.api.api_helpers import *
+from GUD.api.singleflight import query_key
+from urllib.parse import parse_qsl, urlsplit
+from werkzeug.datastructures import MultiDict
 from werkzeug.exceptions import BadRequest
 import time
 
@@ -133,10 +137,8 @@ def genes(request, session):
     resource = Gene()
     names = check_split(request.args.get('names', default=None))
     uids = check_split(request.args.get('uids', default=None))
-    if (len(request.args) == 1 and ((request.args.get('names') is not None) | (request.args.get('uids') is not None))) | (
-            len(request.args) == 2 and (
-            (request.args.get('names') is not None) | (request.args.get('uids') is not None)) and request.args.get(
-        'last_uid') is not None):
+    n_args = len([a for a in request.args if a not in ['last_uid', 'max_uid', 'k']])
+    if n_args == 1 and ((request.args.get('names') is not None) | (request.args.get('uids') is not None)):
         q = resource.select_all(session, None)
         keys = {'chrom': request.args.get('chrom', default=None, type=str),
                 'start': request.args.get('start', default=None), 'end': request.args.get('end', default=None),
@@ -248,44 +250,142 @@ def tss(request, session):
                                  luid=last_uid)
 
 
+# API_ADDITION(2): add feature method to switch for querying feature 
+switch = {
+    "chroms": chroms,
+    "clinvar": clinvar,
+    "copy_number_variants": copy_number_variants,
+    "conservation": conservation,
+    "cpg_islands": cpg_islands,
+    "dna_accessibility": dna_accessibility,
+    "enhancers": enhancers,
+    "experiments": experiments,
+    # "expression": expression,
+    "genes": genes,
+    "histone_modifications": histone_modifications,
+    "samples": samples,
+    "short_tandem_repeats": short_tandem_repeats,
+    "sources": sources,
+    "rmsk": rmsk,
+    "tads": tads,
+    "tf_binding": tf_binding,
+    "tss": tss
+}
+
+# resources that are not genomic features cannot be streamed
+simple_resources = ["chroms", "experiments", "samples", "sources"]
+
+
 @app.route('/api/v1/<db>/<resource>')
 def resource_query(db, resource):
     """ main control switch function for all valid resources"""
-    # API_ADDITION(2): add feature method to switch for querying feature 
-    switch = {
-        "chroms": chroms,
-        "clinvar": clinvar,
-        "copy_number_variants": copy_number_variants,
-        "conservation": conservation,
-        "cpg_islands": cpg_islands,
-        "dna_accessibility": dna_accessibility,
-        "enhancers": enhancers,
-        "experiments": experiments,
-        # "expression": expression,
-        "genes": genes,
-        "histone_modifications": histone_modifications,
-        "samples": samples,
-        "short_tandem_repeats": short_tandem_repeats,
-        "sources": sources,
-        "rmsk": rmsk,
-        "tads": tads,
-        "tf_binding": tf_binding,
-        "tss": tss
-    }
     engine, Session = get_engine_session(db)
     func = switch.get(resource, "none")
     if func == "none":  # check if this is invalid route
         raise BadRequest('Invalid resource')
     start_time = time.time()
-    table_exists(resource, engine)  # check that table exists
-    response = func(request, Session)
+    # identical concurrent queries share one execution
+    key = query_key(db, resource, request.args)
+    try:
+        cached = prefetcher.get(key)
+        if cached is not None:
+            data, status, mimetype, next_page = cached
+        else:
+            data, status, mimetype, next_page = single_flight.do(key, run_query, func, resource,
+                                                                 engine, Session)
+    finally:
+        Session.close()
+        engine.dispose()
+    if next_page is not None and prefetcher.enabled:
+        prefetch_next_page(db, func, resource, next_page)
     print(time.time() - start_time)
-    Session.close()
-    engine.dispose()
-    return response
+    return app.response_class(data, status=status, mimetype=mimetype)
+
+
+def run_query(func, resource, engine, session):
+    """
+    runs a resource query and returns its response as (data, status, mimetype,
+    next page url), the url as set by the page builder (i.e. None if last)
+    """
+    table_exists(resource, engine)  # check that table exists
+    g.next_page = None
+    response = app.make_response(func(request, session))
+    if response.status_code != 200:
+        g.next_page = None
+    return response.get_data(), response.status_code, response.mimetype, g.next_page
+
+def prefetch_next_page(db, func, resource, next_page):
+    """schedules the next page of a paginated query in the background"""
+    args = MultiDict(parse_qsl(urlsplit(next_page).query, keep_blank_values=True))
+    key = query_key(db, resource, args)
+    prefetcher.prefetch(key, get_remote_address(), prefetch_query, db, func, resource, next_page)
+
+
+def prefetch_query(db, func, resource, url):
+    """runs a query outside of a request; returns its response if successful"""
+    with app.test_request_context(url):
+        engine, Session = get_engine_session(db)
+        try:
+            # a foreground request for the same page joins this one
+            key = query_key(db, resource, request.args)
+            result = single_flight.do(key, run_query, func, resource, engine, Session)
+        finally:
+            Session.close()
+            engine.dispose()
+    if result[1] == 200:
+        return result
 
 # custom control routes
 
+@app.route('/api/v1/<db>/<resource>/stream')
+def resource_stream(db, resource):
+    """streams all results of a query (e.g. a whole chromosome) as newline-delimited JSON"""
+    func = switch.get(resource, "none")
+    if func == "none":  # check if this is invalid route
+        raise BadRequest('Invalid resource')
+    if resource in simple_resources:
+        raise BadRequest('only genomic features can be streamed')
+    engine, Session = get_engine_session(db)
+    g.stream = True
+    try:
+        table_exists(resource, engine)  # check that table exists
+        response = app.make_response(func(request, Session))
+    except:
+        Session.close()
+        engine.dispose()
+        raise
+    # the session is needed until the whole response is sent
+    def close():
+        Session.close()
+        engine.dispose()
+    response.call_on_close(close)
+    return response
+
+
+@app.route('/api/v1/<db>/<resource>/partitions')
+def resource_partitions(db, resource):
+    """splits the results of a query into uid ranges that can be fetched concurrently"""
+    func = switch.get(resource, "none")
+    if func == "none":  # check if this is invalid route
+        raise BadRequest('Invalid resource')
+    if resource in simple_resources:
+        raise BadRequest('only genomic features can be partitioned')
+    engine, Session = get_engine_session(db)
+    g.partitions = True
+    try:
+        table_exists(resource, engine)  # check that table exists
+        return func(request, Session)
+    finally:
+        Session.close()
+        engine.dispose()
+
+
+@app.route('/api/v1/<db>/tiles/<resource>')
+def tiles(db, resource):
+    """retrieves precomputed summary tiles (i.e. zoomed-out views) of dense tracks"""
+    return get_tiles(tile_store, db, resource, request)
+
+
 # @app.route('/api/v1/<db>/tss/genic')
 # def genic_tss(db):
 #     """custom control route getting all genic tss"""
@@ -0,0 +1,261 @@
+"""
+Request coalescing (i.e. single-flight) for identical concurrent queries
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+# Seconds a shared result is kept for the processes waiting for it (i.e.
+# they read it as soon as the leader releases the lock) and after which
+# unused lock files are removed
+GRACE = 10
+
+
+def query_key(db, resource, args):
+    """
+    Returns a normalized key for a query (i.e. the same key for identical
+    queries regardless of the order of their parameters).
+
+    @input:
+    db {str} e.g. "hg38"
+    resource {str} e.g. "tf_binding"
+    args {MultiDict} request arguments
+
+    @return: {str}
+    """
+
+    params = []
+
+    for k in sorted(args.keys()):
+        for v in args.getlist(k):
+            params.append((k, v.strip()))
+
+    return("%s/%s?%s" % (db, resource, urlencode(params)))
+
+
+class _Call(object):
+    """
+    An in-flight (or completed) call.
+    """
+
+    def __init__(self):
+
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls across the threads of a process:
+    the first caller for a key (i.e. the leader) executes the function and
+    every caller that arrives while it is in flight waits for, and shares,
+    its result (or its error).
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                leader = False
+
+        # Wait for the leader
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return(call.result)
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return(call.result)
+
+
+class ProcessSingleFlight(object):
+    """
+    Coalesces identical concurrent calls across processes (e.g. the workers
+    of a WSGI server) on the same host. Calls are first coalesced within the
+    process; then, the per-process leaders synchronize through a file lock
+    per key, and the result of the cross-process leader is shared through a
+    file in a shared-memory directory (i.e. "/dev/shm", if available).
+
+    Results (and errors) must be picklable; if an error cannot be pickled,
+    waiting processes execute the function themselves.
+
+    Result files are removed once older than the grace period, and lock
+    files once unused for as long, whenever a leader finishes (i.e. the
+    directory only holds the results of recent flights).
+    """
+
+    def __init__(self, lock_dir=None, grace=GRACE):
+
+        if lock_dir is None:
+            if os.path.isdir("/dev/shm"):
+                lock_dir = "/dev/shm"
+            else:
+                lock_dir = tempfile.gettempdir()
+            lock_dir = os.path.join(lock_dir, "gud-singleflight")
+        if not os.path.isdir(lock_dir):
+            os.makedirs(lock_dir, exist_ok=True)
+
+        self.lock_dir = lock_dir
+        self.grace = grace
+        self._local = SingleFlight()
+
+        # i.e. left by earlier servers
+        self.sweep()
+
+    def do(self, key, func, *args, **kwargs):
+
+        return(self._local.do(key, self._do, key, func, *args, **kwargs))
+
+    def _do(self, key, func, *args, **kwargs):
+
+        import fcntl
+
+        # Initialize
+        prefix = os.path.join(self.lock_dir,
+                              hashlib.sha1(key.encode("utf-8")).hexdigest())
+        lock_file = "%s.lock" % prefix
+        result_file = "%s.result" % prefix
+        joined = time.time()
+
+        with open(lock_file, "a") as handle:
+
+            # i.e. in use (see sweep)
+            os.utime(lock_file)
+
+            try:
+                # Leader
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            except (IOError, OSError):
+
+                # Wait for the leader
+                fcntl.flock(handle, fcntl.LOCK_EX)
+
+                # If the leader finished while we were waiting...
+                shared = self._read_result(result_file, joined)
+                if shared is not None:
+                    ok, value = shared
+                    if ok:
+                        return(value)
+                    raise value
+
+            try:
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    self._write_result(result_file, False, e)
+                    raise
+                self._write_result(result_file, True, result)
+                return(result)
+
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+                self.sweep()
+
+    def sweep(self):
+        """
+        Removes the result files older than the grace period and the lock
+        files unused for as long (i.e. unless locked).
+        """
+
+        import fcntl
+
+        # Initialize
+        now = time.time()
+
+        for file_name in os.listdir(self.lock_dir):
+
+            path = os.path.join(self.lock_dir, file_name)
+
+            try:
+                if now - os.path.getmtime(path) < self.grace:
+                    continue
+                if file_name.endswith(".lock"):
+                    with open(path, "a") as handle:
+                        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(path)
+                else:
+                    os.remove(path)
+            # i.e. removed meanwhile, or locked
+            except (IOError, OSError):
+                continue
+
+    def _read_result(self, result_file, joined):
+
+        try:
+            with open(result_file, "rb") as handle:
+                finished, ok, value = pickle.load(handle)
+        except Exception:
+            return(None)
+
+        # Ignore results from earlier flights
+        if finished < joined or (not ok and value is None):
+            return(None)
+
+        return(ok, value)
+
+    def _write_result(self, result_file, ok, value):
+
+        try:
+            content = pickle.dumps((time.time(), ok, value))
+        except Exception:
+            content = pickle.dumps((time.time(), ok, None))
+
+        # Write atomically
+        dummy_file = "%s.%s" % (result_file, os.getpid())
+        with open(dummy_file, "wb") as handle:
+            handle.write(content)
+        os.replace(dummy_file, result_file)
+
+
+class NoSingleFlight(object):
+    """
+    Executes every call (i.e. no coalescing).
+    """
+
+    def do(self, key, func, *args, **kwargs):
+
+        return(func(*args, **kwargs))
+
+
+def init_single_flight(config):
+    """
+    Returns a single-flight layer from the app configuration:
+    SINGLE_FLIGHT = "thread" (default), "process" or None (i.e. disabled)
+    SINGLE_FLIGHT_DIR = directory for the cross-process locks and results
+    """
+
+    mode = config.get("SINGLE_FLIGHT", "thread")
+
+    if mode == "process":
+        return(ProcessSingleFlight(config.get("SINGLE_FLIGHT_DIR", None)))
+    elif mode == "thread":
+        return(SingleFlight())
+    else:
+        return(NoSingleFlight())
@@ -0,0 +1,100 @@
+"""
+Ingestion benchmarks (i.e. on a scratch database of a local MySQL server)
+"""
+
+import random
+from sqlalchemy_utils import create_database, database_exists, drop_database
+import time
+
+from GUD import GUDUtils
+from GUD.ORM.chrom import Chrom
+from GUD.ORM.experiment import Experiment
+from GUD.ORM.region import Region
+from GUD.ORM.sample import Sample
+from GUD.ORM.source import Source
+
+# hg38 chromosome sizes (i.e. no downloads)
+CHROM_SIZES = {
+    "1": 248956422, "2": 242193529, "3": 198295559, "4": 190214555,
+    "5": 181538259, "6": 170805979, "7": 159345973, "8": 145138636,
+    "9": 138394717, "10": 133797422, "11": 135086622, "12": 133275309,
+    "13": 114364328, "14": 107043718, "15": 101991189, "16": 90338345,
+    "17": 83257441, "18": 80373285, "19": 58617616, "20": 64444167,
+    "21": 46709983, "22": 50818468, "X": 156040895, "Y": 57227415
+}
+
+
+def create_benchmark_db(tables=[]):
+    """
+    (Re)creates the database (i.e. GUDUtils.db) with chromosomes, one source
+    and the given tables; returns an {Engine} and a {Session} factory.
+    """
+
+    db_name = GUDUtils._get_db_name()
+
+    if database_exists(db_name):
+        drop_database(db_name)
+    create_database(db_name)
+
+    engine, Session = GUDUtils.get_engine_session(db_name)
+    for table in [Chrom, Experiment, Region, Sample, Source] + list(tables):
+        table.__table__.create(bind=engine)
+
+    engine.execute(Chrom.__table__.insert(),
+                   [{"chrom": c, "size": s} for c, s in CHROM_SIZES.items()])
+    engine.execute(Source.__table__.insert(), [{"name": "benchmark"}])
+
+    return(engine, Session)
+
+
+def drop_benchmark_db():
+
+    drop_database(GUDUtils._get_db_name())
+
+
+def random_regions(n, seed=0, min_length=100, max_length=1000):
+    """
+    Returns n random (chrom, start, end) tuples.
+    """
+
+    # Initialize
+    regions = []
+    rng = random.Random(seed)
+    chroms = sorted(CHROM_SIZES)
+
+    for i in range(n):
+        chrom = rng.choice(chroms)
+        length = rng.randint(min_length, max_length)
+        start = rng.randint(0, CHROM_SIZES[chrom] - length)
+        regions.append((chrom, start, start + length))
+
+    return(regions)
+
+
+class Timer(object):
+    """
+    e.g.
+    with Timer() as t:
+        ...
+    t.seconds
+    """
+
+    def __enter__(self):
+
+        self._start = time.time()
+
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.seconds = time.time() - self._start
+
+
+def report(label, rows, seconds, *columns):
+    """
+    Prints a tab-separated line with the throughput (i.e. rows/second) and
+    any other columns (e.g. deadlocks).
+    """
+
+    print("\t".join(["%s\t%s\t%.3f\t%.1f" % (label, rows, seconds, rows / max(seconds, 1e-9))] +
+                    [str(c) for c in columns]))
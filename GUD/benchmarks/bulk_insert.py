@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+import argparse
+from binning import assign_bin
+import getpass
+import os
+
+# Import from GUD module
+from GUD import GUDUtils
+from GUD.benchmarks import (Timer, create_benchmark_db, drop_benchmark_db,
+                            random_regions, report)
+from GUD.ORM.conservation import Conservation
+from GUD.ORM.region import Region
+from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+
+usage_msg = """
+usage: %s [-h] [options]
+""" % os.path.basename(__file__)
+
+help_msg = """%s
+benchmarks the ingestion throughput (i.e. rows/second) of
+row-at-a-time upserts (i.e. one query and one commit per row)
+against batched multi-row inserts, both for new rows and for
+duplicates, on a scratch database (i.e. DROPPED if it exists).
+
+optional arguments:
+  -h, --help          show this help message and exit
+  --rows INT          number of rows (default = %s)
+  --row-limit INT     max. number of rows for row-at-a-time
+                      upserts (default = %s)
+  --batch-sizes STR   comma-separated list of batch sizes
+                      (default = "%s")
+  --keep              keep the scratch database (default = False)
+
+mysql arguments:
+  -d STR, --db STR    database name (default = "%s")
+  -H STR, --host STR  host name (default = "localhost")
+  -p STR, --pwd STR   password (default = ignore this option)
+  -P INT, --port INT  port number (default = %s)
+  -u STR, --user STR  user name (default = current user)
+"""
+
+# Defaults
+rows = 100000
+row_limit = 10000
+batch_sizes = "100,1000,10000"
+db = "gud_benchmark"
+
+help_msg = help_msg % (usage_msg, rows, row_limit, batch_sizes, db,
+                       GUDUtils.port)
+
+#-------------#
+# Functions   #
+#-------------#
+
+def parse_args():
+    """
+    This function parses arguments provided via the command line and returns an {argparse} object.
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+
+    # Optional args
+    optional_group = parser.add_argument_group("optional arguments")
+    optional_group.add_argument("-h", "--help", action="store_true")
+    optional_group.add_argument("--rows", default=rows)
+    optional_group.add_argument("--row-limit", default=row_limit)
+    optional_group.add_argument("--batch-sizes", default=batch_sizes)
+    optional_group.add_argument("--keep", action="store_true")
+
+    # MySQL args
+    mysql_group = parser.add_argument_group("mysql arguments")
+    mysql_group.add_argument("-d", "--db", default=db)
+    mysql_group.add_argument("-H", "--host", default="localhost")
+    mysql_group.add_argument("-p", "--pwd")
+    mysql_group.add_argument("-P", "--port", default=GUDUtils.port)
+    mysql_group.add_argument("-u", "--user", default=getpass.getuser())
+
+    args = parser.parse_args()
+
+    check_args(args)
+
+    return(args)
+
+def check_args(args):
+    """
+    This function checks an {argparse} object.
+    """
+
+    # Print help
+    if args.help:
+        print(help_msg)
+        exit(0)
+
+    # Check integer arguments
+    for arg in ["rows", "row_limit", "port"]:
+        try:
+            setattr(args, arg, int(getattr(args, arg)))
+        except:
+            error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--%s\"" % arg.replace("_", "-"), "invalid int value", "\"%s\"\n" % getattr(args, arg)]
+            print(": ".join(error))
+            exit(0)
+
+    # Check "--batch-sizes" argument
+    try:
+        args.batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    except:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--batch-sizes\"", "invalid int values", "\"%s\"\n" % args.batch_sizes]
+        print(": ".join(error))
+        exit(0)
+
+    # Check MySQL password
+    if not args.pwd:
+        args.pwd = ""
+
+def main():
+
+    # Parse arguments
+    args = parse_args()
+
+    # Set MySQL options
+    GUDUtils.user = args.user
+    GUDUtils.pwd = args.pwd
+    GUDUtils.host = args.host
+    GUDUtils.port = args.port
+    GUDUtils.db = args.db
+
+    # Benchmark
+    benchmark_bulk_insert(args.rows, args.row_limit, args.batch_sizes,
+                          args.keep)
+
+def benchmark_bulk_insert(rows, row_limit, batch_sizes, keep=False):
+    """
+    e.g. python -m GUD.benchmarks.bulk_insert -u root --rows 1000000
+    """
+
+    # Initialize
+    engine, Session = create_benchmark_db([Conservation])
+    session = Session()
+    print("label\trows\tseconds\trows/s")
+
+    # Regions (i.e. not timed)
+    regions = random_regions(rows)
+    writer = BulkWriter(session, Region, batch_size=10000)
+    for chrom, start, end in regions:
+        writer.add({"chrom": chrom, "start": start, "end": end,
+                    "bin": assign_bin(start, end)})
+    writer.close()
+    # i.e. sorted by chromosome, as the parsers insert them
+    q = session.query(Region.uid, Region.chrom).order_by(Region.chrom, Region.uid)
+    chroms = dict((r, c) for r, c in q)
+    features = [{"region_id": r, "source_id": 1, "score": 1.0} for r in chroms]
+
+    # Row-at-a-time upserts
+    with Timer() as t:
+        for feature in features[:row_limit]:
+            ParseUtils.upsert_conservation(session, Conservation(**feature),
+                                           chroms[feature["region_id"]])
+    report("upsert", len(features[:row_limit]), t.seconds)
+    with Timer() as t:
+        for feature in features[:row_limit]:
+            ParseUtils.upsert_conservation(session, Conservation(**feature),
+                                           chroms[feature["region_id"]])
+    report("upsert (duplicates)", len(features[:row_limit]), t.seconds)
+
+    # Batched inserts
+    for batch_size in batch_sizes:
+        _truncate(session, Conservation)
+        for label in ["bulk", "bulk (duplicates)"]:
+            with Timer() as t:
+                writer = BulkWriter(session, Conservation, batch_size=batch_size)
+                writer.add_all(features)
+                writer.close()
+            report("%s, batch size = %s" % (label, batch_size), len(features),
+                   t.seconds)
+
+    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+    session.close()
+    engine.dispose()
+
+    if not keep:
+        drop_benchmark_db()
+
+def _truncate(session, table):
+
+    session.execute("TRUNCATE TABLE %s" % table.__tablename__)
+    session.commit()
+
+#-------------#
+# Main        #
+#-------------#
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+import argparse
+import getpass
+from multiprocessing import Pool
+import os
+import random
+import shutil
+import tempfile
+
+# Import from GUD module
+from GUD import GUDUtils
+from GUD.benchmarks import (Timer, create_benchmark_db, drop_benchmark_db,
+                            random_regions, report)
+from GUD.ORM.conservation import Conservation
+from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.partition import split_data
+from GUD.parsers.resolver import RegionResolver
+
+usage_msg = """
+usage: %s [-h] [options]
+""" % os.path.basename(__file__)
+
+help_msg = """%s
+benchmarks parallel ingestion (i.e. regions and features) of
+files split by line count against files split by chromosome
+and bin range (i.e. GUD.parsers.partition): throughput (i.e.
+rows/second), deadlocks and retried batches, on a scratch
+database (i.e. DROPPED if it exists).
+
+optional arguments:
+  -h, --help          show this help message and exit
+  --rows INT          number of rows (default = %s)
+  --shuffle           shuffle the rows (i.e. unsorted input;
+                      default = False)
+  -t INT, --threads INT
+                      number of processes (default = %s)
+  --keep              keep the scratch database (default = False)
+
+mysql arguments:
+  -d STR, --db STR    database name (default = "%s")
+  -H STR, --host STR  host name (default = "localhost")
+  -p STR, --pwd STR   password (default = ignore this option)
+  -P INT, --port INT  port number (default = %s)
+  -u STR, --user STR  user name (default = current user)
+"""
+
+# Defaults
+rows = 1000000
+threads = 4
+db = "gud_benchmark"
+
+help_msg = help_msg % (usage_msg, rows, threads, db, GUDUtils.port)
+
+#-------------#
+# Functions   #
+#-------------#
+
+def parse_args():
+    """
+    This function parses arguments provided via the command line and returns an {argparse} object.
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+
+    # Optional args
+    optional_group = parser.add_argument_group("optional arguments")
+    optional_group.add_argument("-h", "--help", action="store_true")
+    optional_group.add_argument("--rows", default=rows)
+    optional_group.add_argument("--shuffle", action="store_true")
+    optional_group.add_argument("-t", "--threads", default=threads)
+    optional_group.add_argument("--keep", action="store_true")
+
+    # MySQL args
+    mysql_group = parser.add_argument_group("mysql arguments")
+    mysql_group.add_argument("-d", "--db", default=db)
+    mysql_group.add_argument("-H", "--host", default="localhost")
+    mysql_group.add_argument("-p", "--pwd")
+    mysql_group.add_argument("-P", "--port", default=GUDUtils.port)
+    mysql_group.add_argument("-u", "--user", default=getpass.getuser())
+
+    args = parser.parse_args()
+
+    check_args(args)
+
+    return(args)
+
+def check_args(args):
+    """
+    This function checks an {argparse} object.
+    """
+
+    # Print help
+    if args.help:
+        print(help_msg)
+        exit(0)
+
+    # Check integer arguments
+    for arg in ["rows", "threads", "port"]:
+        try:
+            setattr(args, arg, int(getattr(args, arg)))
+        except:
+            error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--%s\"" % arg.replace("_", "-"), "invalid int value", "\"%s\"\n" % getattr(args, arg)]
+            print(": ".join(error))
+            exit(0)
+
+    # Check MySQL password
+    if not args.pwd:
+        args.pwd = ""
+
+def main():
+
+    # Parse arguments
+    args = parse_args()
+
+    # Set MySQL options
+    GUDUtils.user = args.user
+    GUDUtils.pwd = args.pwd
+    GUDUtils.host = args.host
+    GUDUtils.port = args.port
+    GUDUtils.db = args.db
+
+    # Benchmark
+    benchmark_partition_insert(args.rows, args.threads, args.shuffle,
+                               args.keep)
+
+def benchmark_partition_insert(rows, threads, shuffle=False, keep=False):
+    """
+    e.g. python -m GUD.benchmarks.partition_insert -u root --rows 1000000 -t 8
+    """
+
+    # Initialize
+    dummy_dir = tempfile.mkdtemp()
+    data_file = os.path.join(dummy_dir, "regions.bed")
+    print("label\trows\tseconds\trows/s\tdeadlocks\tretries")
+
+    # Regions (i.e. not timed)
+    regions = random_regions(rows)
+    if shuffle:
+        random.Random(0).shuffle(regions)
+    else:
+        regions.sort(key=lambda r: (r[0], r[1]))
+    with open(data_file, "w") as handle:
+        for chrom, start, end in regions:
+            handle.write("%s\t%s\t%s\n" % (chrom, start, end))
+
+    for label, split in [("lines", _split_lines), ("partitions", split_data)]:
+
+        engine, Session = create_benchmark_db([Conservation])
+        engine.dispose()
+
+        with Timer() as t:
+            data_files = split(data_file, threads)
+            pool = Pool(threads)
+            counts = pool.map(_insert_data, data_files)
+            pool.close()
+            pool.join()
+        report("%s, threads = %s" % (label, threads), sum(c[0] for c in counts),
+               t.seconds, sum(c[1] for c in counts), sum(c[2] for c in counts))
+
+        for split_file in data_files:
+            os.remove(split_file)
+
+    shutil.rmtree(dummy_dir)
+
+    if not keep:
+        drop_benchmark_db()
+
+def _split_lines(data_file, threads=1):
+
+    # Initialize
+    split_files = []
+    lines = list(ParseUtils.parse_file(data_file))
+    size = len(lines) // threads + 1
+
+    # i.e. as "split -d -l"
+    for i in range(0, len(lines), size):
+        split_files.append("%s.%02d" % (data_file, len(split_files)))
+        with open(split_files[-1], "w") as handle:
+            for line in lines[i:i + size]:
+                handle.write("%s\n" % line)
+
+    return(split_files)
+
+def _insert_data(data_file):
+
+    # Initialize
+    engine, Session = GUDUtils.get_engine_session(GUDUtils._get_db_name())
+    session = Session()
+    writer = BulkWriter(session, Conservation)
+    resolver = RegionResolver(session, writer)
+
+    for line in ParseUtils.parse_file(data_file):
+        chrom, start, end = line.split("\t")
+        resolver.add_coords(chrom, int(start), int(end),
+                            {"source_id": 1, "score": 1.0})
+    resolver.close()
+    writer.close()
+
+    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+    session.close()
+    engine.dispose()
+
+    return(writer.rows, writer.deadlocks + resolver.deadlocks,
+           writer.retried + resolver.retried)
+
+#-------------#
+# Main        #
+#-------------#
+
+if __name__ == "__main__":
+    main()
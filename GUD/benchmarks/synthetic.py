@@ -0,0 +1,881 @@
+#!/usr/bin/env python
+
+import argparse
+from binning import assign_bin
+from functools import lru_cache
+import getpass
+import gzip
+import numpy as np
+import os
+import pandas
+import zlib
+
+# Import from GUD module
+from GUD import GUDUtils
+from GUD.benchmarks import (CHROM_SIZES, Timer, create_benchmark_db,
+                            drop_benchmark_db, report)
+from GUD.ORM.clinvar import ClinVar
+from GUD.ORM.conservation import Conservation
+from GUD.ORM.copy_number_variant import CNV
+from GUD.ORM.cpg_island import CpGIsland
+from GUD.ORM.dna_accessibility import DNAAccessibility
+from GUD.ORM.enhancer import Enhancer
+from GUD.ORM.experiment import Experiment
+from GUD.ORM.expression import Expression
+from GUD.ORM.gene import Gene
+from GUD.ORM.histone_modification import HistoneModification
+from GUD.ORM.repeat_mask import RepeatMask
+from GUD.ORM.sample import Sample
+from GUD.ORM.short_tandem_repeat import ShortTandemRepeat
+from GUD.ORM.tad import TAD
+from GUD.ORM.tf_binding import TFBinding
+from GUD.ORM.tss import TSS
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.load_data import DataLoader
+
+usage_msg = """
+usage: %s (--out-dir DIR | --load) [-h] [options]
+""" % os.path.basename(__file__)
+
+help_msg = """%s
+generates a synthetic dataset with the distributions of the
+hg38 sources (i.e. rows per Mb, clustering, lengths, scores
+and sparsity of each table) and writes it in the native
+formats of the parsers or loads it into an empty database
+(i.e. DROPPED if it exists; with LOAD DATA, see
+GUD.parsers.load_data), from chr22-sized (i.e. --chroms 22)
+to whole-genome datasets (i.e. ~100M TF binding peaks).
+
+  --out-dir DIR       output directory (i.e. native formats)
+  --load              load into the database
+
+optional arguments:
+  -h, --help          show this help message and exit
+  --chroms STR        comma-separated chromosomes (default = all)
+  --scale FLOAT       rows per Mb relative to the hg38 sources
+                      (default = %s)
+  --samples INT       number of samples (default = %s)
+  --seed INT          random seed (default = %s)
+  --tables STR        comma-separated tables (default = all)
+  --dummy-dir DIR     staging directory of --load (default = "/tmp/")
+  --keep              keep the database (default = False)
+
+mysql arguments:
+  -d STR, --db STR    database name (default = "%s")
+  -H STR, --host STR  host name (default = "localhost")
+  -p STR, --pwd STR   password (default = ignore this option)
+  -P INT, --port INT  port number (default = %s)
+  -u STR, --user STR  user name (default = current user)
+"""
+
+# Defaults
+scale = 1.0
+samples = 100
+seed = 0
+db = "gud_synthetic"
+
+help_msg = help_msg % (usage_msg, scale, samples, seed, db, GUDUtils.port)
+
+# Rows per Mb at scale 1 (i.e. approx. those of the hg38 sources) and
+# lengths of their regions (i.e. median and sigma of a log-normal); TSSs
+# are at the 5' ends of genes, plus as many unannotated ones
+TABLES = {
+    "genes": (26, 20000, 1.2),
+    "cpg_islands": (10, 700, 0.5),
+    "conservation": (3200, 50, 1.0),
+    "rmsk": (1800, 300, 0.9),
+    "short_tandem_repeats": (300, 30, 0.5),
+    "copy_number_variants": (16, 50000, 1.5),
+    "clinvar": (480, 1, 0),
+    "tf_binding": (32000, 300, 0.5),
+    "dna_accessibility": (13000, 300, 0.5),
+    "histone_modifications": (9700, 1000, 0.8),
+    "enhancers": (21, 300, 0.3),
+    "tads": (3, 500000, 0.6),
+    "transcription_start_sites": (None, 20, 0.5)
+}
+ORM = {
+    "genes": Gene, "cpg_islands": CpGIsland, "conservation": Conservation,
+    "rmsk": RepeatMask, "short_tandem_repeats": ShortTandemRepeat,
+    "copy_number_variants": CNV, "clinvar": ClinVar, "tf_binding": TFBinding,
+    "dna_accessibility": DNAAccessibility,
+    "histone_modifications": HistoneModification, "enhancers": Enhancer,
+    "tads": TAD, "transcription_start_sites": TSS
+}
+CHROMS = list(CHROM_SIZES)
+
+# Native formats (i.e. tads have no parser)
+FILES = {
+    "genes": "refGene.txt.gz", "cpg_islands": "cpgIslandExtUnmasked.txt.gz",
+    "conservation": "phastConsElements100way.txt.gz", "rmsk": "rmsk.txt.gz",
+    "short_tandem_repeats": "str.bed.gz", "copy_number_variants": "cnv.tsv.gz",
+    "clinvar": "clinvar.vcf.gz", "tf_binding": "tf_binding.bed.gz",
+    "dna_accessibility": "dna_accessibility.bed.gz",
+    "histone_modifications": "histone_modifications.bed.gz",
+    "enhancers": "CAGE.enhancer.bed",
+    "transcription_start_sites": "CAGE.tss.bed"
+}
+
+# Chunks are generated per window (i.e. bounded memory, sorted output)
+WINDOW = 10000000
+
+# Features cluster around hotspots shared by all tables (i.e. gene-dense
+# regions): per Mb, share of clustered features and spread (i.e. bp)
+HOTSPOTS = 2
+CLUSTERED = 0.6
+SPREAD = 50000
+
+# Gene symbols (i.e. one per 150 kb) and TFs
+SYMBOLS = 20000
+TFS = 1600
+
+# Experiments (i.e. uids) and histone marks
+EXPERIMENTS = ["ChIP-seq", "DNase-seq", "ATAC-seq", "CAGE", "Hi-C"]
+HISTONES = ["H3K4me1", "H3K4me3", "H3K27ac", "H3K27me3", "H3K36me3", "H3K9me3"]
+
+# ClinVar
+CLNSIG = ["Uncertain_significance", "Likely_benign", "Benign", "Pathogenic",
+          "Likely_pathogenic", "Conflicting_interpretations_of_pathogenicity"]
+CLNSIG_P = [0.45, 0.2, 0.1, 0.1, 0.05, 0.1]
+ANNOTATIONS = [("missense_variant", "MODERATE"), ("synonymous_variant", "LOW"),
+               ("intron_variant", "MODIFIER"), ("frameshift_variant", "HIGH"),
+               ("stop_gained", "HIGH"), ("splice_region_variant", "LOW"),
+               ("3_prime_UTR_variant", "MODIFIER"),
+               ("intergenic_region", "MODIFIER")]
+ANNOTATIONS_P = [0.35, 0.15, 0.2, 0.08, 0.05, 0.05, 0.07, 0.05]
+
+# Repeats (i.e. class, family, names and share)
+REPEATS = [("SINE", "Alu", ["AluY", "AluSx", "AluJb"], 0.33),
+           ("LINE", "L1", ["L1PA2", "L1MA9", "L1M5"], 0.2),
+           ("LTR", "ERVL-MaLR", ["MSTA", "THE1B", "MLT1K"], 0.17),
+           ("DNA", "hAT-Charlie", ["MER5A", "Charlie1"], 0.09),
+           ("Simple_repeat", "Simple_repeat", ["(CA)n", "(TG)n", "(A)n"], 0.16),
+           ("Low_complexity", "Low_complexity", ["A-rich", "GC_rich"], 0.05)]
+
+#-------------#
+# Functions   #
+#-------------#
+
+def parse_args():
+    """
+    This function parses arguments provided via the command line and returns an {argparse} object.
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+
+    parser.add_argument("--out-dir")
+    parser.add_argument("--load", action="store_true")
+
+    # Optional args
+    optional_group = parser.add_argument_group("optional arguments")
+    optional_group.add_argument("-h", "--help", action="store_true")
+    optional_group.add_argument("--chroms")
+    optional_group.add_argument("--scale", default=scale)
+    optional_group.add_argument("--samples", default=samples)
+    optional_group.add_argument("--seed", default=seed)
+    optional_group.add_argument("--tables")
+    optional_group.add_argument("--dummy-dir", default="/tmp/")
+    optional_group.add_argument("--keep", action="store_true")
+
+    # MySQL args
+    mysql_group = parser.add_argument_group("mysql arguments")
+    mysql_group.add_argument("-d", "--db", default=db)
+    mysql_group.add_argument("-H", "--host", default="localhost")
+    mysql_group.add_argument("-p", "--pwd")
+    mysql_group.add_argument("-P", "--port", default=GUDUtils.port)
+    mysql_group.add_argument("-u", "--user", default=getpass.getuser())
+
+    args = parser.parse_args()
+
+    check_args(args)
+
+    return(args)
+
+def check_args(args):
+    """
+    This function checks an {argparse} object.
+    """
+
+    # Print help
+    if args.help:
+        print(help_msg)
+        exit(0)
+
+    # Check mandatory arguments
+    if bool(args.out_dir) == args.load:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "arguments \"--out-dir\" \"--load\"", "expected one argument\n"]
+        print(": ".join(error))
+        exit(0)
+
+    # Check numeric arguments
+    for arg, cast in [("scale", float), ("samples", int), ("seed", int),
+                      ("port", int)]:
+        try:
+            setattr(args, arg, cast(getattr(args, arg)))
+        except:
+            error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--%s\"" % arg, "invalid %s value" % cast.__name__, "\"%s\"\n" % getattr(args, arg)]
+            print(": ".join(error))
+            exit(0)
+
+    # Check chromosomes and tables
+    for arg, valid in [("chroms", CHROMS), ("tables", list(TABLES))]:
+        if getattr(args, arg) is None:
+            setattr(args, arg, list(valid))
+            continue
+        values = getattr(args, arg).split(",")
+        invalid = [v for v in values if v not in valid]
+        if invalid:
+            error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--%s\"" % arg, "invalid choice", "\"%s\" (choose from %s)\n" % (invalid[0], ", ".join(valid))]
+            print(": ".join(error))
+            exit(0)
+        setattr(args, arg, values)
+
+    # Check MySQL password
+    if not args.pwd:
+        args.pwd = ""
+
+def main():
+
+    # Parse arguments
+    args = parse_args()
+
+    # Set MySQL options
+    GUDUtils.user = args.user
+    GUDUtils.pwd = args.pwd
+    GUDUtils.host = args.host
+    GUDUtils.port = args.port
+    GUDUtils.db = args.db
+
+    # Generate
+    if args.load:
+        load_synthetic_data(args.tables, args.chroms, args.scale, args.samples,
+                            args.seed, args.dummy_dir, args.keep)
+    else:
+        write_synthetic_data(args.out_dir, args.tables, args.chroms,
+                             args.scale, args.samples, args.seed)
+
+def generate(table, chroms=CHROMS, scale=1.0, samples=samples, seed=0):
+    """
+    Yields the chunks of a synthetic table (i.e. one per window, sorted by
+    chromosome and start): {dict}s of "chrom", "start", "end" and the ORM
+    attributes of the table as {numpy.ndarray}s or, for CAGE tables (i.e.
+    enhancers and TSSs), a "matrix" of expression levels (i.e. one row per
+    peak and one column per sample, as GUD.parsers.fantom2gud reads them).
+
+    Chunks only depend on the seed, table, chromosome and window (i.e. not
+    on the other chromosomes or tables).
+
+    e.g. python -m GUD.benchmarks.synthetic --out-dir synthetic/ --chroms 22
+    """
+
+    for chrom in chroms:
+        for window in range(0, CHROM_SIZES[chrom], WINDOW):
+            if table == "transcription_start_sites":
+                yield(_get_tss_chunk(chrom, window, scale, samples, seed))
+            else:
+                yield(_get_chunk(table, chrom, window, scale, samples, seed))
+
+def _get_rng(seed, table, chrom, window):
+
+    return(np.random.default_rng([seed, list(TABLES).index(table),
+                                  CHROMS.index(chrom), window // WINDOW]))
+
+def _get_chunk(table, chrom, window, scale=1.0, samples=samples, seed=0):
+
+    # Initialize
+    rng = _get_rng(seed, table, chrom, window)
+    rows, median, sigma = TABLES[table]
+    size = CHROM_SIZES[chrom]
+    end = min(window + WINDOW, size)
+    n = rng.poisson(rows * scale * (end - window) / 1e6)
+
+    # Regions
+    starts = _get_starts(rng, chrom, seed, window, end, n)
+    lengths = np.maximum(np.round(rng.lognormal(np.log(median), sigma, n)), 1)
+    chunk = {"chrom": np.full(n, chrom, dtype=object), "start": starts,
+             "end": np.minimum(starts + lengths.astype(np.int64), size)}
+
+    # Columns
+    COLUMNS[table](rng, chunk, samples)
+    chunk["end"] = np.minimum(chunk["end"], size)
+
+    return(chunk)
+
+def _get_starts(rng, chrom, seed, start, end, n):
+    """
+    Returns n sorted starts within a window: a share of them around the
+    hotspots of the window (i.e. by weight) and the rest uniform.
+    """
+
+    # Initialize
+    starts = rng.integers(start, end, n)
+    centers, weights = _get_hotspots(chrom, seed)
+    mask = (centers >= start) & (centers < end)
+
+    if mask.any():
+        clustered = np.nonzero(rng.random(n) < CLUSTERED)[0]
+        p = weights[mask] / weights[mask].sum()
+        spread = np.round(rng.normal(0, SPREAD, len(clustered)))
+        starts[clustered] = rng.choice(centers[mask], len(clustered), p=p) + spread.astype(np.int64)
+        # i.e. spilled over the window
+        out = np.nonzero((starts < start) | (starts >= end))[0]
+        starts[out] = rng.integers(start, end, len(out))
+
+    return(np.sort(starts))
+
+@lru_cache(maxsize=None)
+def _get_hotspots(chrom, seed):
+
+    rng = np.random.default_rng([seed, CHROMS.index(chrom)])
+    n = max(CHROM_SIZES[chrom] // 1000000 * HOTSPOTS, 1)
+    centers = np.sort(rng.integers(0, CHROM_SIZES[chrom], n))
+
+    return(centers, rng.lognormal(0, 1, n))
+
+def _get_symbols(chrom, starts):
+    """
+    Returns the gene symbols of positions (i.e. one per 150 kb, so that
+    nearby transcripts share them).
+    """
+
+    # i.e. offset of the chromosome in the genome
+    offset = sum(CHROM_SIZES[c] for c in CHROMS[:CHROMS.index(chrom)])
+    size = sum(CHROM_SIZES.values()) / SYMBOLS
+    idx = ((offset + starts) / size).astype(np.int64)
+
+    return(np.array(["GENE%05d" % i for i in idx.tolist()], dtype=object))
+
+def _get_tfs():
+
+    # i.e. spread over the genome
+    return(["GENE%05d" % i for i in range(0, SYMBOLS, SYMBOLS // TFS)][:TFS])
+
+def _get_signal(rng, chunk, samples):
+
+    # Initialize
+    n = len(chunk["start"])
+    lengths = chunk["end"] - chunk["start"]
+
+    chunk["sample_id"] = rng.integers(1, samples + 1, n)
+    chunk["score"] = np.round(rng.lognormal(2, 1, n), 3)
+    # i.e. summit near the center
+    peak = np.round(lengths / 2 + rng.normal(0, lengths / 8 + 1))
+    chunk["peak"] = np.clip(peak, 0, lengths - 1).astype(np.int64)
+
+def _get_gene_columns(rng, chunk, samples):
+
+    # Initialize
+    n = len(chunk["start"])
+    w = chunk["start"][0] // WINDOW if n else 0
+    prefix = CHROMS.index(chunk["chrom"][0]) * 100 + w if n else 0
+    chunk["strand"] = rng.choice(np.array(["+", "-"], dtype=object), n)
+    chunk["gene_symbol"] = _get_symbols(chunk["chrom"][0] if n else "1", chunk["start"])
+    coding = rng.random(n) < 0.8
+    chunk["name"] = np.array(["%s_%05d%05d" % ("NM" if c else "NR", prefix, i)
+                              for i, c in enumerate(coding.tolist())], dtype=object)
+    exons = np.minimum(1 + rng.geometric(0.12, n), (chunk["end"] - chunk["start"]) // 2 + 1)
+
+    # Exons (i.e. UCSC comma-terminated lists)
+    exon_starts, exon_ends, coding_start, coding_end = [], [], [], []
+    for start, end, k, c in zip(chunk["start"].tolist(), chunk["end"].tolist(),
+                                exons.tolist(), coding.tolist()):
+        cuts = np.sort(rng.integers(start + 1, max(end, start + 2), 2 * (k - 1))).tolist()
+        starts = [start] + cuts[1::2]
+        ends = cuts[0::2] + [end]
+        exon_starts.append("%s," % ",".join(map(str, starts)))
+        exon_ends.append("%s," % ",".join(map(str, ends)))
+        # i.e. non-coding transcripts have cdsStart = cdsEnd
+        if c:
+            coding_start.append(min(starts[0] + (ends[0] - starts[0]) // 2, end))
+            coding_end.append(max(ends[-1] - (ends[-1] - starts[-1]) // 2, coding_start[-1]))
+        else:
+            coding_start.append(end)
+            coding_end.append(end)
+    chunk["exon_starts"] = np.array(exon_starts, dtype=object)
+    chunk["exon_ends"] = np.array(exon_ends, dtype=object)
+    chunk["coding_start"] = np.array(coding_start, dtype=np.int64)
+    chunk["coding_end"] = np.array(coding_end, dtype=np.int64)
+
+def _get_cpg_columns(rng, chunk, samples):
+
+    # Initialize
+    n = len(chunk["start"])
+    lengths = chunk["end"] - chunk["start"]
+
+    percent_gc = np.clip(rng.normal(65, 5, n), 50, 90)
+    chunk["gcs"] = np.round(lengths * percent_gc / 100).astype(np.int64)
+    chunk["cpgs"] = np.round(lengths * np.clip(rng.normal(0.09, 0.02, n), 0.03, 0.2)).astype(np.int64)
+    chunk["percent_cpg"] = np.round(200.0 * chunk["cpgs"] / lengths, 1)
+    chunk["percent_gc"] = np.round(100.0 * chunk["gcs"] / lengths, 1)
+    # i.e. observed over expected CpGs, with C = G = GCs / 2
+    chunk["obsexp_ratio"] = np.round(chunk["cpgs"] * lengths / np.maximum(chunk["gcs"] / 2.0, 1) ** 2, 2)
+
+def _get_conservation_columns(rng, chunk, samples):
+
+    # i.e. phastCons element scores (i.e. log-odds)
+    chunk["score"] = np.minimum(np.round(rng.lognormal(np.log(300), 0.6, len(chunk["start"]))), 1000)
+
+def _get_rmsk_columns(rng, chunk, samples):
+
+    # Initialize
+    n = len(chunk["start"])
+    repeats = rng.choice(len(REPEATS), n, p=[r[3] for r in REPEATS])
+    names = rng.integers(0, 3, n)
+
+    chunk["score"] = np.round(rng.lognormal(np.log(1500), 0.8, n))
+    chunk["repeat_class"] = np.array([REPEATS[r][0] for r in repeats.tolist()], dtype=object)
+    chunk["family"] = np.array([REPEATS[r][1] for r in repeats.tolist()], dtype=object)
+    chunk["name"] = np.array([REPEATS[r][2][i % len(REPEATS[r][2])]
+                              for r, i in zip(repeats.tolist(), names.tolist())], dtype=object)
+    chunk["strand"] = rng.choice(np.array(["+", "-"], dtype=object), n)
+
+def _get_str_columns(rng, chunk, samples):
+
+    # Initialize
+    n = len(chunk["start"])
+    k = rng.choice([1, 2, 3, 4, 5, 6], n, p=[0.3, 0.25, 0.15, 0.2, 0.05, 0.05])
+    bases = np.array(list("ACGT"))
+
+    chunk["motif"] = np.array(["".join(rng.choice(bases, i)) for i in k.tolist()], dtype=object)
+    # i.e. whole repeats of the motif
+    chunk["end"] = chunk["start"] + np.maximum((chunk["end"] - chunk["start"]) // k, 2) * k
+    chunk["pathogenicity"] = (rng.random(n) < 0.001).astype(np.int64)
+
+def _get_cnv_columns(rng, chunk, samples):
+
+    # Initialize
+    n = len(chunk["start"])
+    uids = rng.integers(1, 10 ** 7, (n, 2)).tolist()
+
+    chunk["copy_number_change"] = rng.choice([-2, -1, 1, 2], n, p=[0.1, 0.45, 0.4, 0.05])
+    assertions = rng.choice(np.array(CLNSIG, dtype=object), n, p=CLNSIG_P)
+    chunk["clinical_assertion"] = np.array(["%s," % a for a in assertions.tolist()], dtype=object)
+    chunk["clinvar_accession"] = np.array(["RCV%09d," % u[0] for u in uids], dtype=object)
+    chunk["dbVar_accession"] = np.array(["nsv%07d," % u[1] for u in uids], dtype=object)
+
+def _get_clinvar_columns(rng, chunk, samples):
+
+    # Initialize
+    n = len(chunk["start"])
+    bases = np.array(list("ACGT"), dtype=object)
+    kind = rng.choice(3, n, p=[0.9, 0.07, 0.03])
+    lengths = rng.integers(2, 11, n)
+    ref = rng.choice(bases, n)
+    alt = rng.choice(bases, n)
+    w = chunk["start"][0] // WINDOW if n else 0
+    offset = CHROMS.index(chunk["chrom"][0]) * 10 ** 8 + w * 10 ** 6 if n else 0
+
+    # Alleles (i.e. SNVs, deletions and insertions)
+    refs, alts = [], []
+    for k, r, a, l in zip(kind.tolist(), ref.tolist(), alt.tolist(), lengths.tolist()):
+        if k == 0:
+            refs.append(r)
+            alts.append(a if a != r else "ACGT"[("ACGT".index(r) + 1) % 4])
+        elif k == 1:
+            refs.append(r + "".join(rng.choice(bases, l - 1)))
+            alts.append(r)
+        else:
+            refs.append(r)
+            alts.append(r + "".join(rng.choice(bases, l - 1)))
+    chunk["ref"] = np.array(refs, dtype=object)
+    chunk["alt"] = np.array(alts, dtype=object)
+    chunk["end"] = chunk["start"] + np.array([len(r) for r in refs], dtype=np.int64)
+    chunk["clinvar_variation_ID"] = offset + np.arange(n)
+
+    # INFO
+    annotations = rng.choice(len(ANNOTATIONS), n, p=ANNOTATIONS_P).tolist()
+    symbols = _get_symbols(chunk["chrom"][0] if n else "1", chunk["start"])
+    chunk["ANN_Annotation"] = np.array([ANNOTATIONS[a][0] for a in annotations], dtype=object)
+    chunk["ANN_Annotation_Impact"] = np.array([ANNOTATIONS[a][1] for a in annotations], dtype=object)
+    chunk["ANN_Gene_Name"] = symbols
+    chunk["ANN_Gene_ID"] = symbols
+    chunk["ANN_Feature_Type"] = np.full(n, "transcript", dtype=object)
+    chunk["ANN_Feature_ID"] = np.array(["NM_%09d" % i for i in rng.integers(1, 10 ** 6, n).tolist()], dtype=object)
+    chunk["CADD"] = np.round(rng.gamma(2, 5, n), 3)
+    diseases = rng.integers(0, 5000, n).tolist()
+    chunk["CLNDISDB"] = np.array(["MedGen:CN%06d" % d if d else "MedGen:CN169374" for d in diseases], dtype=object)
+    chunk["CLNDN"] = np.array(["Disease_%s" % d if d else "not_provided" for d in diseases], dtype=object)
+    chunk["CLNSIG"] = rng.choice(np.array(CLNSIG, dtype=object), n, p=CLNSIG_P)
+    # i.e. most variants are rare and half of them are missing from gnomAD
+    for source in ["exome", "genome"]:
+        af = np.maximum(np.round(rng.beta(0.1, 20, n), 6), 1e-6)
+        af[rng.random(n) < 0.5] = np.nan
+        chunk["gnomad_%s_af_global" % source] = af
+        chunk["gnomad_%s_hom_global" % source] = np.floor(af * af * 70000)
+
+def _get_tf_columns(rng, chunk, samples):
+
+    # i.e. a few TFs (e.g. CTCF) have most peaks
+    tfs = np.array(_get_tfs(), dtype=object)
+    p = 1.0 / np.arange(1, len(tfs) + 1)
+    idx = rng.choice(len(tfs), len(chunk["start"]), p=p / p.sum())
+    chunk["tf"] = tfs[idx]
+    chunk["experiment_id"] = np.full(len(chunk["start"]), EXPERIMENTS.index("ChIP-seq") + 1)
+    _get_signal(rng, chunk, samples)
+    # i.e. each TF is profiled in a few samples
+    chunk["sample_id"] = (idx * 7 + rng.integers(0, 3, len(idx))) % samples + 1
+
+def _get_accessibility_columns(rng, chunk, samples):
+
+    # i.e. DNase-seq or ATAC-seq
+    experiments = [EXPERIMENTS.index("DNase-seq") + 1, EXPERIMENTS.index("ATAC-seq") + 1]
+    chunk["experiment_id"] = rng.choice(experiments, len(chunk["start"]), p=[0.7, 0.3])
+    _get_signal(rng, chunk, samples)
+
+def _get_histone_columns(rng, chunk, samples):
+
+    histones = np.array(HISTONES, dtype=object)
+    chunk["histone_type"] = rng.choice(histones, len(chunk["start"]))
+    chunk["experiment_id"] = np.full(len(chunk["start"]), EXPERIMENTS.index("ChIP-seq") + 1)
+    _get_signal(rng, chunk, samples)
+
+def _get_matrix(rng, n, samples):
+    """
+    Returns the expression levels of n CAGE peaks across samples (i.e.
+    sparse: most peaks are expressed in a few samples).
+    """
+
+    p = rng.beta(0.3, 3, n)
+    mask = rng.random((n, samples)) < p[:, None]
+
+    return(np.round(rng.lognormal(0, 1.5, (n, samples)) * mask, 3))
+
+def _get_enhancer_columns(rng, chunk, samples):
+
+    chunk["strand"] = np.full(len(chunk["start"]), ".", dtype=object)
+    chunk["matrix"] = _get_matrix(rng, len(chunk["start"]), samples)
+
+def _get_tad_columns(rng, chunk, samples):
+
+    chunk["sample_id"] = rng.integers(1, samples + 1, len(chunk["start"]))
+    chunk["experiment_id"] = np.full(len(chunk["start"]), EXPERIMENTS.index("Hi-C") + 1)
+
+def _get_tss_chunk(chrom, window, scale=1.0, samples=samples, seed=0):
+    """
+    Returns the TSSs of a window: at the 5' ends of its genes (i.e. one per
+    gene symbol and position) plus as many unannotated ones.
+    """
+
+    # Initialize
+    genes = _get_chunk("genes", chrom, window, scale, samples, seed)
+    rng = _get_rng(seed, "transcription_start_sites", chrom, window)
+    _, median, sigma = TABLES["transcription_start_sites"]
+    size = CHROM_SIZES[chrom]
+    end = min(window + WINDOW, size)
+
+    # Annotated TSSs
+    plus = genes["strand"] == "+"
+    tss = pandas.DataFrame({"pos": np.where(plus, genes["start"], genes["end"] - 1),
+                            "strand": genes["strand"], "gene": genes["gene_symbol"]})
+    tss = tss.drop_duplicates(["pos", "strand", "gene"])
+
+    # Unannotated TSSs
+    n = len(tss)
+    unannotated = pandas.DataFrame({
+        "pos": _get_starts(rng, chrom, seed, window, end, n),
+        "strand": rng.choice(np.array(["+", "-"], dtype=object), n),
+        "gene": np.full(n, None, dtype=object)})
+    tss = pandas.concat([tss, unannotated]).sort_values("pos", kind="stable")
+
+    # i.e. numbered per gene (e.g. "p1@TP53")
+    tss["tss"] = tss.groupby("gene").cumcount() + 1
+    tss.loc[tss["gene"].isna(), "tss"] = 1
+    n = len(tss)
+    lengths = np.maximum(np.round(rng.lognormal(np.log(median), sigma, n)), 1).astype(np.int64)
+    starts = np.maximum(tss["pos"].to_numpy() - lengths // 2, 0)
+
+    return({"chrom": np.full(n, chrom, dtype=object), "start": starts,
+            "end": np.minimum(starts + lengths, size),
+            "strand": tss["strand"].to_numpy(dtype=object),
+            "gene": tss["gene"].to_numpy(dtype=object),
+            "tss": tss["tss"].to_numpy(dtype=np.int64),
+            "experiment_id": np.full(n, EXPERIMENTS.index("CAGE") + 1),
+            "matrix": _get_matrix(rng, n, samples)})
+
+COLUMNS = {
+    "genes": _get_gene_columns, "cpg_islands": _get_cpg_columns,
+    "conservation": _get_conservation_columns, "rmsk": _get_rmsk_columns,
+    "short_tandem_repeats": _get_str_columns,
+    "copy_number_variants": _get_cnv_columns,
+    "clinvar": _get_clinvar_columns, "tf_binding": _get_tf_columns,
+    "dna_accessibility": _get_accessibility_columns,
+    "histone_modifications": _get_histone_columns,
+    "enhancers": _get_enhancer_columns, "tads": _get_tad_columns
+}
+
+def get_features(table, chunk, source_id=1):
+    """
+    Returns the coordinates and features (i.e. {dict}s keyed by ORM
+    attribute, with Python values) of a chunk, as GUD.parsers.spec does:
+    one feature per expressed enhancer and sample, and one per TSS with
+    its samples and expression levels (i.e. comma-terminated lists).
+
+    @return: {list} of (chrom, start, end, {dict})
+    """
+
+    # Initialize
+    features = []
+    chrom = chunk["chrom"].tolist()
+    start = chunk["start"].tolist()
+    end = chunk["end"].tolist()
+
+    if table == "enhancers":
+        rows, cols = np.nonzero(chunk["matrix"] > 0)
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            features.append((chrom[r], start[r], end[r], {
+                "source_id": source_id, "sample_id": c + 1,
+                "experiment_id": EXPERIMENTS.index("CAGE") + 1}))
+        return(features)
+
+    names = [n for n in chunk if n not in ("chrom", "start", "end", "matrix")]
+    columns = [chunk[n].tolist() for n in names]
+
+    for i, row in enumerate(zip(*columns)):
+        feature = {"source_id": source_id}
+        feature.update(zip(names, row))
+        if table == "transcription_start_sites":
+            c = np.nonzero(chunk["matrix"][i])[0]
+            feature["sample_id"] = "%s," % ",".join(str(s + 1) for s in c.tolist())
+            feature["expression_level"] = "%s," % ",".join(map(str, chunk["matrix"][i, c].tolist()))
+            # i.e. as GUD.parsers.fantom2gud
+            if feature["gene"] is None:
+                feature["tss"] = 1
+        features.append((chrom[i], start[i], end[i], feature))
+
+    return(features)
+
+def write_synthetic_data(out_dir, tables=list(FILES), chroms=CHROMS,
+                         scale=1.0, samples=samples, seed=0):
+    """
+    Writes synthetic tables in the native formats of their parsers (see
+    FILES): UCSC tables (i.e. refGene, cpgIslandExtUnmasked,
+    phastConsElements100way and rmsk), the BED file of short tandem
+    repeats (i.e. str2gud --based 0), the TSV file of copy number variants,
+    the ClinVar VCF, the merged ENCODE peaks (i.e. chrom, start, end,
+    accession, score and peak, as encode2gud streams them; accessions are
+    described in "<table>.accessions.tsv") and the FANTOM5 CAGE matrices
+    (i.e. as fantom2gud preprocesses them). TADs have no parser.
+
+    e.g. python -m GUD.benchmarks.synthetic --out-dir synthetic/ --chroms 22
+    """
+
+    # Initialize
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    print("label\trows\tseconds\trows/s")
+
+    for table in tables:
+
+        # Skip tables without parser
+        if table not in FILES:
+            continue
+
+        # Initialize
+        rows = 0
+        accessions = {}
+        file_name = os.path.join(out_dir, FILES[table])
+
+        with Timer() as t:
+            if file_name.endswith(".gz"):
+                handle = gzip.open(file_name, "wt")
+            else:
+                handle = open(file_name, "w")
+            if table == "clinvar":
+                handle.write("##fileformat=VCFv4.1\n")
+                handle.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+            elif table == "copy_number_variants":
+                handle.write("#chrom\tstart\tend\tcopy_number_change\tclinical_assertion\tclinvar_accession\tdbVar_accession\n")
+            for chunk in generate(table, chroms, scale, samples, seed):
+                if not len(chunk["start"]):
+                    continue
+                rows += len(chunk["start"])
+                _write_table(handle, _get_native_columns(table, chunk, accessions))
+            handle.close()
+
+        # i.e. accession, sample, experiment and target
+        if accessions:
+            with open(os.path.join(out_dir, "%s.accessions.tsv" % table), "w") as handle:
+                for accession in sorted(accessions):
+                    handle.write("%s\t%s\n" % (accession, "\t".join(accessions[accession])))
+
+        report(FILES[table], rows, t.seconds)
+
+def _write_table(handle, columns):
+
+    pandas.DataFrame(dict(enumerate(columns))).to_csv(handle, sep="\t",
+        header=False, index=False)
+
+def _get_native_columns(table, chunk, accessions={}):
+    """
+    Returns the columns of the lines of a chunk in the native format of a
+    table (see write_synthetic_data).
+    """
+
+    # Initialize
+    ucsc = "chr" + chunk["chrom"].astype(str).astype(object)
+    start = chunk["start"]
+    end = chunk["end"]
+
+    if table in ("genes", "cpg_islands", "conservation", "rmsk"):
+        bins = [assign_bin(s, e) for s, e in zip(start.tolist(), end.tolist())]
+
+    if table == "genes":
+        exons = [s.count(",") for s in chunk["exon_starts"].tolist()]
+        frames = ["-1," * e for e in exons]
+        cmpl = np.where(chunk["coding_start"] < chunk["coding_end"], "cmpl", "none")
+        return([bins, chunk["name"], ucsc, chunk["strand"], start, end,
+                chunk["coding_start"], chunk["coding_end"], exons,
+                chunk["exon_starts"], chunk["exon_ends"], 0, chunk["gene_symbol"],
+                cmpl, cmpl, frames])
+
+    if table == "cpg_islands":
+        names = ["CpG: %s" % c for c in chunk["cpgs"].tolist()]
+        return([bins, ucsc, start, end, names, end - start, chunk["cpgs"],
+                chunk["gcs"], chunk["percent_cpg"], chunk["percent_gc"],
+                chunk["obsexp_ratio"]])
+
+    if table == "conservation":
+        score = chunk["score"].astype(np.int64)
+        return([bins, ucsc, start, end, ["lod=%s" % s for s in score.tolist()], score])
+
+    if table == "rmsk":
+        lengths = end - start
+        return([bins, chunk["score"].astype(np.int64), 150, 10, 10, ucsc, start,
+                end, end - CHROM_SIZES[chunk["chrom"][0]] if len(start) else end,
+                chunk["strand"], chunk["name"], chunk["repeat_class"],
+                chunk["family"], 1, lengths, 0, np.arange(1, len(start) + 1)])
+
+    if table == "short_tandem_repeats":
+        return([ucsc, start, end, chunk["motif"], chunk["pathogenicity"]])
+
+    if table == "copy_number_variants":
+        # i.e. ";"-separated, rather than as stored
+        columns = [pandas.Series(chunk[c]).str.rstrip(",").str.replace(",", ";")
+                   for c in ("clinical_assertion", "clinvar_accession", "dbVar_accession")]
+        return([ucsc, start, end, chunk["copy_number_change"]] + columns)
+
+    if table == "clinvar":
+        return(_get_vcf_columns(chunk))
+
+    if table in ("tf_binding", "dna_accessibility", "histone_modifications"):
+        experiments = chunk["experiment_id"].tolist()
+        sample_ids = chunk["sample_id"].tolist()
+        targets = chunk.get("tf", chunk.get("histone_type"))
+        if targets is None:
+            targets = np.full(len(start), None, dtype=object)
+        names = []
+        for experiment_id, sample_id, target in zip(experiments, sample_ids, targets.tolist()):
+            # i.e. one per sample, experiment and target (e.g. TF)
+            key = ("sample%s" % sample_id, EXPERIMENTS[experiment_id - 1], target or "")
+            accession = "ENCSYN%08d" % (zlib.crc32("\t".join(key).encode()) % 10 ** 8)
+            accessions.setdefault(accession, key)
+            names.append(accession)
+        return([ucsc, start, end, names, chunk["score"], chunk["peak"]])
+
+    # i.e. CAGE matrices (e.g. "p1@TP53", or "p@chr1:..." if unannotated)
+    columns = [ucsc, start, end, chunk["strand"]]
+    if table == "transcription_start_sites":
+        columns.append(["p%s@%s" % (t, g) if g is not None else "p@%s:%s..%s,%s" % (c, s, e, d)
+                        for t, g, c, s, e, d in zip(chunk["tss"].tolist(), chunk["gene"].tolist(),
+                                                    ucsc.tolist(), start.tolist(), end.tolist(),
+                                                    chunk["strand"].tolist())])
+
+    return(columns + list(chunk["matrix"].T))
+
+def _get_vcf_columns(chunk):
+
+    # Initialize
+    info = []
+    keys = ["CADD", "CLNDISDB", "CLNDN", "CLNSIG", "gnomad_exome_af_global",
+            "gnomad_exome_hom_global", "gnomad_genome_af_global",
+            "gnomad_genome_hom_global"]
+    ann = ["ANN_Annotation", "ANN_Annotation_Impact", "ANN_Gene_Name",
+           "ANN_Gene_ID", "ANN_Feature_Type", "ANN_Feature_ID"]
+    values = [chunk[k].tolist() for k in keys]
+    anns = [chunk[k].tolist() for k in ann]
+
+    for i, alt in enumerate(chunk["alt"].tolist()):
+        fields = ["%s=%s" % (k, v[i]) for k, v in zip(keys, values) if v[i] == v[i]]
+        # i.e. allele, annotation, impact, gene, gene ID, feature type and ID
+        fields.append("ANN=%s" % "|".join([alt] + [a[i] for a in anns] + ["protein_coding"]))
+        info.append(";".join(fields))
+
+    return([chunk["chrom"], chunk["start"] + 1, chunk["clinvar_variation_ID"],
+            chunk["ref"], chunk["alt"], ".", ".", info])
+
+def load_synthetic_data(tables=list(TABLES), chroms=CHROMS, scale=1.0,
+                        samples=samples, seed=0, dummy_dir="/tmp/",
+                        keep=False):
+    """
+    Loads synthetic tables into an empty database (i.e. recreated; see
+    create_benchmark_db) with LOAD DATA (see DataLoader), one table at a
+    time, and expression from the loaded TSSs; prints the throughput of
+    each table.
+
+    e.g. python -m GUD.benchmarks.synthetic -u root --load --scale 0.1
+    """
+
+    # Initialize
+    orms = [ORM[t] for t in TABLES if t in tables]
+    if TSS in orms:
+        orms.append(Expression)
+    engine, Session = create_benchmark_db(orms)
+    engine.execute(Experiment.__table__.insert(),
+                   [{"name": e} for e in EXPERIMENTS])
+    engine.execute(Sample.__table__.insert(),
+                   [{"name": "sample%s" % (i + 1), "treatment": False,
+                     "cell_line": i % 2 == 0, "cancer": i % 10 == 0}
+                    for i in range(samples)])
+    print("label\trows\tseconds\trows/s\tregions")
+
+    for table in TABLES:
+
+        # Skip tables
+        if table not in tables:
+            continue
+
+        # Initialize
+        session = Session()
+        loader = DataLoader(session, ORM[table], dummy_dir)
+
+        with Timer() as t:
+            for chunk in generate(table, chroms, scale, samples, seed):
+                for chrom, start, end, feature in get_features(table, chunk):
+                    loader.resolver.add_coords(chrom, start, end, feature)
+            loader.resolver.close()
+            loader.close()
+        report(table, loader.rows, t.seconds, loader.resolver.regions)
+
+        session.close()
+
+    # Expression (i.e. of genic TSSs, as GUD.parsers.fantom2gud)
+    if Expression in orms:
+        session = Session()
+        writer = BulkWriter(session, Expression)
+        q = session.query(TSS.uid, TSS.sample_id, TSS.expression_level)\
+            .filter(TSS.gene != None).yield_per(10000)
+        with Timer() as t:
+            for uid, sample_ids, levels in q:
+                for sample_id, level in zip(sample_ids.decode().split(","),
+                                            levels.decode().split(",")):
+                    # i.e. comma-terminated
+                    if not sample_id:
+                        continue
+                    writer.add({"tss_id": uid, "sample_id": int(sample_id),
+                                "expression_level": float(level)})
+            writer.close()
+        report("expression", writer.rows, t.seconds)
+        session.close()
+
+    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+    engine.dispose()
+
+    if not keep:
+        drop_benchmark_db()
+
+#-------------#
+# Main        #
+#-------------#
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Vectorized UCSC interval binning (i.e. the scheme of the binning package,
+for whole arrays of intervals at once)
+
+Intervals are zero-based and open-ended, as in binning; all functions are
+bit-for-bit compatible with their scalar counterparts (see GUD.tests.test_bins).
+"""
+
+from binning import (BIN_OFFSETS, MAX_POSITION, SHIFT_FIRST, SHIFT_NEXT,
+                     OutOfRangeError)
+import numpy as np
+
+
+def assign_bins(starts, ends):
+    """
+    Returns the smallest bin in which each interval fits (i.e. Region.bin).
+
+    @input:
+    starts {array-like} of {int}
+    ends {array-like} of {int}
+
+    @return: {numpy.ndarray} of {int64}
+    """
+
+    firsts, lasts = _range_per_level(starts, ends)
+    bins = np.full(firsts.shape[1], -1, dtype=np.int64)
+
+    # From the smallest bins, the first level where the interval fits
+    for first, last in zip(firsts, lasts):
+        fits = (bins == -1) & (first == last)
+        bins[fits] = first[fits]
+
+    return(bins)
+
+
+def containing_bins(starts, ends):
+    """
+    Returns the bins of intervals completely containing any of the query
+    windows (i.e. the union of binning.containing_bins over all windows).
+
+    @input:
+    starts {array-like} of {int}
+    ends {array-like} of {int}
+
+    @return: {numpy.ndarray} of {int64}, sorted
+    """
+
+    firsts, lasts = _range_per_level(starts, ends)
+    bins = assign_bins(starts, ends)
+
+    # i.e. one bin per level, from that of the window upwards
+    keep = firsts <= bins
+
+    return(np.unique(firsts[keep]))
+
+
+def contained_bins(starts, ends):
+    """
+    Returns the bins of intervals completely contained by any of the query
+    windows (i.e. the union of binning.contained_bins over all windows).
+
+    @input:
+    starts {array-like} of {int}
+    ends {array-like} of {int}
+
+    @return: {numpy.ndarray} of {int64}, sorted
+    """
+
+    firsts, lasts = _range_per_level(starts, ends)
+    bins = assign_bins(starts, ends)
+
+    # i.e. every overlapping bin, from the level of the window downwards
+    keep = firsts >= bins
+
+    return(np.unique(_expand(firsts[keep], lasts[keep])))
+
+
+def _range_per_level(starts, ends):
+    """
+    Returns the first and last bin overlapping each interval per level
+    (i.e. one row per level, from the smallest bins); as in binning, empty
+    intervals are binned as the position following them.
+    """
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    if starts.size and (starts.min() < 0 or ends.max() > MAX_POSITION + 1):
+        raise OutOfRangeError("Interval out of range (maximum position is %d)"
+                              % MAX_POSITION)
+
+    start_bins = starts >> SHIFT_FIRST
+    stop_bins = np.maximum(starts, ends - 1) >> SHIFT_FIRST
+    firsts = np.empty((len(BIN_OFFSETS), starts.size), dtype=np.int64)
+    lasts = np.empty((len(BIN_OFFSETS), starts.size), dtype=np.int64)
+
+    for i, offset in enumerate(BIN_OFFSETS):
+        firsts[i] = offset + start_bins
+        lasts[i] = offset + stop_bins
+        start_bins = start_bins >> SHIFT_NEXT
+        stop_bins = stop_bins >> SHIFT_NEXT
+
+    return(firsts, lasts)
+
+
+def _expand(firsts, lasts):
+    """
+    Returns the concatenation of the ranges [first, last].
+    """
+
+    counts = lasts - firsts + 1
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+
+    return(np.repeat(firsts, counts) + np.arange(counts.sum()) - offsets)
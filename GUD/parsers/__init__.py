@@ -8,29 +8,35 @@ from ftplib import FTP
 import gzip
 import os
 import pandas
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy_utils import create_database, database_exists
 import sys
 from zipfile import ZipFile
 
 from GUD.ORM.chrom import Chrom
-from GUD.ORM.conservation import Conservation
-from GUD.ORM.cpg_island import CpGIsland
-from GUD.ORM.dna_accessibility import DNAAccessibility
-from GUD.ORM.enhancer import Enhancer
 from GUD.ORM.experiment import Experiment
-from GUD.ORM.expression import Expression
-from GUD.ORM.gene import Gene
-from GUD.ORM.copy_number_variant import CNV
-from GUD.ORM.short_tandem_repeat import ShortTandemRepeat
-from GUD.ORM.clinvar import ClinVar
-from GUD.ORM.histone_modification import HistoneModification
 from GUD.ORM.region import Region
-from GUD.ORM.repeat_mask import RepeatMask
 from GUD.ORM.sample import Sample
 from GUD.ORM.source import Source
-from GUD.ORM.tf_binding import TFBinding
-from GUD.ORM.tad import TAD
 from GUD.ORM.tss import TSS
+from GUD.parsers.dedup import KeySet
+
+# Attempts per file after the first one (i.e. parallel inserts)
+RETRIES = 2
+
+# Column dtypes of BED-like files (i.e. by name)
+BED_DTYPES = {
+    "chrom": str,
+    "start": "int64",
+    "end": "int64",
+    "name": str,
+    "score": "float64",
+    "strand": str,
+    "signal": "float64",
+    "p_value": "float64",
+    "q_value": "float64",
+    "peak": "int64",
+}
 
 class ParseUtililities:
     """
@@ -52,6 +58,7 @@ class ParseUtililities:
         self._dbname = None
         self._engine = None
         self._session = None
+        self._keys = {}
 
     @property
     def genome(self):
@@ -174,10 +181,125 @@ class ParseUtililities:
         # Read in chunks
         for chunk in pandas.read_csv(file_name, compression=compression,
                                      header=None, encoding="utf8",
-                                     sep=delimiter, chunksize=1024,
-                                     comment="#", engine="python"):
-            for index, row in chunk.iterrows():
-                yield(row.tolist())
+                                     sep=delimiter, chunksize=100000,
+                                     comment="#", engine="c"):
+            for row in chunk.itertuples(index=False, name=None):
+                yield(list(row))
+
+    def parse_bed_file(self, file_name, columns, dtypes=None,
+                       chunksize=100000):
+        """
+        Parses a BED-like file (e.g. narrowPeak or a UCSC table) and yields
+        its columns in chunks (i.e. column-wise, rather than line by line).
+
+        @input:
+        file_name {str}
+        columns {dict} 0-based column indices to names
+                       e.g. {1: "chrom", 2: "start", 3: "end"}
+        dtypes {dict} names to dtypes; default = BED_DTYPES
+        chunksize {int} lines per chunk
+
+        @yield: {dict} names to {numpy.ndarray}
+        """
+
+        # Initialize
+        indices = sorted(columns)
+        dtypes = self._get_bed_dtypes(columns, dtypes)
+
+        # Get compression (if any)
+        compression = None
+        if file_name.endswith(".gz"):
+            compression = "gzip"
+        if file_name.endswith(".zip"):
+            compression = "zip"
+
+        # Read in chunks
+        for chunk in pandas.read_csv(file_name, compression=compression,
+                                     header=None, encoding="utf8", sep="\t",
+                                     usecols=indices, dtype=dtypes,
+                                     chunksize=chunksize, comment="#",
+                                     engine="c"):
+            yield(dict((columns[i], chunk[i].to_numpy()) for i in indices))
+
+    def parse_bed_file_from(self, file_name, columns, offset=0, dtypes=None,
+                            chunk_bytes=2**24):
+        """
+        Same as parse_bed_file but from a byte offset of an uncompressed
+        file, and yields the byte offset after each chunk (i.e. where to
+        resume; see GUD.parsers.checkpoint).
+
+        @input:
+        file_name {str}
+        columns {dict} 0-based column indices to names
+        offset {int} byte offset
+        dtypes {dict} names to dtypes; default = BED_DTYPES
+        chunk_bytes {int} approx. bytes per chunk
+
+        @yield: {dict} names to {numpy.ndarray}, {int}
+        """
+
+        # Initialize
+        indices = sorted(columns)
+        dtypes = self._get_bed_dtypes(columns, dtypes)
+
+        if file_name.endswith(".gz") or file_name.endswith(".zip"):
+            raise ValueError("Cannot seek compressed file: %s" % file_name)
+
+        with open(file_name, "rb") as handle:
+
+            handle.seek(offset)
+
+            while True:
+
+                # i.e. up to the end of a line
+                data = handle.read(chunk_bytes)
+                if not data:
+                    break
+                data += handle.readline()
+
+                try:
+                    chunk = pandas.read_csv(BytesIO(data), header=None,
+                                            encoding="utf8", sep="\t",
+                                            usecols=indices, dtype=dtypes,
+                                            comment="#", engine="c")
+                    chunk = dict((columns[i], chunk[i].to_numpy())
+                                 for i in indices)
+                # i.e. only comments
+                except pandas.errors.EmptyDataError:
+                    chunk = dict((columns[i], pandas.Series([], dtype=dtypes[i]).to_numpy())
+                                 for i in indices)
+
+                yield(chunk, handle.tell())
+
+    def _get_bed_dtypes(self, columns, dtypes=None):
+
+        if dtypes is None:
+            dtypes = {}
+
+        return(dict(
+            (i, dtypes.get(columns[i], BED_DTYPES.get(columns[i], str)))
+            for i in columns
+        ))
+
+    def filter_chroms(self, columns, chroms):
+        """
+        Removes the "chr" prefix of the chromosomes of a chunk of columns
+        (i.e. from parse_bed_file) and keeps the rows of valid chromosomes.
+
+        @input:
+        columns {dict} names to {numpy.ndarray}; requires "chrom"
+        chroms {list} valid chromosomes
+
+        @return: {dict}
+        """
+
+        chrom = pandas.Series(columns["chrom"], dtype=object)
+        chrom = chrom.str.replace("^chr", "", regex=True)
+        mask = chrom.isin(chroms).to_numpy()
+        columns = dict((k, v[mask]) for k, v in columns.items())
+        columns["chrom"] = chrom.to_numpy()[mask]
+
+        return(columns)
 
     def parse_tsv_file(self, file_name):
         """
@@ -305,6 +427,13 @@ class ParseUtililities:
     def create_table(self, table):
 
         if not self.engine.has_table(table.__tablename__):
+
+            # Region keys (i.e. BIGINT region uids)
+            if table.__tablename__ != "regions" and self.engine.has_table("regions"):
+                from GUD.parsers.resolver import set_region_key_types, uses_region_keys
+                if uses_region_keys(self.engine):
+                    set_region_key_types(table.__table__)
+
             table.__table__.create(bind=self.engine)
 
     def _download_data_from_UCSC(self):
@@ -371,163 +500,227 @@ class ParseUtililities:
     # Upserts      #
     #--------------#
 
-    def upsert_accessibility(self, session, accessibility):
+    def upsert_accessibility(self, session, accessibility, chrom=None):
+        self._upsert(session, accessibility, chrom)
 
-        if DNAAccessibility.is_unique(session, accessibility.region_id,
-                                      accessibility.sample_id,
-                                      accessibility.experiment_id,
-                                      accessibility.source_id):
-            session.add(accessibility)
-            session.commit()
+    def upsert_conservation(self, session, conservation, chrom=None):
+        self._upsert(session, conservation, chrom)
 
-    def upsert_conservation(self, session, conservation):
+    def upsert_cpg_island(self, session, cpg_island, chrom=None):
+        self._upsert(session, cpg_island, chrom)
 
-        if Conservation.is_unique(session, conservation.region_id,
-                                  conservation.source_id):
-            session.add(conservation)
-            session.commit()
-
-    def upsert_cpg_island(self, session, cpg_island):
-
-        if CpGIsland.is_unique(session, cpg_island.region_id,
-                               cpg_island.source_id):
-            session.add(cpg_island)
-            session.commit()
-
-    def upsert_enhancer(self, session, enhancer):
-
-        if Enhancer.is_unique(session, enhancer.region_id, enhancer.sample_id, enhancer.experiment_id, enhancer.source_id):
-            session.add(enhancer)
-            session.commit()
+    def upsert_enhancer(self, session, enhancer, chrom=None):
+        self._upsert(session, enhancer, chrom)
 
     def upsert_experiment(self, session, experiment):
-
-        if Experiment.is_unique(session, experiment.name, experiment.experiment_metadata, experiment.metadata_descriptor):
-            session.add(experiment)
-            session.commit()
+        self._upsert(session, experiment)
 
     def upsert_expression(self, session, expression):
+        self._upsert(session, expression)
 
-        if Expression.is_unique(session, expression.tss_id, expression.sample_id):
-            session.add(expression)
-            session.commit()
+    def upsert_gene(self, session, gene, chrom=None):
+        self._upsert(session, gene, chrom)
 
-    def upsert_gene(self, session, gene):
+    def upsert_histone(self, session, histone, chrom=None):
+        self._upsert(session, histone, chrom)
 
-        if Gene.is_unique(session, gene.region_id, gene.source_id, gene.name,
-                          gene.strand):
-            session.add(gene)
-            session.commit()
+    # def upsert_mask(self, session, mask):
+    #     self._upsert(session, mask)
 
-    def upsert_histone(self, session, histone):
+    def upsert_region(self, session, region):
+        self._upsert(session, region, region.chrom)
 
-        if HistoneModification.is_unique(session, histone.region_id,
-                                         histone.sample_id,
-                                         histone.experiment_id,
-                                         histone.source_id,
-                                         histone.histone_type):
-            session.add(histone)
-            session.commit()
+    def upsert_rmsk(self, session, repeat, chrom=None):
+        self._upsert(session, repeat, chrom)
 
-    # def upsert_mask(self, session, mask):
+    def upsert_sample(self, session, sample):
+        self._upsert(session, sample)
 
-    #     if Mask.is_unique(session, mask.region_id, mask.source_id):
-    #         session.add(mask)
-    #         session.commit()
+    def upsert_source(self, session, source):
+        self._upsert(session, source)
 
-    def upsert_region(self, session, region):
+    def upsert_tf(self, session, tf, chrom=None):
+        self._upsert(session, tf, chrom)
 
-        if Region.is_unique(session, region.chrom, region.start, region.end):
-            session.add(region)
-            session.commit()
+    def upsert_str(self, session, STR, chrom=None):
+        self._upsert(session, STR, chrom)
 
-    def upsert_rmsk(self, session, repeat):
+    def upsert_cnv(self, session, cnv, chrom=None):
+        self._upsert(session, cnv, chrom)
 
-        if RepeatMask.is_unique(session, repeat.region_id, repeat.source_id,
-                                repeat.name, repeat.strand):
-            session.add(repeat)
-            session.commit()
+    def upsert_clinvar(self, session, clinvar, chrom=None):
+        self._upsert(session, clinvar, chrom)
 
-    def upsert_sample(self, session, sample):
+    def upsert_tad(self, session, tad, chrom=None):
+        self._upsert(session, tad, chrom)
 
-        if Sample.is_unique(session, sample.name, sample.X, sample.Y,
-                            sample.treatment, sample.cell_line, sample.cancer):
-            session.add(sample)
-            session.commit()
+    def upsert_tss(self, session, tss, chrom=None):
+        self._upsert(session, tss, chrom)
 
-    def upsert_source(self, session, source):
+    def _upsert(self, session, row, chrom=None):
+        """
+        Inserts a row unless its key is known: the keys of the table are
+        preloaded once per source and chromosome (i.e. that of the region
+        of the row, if not given; see KeySet), so that only new rows touch
+        the database.
+        """
 
-        if Source.is_unique(session, source.name, source.source_metadata,
-                            source.metadata_descriptor, source.url):
-            session.add(source)
-            session.commit()
+        # Initialize
+        name = (str(session.get_bind().url), row.__table__.name)
 
-    def upsert_tf(self, session, tf):
+        # i.e. rather than the keys of every chromosome
+        if chrom is None and getattr(row, "region_id", None) is not None:
+            chrom = session.query(Region.chrom)\
+                .filter(Region.uid == row.region_id).scalar()
 
-        if TFBinding.is_unique(session, tf.region_id, tf.sample_id,
-                               tf.experiment_id, tf.source_id, tf.tf):
-            session.add(tf)
-            session.commit()
-    
-    def upsert_str(self, session, STR):
-        if ShortTandemRepeat.is_unique(session, STR.region_id, STR.source_id,
-                                       STR.pathogenicity):
-            session.add(STR)
-            session.commit()
-    
-    def upsert_cnv(self, session, cnv):
-        if CNV.is_unique(session, cnv.region_id, cnv.source_id,
-                         cnv.copy_number_change):
-            session.add(cnv)
-            session.commit()
-
-    def upsert_clinvar(self, session, clinvar):
-        if clinvar.is_unique(session, clinvar.clinvar_variation_ID):
-            session.add(clinvar)
-            session.commit()
-
-    def upsert_tad(self, session, tad):
-        if TAD.is_unique(session, tad.region_id, tad.sample_id,
-                         tad.experiment_id, tad.source_id):
-            session.add(tad)
-            session.commit()
-
-    def upsert_tss(self, session, tss):
-        if TSS.is_unique(session, tss.region_id, tss.experiment_id,
-                         tss.source_id, tss.gene, tss.tss):
-            session.add(tss)
-            session.commit()
+        if name not in self._keys:
+            self._keys[name] = KeySet(type(row))
+        keys = self._keys[name]
+        keys.preload(session, chrom, getattr(row, "source_id", None))
+
+        if keys.add(row):
+            session.add(row)
+            try:
+                session.commit()
+            except IntegrityError:
+                # i.e. inserted meanwhile (e.g. by another process)
+                session.rollback()
 
     #--------------#
     # Multiprocess #
     #--------------#
 
-    def insert_data_files_in_parallel(self, files, insert_function, threads=1, sleep=0):
+    def insert_data_files_in_parallel(self, files, insert_function, threads=1, sleep=0,
+                                      metrics_dir=None, expected=None, retries=RETRIES):
+        """
+        Inserts files (e.g. split files or chromosomes) with one pool of
+        workers fed from a work queue: files are queued largest first (i.e.
+        files on disk; others keep their order) and each worker takes the
+        next one as soon as it is done with the last. Workers keep their
+        database connections (i.e. those of ParseUtils.engine) across files
+        and close them when they exit.
+
+        A failed file is queued again, up to retries times; then the files
+        not yet started are cancelled and an {InsertError} with the worker
+        traceback is raised. So is one if a worker dies (e.g. killed by the
+        OOM killer; i.e. the pool is broken), rather than waiting forever
+        for its file.
+
+        With a metrics directory, workers record live metrics there and a
+        summary is printed periodically (see GUD.parsers.metrics).
+
+        @input:
+        files {list} e.g. split files or chromosomes
+        insert_function {function} inserts one of them
+        threads {int}
+        sleep {int} seconds between the first submissions (i.e. to stagger
+                    the workers)
+        metrics_dir {str}
+        expected {int} rows to parse (i.e. for the ETA)
+        retries {int} attempts per file after the first one
+        """
 
-        from multiprocessing import Pool
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        from concurrent.futures.process import BrokenProcessPool
+        from functools import partial
         import time
+        from GUD.parsers import metrics
 
-        while len(files) > 0:
+        # Initialize
+        files = sorted(files, key=_get_size, reverse=True)
+        attempts = dict((f, 0) for f in files)
+        futures = {}
+        unfinished = set(files)
 
-            # Initialize pool
-            pool = Pool(processes=threads)
+        if metrics_dir is not None:
+            insert_function = partial(metrics.run, insert_function, metrics_dir)
+            monitor = metrics.Monitor(metrics_dir, expected,
+                {"files": lambda: max(len(unfinished) - threads, 0)})
+            monitor.start()
 
-            for p in range(threads):
+        def submit(f):
+            futures[pool.submit(_try_insert, insert_function, f)] = f
 
-                if len(files) > 0:
+        pool = ProcessPoolExecutor(max_workers=threads, initializer=_init_worker)
 
-                    # Submit job
-                    pool.apply_async(insert_function, args=(files.pop(0),))
+        try:
 
-                    # Sleep for a number of seconds before submitting the next job
+            # Queue files
+            for i, f in enumerate(files):
+                submit(f)
+                if i < threads - 1:
                     time.sleep(sleep)
 
-                else:
-                    # Exit for loop
-                    break
+            # Wait for files, queueing failed ones again
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    f = futures.pop(future)
+                    try:
+                        error = future.result()
+                    except BrokenProcessPool as e:
+                        raise InsertError("%s failed: a worker exited unexpectedly (e.g. killed by the OOM killer):\n%r" % (f, e))
+                    # i.e. not even started (e.g. unpicklable)
+                    except Exception as e:
+                        error = repr(e)
+                    if error is None:
+                        unfinished.discard(f)
+                        continue
+                    attempts[f] += 1
+                    if attempts[f] > retries:
+                        raise InsertError("%s failed after %s attempts:\n%s" % (f, attempts[f], error))
+                    print("%s failed (attempt %s), retrying:\n%s" % (f, attempts[f], error))
+                    submit(f)
+
+        except:
+            for future in futures:
+                future.cancel()
+            raise
+
+        finally:
+            pool.shutdown()
+            if metrics_dir is not None:
+                monitor.stop()
+
+
+class InsertError(Exception):
+    """
+    Raised when a file fails to insert (i.e. after all its attempts).
+    """
+
+    pass
+
+
+def _get_size(f):
+
+    # i.e. files on disk, largest first
+    try:
+        return(os.path.getsize(f))
+    except (OSError, TypeError):
+        return(0)
+
+
+def _init_worker():
+
+    from multiprocessing.util import Finalize
+
+    # i.e. connections are closed when the worker exits, not after each file
+    if ParseUtils.engine is not None:
+        Finalize(ParseUtils.engine, ParseUtils.engine.dispose, exitpriority=10)
+
+
+def _try_insert(insert_function, f):
+    """
+    Inserts a file in a worker; returns the traceback of any error (i.e. so
+    that the file can be queued again), or None.
+    """
+
+    import traceback
+
+    try:
+        insert_function(f)
+    except Exception:
+        return(traceback.format_exc())
 
-            # Close the pool and wait for everything to finish
-            pool.close()
-            pool.join()
 
 ParseUtils = ParseUtililities()
\ No newline at end of file
@@ -1,15 +1,12 @@
 #!/usr/bin/env python
 
 import argparse
-from binning import assign_bin
-from functools import partial
 import getpass
 from multiprocessing import cpu_count
 import os
 from pybedtools import BedTool
 import re
 import shutil
-import subprocess
 import sys
 import warnings
 from zipfile import ZipFile
@@ -18,10 +15,10 @@ from zipfile import ZipFile
 from GUD import GUDUtils
 from GUD.ORM.dna_accessibility import DNAAccessibility
 from GUD.ORM.experiment import Experiment
-from GUD.ORM.region import Region
 from GUD.ORM.sample import Sample
 from GUD.ORM.source import Source
 from GUD.parsers import ParseUtils
+from GUD.parsers.spec import Dimension, SourceSpec, ingest
 
 usage_msg = """
 usage: %s --genome STR [-h] [options]
@@ -141,18 +138,6 @@ def boca_to_gud(genome, dummy_dir="/tmp/", remove=False, test=False, threads=1):
     e.g. python -m GUD.parsers.boca2gud --genome hg38 --test -P 3306
     """
 
-    # Initialize
-    global chroms
-    global engine
-    global experiment
-    global Session
-    global source
-
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -206,11 +191,12 @@ def boca_to_gud(genome, dummy_dir="/tmp/", remove=False, test=False, threads=1):
     session.close()
     engine.dispose()
 
-    # Split data
-    data_files = _split_data(data_file, threads)
-
     # Parallelize inserts to the database
-    ParseUtils.insert_data_files_in_parallel(data_files, partial(_insert_data, test=test), threads)
+    spec = SourceSpec(DNAAccessibility, {0: "chrom", 1: "start", 2: "end", 3: "sample"},
+                      fields={"sample_id": Dimension("sample", _get_sample_uid)})
+    values = {"experiment_id": experiment.uid, "source_id": source.uid,
+              "score": None, "peak": None}
+    ingest(spec, data_file, values, chroms, threads, test)
 
     # Remove files
     if remove:
@@ -313,96 +299,16 @@ def _get_abbreviations():
 
     return(abbreviations)
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["wc -l %s" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "split -d -l %s %s %s" % (int(L/threads)+1, data_file, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
-
-    # For each split file...
-    for split_file in os.listdir(split_dir):
-
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
-
-    return(split_files)
-
-def _insert_data(data_file, test=False):
+def _get_sample_uid(session, value):
 
     # Initialize
-    session = Session()
-    samples = {}
-    abbreviations = _get_abbreviations()
-
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
+    abbrev, origin = value.split("_")
+    name = "%s (%s)" % (_get_abbreviations()[abbrev], origin)
 
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
+    # Get sample
+    sample = ParseUtils.get_sample(session, name, None, None, False, False, False)
 
-        # Initialize
-        abbrev, origin = line[3].split("_")
-
-        # Upsert region
-        region = Region()
-        region.chrom = str(line[0])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[1])
-        region.end = int(line[2])
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
-
-        # Get sample
-        s = "%s (%s)" % (abbreviations[abbrev], origin)
-        if s not in samples:
-            sample = Sample()
-            sample.name = s
-            sample.treatment = False
-            sample.cell_line = False
-            sample.cancer = False
-            sample = ParseUtils.get_sample(session, sample.name, sample.X, sample.Y, sample.treatment, sample.cell_line, sample.cancer)
-            samples.setdefault(s, sample)
-        else:
-            sample = samples[s]
-
-        # Upsert DNA accessibility
-        dna_accessibility = DNAAccessibility()
-        dna_accessibility.region_id = region.uid
-        dna_accessibility.sample_id = sample.uid
-        dna_accessibility.experiment_id = experiment.uid
-        dna_accessibility.source_id = source.uid
-        dna_accessibility.score = None
-        dna_accessibility.peak = None
-        ParseUtils.upsert_accessibility(session, dna_accessibility)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
-
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
-    session.close()
-    engine.dispose()
+    return(sample.uid)
 
 #-------------#
 # Main        #
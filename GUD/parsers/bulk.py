@@ -0,0 +1,224 @@
+"""
+Batched bulk inserts for the parsers
+"""
+
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.exc import OperationalError
+import time
+
+# Import from GUD module
+from GUD.parsers import metrics
+from GUD.parsers.dedup import KeySet
+
+# Defaults
+BATCH_SIZE = 1000
+RETRIES = 5
+# MySQL errors for which a batch is retried (i.e. lock wait timeout
+# exceeded and deadlock found)
+RETRY_ERRORS = (1205, 1213)
+
+
+class BulkWriter(object):
+    """
+    Buffers the rows of a table (i.e. ORM objects or dicts keyed by ORM
+    attribute or column name) and inserts them in batches, with one
+    multi-row INSERT and one commit per batch.
+
+    Rows that violate a unique constraint of the table (i.e. duplicates)
+    are ignored (i.e. INSERT IGNORE) or, if update columns are provided,
+    those columns are updated (i.e. INSERT ... ON DUPLICATE KEY UPDATE).
+    With dedup, duplicates are dropped in memory instead (see KeySet): the
+    keys of the rows already in the table are preloaded per chromosome
+    (i.e. see set_chrom) and source, so that only new rows are inserted.
+
+    e.g.
+    writer = BulkWriter(session, TFBinding)
+    for tf in tfs:
+        writer.add(tf)
+    writer.close()
+    """
+
+    def __init__(self, session, table, batch_size=BATCH_SIZE, update=None,
+                 retries=RETRIES, dedup=False, key=None):
+        """
+        @input:
+        session {Session}
+        table {DeclarativeMeta} or {Table}
+        batch_size {int} rows per batch
+        update {list} columns to update on duplicates (default = ignore)
+        retries {int} attempts per batch on deadlocks and lock timeouts
+        dedup {bool} drop duplicates in memory (default = False)
+        key {list} ORM attributes (or columns) of the key of dedup
+                   (default = the unique constraint; see KeySet)
+        """
+
+        self.session = session
+        self.batch_size = batch_size
+        self.retries = retries
+        self.rows = 0
+        self.batches = 0
+        self.duplicates = 0
+        self.retried = 0
+        self.deadlocks = 0
+        self.chrom = None
+
+        # ORM attribute to column names
+        if hasattr(table, "__table__"):
+            self.table = table.__table__
+            self._columns = {}
+            for attr in table.__mapper__.column_attrs:
+                self._columns.setdefault(attr.key, attr.columns[0].key)
+        else:
+            self.table = table
+            self._columns = {c.key: c.key for c in table.columns}
+        self._primary_keys = set([c.key for c in self.table.primary_key])
+
+        if update is None:
+            self.update = []
+        else:
+            self.update = [self._columns.get(c, c) for c in update]
+
+        # i.e. updates require the duplicates
+        if dedup and self.update:
+            raise ValueError("dedup and update are mutually exclusive")
+        if dedup:
+            self.keys = KeySet(table, key)
+        else:
+            self.keys = None
+
+        self._buffer = []
+
+    def __enter__(self):
+
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.close()
+
+    def add(self, row):
+        """
+        Adds a row; flushes the buffer once it is full.
+        """
+
+        values = self._as_dict(row)
+
+        # Skip duplicates
+        if self.keys is not None:
+            self.keys.preload(self.session, self.chrom, values.get("sourceID"))
+            if not self.keys.add(values):
+                self.duplicates += 1
+                return
+
+        self._buffer.append(values)
+
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, rows):
+
+        for row in rows:
+            self.add(row)
+
+    def set_chrom(self, chrom):
+        """
+        Sets the chromosome of the rows that follow (i.e. for dedup).
+        """
+
+        self.chrom = chrom
+
+    def _as_dict(self, row):
+
+        # Initialize
+        values = {}
+
+        if isinstance(row, dict):
+            items = row.items()
+        else:
+            items = [(a, getattr(row, a)) for a in self._columns]
+
+        for key, value in items:
+            column = self._columns.get(key, key)
+            # i.e. autoincrement
+            if value is None and column in self._primary_keys:
+                continue
+            values.setdefault(column, value)
+
+        return(values)
+
+    def flush(self):
+        """
+        Inserts the buffered rows.
+        """
+
+        # Initialize
+        groups = {}
+
+        if not self._buffer:
+            return
+
+        # Rows of a multi-row INSERT must have the same columns
+        for values in self._buffer:
+            groups.setdefault(tuple(sorted(values)), []).append(values)
+        self._buffer = []
+
+        for columns in groups:
+            t = time.time()
+            self._execute(self.statement(groups[columns]))
+            self.rows += len(groups[columns])
+            self.batches += 1
+            # i.e. live metrics of the process, if any
+            if metrics.get() is not None:
+                metrics.get().flushed(self.table.name, len(groups[columns]),
+                                      time.time() - t)
+
+    def statement(self, rows):
+        """
+        Returns a multi-row INSERT IGNORE (or INSERT ... ON DUPLICATE KEY
+        UPDATE) statement.
+        """
+
+        stmt = insert(self.table).values(rows)
+
+        if self.update:
+            stmt = stmt.on_duplicate_key_update(
+                dict([(c, stmt.inserted[c]) for c in self.update]))
+        else:
+            stmt = stmt.prefix_with("IGNORE")
+
+        return(stmt)
+
+    def _execute(self, stmt):
+
+        attempt = 0
+
+        while True:
+
+            try:
+                self.session.execute(stmt)
+                self.session.commit()
+                break
+
+            except OperationalError as e:
+                self.session.rollback()
+                if e.orig.args[0] == 1213:
+                    self.deadlocks += 1
+                    if metrics.get() is not None:
+                        metrics.get().add("deadlocks")
+                if e.orig.args[0] not in RETRY_ERRORS or \
+                   attempt >= self.retries:
+                    raise
+                # Back off before retrying
+                time.sleep(0.1 * 2 ** attempt)
+                attempt += 1
+                self.retried += 1
+                if metrics.get() is not None:
+                    metrics.get().add("retried")
+
+    def close(self):
+        """
+        Inserts any remaining rows.
+        """
+
+        self.flush()
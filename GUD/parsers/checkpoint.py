@@ -0,0 +1,135 @@
+"""
+Durable checkpoints of ingestion jobs (i.e. resumable parsers)
+"""
+
+from hashlib import sha1
+import json
+import os
+import re
+
+
+class Checkpoint(object):
+    """
+    Records the progress of an ingestion job in a directory, so that a
+    restarted job resumes where it stopped: completed keys (e.g. input
+    files), values (e.g. the byte offset of the last committed chunk of a
+    file) and append-only logs (e.g. the committed batches of a pipeline).
+
+    Every key is a small file of its own, replaced atomically (or appended
+    to, for logs) and synced to disk, so that concurrent processes can
+    record their progress safely; record progress only after it has been
+    committed to the database.
+
+    e.g.
+    checkpoint = Checkpoint(os.path.join(dummy_dir, "checkpoints"))
+    offset = checkpoint.get(data_file, 0)
+    ...
+    checkpoint.set(data_file, offset)
+    checkpoint.done(data_file)
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, key, suffix):
+
+        return(os.path.join(self.directory, "%s.%s" % (_sanitize(key), suffix)))
+
+    def is_done(self, key):
+        """
+        Returns whether a key is completed.
+        """
+
+        return(os.path.exists(self._path(key, "done")))
+
+    def done(self, key):
+        """
+        Marks a key as completed (i.e. its values and logs are removed).
+        """
+
+        _write_file(self._path(key, "done"), "")
+
+        if os.path.exists(self._path(key, "json")):
+            os.remove(self._path(key, "json"))
+        for log_file in self._get_log_files(key):
+            os.remove(log_file)
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a key (i.e. JSON-serializable).
+        """
+
+        if not os.path.exists(self._path(key, "json")):
+            return(default)
+
+        with open(self._path(key, "json")) as handle:
+            return(json.load(handle))
+
+    def set(self, key, value):
+
+        _write_file(self._path(key, "json"), json.dumps(value))
+
+    def log(self, key, name, value):
+        """
+        Appends a value (i.e. {int}) to a log of a key (i.e. one log per
+        process, e.g. name = process name).
+        """
+
+        log_file = os.path.join(self.directory, "%s+%s.log" % (_sanitize(key), _sanitize(name)))
+        with open(log_file, "a") as handle:
+            handle.write("%s\n" % value)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def get_logged(self, key):
+        """
+        Returns the values of all the logs of a key.
+
+        @return: {set} of {int}
+        """
+
+        # Initialize
+        values = set()
+
+        for log_file in self._get_log_files(key):
+            with open(log_file) as handle:
+                for line in handle:
+                    # i.e. skip the last line if incomplete
+                    if line.endswith("\n"):
+                        values.add(int(line))
+
+        return(values)
+
+    def _get_log_files(self, key):
+
+        prefix = "%s+" % _sanitize(key)
+
+        return([os.path.join(self.directory, f)
+                for f in sorted(os.listdir(self.directory))
+                if f.startswith(prefix) and f.endswith(".log")])
+
+
+def _sanitize(key):
+
+    # i.e. readable, but unique to the full key (e.g. split files of the
+    # same name in different directories); "+" separates keys from log
+    # names
+    name = re.sub(r"[^\w.-]", "_", os.path.basename(str(key)))
+    digest = sha1(str(key).encode("utf-8")).hexdigest()[:12]
+
+    return("%s.%s" % (name, digest))
+
+
+def _write_file(file_name, content):
+
+    # i.e. replaced atomically
+    dummy_file = "%s.%s" % (file_name, os.getpid())
+    with open(dummy_file, "w") as handle:
+        handle.write(content)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(dummy_file, file_name)
@@ -1,20 +1,21 @@
 #!/usr/bin/env python
 
-from GUD.parsers import ParseUtils
+from GUD.parsers import ParseUtils, metrics
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.resolver import RegionResolver
+from GUD.parsers.sync import Diff, delete_rows, get_digest
+from GUD.parsers.vcf import VCFReader
 from GUD.ORM.clinvar import ClinVar
 from GUD.ORM.source import Source
 from GUD.ORM.region import Region
 from GUD import GUDUtils
-from binning import assign_bin
 from functools import partial
 import getpass
 from multiprocessing import Pool, cpu_count
 from numpy import isnan
 import os
 import sys
-import re
 import shutil
-import subprocess
 import warnings
 import argparse
 
@@ -31,9 +32,16 @@ inserts copy number variants from curated sourcesq.
 
 optional arguments:
   -h, --help          show this help message and exit
+  --dummy-dir DIR     dummy directory (default = "/tmp/")
+  -r, --remove        remove downloaded files (default = False)
+  --sync              update the source incrementally (i.e.
+                      insert, update and delete only the
+                      variants that changed since the loaded
+                      release; default = False)
   -t, --test          limit the total of inserts to ~1K per
                       thread for testing (default = False)
-  --threads INT       number of threads to use (default = %s)
+  --threads INT       number of threads to use (i.e. to insert
+                      chromosomes in parallel; default = %s)
 
 mysql arguments:
   -d STR, --db STR    database name (default = "%s")
@@ -43,6 +51,18 @@ mysql arguments:
   -u STR, --user STR  user name (default = current user)
 """ % (usage_msg, (cpu_count() - 1), GUDUtils.db, GUDUtils.port)
 
+# INFO keys (i.e. columns) and ANN subfields (i.e. 0-based indices to
+# columns) of the ClinVar VCF
+INFO_KEYS = ["CADD", "CLNDISDB", "CLNDN", "CLNSIG", "gnomad_exome_af_global",
+             "gnomad_exome_hom_global", "gnomad_genome_af_global",
+             "gnomad_genome_hom_global"]
+FLOAT_KEYS = set(["CADD", "gnomad_exome_af_global", "gnomad_exome_hom_global",
+                  "gnomad_genome_af_global", "gnomad_genome_hom_global"])
+ANN_FIELDS = {1: "ANN_Annotation", 2: "ANN_Annotation_Impact",
+              3: "ANN_Gene_Name", 4: "ANN_Gene_ID", 5: "ANN_Feature_Type",
+              6: "ANN_Feature_ID"}
+_columns = INFO_KEYS + [ANN_FIELDS[i] for i in sorted(ANN_FIELDS)]
+
 #-------------#
 # Functions   #
 #-------------#
@@ -63,6 +83,9 @@ def parse_args():
     # Optional args
     optional_group = parser.add_argument_group("optional arguments")
     optional_group.add_argument("-h", "--help", action="store_true")
+    optional_group.add_argument("--dummy-dir", default="/tmp/")
+    optional_group.add_argument("-r", "--remove", action="store_true")
+    optional_group.add_argument("--sync", action="store_true")
     optional_group.add_argument("-t", "--test", action="store_true")
     optional_group.add_argument("--threads", default=(cpu_count() - 1))
 
@@ -141,10 +164,11 @@ def main():
 
     # Insert ClinVar data
     clinvar_to_gud(args.genome, args.source_name, args.clinvar_file,
-                   args.test, args.threads)
+                   args.test, args.threads, args.dummy_dir, args.remove,
+                   args.sync)
 
 
-def clinvar_to_gud(genome, source_name, clinvar_file, test=False, threads=1):
+def clinvar_to_gud(genome, source_name, clinvar_file, test=False, threads=1, dummy_dir="/tmp/", remove=False, sync=False):
     """
     python -m GUD.parsers.clinvar2gud --genome hg38 --source_name <name> --clinvar_file <FILE> 
     """
@@ -155,11 +179,6 @@ def clinvar_to_gud(genome, source_name, clinvar_file, test=False, threads=1):
     global Session
     global source
 
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -199,12 +218,28 @@ def clinvar_to_gud(genome, source_name, clinvar_file, test=False, threads=1):
     session.close()
     engine.dispose()
 
-    # Split data
-    data_files = _split_data(clinvar_file, threads)
+    # Get chromosomes
+    reader = _get_reader(clinvar_file, dummy_dir)
+    valid_chroms = _get_chroms(reader)
+
+    # Testing
+    if test:
+        valid_chroms = valid_chroms[:threads]
+        limit = 1000
+    else:
+        limit = None
+
+    # Update only what changed since the loaded release
+    if sync:
+        _sync_data(reader, valid_chroms, threads, limit)
+
+    else:
 
-    # Parallelize inserts to the database
-    ParseUtils.insert_data_files_in_parallel(
-        data_files, partial(_insert_data, test=test), threads)
+        # Parallelize inserts to the database (i.e. one chromosome each)
+        ParseUtils.insert_data_files_in_parallel(list(valid_chroms),
+            partial(_insert_chrom, reader=reader, limit=limit), threads,
+            metrics_dir=os.path.join(dummy_dir, "metrics"),
+            expected=_get_expected(reader, valid_chroms, limit))
 
     # Remove files
     if remove:
@@ -214,132 +249,198 @@ def clinvar_to_gud(genome, source_name, clinvar_file, test=False, threads=1):
     Session.remove()
 
 
-def _split_data(data_file, threads=1):
+def _get_reader(clinvar_file, dummy_dir="/tmp/"):
 
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
+    return(VCFReader(clinvar_file, INFO_KEYS, sorted(ANN_FIELDS), dummy_dir))
+
+
+def _get_chroms(reader):
+    """
+    Returns the chromosomes of the file (i.e. as in the file) that are
+    valid chromosomes.
+    """
 
-    # Get number of lines
-    output = subprocess.check_output(["wc -l %s" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
+    return([c for c in reader.get_chroms() if _get_chrom(c) in chroms])
 
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "less %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
 
-    # For each split file...
-    for split_file in os.listdir(split_dir):
+def _get_chrom(chrom):
 
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
+    if chrom.startswith("chr"):
+        return(chrom[3:])
 
-    return(split_files)
+    return(chrom)
+
+
+def _parse_variant(variant):
+    """
+    Returns a record (i.e. chrom, start, end and ClinVar values) from a
+    variant of the VCFReader.
+    """
 
+    # Get region
+    chrom, pos, variation_ID, ref, alt, values = variant
+    start = pos - 1
+    end = start + len(ref)
 
-def _insert_data(data_file, test=False):
+    # Get feature
+    clinvar = {}
+    clinvar["source_id"] = source.uid
+    clinvar["ref"] = ref.encode(encoding="UTF-8")
+    clinvar["alt"] = alt.encode(encoding="UTF-8")
+    clinvar["clinvar_variation_ID"] = int(variation_ID)
+    for column, value in zip(_columns, values):
+        if value is None:
+            clinvar[column] = None
+        elif column in FLOAT_KEYS:
+            clinvar[column] = _get_float(value)
+        else:
+            clinvar[column] = value.encode(encoding="UTF-8")
+
+    return((_get_chrom(chrom), start, end, clinvar))
+
+
+def _get_float(value):
+
+    try:
+        return(float(value))
+    except ValueError:
+        return(None)
+
+
+def _insert_chrom(chrom, reader, limit=None):
 
     # Initialize
     session = Session()
+    writer = BulkWriter(session, ClinVar, dedup=True)
+    resolver = RegionResolver(session, writer)
 
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
-
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
-
-        # Get region
-        region = Region()
-        region.chrom = str(line[0])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[1]) - 1
-        region.end = region.start + len(line[3])
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
+    # For each variant...
+    variants = reader.parse_chrom(chrom, limit)
+    if metrics.get() is not None:
+        variants = metrics.get().timed(variants, count="parsed")
+    for variant in variants:
 
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
+        # Get feature (i.e. chrom, start, end and ClinVar values)
+        resolver.add_coords(*_parse_variant(variant))
 
-        # Get feature
-        clinvar = ClinVar()
-        clinvar.region_id = region.uid
-        clinvar.source_id = source.uid
-        clinvar.ref = line[3].encode(encoding="UTF-8")
-        clinvar.alt = line[4].encode(encoding="UTF-8")
-        clinvar.clinvar_variation_ID = line[2]
-        ## get info 
-        info = line[7].split(";")
-        infoDict = {}
-        for t in info: 
-            if "=" in t:
-                infoDict[t.split("=")[0]] = t.split("=")[1]
-        try:
-            ANN = infoDict["ANN"].split("|")
-            clinvar.ANN_Annotation = ANN[1].encode(encoding="UTF-8")
-            clinvar.ANN_Annotation_Impact = ANN[2].encode(encoding="UTF-8")
-            clinvar.ANN_Gene_Name = ANN[3].encode(encoding="UTF-8")
-            clinvar.ANN_Gene_ID = ANN[4].encode(encoding="UTF-8")
-            clinvar.ANN_Feature_Type = ANN[5].encode(encoding="UTF-8")
-            clinvar.ANN_Feature_ID = ANN[6].encode(encoding="UTF-8")
-        except:
-            clinvar.ANN_Annotation = None
-            clinvar.ANN_Annotation_Impact = None
-            clinvar.ANN_Gene_Name = None
-            clinvar.ANN_Gene_ID = None
-            clinvar.ANN_Feature_Type = None
-            clinvar.ANN_Feature_ID = None
-        try: 
-            clinvar.CADD = float(infoDict["CADD"])
-        except:  
-            clinvar.CADD = None
-        try:
-            clinvar.CLNDISDB = infoDict["CLNDISDB"].encode(encoding="UTF-8")
-        except:  
-            clinvar.CLNDN = None
-        try:
-            clinvar.CLNDN = infoDict["CLNDN"].encode(encoding="UTF-8")
-        except:  
-            clinvar.CLNDN = None
-        try:
-            clinvar.CLNSIG = infoDict["CLNSIG"].encode(encoding="UTF-8")
-        except:  
-            clinvar.CLNSIG = None
-        try:
-            clinvar.gnomad_exome_af_global      = float(infoDict["gnomad_exome_af_global"])
-        except:
-            clinvar.gnomad_exome_af_global      = None
-        try:
-            clinvar.gnomad_exome_hom_global     = float(infoDict["gnomad_exome_hom_global"])
-        except:
-            clinvar.gnomad_exome_hom_global     = None
-        try:
-            clinvar.gnomad_genome_af_global     = float(infoDict["gnomad_genome_af_global"])
-        except:
-            clinvar.gnomad_genome_af_global     = None
-        try:
-            clinvar.gnomad_genome_hom_global    = float(infoDict["gnomad_genome_hom_global"])
-        except:
-            clinvar.gnomad_genome_hom_global    = None
-        ParseUtils.upsert_clinvar(session, clinvar)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
+    # Insert remaining features
+    resolver.close()
+    writer.close()
+
+    # i.e. connections are reused by the next file of the worker and
+    # closed when it exits (see ParseUtils.insert_data_files_in_parallel)
+    session.close()
+
+def _get_expected(reader, valid_chroms, limit=None):
+
+    # i.e. variants to parse, for the ETA
+    if limit is not None:
+        return(limit * len(valid_chroms))
+    if not reader.tabix:
+        return(metrics.estimate_lines(reader.file_name))
+
+def _sync_data(reader, valid_chroms, threads=1, limit=None):
+    """
+    Diffs the release against the loaded variants of the source (i.e. by
+    clinvar_variation_ID), reports the diff, deletes the variants no longer
+    in the release and inserts/updates the new and changed ones.
+    """
+
+    # Initialize
+    global changed
+    release = {}
+    session = Session()
+
+    # Get loaded/released variants
+    loaded, uids = _get_loaded_variants(session)
+    for chrom in valid_chroms:
+        for variant in reader.parse_chrom(chrom, limit):
+            record = _parse_variant(variant)
+            release[record[3]["clinvar_variation_ID"]] = _get_digest(record)
+    diff = Diff(loaded, release)
+    print("%s: %s" % (source.name, diff))
+
+    # Delete variants (i.e. unless testing, for the release is partial)
+    if limit is None:
+        delete_rows(session, ClinVar.__table__, "uid",
+                    [uids[k] for k in diff.deletes])
 
     # This is ABSOLUTELY necessary to prevent MySQL from crashing!
     session.close()
     engine.dispose()
 
+    # Insert/update variants
+    changed = diff.get_changed()
+    if changed:
+        ParseUtils.insert_data_files_in_parallel(list(valid_chroms),
+            partial(_sync_chrom, reader=reader, limit=limit), threads)
+
+
+def _get_loaded_variants(session):
+    """
+    Returns the digests and uids of the loaded variants of the source keyed
+    by clinvar_variation_ID.
+    """
+
+    # Initialize
+    digests = {}
+    uids = {}
+
+    q = session.query(ClinVar.uid, Region.chrom, Region.start, Region.end,
+                      *[getattr(ClinVar, c) for c in _get_digest_columns()])\
+        .join(Region, Region.uid == ClinVar.region_id)\
+        .filter(ClinVar.source_id == source.uid)
+
+    for row in q.yield_per(100000):
+        digests[row.clinvar_variation_ID] = get_digest(row[1:])
+        uids[row.clinvar_variation_ID] = row.uid
+
+    return(digests, uids)
+
+
+def _get_digest(record):
+
+    chrom, start, end, clinvar = record
+
+    return(get_digest([chrom, start, end] + \
+        [clinvar.get(c) for c in _get_digest_columns()]))
+
+
+def _get_digest_columns():
+
+    return([a.key for a in ClinVar.__mapper__.column_attrs
+            if a.key not in ("uid", "region_id", "source_id")])
+
+
+def _sync_chrom(chrom, reader, limit=None):
+
+    # Initialize
+    session = Session()
+    update = [c for c in _get_digest_columns() if c != "clinvar_variation_ID"]
+    writer = BulkWriter(session, ClinVar, update=update + ["region_id"])
+    resolver = RegionResolver(session, writer)
+
+    # For each variant...
+    variants = reader.parse_chrom(chrom, limit)
+    if metrics.get() is not None:
+        variants = metrics.get().timed(variants, count="parsed")
+    for variant in variants:
+
+        # Skip unchanged variants (i.e. by ID, before parsing)
+        if int(variant[2]) not in changed:
+            continue
+
+        # Get feature
+        resolver.add_coords(*_parse_variant(variant))
+
+    # Insert remaining features
+    resolver.close()
+    writer.close()
+
+    # i.e. connections are reused by the next file of the worker and
+    # closed when it exits (see ParseUtils.insert_data_files_in_parallel)
+    session.close()
+
 #-------------#
 # Main        #
 #-------------#
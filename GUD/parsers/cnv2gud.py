@@ -3,18 +3,15 @@
 from GUD.parsers import ParseUtils
 from GUD.ORM.copy_number_variant import CNV
 from GUD.ORM.source import Source
-from GUD.ORM.region import Region
+from GUD.parsers.spec import SourceSpec, ingest
 from GUD import GUDUtils
-from binning import assign_bin
 from functools import partial
 import getpass
 from multiprocessing import Pool, cpu_count
 from numpy import isnan
 import os
 import sys
-import re
 import shutil
-import subprocess
 import warnings
 import argparse
 
@@ -36,6 +33,8 @@ inserts copy number variants from curated sources into GUD.
 
 optional arguments:
   -h, --help          show this help message and exit
+  --dummy-dir DIR     dummy directory (default = "/tmp/")
+  -r, --remove        remove downloaded files (default = False)
   -t, --test          limit the total of inserts to ~1K per
                       thread for testing (default = False)
   --threads INT       number of threads to use (default = %s)
@@ -53,6 +52,35 @@ mysql arguments:
 #-------------#
 
 
+def _get_list(column, chunk):
+    """
+    Returns the UTF-8 encoded, comma-terminated lists of a column of
+    semicolon-separated values (i.e. empty values as ",").
+    """
+
+    # Initialize
+    values = []
+
+    for value in chunk[column].tolist():
+        if not isinstance(value, str):
+            value = ""
+        values.append(("%s," % value.replace(";", ",")).encode("UTF-8"))
+
+    return(values)
+
+
+# CNVs have no unique constraint (i.e. duplicates are dropped by key)
+SPEC = SourceSpec(CNV,
+    {0: "chrom", 1: "start", 2: "end", 3: "copy_number_change",
+     4: "clinical_assertion", 5: "clinvar_accession", 6: "dbVar_accession"},
+    fields={"copy_number_change": "copy_number_change",
+            "clinical_assertion": partial(_get_list, "clinical_assertion"),
+            "clinvar_accession": partial(_get_list, "clinvar_accession"),
+            "dbVar_accession": partial(_get_list, "dbVar_accession")},
+    dtypes={"copy_number_change": "int64"},
+    key=["region_id", "source_id", "copy_number_change"])
+
+
 def parse_args():
     """
     This function parses arguments provided via the command line and returns an {argparse} object.
@@ -68,6 +96,8 @@ def parse_args():
     # Optional args
     optional_group = parser.add_argument_group("optional arguments")
     optional_group.add_argument("-h", "--help", action="store_true")
+    optional_group.add_argument("--dummy-dir", default="/tmp/")
+    optional_group.add_argument("-r", "--remove", action="store_true")
     optional_group.add_argument("-t", "--test", action="store_true")
     optional_group.add_argument("--threads", default=(cpu_count() - 1))
 
@@ -146,25 +176,14 @@ def main():
 
     # Insert CNV data
     cnv_to_gud(args.genome, args.source_name, args.cnv_file,
-               args.test, args.threads)
+               args.test, args.threads, args.dummy_dir, args.remove)
 
 
-def cnv_to_gud(genome, source_name, cnv_file, test=False, threads=1):
+def cnv_to_gud(genome, source_name, cnv_file, test=False, threads=1, dummy_dir="/tmp/", remove=False):
     """
     python -m GUD.parsers.cnv2gud --genome hg38 --source_name <name> --cnv_file <FILE> 
     """
 
-    # Initialize
-    global chroms
-    global engine
-    global Session
-    global source
-
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -204,12 +223,8 @@ def cnv_to_gud(genome, source_name, cnv_file, test=False, threads=1):
     session.close()
     engine.dispose()
 
-    # Split data
-    data_files = _split_data(cnv_file, threads)
-
     # Parallelize inserts to the database
-    ParseUtils.insert_data_files_in_parallel(
-        data_files, partial(_insert_data, test=test), threads)
+    ingest(SPEC, cnv_file, {"source_id": source.uid}, chroms, threads, test)
 
     # Remove files
     if remove:
@@ -219,82 +234,6 @@ def cnv_to_gud(genome, source_name, cnv_file, test=False, threads=1):
     Session.remove()
 
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["wc -l %s" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "less %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
-
-    # For each split file...
-    for split_file in os.listdir(split_dir):
-
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
-
-    return(split_files)
-
-def _insert_data(data_file, test=False):
-
-    # Initialize
-    session = Session()
-
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
-
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
-
-        # Get region
-        region = Region()
-        region.chrom = str(line[0])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[1])
-        region.end = int(line[2])
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
-
-        # Get feature
-        cnv = CNV()
-        cnv.region_id = region.uid
-        cnv.source_id = source.uid
-        cnv.copy_number_change = int(line[3])
-        clinical_assertion = "%s," % line[4].replace(";", ",")
-        cnv.clinical_assertion = clinical_assertion.encode(encoding="UTF-8")
-        clinvar_accession = "%s," % line[5].replace(";", ",")
-        cnv.clinvar_accession = clinvar_accession.encode(encoding="UTF-8")
-        dbVar_accession = "%s," % line[6].replace(";", ",")
-        cnv.dbVar_accession = dbVar_accession.encode(encoding="UTF-8")
-        ParseUtils.upsert_cnv(session, cnv)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
-
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
-    session.close()
-    engine.dispose()
-
 #-------------#
 # Main        #
 #-------------#
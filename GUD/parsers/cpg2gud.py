@@ -1,22 +1,19 @@
 #!/usr/bin/env python
 
 import argparse
-from binning import assign_bin
-from functools import partial
 import getpass
 from multiprocessing import cpu_count
 import os
 import re
 import shutil
-import subprocess
 import sys
 
 # Import from GUD module
 from GUD import GUDUtils
 from GUD.ORM.cpg_island import CpGIsland
-from GUD.ORM.region import Region
 from GUD.ORM.source import Source
 from GUD.parsers import ParseUtils
+from GUD.parsers.spec import SourceSpec, ingest
 
 usage_msg = """
 usage: %s --genome STR --version STR [-h] [options]
@@ -45,6 +42,13 @@ mysql arguments:
   -u STR, --user STR  user name (default = current user)
 """ % (usage_msg, (cpu_count() - 1), GUDUtils.db, GUDUtils.port)
 
+# Columns of the "cpgIslandExtUnmasked" table
+SPEC = SourceSpec(CpGIsland,
+    {1: "chrom", 2: "start", 3: "end", 6: "cpgs", 7: "gcs",
+     8: "percent_cpg", 9: "percent_gc", 10: "obsexp_ratio"},
+    dtypes={"cpgs": "int64", "gcs": "int64", "percent_cpg": "float64",
+            "percent_gc": "float64", "obsexp_ratio": "float64"})
+
 #-------------#
 # Functions   #
 #-------------#
@@ -138,17 +142,6 @@ def cpg_islands_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=Fa
     e.g. python -m GUD.parsers.cpg2gud --genome hg38 --version abcd --test -P 3306
     """
 
-    # Initialize
-    global chroms
-    global engine
-    global Session
-    global source
-
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -195,11 +188,8 @@ def cpg_islands_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=Fa
     session.close()
     engine.dispose()
 
-    # Split data
-    data_files = _split_data(data_file, threads)
-
     # Parallelize inserts to the database
-    ParseUtils.insert_data_files_in_parallel(data_files, partial(_insert_data, test=test), threads)
+    ingest(SPEC, data_file, {"source_id": source.uid}, chroms, threads, test)
 
     # Remove files
     if remove:
@@ -228,86 +218,6 @@ def _download_data(genome, dummy_dir="/tmp/"):
 
     return(data_file, ftp_file)
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["zless %s | wc -l" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "zless %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
-
-    # For each split file...
-    for split_file in os.listdir(split_dir):
-
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
-
-    return(split_files)
-
-def _insert_data(data_file, test=False):
-
-    # Initialize
-    session = Session()
-
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
-
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
-
-        # Skip empty lines
-        if not line:
-            continue
-
-        # Upsert region
-        region = Region()
-        region.chrom = str(line[1])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[2])
-        region.end = int(line[3])
-        region.bin = assign_bin(region.start, region.end)
-        if region.chrom not in chroms:
-            continue
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
-
-        # Upsert CpG island
-        cpg_island = CpGIsland()
-        cpg_island.cpgs = int(line[6])
-        cpg_island.gcs = line[7]
-        cpg_island.percent_cpg = float(line[8])
-        cpg_island.percent_gc = float(line[9])
-        cpg_island.obsexp_ratio = float(line[10])
-        cpg_island.region_id = region.uid
-        cpg_island.source_id = source.uid
-        ParseUtils.upsert_cpg_island(session, cpg_island)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
-
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
-    session.close()
-    engine.dispose()
-
 #-------------#
 # Main        #
 #-------------#
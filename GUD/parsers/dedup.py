@@ -0,0 +1,218 @@
+"""
+In-memory deduplication (i.e. unique constraint keys) for the parsers
+"""
+
+from collections import OrderedDict
+from hashlib import blake2b
+import numpy as np
+from sqlalchemy import UniqueConstraint, select
+
+# Import from GUD module
+from GUD.ORM.region import Region
+
+# Rows per fetch when preloading keys
+FETCH_SIZE = 100000
+# Chromosomes whose keys are kept (i.e. for unsorted rows)
+CHROMS = 4
+
+# Keys of tables without a unique constraint (i.e. as their is_unique)
+KEYS = {
+    "copy_number_variants": ["regionID", "sourceID", "copy_number_change"]
+}
+
+
+def get_unique_columns(table):
+    """
+    Returns the columns of the unique constraint of a table (i.e. empty if
+    none).
+
+    @input:
+    table {Table}
+
+    @return: {list} of {Column}
+    """
+
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            return(list(constraint.columns))
+
+    return([])
+
+
+def get_key_columns(table):
+    """
+    Returns the names of the columns of the key of a table: those of its
+    unique constraint or, if none, those of KEYS (i.e. empty if neither).
+
+    @input:
+    table {Table}
+
+    @return: {list} of {str}
+    """
+
+    columns = [c.key for c in get_unique_columns(table)]
+    if not columns:
+        columns = list(KEYS.get(table.name, []))
+
+    return(columns)
+
+
+def hash_key(key):
+    """
+    Returns a compact 64-bit hash of the key of a row (i.e. {tuple} of
+    values; numpy scalars are hashed as the equivalent Python values).
+    """
+
+    key = tuple(v.item() if isinstance(v, np.generic) else v for v in key)
+
+    return(int.from_bytes(blake2b(repr(key).encode("utf-8"),
+                                  digest_size=8).digest(), "little"))
+
+
+class KeySet(object):
+    """
+    Keeps the keys of the rows of a table seen so far (i.e. its unique
+    constraint, or those of KEYS or given), as 64-bit hashes rather than
+    tuples, so that duplicates are dropped without querying the database
+    (i.e. rather than one is_unique query per row).
+
+    For incremental loads, the keys of the rows already in the table are
+    preloaded in one streamed scan per chromosome (i.e. through regions)
+    and source; the keys of the last CHROMS chromosomes are kept (i.e. a
+    chromosome dropped earlier is preloaded again).
+
+    Collisions (i.e. a new row dropped as a duplicate) are unlikely at the
+    scale of the keys of one chromosome (i.e. p ~ n^2 / 2^65, e.g. 2.7e-6
+    for 1e7 keys).
+
+    e.g.
+    keys = KeySet(TFBinding)
+    keys.preload(session, chrom="1", source_id=source.uid)
+    if keys.add(tf):
+        writer.add(tf)
+    """
+
+    def __init__(self, table, columns=None):
+        """
+        @input:
+        table {DeclarativeMeta} or {Table}
+        columns {list} names of the columns (or ORM attributes) of the key
+                       (default = see get_key_columns)
+        """
+
+        # ORM attribute to column names
+        if hasattr(table, "__table__"):
+            self.table = table.__table__
+            attrs = dict((attr.columns[0].key, attr.key)
+                         for attr in table.__mapper__.column_attrs)
+        else:
+            self.table = table
+            attrs = {}
+
+        if columns is None:
+            columns = get_key_columns(self.table)
+        names = dict((a, c) for c, a in attrs.items())
+        self.columns = [names.get(c, c) for c in columns]
+        self._attrs = [attrs.get(c, c) for c in self.columns]
+        self.chrom = None
+        self._keys = set()
+        self._loaded = set()
+        self._chroms = OrderedDict()
+
+    def __len__(self):
+
+        return(len(self._keys))
+
+    def __contains__(self, row):
+
+        return(self.get_key(row) in self._keys)
+
+    def get_key(self, row):
+        """
+        Returns the hashed key of a row (i.e. ORM object or dict keyed by
+        column or ORM attribute name).
+        """
+
+        if isinstance(row, dict):
+            key = [row.get(c, row.get(a)) for c, a in zip(self.columns, self._attrs)]
+        else:
+            key = [getattr(row, a) for a in self._attrs]
+
+        return(hash_key(key))
+
+    def add(self, row):
+        """
+        Adds the key of a row.
+
+        @return: {bool} whether the row is new (i.e. always, if the table
+                 has no key)
+        """
+
+        if not self.columns:
+            return(True)
+
+        key = self.get_key(row)
+        if key in self._keys:
+            return(False)
+        self._keys.add(key)
+
+        return(True)
+
+    def preload(self, session, chrom=None, source_id=None):
+        """
+        Adds the keys of the rows of the table (i.e. once per chromosome and
+        source).
+
+        @input:
+        session {Session} (i.e. None, nothing is preloaded)
+        chrom {str} rows of regions of this chromosome (default = all)
+        source_id {int} rows of this source (default = all)
+        """
+
+        c = self.table.c
+
+        # i.e. tables without regions are not split by chromosome
+        if "regionID" not in c and "chrom" not in c:
+            chrom = None
+
+        # Keys of another chromosome
+        if chrom != self.chrom:
+            self._set_chrom(chrom)
+
+        # i.e. no database (e.g. staging only)
+        if session is None or not self.columns or \
+           source_id in self._loaded or None in self._loaded:
+            return
+        self._loaded.add(source_id)
+
+        stmt = select([c[k] for k in self.columns])
+        if chrom is not None:
+            if "regionID" in c:
+                regions = Region.__table__
+                stmt = stmt.select_from(self.table.join(regions,
+                    regions.c.uid == c.regionID)).where(regions.c.chrom == chrom)
+            else:
+                stmt = stmt.where(c.chrom == chrom)
+        if source_id is not None and "sourceID" in c:
+            stmt = stmt.where(c.sourceID == source_id)
+
+        result = session.execute(stmt.execution_options(stream_results=True))
+        while True:
+            rows = result.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            self._keys.update(hash_key(row) for row in rows)
+        result.close()
+
+    def _set_chrom(self, chrom):
+
+        # i.e. the last used is the last one
+        if chrom in self._chroms:
+            self._keys, self._loaded = self._chroms.pop(chrom)
+        else:
+            self._keys, self._loaded = set(), set()
+        self._chroms[chrom] = (self._keys, self._loaded)
+        self.chrom = chrom
+
+        while len(self._chroms) > CHROMS:
+            self._chroms.popitem(last=False)
@@ -11,7 +11,6 @@ import pickle
 import re
 import requests
 import shutil
-import subprocess
 import sys
 import warnings
 # Python 3+
@@ -31,6 +30,15 @@ from GUD.ORM.sample import Sample
 from GUD.ORM.source import Source
 from GUD.ORM.tf_binding import TFBinding
 from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.checkpoint import Checkpoint
+from GUD.parsers.dedup import hash_key
+from GUD.parsers.load_data import DataLoader
+from GUD.parsers.merge import (merge_lines, read_bed_file,
+                               remove_partial_files, sort_bed_file)
+from GUD.parsers.pipeline import COMMIT, parse_records, run_pipeline
+from GUD.parsers.resolver import RegionResolver
+from GUD.parsers.sync import Diff, delete_rows, get_digest
 
 usage_msg = """
 usage: %s --genome STR --samples FILE --feature STR
@@ -39,7 +47,8 @@ usage: %s --genome STR --samples FILE --feature STR
 
 help_msg = """%s
 inserts features from ENCODE (Encyclopedia of DNA Elements)
-into GUD.
+into GUD. Interrupted runs resume from their checkpoints (i.e.
+in the dummy directory).
 
   --genome STR        genome assembly
   --samples FILE      ENCODE samples (manually-curated)
@@ -50,9 +59,19 @@ optional arguments:
   -h, --help          show this help message and exit
   --dummy-dir DIR     dummy directory (default = "/tmp/")
   -r, --remove        remove downloaded files (default = False)
+  --load-data         stage the data in files and load them
+                      with "LOAD DATA LOCAL INFILE" (requires
+                      "local_infile"; default = False)
+  --producers INT     number of processes parsing the data
+                      (default = 1)
+  --sync              update the feature incrementally (i.e.
+                      insert, update and delete only the
+                      experiments that changed since the
+                      loaded release; default = False)
   -t, --test          limit the total of inserts to ~1K per
                       thread for testing (default = False)
-  --threads INT       number of threads to use (default = %s)
+  --threads INT       number of threads to use (i.e. to insert
+                      the data; default = %s)
 
 mysql arguments:
   -d STR, --db STR    database name (default = "%s")
@@ -177,7 +196,10 @@ def parse_args():
     optional_group = parser.add_argument_group("optional arguments")
     optional_group.add_argument("-h", "--help", action="store_true")
     optional_group.add_argument("--dummy-dir", default="/tmp/")
+    optional_group.add_argument("--load-data", action="store_true")
     optional_group.add_argument("-r", "--remove", action="store_true")
+    optional_group.add_argument("--producers", default=1)
+    optional_group.add_argument("--sync", action="store_true")
     optional_group.add_argument("-t", "--test", action="store_true")
     optional_group.add_argument("--threads", default=(cpu_count() - 1))
     
@@ -226,6 +248,14 @@ def check_args(args):
         print(": ".join(error))
         exit(0)
 
+    # Check "--producers" argument
+    try:
+        args.producers = int(args.producers)
+    except:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--producers\"", "invalid int value", "\"%s\"\n" % args.producers]
+        print(": ".join(error))
+        exit(0)
+
     # Check MySQL password
     if not args.pwd:
         args.pwd = ""
@@ -251,9 +281,9 @@ def main():
     GUDUtils.db = args.db
 
     # Insert ENCODE data
-    encode_to_gud(args.genome, args.samples, args.feature, args.dummy_dir, args.remove, args.test, args.threads)
+    encode_to_gud(args.genome, args.samples, args.feature, args.dummy_dir, args.remove, args.test, args.threads, args.load_data, args.producers, args.sync)
 
-def encode_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=False, test=False, threads=1):
+def encode_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=False, test=False, threads=1, load_data=False, producers=1, sync=False):
     """
     e.g. python -m GUD.parsers.encode2gud --genome hg38 --samples ./samples/ENCODE.tsv --feature accessibility
     """
@@ -278,6 +308,15 @@ def encode_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=Fal
     if not os.path.isdir(dummy_dir):
         os.makedirs(dummy_dir)
 
+    # Get checkpoint (i.e. not when testing)
+    checkpoint = None
+    if not test:
+        checkpoint = Checkpoint(os.path.join(dummy_dir, "checkpoints"))
+
+        # Remove files left incomplete (i.e. resume only from completed
+        # downloads)
+        remove_partial_files(dummy_dir)
+
     # Download metadata
     metadata_file = _download_metadata(genome, feat_type, dummy_dir)
 
@@ -344,21 +383,27 @@ def encode_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=Fal
     # Group ENCODE accessions by experiment target and type
     grouped_accessions = _group_ENCODE_accessions(_filter_ENCODE_accessions(feat_type))
 
+    # Update only what changed since the loaded release
+    if sync:
+        grouped_accessions, sync_key = _sync_accessions(grouped_accessions, feat_type, checkpoint)
+
+    # Features of all groups are loaded at once (i.e. in genomic order)
+    loader = None
+    loaded = []
+
     # For each experiment target/type...
     for experiment_target, experiment_type in sorted(grouped_accessions):
 
-        # Beware, for this should not be possible!
-        if experiment_target is not None:
-            if feat_type != "histone" and feat_type != "tf":
-                continue
-        else:
-            if feat_type == "histone" or feat_type == "tf":
-                continue
-
         # Skip if non-valid target
-        if feat_type == "tf":
-            if experiment_target not in genes:
-                continue
+        if not _is_valid_group(experiment_target, feat_type):
+            continue
+
+        # Skip if completed (i.e. resume)
+        key = "%s.%s" % (experiment_type, experiment_target)
+        if sync:
+            key = "%s.%s" % (sync_key, key)
+        if checkpoint is not None and checkpoint.is_done(key):
+            continue
 
         # Start a new session
         session = Session()
@@ -377,19 +422,50 @@ def encode_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=Fal
         subgrouped_accessions = grouped_accessions[(experiment_target, experiment_type)]
         data_file = _preprocess_data(subgrouped_accessions, dummy_dir, test, threads)
 
-        # Split data
-        data_files = _split_data(data_file, threads)
-        
         # Insert samples/sources
         _insert_samples_and_sources(subgrouped_accessions)
 
-        # Parallelize inserts to the database
-        ParseUtils.insert_data_files_in_parallel(data_files, partial(_insert_data_file, test=test), threads)
+        # Testing
+        if test:
+            limit = 1000 * threads
+        else:
+            limit = None
+
+        # Stage data
+        if load_data:
+            if loader is None:
+                loader = DataLoader(Session(), Feature, dummy_dir)
+            records = parse_records(data_file, _parse_line, limit)
+            _insert_records(records, loader=loader)
+            loaded.append(key)
+
+        else:
+
+            # Stream data into the database
+            run_pipeline(data_file, _parse_line, _insert_records, producers, threads, limit=limit, checkpoint=checkpoint, key=key, metrics_dir=os.path.join(dummy_dir, "metrics"))
+
+            # Checkpoint
+            if checkpoint is not None:
+                checkpoint.done(key)
 
         # Testing
         if test:
             break
 
+    # Load data into the database
+    if loader is not None:
+        loader.resolver.close()
+        loader.close()
+
+        # Checkpoint
+        if checkpoint is not None:
+            for key in loaded:
+                checkpoint.done(key)
+
+        # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+        loader.session.close()
+        engine.dispose()
+
     # Remove files
     if remove:
         shutil.rmtree(dummy_dir)
@@ -397,6 +473,104 @@ def encode_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=Fal
     # Dispose session
     Session.remove()
 
+def _is_valid_group(experiment_target, feat_type):
+
+    # Beware, for this should not be possible!
+    if experiment_target is not None:
+        if feat_type != "histone" and feat_type != "tf":
+            return(False)
+    else:
+        if feat_type == "histone" or feat_type == "tf":
+            return(False)
+
+    # Skip if non-valid target
+    if feat_type == "tf":
+        if experiment_target not in genes:
+            return(False)
+
+    return(True)
+
+def _sync_accessions(grouped_accessions, feat_type, checkpoint=None):
+    """
+    Diffs the release against the loaded experiments of the feature (i.e.
+    by accession; an experiment is updated if its download URL changed),
+    reports the diff and deletes the features of the experiments no longer
+    in the release or updated (i.e. reinserted). Returns the groups of new
+    or updated accessions and the key of the release (i.e. checkpoints).
+
+    The diff is recorded in the checkpoint, so that an interrupted update
+    resumes with the same diff.
+    """
+
+    # Initialize
+    release = {}
+
+    # Get released experiments
+    for experiment_target, experiment_type in grouped_accessions:
+        if not _is_valid_group(experiment_target, feat_type):
+            continue
+        for accession in grouped_accessions[(experiment_target, experiment_type)]:
+            release[accession] = get_digest([encodes[accession].download_url])
+    key = "sync.%x" % hash_key(sorted(release.items()))
+
+    # Get the diff (i.e. unless recorded)
+    changed = None
+    if checkpoint is not None:
+        changed = checkpoint.get(key)
+
+    if changed is None:
+
+        # Start a new session
+        session = Session()
+
+        # Get loaded experiments
+        loaded, uids = _get_loaded_accessions(session)
+        diff = Diff(loaded, release)
+        print("%s: %s" % (Feature.__tablename__, diff))
+
+        # Delete features
+        delete_rows(session, Feature.__table__, "sourceID",
+                    [uids[a] for a in diff.deletes + diff.updates])
+
+        # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+        session.close()
+        engine.dispose()
+
+        changed = sorted(diff.get_changed())
+        if checkpoint is not None:
+            checkpoint.set(key, changed)
+
+    # Keep new/updated accessions
+    changed = set(changed)
+    groups = {}
+    for group, accessions in grouped_accessions.items():
+        accessions = [a for a in accessions if a in changed]
+        if accessions:
+            groups[group] = accessions
+
+    return(groups, key)
+
+def _get_loaded_accessions(session):
+    """
+    Returns the digests and source uids of the experiments with features
+    keyed by accession.
+    """
+
+    # Initialize
+    digests = {}
+    uids = {}
+
+    q = session.query(Source.uid, Source.source_metadata, Source.url)\
+        .filter(Source.name == "ENCODE",
+                Source.uid.in_(session.query(Feature.source_id).distinct()))
+
+    for uid, source_metadata, url in q:
+        accession = source_metadata.split(",")[0]
+        digests[accession] = get_digest([url])
+        uids[accession] = uid
+
+    return(digests, uids)
+
 def _download_metadata(genome, feat_type, dummy_dir="/tmp/"):
 
     # Initialize
@@ -654,92 +828,46 @@ def _group_ENCODE_accessions(accessions):
 def _preprocess_data(accessions, dummy_dir="/tmp/", test=False, threads=1):
 
     # Initialize
-    dummy_files = []
+    bed_files = []
     encode_objects = set()
 
-    # Get label
-    accession = next(iter(accessions))
-    encode = encodes[accession]
-    label = encode.experiment_type
-    if encode.experiment_target is not None:
-        label += ".%s" % encode.experiment_target
-
-    # Skip if BED file exists
-    bed_file = os.path.join(dummy_dir, "%s.bed" % label)
-    if not os.path.exists(bed_file):
-
-        # Skip if BED file exists
-        dummy_file = os.path.join(dummy_dir, "dummy.bed")
-        if not os.path.exists(dummy_file):
-
-            # For each accession...
-            for accession in accessions:
-                encode_objects.add(encodes[accession])
-
-            # Get ENCODE BED files
-            pool = Pool(processes=threads)
-            for download_file in pool.imap(partial(_download_ENCODE_bed_file, dummy_dir=dummy_dir, test=test), encode_objects):
-
-                # Initialize
-                m = re.search("\/(\w+).(bam|bed.gz)$", download_file)
-                accession = m.group(1)
-
-                # Concatenate
-                cmd = "zless %s | awk '{print $1\"\t\"$2\"\t\"$3\"\t%s\t\"$7\"\t\"$10}' >> %s" % (download_file, accession, dummy_file)
-                subprocess.call(cmd, shell=True)
-
-                # Remove downloaded file
-                os.remove(download_file)
-
-            pool.close()
-
-        # Add dummy file
-        dummy_files.append(dummy_file)
-
-        # Sort BED
-        dummy_file = os.path.join(dummy_dir, "dummy.sorted.bed")
-        if not os.path.exists(dummy_file):
-
-            # UNIX parallel sort is more efficient than bedtools
-            cmd = "LC_ALL=C sort --parallel=%s -T %s -k1,1 -k2,2n %s > %s" % (str(threads), dummy_dir, dummy_files[0], dummy_file)
-            subprocess.call(cmd, shell=True)
-
-        # Add dummy file
-        dummy_files.append(dummy_file)
-
-        # Copy file
-        shutil.copy(dummy_files[1], bed_file)
+    # For each accession...
+    for accession in accessions:
+        encode_objects.add(encodes[accession])
 
-        # Remove ALL dummy files
-        for dummy_file in dummy_files:
-            os.remove(dummy_file)
+    # Get ENCODE BED files (i.e. sorted)
+    pool = Pool(processes=threads)
+    for download_file in pool.imap(partial(_download_ENCODE_bed_file, dummy_dir=dummy_dir, test=test), encode_objects):
+        bed_files.append(download_file)
+    pool.close()
 
-    return(bed_file)
+    return(_merge_data(bed_files, dummy_dir))
 
-def _split_data(data_file, threads=1):
+def _merge_data(bed_files, dummy_dir="/tmp/"):
+    """
+    Streams the lines of the BED files sorted by chromosome and start
+    (i.e. a k-way merge, rather than concatenating and sorting them).
+    """
 
     # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
+    iterables = []
 
-    # Get number of lines
-    output = subprocess.check_output(["wc -l %s" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
+    # For each BED file...
+    for bed_file in bed_files:
 
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "split -d -l %s %s %s" % (int(L/threads)+1, data_file, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
+        # Initialize
+        m = re.search("\/(\w+).(bam|bed.gz)$", bed_file)
+        accession = m.group(1)
 
-    # For each split file...
-    for split_file in os.listdir(split_dir):
+        # i.e. chrom, start, end, accession, score and peak
+        iterables.append(read_bed_file(bed_file, [0, 1, 2, 6, 9], accession))
 
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
+    for line in merge_lines(iterables, dummy_dir):
+        yield(line)
 
-    return(split_files)
+    # Remove downloaded files (i.e. kept if interrupted, to resume)
+    for bed_file in bed_files:
+        os.remove(bed_file)
 
 def _download_ENCODE_bed_file(encode, dummy_dir="/tmp/", test=False):
 
@@ -782,7 +910,12 @@ def _download_ENCODE_bed_file(encode, dummy_dir="/tmp/", test=False):
     # Download BED file
     download_file += ".bed.gz"
     if not os.path.exists(download_file):
-        urlretrieve(encode.download_url, download_file)
+        part_file = "%s.part.bed.gz" % download_file[:-7]
+        urlretrieve(encode.download_url, part_file)
+
+        # Sort BED file (i.e. unless already sorted); the download file
+        # only exists once downloaded and sorted
+        sort_bed_file(part_file, download_file)
 
     return(download_file)
 
@@ -822,38 +955,51 @@ def _insert_samples_and_sources(accessions):
     session.close()
     engine.dispose()
 
-def _insert_data_file(data_file, test=False):
+def _parse_line(line):
+    """
+    Returns a record (i.e. chrom, start, end, accession, score and peak)
+    or None.
+    """
+
+    chrom = str(line[0])
+    if chrom.startswith("chr"):
+        chrom = chrom[3:]
+    if chrom not in chroms:
+        return(None)
+
+    return((chrom, int(line[1]), int(line[2]), line[3], float(line[4]),
+            int(line[5])))
+
+def _insert_records(records, loader=None):
 
     # Initialize
     session = Session()
+    if loader is not None:
+        writer = loader
+        resolver = loader.resolver
+    else:
+        writer = BulkWriter(session, Feature, dedup=True)
+        resolver = RegionResolver(session, writer)
     accession2sample = {}
     accession2source = {}
 
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
+    # For each record...
+    for record in records:
 
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
+        # Checkpoint (i.e. everything so far must be committed)
+        if record is COMMIT:
+            resolver.flush()
+            writer.flush()
+            continue
 
-        # Initialize
-        accession = line[3]
+        chrom, start, end, accession, score, peak = record
 
         # Upsert region
         region = Region()
-        region.chrom = str(line[0])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[1])
-        region.end = int(line[2])
+        region.chrom = chrom
+        region.start = start
+        region.end = end
         region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
 
         # Get sample
         if accession not in accession2sample:
@@ -887,27 +1033,22 @@ def _insert_data_file(data_file, test=False):
 
         # Upsert feature
         feature = Feature()
-        feature.region_id = region.uid
         feature.sample_id = sample.uid
         feature.experiment_id = experiment.uid
         feature.source_id = source.uid
-        feature.score = float(line[4])
-        feature.peak = int(line[5])
-        if Feature.__tablename__ == "dna_accessibility":
-            ParseUtils.upsert_accessibility(session, feature)
-        else:
-            if Feature.__tablename__ == "histone_modifications":
-                feature.histone_type = encodes[accession].experiment_target
-                ParseUtils.upsert_histone(session, feature)
-            else:
-                feature.tf = encodes[accession].experiment_target
-                ParseUtils.upsert_tf(session, feature)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
+        feature.score = score
+        feature.peak = peak
+        if Feature.__tablename__ == "histone_modifications":
+            feature.histone_type = encodes[accession].experiment_target
+        elif Feature.__tablename__ == "tf_binding":
+            feature.tf = encodes[accession].experiment_target
+        resolver.add(region, feature)
+
+    # Insert remaining features (i.e. the loader is closed once all the
+    # data is staged)
+    if loader is None:
+        resolver.close()
+        writer.close()
 
     # This is ABSOLUTELY necessary to prevent MySQL from crashing!
     session.close()
@@ -1,14 +1,14 @@
 #!/usr/bin/env python
 
 import argparse
-from binning import assign_bin
 from functools import partial
 import getpass
 from multiprocessing import Pool, cpu_count
+import numpy as np
 import os
+import pandas
 import re
 import shutil
-import subprocess
 import sys
 import warnings
 
@@ -16,11 +16,15 @@ import warnings
 from GUD import GUDUtils
 from GUD.ORM.enhancer import Enhancer
 from GUD.ORM.experiment import Experiment
-from GUD.ORM.region import Region
 from GUD.ORM.sample import Sample
 from GUD.ORM.source import Source
 from GUD.ORM.tss import TSS
 from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.liftover import ChainIndex, lift_columns
+from GUD.parsers.merge import sort_lines
+from GUD.parsers.partition import split_data
+from GUD.parsers.resolver import RegionResolver
 
 usage_msg = """
 usage: %s --genome STR --samples FILE --feature STR [-h] [options]
@@ -51,6 +55,9 @@ mysql arguments:
   -u STR, --user STR  user name (default = current user)
 """ % (usage_msg, (cpu_count() - 1), GUDUtils.db, GUDUtils.port)
 
+# Peaks per chunk of the matrix of samples
+CHUNK_SIZE = 10000
+
 #-------------#
 # Functions   #
 #-------------#
@@ -245,7 +252,7 @@ def fantom_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=Fal
     bed_file, idx = _preprocess_data(data_files, feat_type, dummy_dir, test, threads)
 
     # Split data
-    data_files = _split_data(bed_file, threads)
+    data_files = split_data(bed_file, threads)
 
     # Parallelize inserts to the database
     ParseUtils.insert_data_files_in_parallel(data_files, partial(_insert_data, test=test), threads)
@@ -361,7 +368,6 @@ def _preprocess_data(data_files, feat_type, dummy_dir="/tmp/", test=False, threa
 
     # Initialize
     coords = {}
-    dummy_files = []
     if feat_type == "enhancer":
         start_idx = 1
     else:
@@ -369,23 +375,23 @@ def _preprocess_data(data_files, feat_type, dummy_dir="/tmp/", test=False, threa
 
     # If chains file...
     if data_files[-1] is not None:
-        from pyliftover import LiftOver
-        lo = LiftOver(data_files[-1])
+        index = ChainIndex(data_files[-1])
 
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_files[1]):
-        chrom, start, end = line[:3]
+    # For each chunk...
+    columns = {0: "chrom", 1: "start", 2: "end", 3: "name", 5: "strand"}
+    for chunk in ParseUtils.parse_bed_file(data_files[1], columns):
+
+        # LiftOver (i.e. the whole chunk at once)
         if data_files[-1] is not None:
-            try:
-                l = lo.convert_coordinate(chrom, start) # i.e. already 0-based
-                start = l[0][1]
-                l = lo.convert_coordinate(chrom, end - 1)  # i.e. requires 0-based
-                end = l[0][1] + 1
-            except:
-                msg = "position could not be found in new assembly"
-                warnings.warn("%s: %s:%s-%s" % (msg, chrom, start, end), Warning, stacklevel=2)
-                continue
-        coords.setdefault(line[3], [chrom, start, end, line[5]])
+            chunk, unmapped = lift_columns(index, chunk)
+            if unmapped:
+                msg = "positions could not be found in new assembly"
+                warnings.warn("%s: %s" % (msg, unmapped), Warning, stacklevel=2)
+
+        for chrom, start, end, name, strand in zip(chunk["chrom"].tolist(),
+            chunk["start"].tolist(), chunk["end"].tolist(),
+            chunk["name"].tolist(), chunk["strand"].tolist()):
+            coords.setdefault(name, [chrom, start, end, strand])
 
     # Enhancer file is weird: rows have different number of cols;
     # Read as a normal file and split by tabs
@@ -403,162 +409,186 @@ def _preprocess_data(data_files, feat_type, dummy_dir="/tmp/", test=False, threa
     bed_file = os.path.join(dummy_dir, "CAGE.%s.bed" % feat_type)
     if not os.path.exists(bed_file):
 
-        # Skip if BED file exists
-        dummy_file = os.path.join(dummy_dir, "dummy.bed")
-        if not os.path.exists(dummy_file):
+        # Sort BED (i.e. external merge sort; no intermediate BED files)
+        dummy_file = os.path.join(dummy_dir, "dummy.CAGE.%s.bed" % feat_type)
+        with open(dummy_file, "w") as handle:
+            for txt in sort_lines(_get_lines(data_files[0], coords, feat_type, start_idx), dummy_dir):
+                handle.write("%s\n" % txt)
+        os.rename(dummy_file, bed_file)
 
-            # Enhancer file is weird: rows have different number of cols;
-            # Read as a normal file and split by tabs
-            for line in ParseUtils.parse_file(data_files[0]):
+    return(bed_file, idx)
 
-                line = line.split("\t")
+def _get_lines(data_file, coords, feat_type, start_idx):
 
-                if line[0] not in coords:
-                    continue
+    # Enhancer file is weird: rows have different number of cols;
+    # Read as a normal file and split by tabs
+    for line in ParseUtils.parse_file(data_file):
 
-                else:
-                    if feat_type == "enhancer":
-                        txt = "\t".join(map(str, coords[line[0]]+line[start_idx:]))
-                    else:
-                        txt = "\t".join(map(str, coords[line[0]]+[line[1]]+line[start_idx:]))
-                    ParseUtils.write(dummy_file, txt)
+        line = line.split("\t")
 
-        # Add dummy file
-        dummy_files.append(dummy_file)
+        if line[0] not in coords:
+            continue
 
-        # Sort BED
-        dummy_file = os.path.join(dummy_dir, "dummy.sorted.bed")
-        if not os.path.exists(dummy_file):
+        else:
+            if feat_type == "enhancer":
+                txt = "\t".join(map(str, coords[line[0]]+line[start_idx:]))
+            else:
+                txt = "\t".join(map(str, coords[line[0]]+[line[1]]+line[start_idx:]))
+            yield(txt)
 
-            # UNIX parallel sort is more efficient than bedtools
-            cmd = "LC_ALL=C sort --parallel=%s -T %s -k1,1 -k2,2n %s > %s" % (str(threads), dummy_dir, dummy_files[0], dummy_file)
-            subprocess.call(cmd, shell=True)
+def _insert_data(data_file, test=False):
 
-        # Add dummy file
-        dummy_files.append(dummy_file)
+    # Initialize
+    session = Session()
+    # i.e. INSERT IGNORE would re-insert TSSs without gene (i.e. NULLs are
+    # distinct in the unique constraint)
+    writer = BulkWriter(session, Feature, dedup=True)
+    if Feature.__tablename__ == "transcription_start_sites":
+        columns = {0: "chrom", 1: "start", 2: "end", 3: "strand", 4: "name"}
+        writer2 = BulkWriter(session, Feature2)
+    else:
+        columns = {0: "chrom", 1: "start", 2: "end", 3: "strand"}
+    resolver = RegionResolver(session, writer)
 
-        # Copy file
-        shutil.copy(dummy_files[1], bed_file)
+    # Testing
+    if test:
+        print(current_process().name)
 
-        # Remove ALL dummy files
-        for dummy_file in dummy_files:
-            os.remove(dummy_file)
+    # Samples to insert (i.e. columns of the matrix)
+    keep = [i for i in range(len(idx)) if idx[i] in samples]
+    sample_ids = np.array([samples[idx[i]].uid for i in keep], dtype=np.int64)
 
-    return(bed_file, idx)
+    # For each chunk...
+    for chunk in _parse_matrix(data_file, columns, keep, test):
 
-def _split_data(data_file, threads=1):
+        if Feature.__tablename__ == "transcription_start_sites":
+            _insert_tss(session, resolver, writer, writer2, chunk, sample_ids)
+        else:
+            _insert_enhancers(resolver, chunk, sample_ids)
 
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
+    # Insert remaining features
+    resolver.close()
+    writer.close()
+    if Feature.__tablename__ == "transcription_start_sites":
+        writer2.close()
 
-    # Get number of lines
-    output = subprocess.check_output(["wc -l %s" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
+    # i.e. connections are reused by the next file of the worker and
+    # closed when it exits (see ParseUtils.insert_data_files_in_parallel)
+    session.close()
 
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "split -d -l %s %s %s" % (int(L/threads)+1, data_file, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
+def _parse_matrix(data_file, columns, keep, test=False):
+    """
+    Yields chunks of a BED-like file of CAGE peaks (i.e. coordinates) and
+    their values across samples: only the columns of the samples to keep
+    are read, as a {numpy.ndarray} (i.e. "matrix"; one row per peak).
+    """
 
-    # For each split file...
-    for split_file in os.listdir(split_dir):
+    # Initialize
+    offset = len(columns)
+    usecols = sorted(columns) + [offset + i for i in keep]
+    dtypes = dict((i, str) for i in columns if columns[i] in ("chrom", "strand", "name"))
+    if test:
+        nrows = 1000
+    else:
+        nrows = None
 
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
+    for chunk in pandas.read_csv(data_file, sep="\t", header=None,
+                                 usecols=usecols, dtype=dtypes,
+                                 chunksize=CHUNK_SIZE, nrows=nrows,
+                                 engine="c"):
+        matrix = chunk[usecols[offset:]].to_numpy(dtype=np.float64)
+        chunk = dict((columns[i], chunk[i].to_numpy()) for i in columns)
+        chunk["matrix"] = matrix
 
-    return(split_files)
+        yield(ParseUtils.filter_chroms(chunk, chroms))
 
-def _insert_data(data_file, test=False):
+def _insert_enhancers(resolver, chunk, sample_ids):
 
     # Initialize
-    session = Session()
+    chrom = chunk["chrom"].tolist()
+    start = chunk["start"].tolist()
+    end = chunk["end"].tolist()
 
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
+    # i.e. one feature per peak and sample with counts
+    rows, cols = np.nonzero(chunk["matrix"] > 0)
+    for r, sample_id in zip(rows.tolist(), sample_ids[cols].tolist()):
+        feature = {"experiment_id": experiment.uid, "source_id": source.uid,
+                   "sample_id": sample_id}
+        resolver.add_coords(chrom[r], start[r], end[r], feature)
 
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
+def _insert_tss(session, resolver, writer, writer2, chunk, sample_ids):
 
-        # Skip empty lines
-        if not line:
-            continue
+    # Initialize
+    features = []
+    chrom = chunk["chrom"].tolist()
+    start = chunk["start"].tolist()
+    end = chunk["end"].tolist()
+    strand = chunk["strand"].tolist()
+    matrix = np.round(chunk["matrix"], 3)
+
+    # Get TSSs and genes (e.g. "p1@TP53")
+    names = pandas.Series(chunk["name"], dtype=object).str.extract(r"p(\d+)@(\w+)")
+    tsss = names[0].tolist()
+    symbols = names[1].tolist()
+
+    # Nonzero expression levels of each TSS (i.e. rows are sorted)
+    rows, cols = np.nonzero(chunk["matrix"] > 0)
+    bounds = np.searchsorted(rows, np.arange(len(matrix) + 1)).tolist()
+
+    for r in range(len(matrix)):
+
+        feature = {"experiment_id": experiment.uid, "source_id": source.uid,
+                   "strand": strand[r], "tss": None, "gene": None}
+        if not isinstance(symbols[r], str):
+            feature["tss"] = 1
+        elif symbols[r] in genes:
+            feature["tss"] = int(tsss[r])
+            feature["gene"] = symbols[r]
+        c = cols[bounds[r]:bounds[r + 1]]
+        ids = sample_ids[c].tolist()
+        levels = matrix[r, c].tolist()
+        sample_id = "%s," % ",".join(map(str, ids))
+        feature["sample_id"] = sample_id.encode(encoding="UTF-8")
+        expression_level = "%s," % ",".join(map(str, levels))
+        feature["expression_level"] = expression_level.encode(encoding="UTF-8")
+        features.append((feature, ids, levels))
+        resolver.add_coords(chrom[r], start[r], end[r], feature)
+
+    # Insert TSSs (i.e. expression requires their uids)
+    resolver.flush()
+    writer.flush()
+    uids = _get_tss_uids(session, [f[0]["region_id"] for f in features if f[0]["gene"]])
+
+    # Insert expression
+    for feature, ids, levels in features:
+        if feature["gene"]:
+            uid = uids[(feature["region_id"], feature["gene"], feature["tss"],
+                        feature["strand"])]
+            for sample_id, expression_level in zip(ids, levels):
+                writer2.add({"tss_id": uid, "sample_id": sample_id,
+                             "expression_level": expression_level})
+
+def _get_tss_uids(session, region_ids):
+    """
+    Returns the uids of the TSSs of the given regions keyed by region uid,
+    gene, TSS and strand.
+    """
 
-        # Upsert region
-        region = Region()
-        region.chrom = str(line.pop(0))
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line.pop(0))
-        region.end = int(line.pop(0))
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
+    # Initialize
+    uids = {}
 
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
+    if not region_ids:
+        return(uids)
 
-        # Upsert/get feature
-        if Feature.__tablename__ == "transcription_start_sites":
-            sample_ids = []
-            expression_levels = []
-            feature = Feature()
-            feature.region_id = region.uid
-            feature.experiment_id = experiment.uid
-            feature.source_id = source.uid
-            feature.strand = line.pop(0)
-            try:
-                m = re.search("p(\d+)@(\w+)", line.pop(0))
-                if m.group(2) in genes:
-                    feature.tss = int(m.group(1))
-                    feature.gene = m.group(2)
-            except:
-                feature.tss = 1
-                feature.gene = None
-            for i in range(len(idx)):
-                if float(line[i]) > 0 and idx[i] in samples:
-                    sample_ids.append(samples[idx[i]].uid)
-                    expression_levels.append(float("{:.3f}".format(line[i])))
-            sample_id = "%s," % ",".join(map(str, sample_ids))
-            feature.sample_id = sample_id.encode(encoding="UTF-8")
-            expression_level = "%s," % ",".join(map(str, expression_levels))
-            feature.expression_level = expression_level.encode(encoding="UTF-8")
-            ParseUtils.upsert_tss(session, feature)
-            feature = ParseUtils.get_tss(session, feature.region_id, feature.experiment_id,
-                                         feature.source_id, feature.gene, feature.tss)
-            # Upsert feature2
-            if feature.gene:
-                for i in range(len(sample_ids)):
-                    feature2 = Feature2()
-                    feature2.expression_level = expression_levels[i]
-                    feature2.tss_id = feature.uid
-                    feature2.sample_id = sample_ids[i]
-                    ParseUtils.upsert_expression(session, feature2)
-        else:
-            strand = line.pop(0)
-            for i in range(len(idx)):
-                if int(line[i]) > 0 and idx[i] in samples:
-                    feature = Feature()
-                    feature.region_id = region.uid
-                    feature.experiment_id = experiment.uid
-                    feature.source_id = source.uid
-                    feature.sample_id = samples[idx[i]].uid
-                    ParseUtils.upsert_enhancer(session, feature)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
+    q = session.query(Feature.uid, Feature.region_id, Feature.gene,
+                      Feature.tss, Feature.strand)\
+        .filter(Feature.experiment_id == experiment.uid,
+                Feature.source_id == source.uid,
+                Feature.region_id.in_(set(region_ids)))
+    for uid, region_id, gene, tss, strand in q:
+        uids[(region_id, gene, tss, strand)] = uid
 
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
-    session.close()
-    engine.dispose()
+    return(uids)
 
 #-------------#
 # Main        #
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+import argparse
+import getpass
+import os
+from sqlalchemy import inspect, text
+
+# Import from GUD module
+from GUD import GUDUtils
+from GUD.parsers.resolver import KEY_BITS, KEY_CHROMS
+
+usage_msg = """
+usage: %s [-h] [options]
+""" % os.path.basename(__file__)
+
+help_msg = """%s
+converts the region uids of a database into region keys (i.e.
+deterministic 64-bit uids computed from the coordinates), so
+that parsers can compute them without any lookups. Stop all the
+parsers first; if interrupted, it can be run again.
+
+optional arguments:
+  -h, --help          show this help message and exit
+
+mysql arguments:
+  -d STR, --db STR    database name (default = "%s")
+  -H STR, --host STR  host name (default = "localhost")
+  -p STR, --pwd STR   password (default = ignore this option)
+  -P INT, --port INT  port number (default = %s)
+  -u STR, --user STR  user name (default = current user)
+""" % (usage_msg, GUDUtils.db, GUDUtils.port)
+
+# Region key (i.e. see GUD.parsers.resolver.get_region_key)
+region_key = "(FIELD(r.chrom, %s) << %s | r.start << %s | (r.end - r.start))" % \
+    (", ".join("'%s'" % c for c in KEY_CHROMS), 2 * KEY_BITS, KEY_BITS)
+
+#-------------#
+# Functions   #
+#-------------#
+
+def parse_args():
+    """
+    This function parses arguments provided via the command line and returns an {argparse} object.
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+
+    # Optional args
+    optional_group = parser.add_argument_group("optional arguments")
+    optional_group.add_argument("-h", "--help", action="store_true")
+
+    # MySQL args
+    mysql_group = parser.add_argument_group("mysql arguments")
+    mysql_group.add_argument("-d", "--db", default=GUDUtils.db)
+    mysql_group.add_argument("-H", "--host", default="localhost")
+    mysql_group.add_argument("-p", "--pwd")
+    mysql_group.add_argument("-P", "--port", default=GUDUtils.port)
+    mysql_group.add_argument("-u", "--user", default=getpass.getuser())
+
+    args = parser.parse_args()
+
+    check_args(args)
+
+    return(args)
+
+def check_args(args):
+    """
+    This function checks an {argparse} object.
+    """
+
+    # Print help
+    if args.help:
+        print(help_msg)
+        exit(0)
+
+    # Check MySQL password
+    if not args.pwd:
+        args.pwd = ""
+
+    # Check MySQL port
+    try:
+        args.port = int(args.port)
+    except:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"-P\" \"--port\"", "invalid int value", "\"%s\"\n" % args.port]
+        print(": ".join(error))
+        exit(0)
+
+def main():
+
+    # Parse arguments
+    args = parse_args()
+
+    # Set MySQL options
+    GUDUtils.user = args.user
+    GUDUtils.pwd = args.pwd
+    GUDUtils.host = args.host
+    GUDUtils.port = args.port
+    GUDUtils.db = args.db
+
+    # Convert region uids
+    gud_to_region_keys()
+
+def gud_to_region_keys():
+    """
+    e.g. python -m GUD.parsers.gud2regionkeys -d hg38
+    """
+
+    # Get engine/connection (i.e. session variables must persist)
+    engine, Session = GUDUtils.get_engine_session(GUDUtils._get_db_name())
+    conn = engine.connect()
+
+    # Check regions
+    for error in _check_regions(conn):
+        print(": ".join(["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", error]))
+        exit(0)
+
+    # Tables with regions (i.e. "regionID")
+    tables = []
+    for table in sorted(inspect(engine).get_table_names()):
+        columns = dict((c["name"], c) for c in inspect(engine).get_columns(table))
+        if "regionID" in columns:
+            tables.append((table, columns["regionID"]))
+    columns = dict((c["name"], c) for c in inspect(engine).get_columns("regions"))
+
+    # i.e. foreign keys are not checked until all uids have been converted
+    conn.execute("SET foreign_key_checks = 0")
+
+    # Widen uids (i.e. unless widened in a previous run); region keys are
+    # not auto-incremented
+    if "BIGINT" not in str(columns["uid"]["type"]):
+        conn.execute("ALTER TABLE regions MODIFY uid BIGINT UNSIGNED NOT NULL")
+    for table, column in tables:
+        if "BIGINT" not in str(column["type"]):
+            conn.execute("ALTER TABLE `%s` MODIFY regionID BIGINT UNSIGNED NOT NULL" % table)
+
+    # For each chromosome...
+    chroms = [c[0] for c in conn.execute("SELECT DISTINCT chrom FROM regions")]
+    for chrom in sorted(chroms, key=lambda c: KEY_CHROMS.index(c)):
+
+        # Convert features first (i.e. joined by their old region uids)
+        for table, column in tables:
+            conn.execute(text("UPDATE `%s` t JOIN regions r ON t.regionID = r.uid SET t.regionID = %s WHERE r.chrom = :chrom" % (table, region_key)), {"chrom": chrom})
+
+        # Convert regions
+        conn.execute(text("UPDATE regions r SET r.uid = %s WHERE r.chrom = :chrom" % region_key), {"chrom": chrom})
+
+        print("%s\tdone" % chrom)
+
+    conn.execute("SET foreign_key_checks = 1")
+
+    # Features without region (i.e. verify)
+    for table, column in tables:
+        orphans = conn.execute("SELECT COUNT(*) FROM `%s` t LEFT JOIN regions r ON t.regionID = r.uid WHERE r.uid IS NULL" % table).scalar()
+        if orphans:
+            print("%s\t%s features without region" % (table, orphans))
+
+    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+    conn.close()
+    engine.dispose()
+
+def _check_regions(conn):
+    """
+    Returns the errors of regions that cannot be converted into region keys.
+    """
+
+    # Initialize
+    errors = []
+
+    chroms = [c[0] for c in conn.execute("SELECT DISTINCT chrom FROM regions")]
+    for chrom in chroms:
+        if chrom not in KEY_CHROMS:
+            errors.append("invalid chromosome for region keys: \"%s\"\n" % chrom)
+
+    start, length = conn.execute("SELECT MAX(start), MAX(end - start) FROM regions").fetchone()
+    if max(start or 0, length or 0) >= 1 << KEY_BITS:
+        errors.append("region too large for region keys\n")
+
+    return(errors)
+
+#-------------#
+# Main        #
+#-------------#
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+import argparse
+import getpass
+from itertools import islice
+import numpy as np
+import os
+from sqlalchemy import literal
+
+# Import from GUD module
+from GUD import GUDUtils
+from GUD.ORM.conservation import Conservation
+from GUD.ORM.dna_accessibility import DNAAccessibility
+from GUD.ORM.region import Region
+from GUD.ORM.repeat_mask import RepeatMask
+from GUD.ORM.sample import Sample
+from GUD.ORM.source import Source
+from GUD.parsers import ParseUtils
+from GUD.tiles import (TILE_SIZE, TileStore, compute_tiles, get_zoom_levels)
+
+usage_msg = """
+usage: %s --tiles-dir DIR [-h] [options]
+""" % os.path.basename(__file__)
+
+help_msg = """%s
+precomputes multi-resolution summary tiles (i.e. count, coverage
+fraction, mean and max. score at zoom levels doubling from the
+tile size) per table, source and sample. Run it after loading
+the tables with the parsers.
+
+  --tiles-dir DIR     tiles directory (e.g. "GUD/api/static/tiles")
+
+optional arguments:
+  -h, --help          show this help message and exit
+  --tables STR        comma-separated list of tables (default =
+                      "%s")
+  --tile-size INT     tile size at the first zoom level (default
+                      = %s)
+
+mysql arguments:
+  -d STR, --db STR    database name (default = "%s")
+  -H STR, --host STR  host name (default = "localhost")
+  -p STR, --pwd STR   password (default = ignore this option)
+  -P INT, --port INT  port number (default = %s)
+  -u STR, --user STR  user name (default = current user)
+"""
+
+# Tables with tiles
+tables = {
+    "conservation": Conservation,
+    "dna_accessibility": DNAAccessibility,
+    "rmsk": RepeatMask
+}
+
+help_msg = help_msg % (usage_msg, ",".join(sorted(tables)), TILE_SIZE,
+                       GUDUtils.db, GUDUtils.port)
+
+# Rows per chunk
+chunk_size = 100000
+
+#-------------#
+# Functions   #
+#-------------#
+
+def parse_args():
+    """
+    This function parses arguments provided via the command line and returns an {argparse} object.
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+
+    # Mandatory args
+    parser.add_argument("--tiles-dir")
+
+    # Optional args
+    optional_group = parser.add_argument_group("optional arguments")
+    optional_group.add_argument("-h", "--help", action="store_true")
+    optional_group.add_argument("--tables", default=",".join(sorted(tables)))
+    optional_group.add_argument("--tile-size", default=TILE_SIZE)
+
+    # MySQL args
+    mysql_group = parser.add_argument_group("mysql arguments")
+    mysql_group.add_argument("-d", "--db", default=GUDUtils.db)
+    mysql_group.add_argument("-H", "--host", default="localhost")
+    mysql_group.add_argument("-p", "--pwd")
+    mysql_group.add_argument("-P", "--port", default=GUDUtils.port)
+    mysql_group.add_argument("-u", "--user", default=getpass.getuser())
+
+    args = parser.parse_args()
+
+    check_args(args)
+
+    return(args)
+
+def check_args(args):
+    """
+    This function checks an {argparse} object.
+    """
+
+    # Print help
+    if args.help:
+        print(help_msg)
+        exit(0)
+
+    # Check mandatory arguments
+    if not args.tiles_dir:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--tiles-dir\" is required\n"]
+        print(": ".join(error))
+        exit(0)
+
+    # Check for invalid tables
+    args.tables = args.tables.split(",")
+    for table in args.tables:
+        if table not in tables:
+            error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--tables\"", "invalid choice", "\"%s\" (choose from" % table, "%s)\n" % " ".join(["\"%s\"" % i for i in sorted(tables)])]
+            print(": ".join(error))
+            exit(0)
+
+    # Check "--tile-size" argument
+    try:
+        args.tile_size = int(args.tile_size)
+    except:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--tile-size\"", "invalid int value", "\"%s\"\n" % args.tile_size]
+        print(": ".join(error))
+        exit(0)
+
+    # Check MySQL password
+    if not args.pwd:
+        args.pwd = ""
+
+    # Check MySQL port
+    try:
+        args.port = int(args.port)
+    except:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"-P\" \"--port\"", "invalid int value", "\"%s\"\n" % args.port]
+        print(": ".join(error))
+        exit(0)
+
+def main():
+
+    # Parse arguments
+    args = parse_args()
+
+    # Set MySQL options
+    GUDUtils.user = args.user
+    GUDUtils.pwd = args.pwd
+    GUDUtils.host = args.host
+    GUDUtils.port = args.port
+    GUDUtils.db = args.db
+
+    # Precompute tiles
+    gud_to_tiles(args.tiles_dir, args.tables, args.tile_size)
+
+def gud_to_tiles(tiles_dir, table_names, tile_size=TILE_SIZE):
+    """
+    e.g. python -m GUD.parsers.gud2tiles --tiles-dir GUD/api/static/tiles -d hg38
+    """
+
+    # Initialize
+    store = TileStore(tiles_dir)
+
+    # Get engine/session
+    engine, Session = GUDUtils.get_engine_session(GUDUtils._get_db_name())
+    session = Session()
+
+    # Get valid chromosomes
+    chroms = ParseUtils.get_chroms(session)
+    zooms = get_zoom_levels(max(chroms.values()), tile_size)
+
+    # For each table...
+    for table_name in table_names:
+
+        # Initialize
+        Feature = tables[table_name]
+        tracks = _get_tracks(session, Feature)
+
+        # For each chromosome...
+        for chrom in sorted(chroms):
+
+            # For each track...
+            features = _get_features(session, Feature, chrom)
+            for track in sorted(features):
+                starts, ends, scores = features[track]
+                levels = compute_tiles(starts, ends, scores, chroms[chrom],
+                                       tile_size, zooms)
+                store.write_tiles(GUDUtils.db, table_name, track, chrom,
+                                  levels)
+
+        # Write index last (i.e. tiles are served once complete)
+        store.write_index(GUDUtils.db, table_name, tile_size, zooms, chroms,
+                          tracks)
+
+    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+    session.close()
+    engine.dispose()
+
+def _get_tracks(session, Feature):
+    """
+    Returns the tracks (i.e. source/sample pairs) of a table.
+    """
+
+    # Initialize
+    tracks = {}
+
+    if hasattr(Feature, "sample_id"):
+        q = session.query(Feature.source_id, Feature.sample_id, Source.name,
+                          Sample.name)\
+            .join(Source, Source.uid == Feature.source_id)\
+            .join(Sample, Sample.uid == Feature.sample_id)
+    else:
+        q = session.query(Feature.source_id, literal(0), Source.name,
+                          literal(None))\
+            .join(Source, Source.uid == Feature.source_id)
+
+    for source_id, sample_id, source_name, sample_name in q.distinct():
+        track = "%s.%s" % (source_id, sample_id)
+        tracks.setdefault(track, {"source": source_name,
+                                  "sample": sample_name})
+
+    return(tracks)
+
+def _get_features(session, Feature, chrom):
+    """
+    Returns the features of a table on a chromosome grouped by track as
+    a {dict} of track: (starts, ends, scores). Rows are streamed in chunks
+    and read column by column into typed arrays (i.e. int64 coordinates
+    and float64 scores, NaN for none).
+    """
+
+    # Initialize
+    chunks = {}
+    features = {}
+
+    if hasattr(Feature, "sample_id"):
+        sample_id = Feature.sample_id
+    else:
+        sample_id = literal(0)
+    q = session.query(Feature.source_id, sample_id, Region.start, Region.end,
+                      Feature.score)\
+        .join(Region, Region.uid == Feature.region_id)\
+        .filter(Region.chrom == chrom)\
+        .execution_options(stream_results=True)\
+        .yield_per(chunk_size)
+
+    # Read in chunks
+    rows = iter(q)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        n = len(chunk)
+        keys = np.fromiter((r[0] << 32 | r[1] for r in chunk), np.int64, n)
+        starts = np.fromiter((r[2] for r in chunk), np.int64, n)
+        ends = np.fromiter((r[3] for r in chunk), np.int64, n)
+        scores = np.fromiter((np.nan if r[4] is None else r[4]
+                              for r in chunk), np.float64, n)
+        # Group by track
+        order = np.argsort(keys, kind="mergesort")
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for group in np.split(order, bounds):
+            key = int(keys[group[0]])
+            chunks.setdefault(key, []).append((starts[group], ends[group],
+                                               scores[group]))
+
+    for key in chunks:
+        track = "%d.%d" % (key >> 32, key & 0xFFFFFFFF)
+        features.setdefault(track, tuple(np.concatenate(c)
+                                         for c in zip(*chunks[key])))
+
+    return(features)
+
+#-------------#
+# Main        #
+#-------------#
+
+if __name__ == "__main__":
+    main()
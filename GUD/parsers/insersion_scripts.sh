@@ -48,4 +48,10 @@ python -m GUD.parsers.cnv2gud --genome hg38 --source_name dbVar --cnv_file \
 
 python -m GUD.parsers.cnv2gud --genome hg38 --source_name dbVar --cnv_file \
 /space/www/GUD_TABLES/Transfer_GRCh38_191007/GRCh38.nr_duplications.GUDformatted.tsv \
--d hg38 -u gud_w 
\ No newline at end of file
+-d hg38 -u gud_w 
+
+###################### tiles ######################
+# run after loading conservation, dna_accessibility and rmsk
+python -m GUD.parsers.gud2tiles --tiles-dir GUD/api/static/tiles -d hg19 -u gud_r
+
+python -m GUD.parsers.gud2tiles --tiles-dir GUD/api/static/tiles -d hg38 -u gud_r
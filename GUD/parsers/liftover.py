@@ -0,0 +1,280 @@
+"""
+Vectorized liftOver (i.e. batches of coordinates at once) for the parsers
+"""
+
+import gzip
+import numpy as np
+import os
+import pandas
+
+# Version of the cached index (i.e. bump if its arrays change)
+INDEX_VERSION = 1
+_arrays = ["source_chroms", "target_chroms", "chrom_offsets", "starts",
+           "ends", "deltas", "targets", "target_sizes", "reverse"]
+
+
+class ChainIndex(object):
+    """
+    Indexes a UCSC chain file (i.e. xxxToYyy.over.chain.gz) into sorted
+    arrays of disjoint source segments, each with the aligned block that
+    maps it, so that whole arrays of positions are converted with a binary
+    search rather than one interval tree query per position.
+
+    Positions covered by several chains are mapped by the highest-scoring
+    one, which is the first conversion returned by pyliftover (i.e. as in
+    lo.convert_coordinate(chrom, pos)[0]).
+
+    The index is cached next to the chain file (i.e. as .npz).
+
+    e.g.
+    index = ChainIndex("hg19ToHg38.over.chain.gz")
+    chroms, starts, ends, mapped = index.lift_regions(chroms, starts, ends)
+    """
+
+    def __init__(self, chains_file, cache=True):
+        """
+        @input:
+        chains_file {str}
+        cache {bool} read/write the cached index (default = True)
+        """
+
+        cache_file = "%s.v%s.npz" % (chains_file, INDEX_VERSION)
+
+        if cache and os.path.exists(cache_file) and \
+           os.path.getmtime(cache_file) >= os.path.getmtime(chains_file):
+            self._load(cache_file)
+        else:
+            self._build(chains_file)
+            if cache:
+                self._save(cache_file)
+
+        self._offsets = dict((c, i) for i, c in enumerate(self.source_chroms))
+
+    def convert_coordinates(self, chroms, positions):
+        """
+        Converts 0-based positions.
+
+        @input:
+        chroms {array-like} of {str} e.g. "chr1"
+        positions {array-like} of {int}
+
+        @return: {numpy.ndarray} of target chromosomes (i.e. None if
+                 unmapped), {numpy.ndarray} of target positions and
+                 {numpy.ndarray} of {bool} (i.e. whether mapped)
+        """
+
+        # Initialize
+        chroms = np.asarray(chroms, dtype=object)
+        positions = np.asarray(positions, dtype=np.int64)
+        target_chroms = np.full(positions.size, None, dtype=object)
+        target_positions = np.zeros(positions.size, dtype=np.int64)
+        mapped = np.zeros(positions.size, dtype=bool)
+        targets = np.array(self.target_chroms, dtype=object)
+
+        # For each source chromosome...
+        codes, uniques = pandas.factorize(chroms)
+        for code, chrom in enumerate(uniques):
+
+            if chrom not in self._offsets:
+                continue
+
+            rows = np.flatnonzero(codes == code)
+            i = self._offsets[chrom]
+            start, end = self.chrom_offsets[i], self.chrom_offsets[i + 1]
+            pos = positions[rows]
+
+            # Segment of each position
+            segment = np.searchsorted(self.starts[start:end], pos,
+                                      side="right") - 1 + start
+            hit = (segment >= start)
+            segment[~hit] = start
+            hit &= pos < self.ends[segment]
+            rows, pos, segment = rows[hit], pos[hit], segment[hit]
+
+            # i.e. reverse strand positions are counted from the end
+            lifted = pos + self.deltas[segment]
+            reverse = self.reverse[segment]
+            lifted[reverse] = self.target_sizes[segment[reverse]] - 1 - \
+                lifted[reverse]
+
+            target_chroms[rows] = targets[self.targets[segment]]
+            target_positions[rows] = lifted
+            mapped[rows] = True
+
+        return(target_chroms, target_positions, mapped)
+
+    def lift_regions(self, chroms, starts, ends):
+        """
+        Converts 0-based, open-ended regions (i.e. their first and last
+        positions, swapped if mapped to the reverse strand); regions are
+        unmapped unless both positions map to the same chromosome.
+
+        @input:
+        chroms {array-like} of {str} e.g. "chr1"
+        starts {array-like} of {int}
+        ends {array-like} of {int}
+
+        @return: {numpy.ndarray} of target chromosomes, starts and ends, and
+                 {numpy.ndarray} of {bool} (i.e. whether mapped)
+        """
+
+        ends = np.asarray(ends, dtype=np.int64)
+        start_chroms, firsts, start_mapped = self.convert_coordinates(chroms, starts)
+        end_chroms, lasts, end_mapped = self.convert_coordinates(chroms, ends - 1)
+        mapped = start_mapped & end_mapped & (start_chroms == end_chroms)
+
+        return(start_chroms, np.minimum(firsts, lasts),
+               np.maximum(firsts, lasts) + 1, mapped)
+
+    def _build(self, chains_file):
+
+        # Initialize
+        blocks = {}
+        target_chroms = {}
+        target_sizes = []
+        scores = []
+        reverse = []
+        targets = []
+
+        # For each chain...
+        for chain, header, chain_blocks in _parse_chains(chains_file):
+            scores.append(int(header[1]))
+            targets.append(target_chroms.setdefault(header[7], len(target_chroms)))
+            target_sizes.append(int(header[8]))
+            reverse.append(header[9] == "-")
+            for sfrom, sto, tfrom in chain_blocks:
+                blocks.setdefault(header[2], []).append((sfrom, sto, tfrom, chain))
+
+        scores = np.array(scores, dtype=np.int64)
+        target_sizes = np.array(target_sizes, dtype=np.int64)
+        reverse = np.array(reverse, dtype=bool)
+        targets = np.array(targets, dtype=np.int32)
+        self.source_chroms = sorted(blocks)
+        self.target_chroms = sorted(target_chroms, key=target_chroms.get)
+        segments = [_get_segments(np.array(blocks[c], dtype=np.int64), scores)
+                    for c in self.source_chroms]
+
+        self.chrom_offsets = np.cumsum([0] + [len(s[0]) for s in segments])
+        self.starts = np.concatenate([s[0] for s in segments] + [[]]).astype(np.int64)
+        self.ends = np.concatenate([s[1] for s in segments] + [[]]).astype(np.int64)
+        chains = np.concatenate([s[3] for s in segments] + [[]]).astype(np.int64)
+        self.deltas = np.concatenate([s[2] for s in segments] + [[]]).astype(np.int64)
+        self.targets = targets[chains]
+        self.target_sizes = target_sizes[chains]
+        self.reverse = reverse[chains]
+
+    def _load(self, cache_file):
+
+        with np.load(cache_file, allow_pickle=False) as arrays:
+            for name in _arrays:
+                setattr(self, name, arrays[name])
+        self.source_chroms = self.source_chroms.tolist()
+        self.target_chroms = self.target_chroms.tolist()
+
+    def _save(self, cache_file):
+
+        # i.e. written under another name first, for concurrent parsers
+        dummy_file = "%s.%s.npz" % (cache_file[:-4], os.getpid())
+        np.savez(dummy_file, **dict((name, np.asarray(getattr(self, name)))
+                                    for name in _arrays))
+        os.rename(dummy_file, cache_file)
+
+
+def _parse_chains(chains_file):
+    """
+    Yields the chains of a chain file as (index, header, blocks), where
+    blocks are (source start, source end, target start).
+    """
+
+    # Initialize
+    chain = -1
+    header = None
+    blocks = []
+
+    if chains_file.endswith(".gz"):
+        handle = gzip.open(chains_file, "rt")
+    else:
+        handle = open(chains_file)
+
+    with handle:
+
+        for line in handle:
+
+            fields = line.split()
+
+            if not fields or fields[0].startswith("#"):
+                continue
+
+            if fields[0] == "chain":
+                if header is not None:
+                    yield(chain, header, blocks)
+                chain += 1
+                header = fields
+                blocks = []
+                sfrom, tfrom = int(fields[5]), int(fields[10])
+                continue
+
+            # i.e. size, then gaps (except for the last block)
+            size = int(fields[0])
+            blocks.append((sfrom, sfrom + size, tfrom))
+            if len(fields) == 3:
+                sfrom += size + int(fields[1])
+                tfrom += size + int(fields[2])
+
+        if header is not None:
+            yield(chain, header, blocks)
+
+
+def _get_segments(blocks, scores):
+    """
+    Returns the disjoint segments covered by the blocks of a chromosome as
+    arrays of starts, ends, deltas (i.e. target minus source position) and
+    chains; where blocks overlap, the highest-scoring chain wins.
+    """
+
+    sfrom, sto, tfrom, chains = blocks[:, 0], blocks[:, 1], blocks[:, 2], blocks[:, 3]
+    order = np.argsort(sfrom, kind="stable")
+
+    # Blocks do not overlap (i.e. they are the segments)
+    if np.all(sto[order][:-1] <= sfrom[order][1:]):
+        return(sfrom[order], sto[order], (tfrom - sfrom)[order], chains[order])
+
+    # Otherwise, paint blocks from the lowest-scoring chain upwards
+    bounds = np.unique(np.concatenate([sfrom, sto]))
+    best = np.full(bounds.size - 1, -1, dtype=np.int64)
+    lo = np.searchsorted(bounds, sfrom)
+    hi = np.searchsorted(bounds, sto)
+    for b in np.argsort(-scores[chains], kind="stable")[::-1]:
+        best[lo[b]:hi[b]] = b
+
+    covered = np.flatnonzero(best != -1)
+    best = best[covered]
+
+    return(bounds[covered], bounds[covered + 1], (tfrom - sfrom)[best],
+           chains[best])
+
+
+def lift_columns(index, columns):
+    """
+    Converts the regions of a chunk of columns (i.e. from
+    ParseUtils.parse_bed_file) and removes those that cannot be mapped.
+
+    @input:
+    index {ChainIndex}
+    columns {dict} names to {numpy.ndarray}; requires "chrom", "start" and
+                   "end" (i.e. "chr" is prepended to chromosomes without it)
+
+    @return: {dict} and {int} (i.e. number of unmapped regions); target
+             chromosomes keep their "chr" prefix (see filter_chroms)
+    """
+
+    chroms = np.array([c if c.startswith("chr") else "chr%s" % c
+                       for c in columns["chrom"].tolist()], dtype=object)
+    chroms, starts, ends, mapped = index.lift_regions(chroms, columns["start"],
+                                                      columns["end"])
+    columns = dict((k, v[mapped]) for k, v in columns.items())
+    columns["chrom"] = chroms[mapped]
+    columns["start"] = starts[mapped]
+    columns["end"] = ends[mapped]
+
+    return(columns, int((~mapped).sum()))
@@ -0,0 +1,432 @@
+"""
+Staged bulk loads (i.e. LOAD DATA LOCAL INFILE) for the parsers
+"""
+
+from binning import assign_bin
+import os
+from sqlalchemy import create_engine, text
+
+# Import from GUD module
+from GUD import GUDUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.dedup import get_unique_columns
+from GUD.parsers.merge import read_bed_file, sort_lines
+from GUD.parsers.resolver import (RegionResolver, _set_region_id,
+                                  get_region_key)
+
+# Name of the MySQL lock held while uids are assigned and loaded
+LOCK_NAME = "gud_load_data"
+LOCK_TIMEOUT = 3600
+# Key of the region of a staged feature (i.e. sorted loads)
+_REGION = "__region__"
+
+
+class StagedRegionResolver(RegionResolver):
+    """
+    Resolves region uids like {RegionResolver} but, rather than inserting
+    new regions, stages them in a file (i.e. for {DataLoader}) with
+    provisional uids (i.e. -1, -2, etc.), which are offset by the max.
+    region uid as they are loaded (see DataLoader.close).
+    """
+
+    def __init__(self, session, writer, handle):
+
+        RegionResolver.__init__(self, session, writer)
+
+        self._handle = handle
+        self._staged = {}
+
+    def add_coords(self, chrom, start, end, feature):
+
+        # i.e. the region of the feature, for sorted loads
+        self.writer.region = (chrom, start, end)
+        RegionResolver.add_coords(self, chrom, start, end, feature)
+
+    def _key(self, chrom, start, end):
+
+        previous = self.chrom
+        key = RegionResolver._key(self, chrom, start, end)
+
+        if chrom != previous:
+            # Regions staged earlier (i.e. unsorted input)
+            self.uids.update(self._staged.get(chrom, {}))
+            self.writer.flush()
+
+        return(key)
+
+    def _add_new(self, chrom, start, end, key, feature):
+
+        _set_region_id(feature, self._stage(chrom, start, end, key))
+        self.writer.add(feature)
+
+    def get_uid(self, region):
+
+        key = self._key(region.chrom, region.start, region.end)
+        uid = self.uids.get(key)
+
+        if uid is None:
+            uid = self._stage(region.chrom, region.start, region.end, key)
+
+        return(uid)
+
+    def _stage(self, chrom, start, end, key):
+
+        if self.keyed:
+            uid = get_region_key(chrom, start, end)
+        else:
+            uid = -(self.regions + 1)
+        self.uids[key] = uid
+        self._staged.setdefault(chrom, {})[key] = uid
+        self.writer._write(self._handle, [uid, assign_bin(start, end), chrom,
+                                          start, end])
+        self.regions += 1
+
+        return(uid)
+
+
+class DataLoader(BulkWriter):
+    """
+    Stages the rows of a feature table, and those of any new regions (i.e.
+    resolved by its {StagedRegionResolver}), in tab-separated files and
+    loads them with LOAD DATA LOCAL INFILE (i.e. MySQL's native bulk
+    loader) once closed, followed by a verification pass: features that
+    duplicate an existing row (i.e. unique constraint) are removed and
+    features must point to existing regions.
+
+    Uids are assigned as the files are loaded (i.e. offset by the max.
+    uids of the tables) under a MySQL lock that other loads wait for, but
+    other parsers do not take that lock, so nothing else should insert
+    regions or rows of the table meanwhile.
+
+    Features are sorted by the position of their regions (i.e. chromosome,
+    start and end) before their uids are assigned, so that uids follow the
+    genomic order (i.e. as keyset pagination and get_last_uid_region
+    expect); loaded into an empty table, the table is position-ordered
+    with no re-sorting (i.e. resort_scripts). The secondary indexes (e.g.
+    ix_join) of an empty table are dropped during the load and rebuilt
+    once, after it.
+
+    Requires local_infile to be enabled on the MySQL server.
+
+    e.g.
+    loader = DataLoader(session, TFBinding)
+    for region, tf in tfs:
+        loader.resolver.add(region, tf)
+    loader.resolver.close()
+    loader.close()
+    """
+
+    def __init__(self, session, table, staging_dir="/tmp/", keep=False,
+                 sort=True, defer_indexes=None, key=None):
+        """
+        @input:
+        session {Session}
+        table {DeclarativeMeta}
+        staging_dir {str} directory for the staged files
+        keep {bool} keep the staged files (default = False)
+        sort {bool} assign uids in genomic order (default = True)
+        defer_indexes {bool} rebuild the secondary indexes after the load
+                             (default = only if the table is empty)
+        key {list} ORM attributes (or columns) of the key of duplicates
+                   (default = the unique constraint; see KeySet)
+        """
+
+        BulkWriter.__init__(self, session, table, dedup=True, key=key)
+
+        self.keep = keep
+        self.sort = sort
+        self.defer_indexes = defer_indexes
+        self.region = None
+
+        # Columns of the staged files (i.e. feature uids are autoincrement)
+        self._load_columns = [c.key for c in self.table.columns
+                              if c.key not in self._primary_keys]
+        self._region_columns = ["uid", "bin", "chrom", "start", "end"]
+
+        # Key of duplicates (i.e. only removed after the load for tables
+        # without a unique index; otherwise, LOAD DATA IGNORE skips them)
+        self._unique = self.keys.columns
+        self._unique_index = len(get_unique_columns(self.table)) > 0
+
+        # Staged files
+        prefix = os.path.join(staging_dir, "%s.%s" % (self.table.name, os.getpid()))
+        self.regions_file = "%s.regions.tsv" % prefix
+        self.features_file = "%s.features.tsv" % prefix
+        self.sorted_file = "%s.sorted.tsv" % prefix
+        self._regions_handle = open(self.regions_file, "w")
+        self._features_handle = open(self.features_file, "w")
+
+        self.resolver = StagedRegionResolver(session, self, self._regions_handle)
+
+    def _as_dict(self, row):
+
+        values = BulkWriter._as_dict(self, row)
+
+        # i.e. staged before the feature, for sorting
+        if self.sort:
+            if self.region is None:
+                raise ValueError("sorted loads require the regions of features (i.e. add them through the resolver)")
+            values[_REGION] = self.region
+
+        return(values)
+
+    def flush(self):
+        """
+        Stages the buffered rows.
+        """
+
+        # i.e. duplicates are skipped as rows are added
+        for values in self._buffer:
+            row = [values.get(c) for c in self._load_columns]
+            if self.sort:
+                row = list(values[_REGION]) + row
+            self._write(self._features_handle, row)
+            self.rows += 1
+
+        self._buffer = []
+
+    def _write(self, handle, values):
+
+        handle.write("%s\n" % "\t".join(format_value(v) for v in values))
+
+    def close(self):
+        """
+        Loads the staged files and verifies the loaded rows.
+        """
+
+        # Initialize
+        self.flush()
+        self._regions_handle.close()
+        self._features_handle.close()
+        table = self.table.name
+        indexes = []
+
+        # i.e. no open transaction (e.g. metadata locks of the preloads)
+        self.session.commit()
+
+        # Sort features (i.e. uids in genomic order)
+        if self.sort:
+            features_file = self._sort_features()
+            load_columns = ["uid"] + self._load_columns
+        else:
+            features_file = self.features_file
+            load_columns = self._load_columns
+
+        engine = create_engine(GUDUtils._get_db_name(),
+                               connect_args={"local_infile": True})
+
+        try:
+
+            with engine.connect() as conn:
+
+                # i.e. held only while uids are assigned and loaded
+                self._get_lock(conn)
+
+                try:
+
+                    max_region_uid = conn.execute(text("SELECT MAX(uid) FROM regions")).scalar() or 0
+                    max_uid = conn.execute(text("SELECT MAX(uid) FROM `%s`" % table)).scalar() or 0
+
+                    # i.e. rebuilding the indexes of a large table costs
+                    # more than updating them
+                    defer_indexes = self.defer_indexes
+                    if defer_indexes is None:
+                        defer_indexes = max_uid == 0
+
+                    # Regions (i.e. unique checks on)
+                    regions = self.resolver.regions
+                    if regions:
+                        loaded = self._load_file(conn, self.regions_file, "regions",
+                            self._region_columns, self._get_region_uids(max_region_uid))
+                        # i.e. with region keys, regions are not preloaded
+                        if loaded != regions and not self.resolver.keyed:
+                            raise ValueError("regions were inserted meanwhile: %s of %s loaded" % (loaded, regions))
+
+                    # Features (i.e. foreign key checks off, and unique
+                    # checks too unless duplicates rely on them)
+                    if not self._unique_index:
+                        conn.execute("SET unique_checks = 0")
+                    conn.execute("SET foreign_key_checks = 0")
+                    if defer_indexes:
+                        indexes = self._drop_indexes(conn)
+                    values = self._get_region_uids(max_region_uid, "regionID")
+                    if self.sort:
+                        values["uid"] = "@uid + %d" % max_uid
+                    self._load_file(conn, features_file, table, load_columns,
+                                    values)
+                    conn.execute("SET foreign_key_checks = 1")
+                    conn.execute("SET unique_checks = 1")
+
+                finally:
+
+                    # Release the lock
+                    self._release_lock(conn)
+
+                try:
+
+                    # Verify
+                    if not self._unique_index:
+                        self.duplicates += self._remove_duplicates(conn, max_uid)
+                    orphans = conn.execute(text(
+                        "SELECT COUNT(*) FROM `%s` f LEFT JOIN regions r ON r.uid = f.regionID WHERE f.uid > :max_uid AND r.uid IS NULL" % table),
+                        max_uid=max_uid).scalar()
+                    if orphans:
+                        raise ValueError("features without region: %s" % orphans)
+
+                finally:
+
+                    # Rebuild indexes (i.e. one pass over the table)
+                    if indexes:
+                        conn.execute("ALTER TABLE `%s` %s" % (table,
+                            ", ".join("ADD INDEX `%s` (%s)" % (name, columns)
+                                      for name, columns in indexes)))
+
+        finally:
+
+            engine.dispose()
+
+            # Remove files
+            if not self.keep:
+                for file_name in [self.regions_file, self.features_file,
+                                  self.sorted_file]:
+                    if os.path.exists(file_name):
+                        os.remove(file_name)
+
+    def _get_lock(self, conn):
+
+        got = conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+            name=LOCK_NAME, timeout=LOCK_TIMEOUT).scalar()
+        if not got:
+            raise ValueError("could not get lock: %s" % LOCK_NAME)
+
+    def _release_lock(self, conn):
+
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), name=LOCK_NAME)
+
+    def _get_region_uids(self, max_region_uid, column="uid"):
+        """
+        Returns the SQL expression of the final uids of the staged regions
+        (i.e. provisional uids -1, -2, etc. offset by the max. region uid)
+        in a column of region uids (see _load_file).
+        """
+
+        if self.resolver.keyed:
+            return({})
+
+        return({column: "IF(@%s < 0, %d - @%s, @%s)" % (column, max_region_uid,
+                                                       column, column)})
+
+    def _sort_features(self):
+        """
+        Sorts the staged features by the position of their regions and
+        numbers them from 1 (i.e. offset by the max. uid as they are
+        loaded).
+        """
+
+        lines = sort_lines(read_bed_file(self.features_file),
+                           os.path.dirname(self.features_file),
+                           key=_region_key)
+
+        with open(self.sorted_file, "w") as handle:
+            for uid, line in enumerate(lines, 1):
+                handle.write("%s\t%s\n" % (uid, line.split("\t", 3)[3]))
+
+        return(self.sorted_file)
+
+    def _drop_indexes(self, conn):
+        """
+        Drops the secondary indexes of the table (i.e. those of the ORM
+        that are not unique), except any that a foreign key needs.
+
+        @return: {list} of (name, columns) to rebuild them
+        """
+
+        # Initialize
+        indexes = {}
+        dropped = []
+
+        for row in conn.execute("SHOW INDEX FROM `%s`" % self.table.name):
+            column = "`%s`" % row["Column_name"]
+            if row["Sub_part"]:
+                column += "(%s)" % row["Sub_part"]
+            indexes.setdefault(row["Key_name"], []).append(column)
+
+        # i.e. InnoDB requires an index starting with each foreign key
+        fk_columns = set("`%s`" % fk.parent.name for fk in self.table.foreign_keys)
+        for index in self.table.indexes:
+            if index.unique or index.name not in indexes:
+                continue
+            first = indexes[index.name][0]
+            if first in fk_columns and \
+               not any(c[0] == first for n, c in indexes.items()
+                       if n != index.name and n not in dropped):
+                continue
+            dropped.append(index.name)
+
+        if dropped:
+            conn.execute("ALTER TABLE `%s` %s" % (self.table.name,
+                ", ".join("DROP INDEX `%s`" % n for n in dropped)))
+
+        return([(n, ", ".join(indexes[n])) for n in dropped])
+
+    def _load_file(self, conn, file_name, table, columns, values={}):
+        """
+        Loads a staged file (i.e. LOAD DATA IGNORE).
+
+        @input:
+        values {dict} columns to SQL expressions of their staged value
+                      (i.e. @column)
+        """
+
+        stmt = "LOAD DATA LOCAL INFILE '%s' IGNORE INTO TABLE `%s` FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s)" % \
+            (file_name, table, ", ".join("@%s" % c if c in values else "`%s`" % c
+                                         for c in columns))
+        if values:
+            stmt += " SET %s" % ", ".join("`%s` = %s" % (c, values[c])
+                                          for c in sorted(values))
+
+        return(conn.execute(stmt).rowcount)
+
+    def _remove_duplicates(self, conn, max_uid):
+        """
+        Removes the loaded features that duplicate an older one (i.e. the
+        unique constraint was not checked while loading).
+        """
+
+        if not self._unique:
+            return(0)
+
+        on = " AND ".join("o.`%s` <=> n.`%s`" % (c, c) for c in self._unique)
+        stmt = "DELETE n FROM `%s` n JOIN `%s` o ON o.uid < n.uid AND %s WHERE n.uid > :max_uid" % \
+            (self.table.name, self.table.name, on)
+
+        return(conn.execute(text(stmt), max_uid=max_uid).rowcount)
+
+
+def _region_key(line):
+
+    fields = line.split("\t", 3)
+
+    return(fields[0], int(fields[1]), int(fields[2]))
+
+
+def format_value(value):
+    """
+    Formats a value for LOAD DATA (i.e. NULLs as \\N, and backslashes,
+    tabs and newlines escaped).
+    """
+
+    if value is None:
+        return("\\N")
+    if isinstance(value, bool):
+        return(str(int(value)))
+    if isinstance(value, float):
+        if value != value:
+            return("\\N")
+        return(repr(value))
+
+    value = str(value)
+    for c, escaped in [("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n")]:
+        value = value.replace(c, escaped)
+
+    return(value)
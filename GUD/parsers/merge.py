@@ -0,0 +1,260 @@
+"""
+Streaming merges of coordinate-sorted BED files for the parsers
+"""
+
+import gzip
+import heapq
+import os
+import re
+import tempfile
+
+# Import from GUD module
+from GUD.parsers import ParseUtils
+
+# Defaults
+FAN_IN = 256
+BUFFER_SIZE = 1000000
+
+# Files left incomplete by an interrupted job (i.e. partial downloads,
+# unfinished writes and merge runs)
+PARTIAL_FILES = r"(\.part\.bed\.gz|\.bed\.gz\.\d+)$|^run\..+\.bed(\.\d+)?$"
+
+
+def bed_key(line):
+    """
+    Returns the sort key of a BED line (i.e. as in "LC_ALL=C sort -k1,1
+    -k2,2n": chromosome, then start).
+    """
+
+    fields = line.split("\t", 2)
+
+    return(fields[0], int(fields[1]))
+
+
+def read_bed_file(file_name, columns=None, label=None):
+    """
+    Reads a BED file (i.e. plain or gzipped) and yields its lines one by one
+    (i.e. no comments or empty lines).
+
+    @input:
+    file_name {str}
+    columns {list} 0-based indices of the columns to keep (default = all)
+    label {str} inserted after the coordinates (e.g. an accession)
+
+    @yield: {str}
+    """
+
+    handle = ParseUtils._get_file_handle(file_name)
+
+    try:
+
+        for line in handle:
+
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            line = line.rstrip("\r\n")
+
+            # Skip comments and empty lines
+            if not line or line.startswith("#") or line.startswith("track"):
+                continue
+
+            if columns is not None or label is not None:
+                fields = line.split("\t")
+                if columns is not None:
+                    fields = [fields[i] for i in columns]
+                if label is not None:
+                    fields.insert(3, label)
+                line = "\t".join(fields)
+
+            yield(line)
+
+    finally:
+
+        handle.close()
+
+
+def sort_bed_file(file_name, out_file=None):
+    """
+    Sorts a BED file unless already sorted (i.e. in memory; for files of a
+    single experiment) into another file (i.e. which replaces it) or in
+    place. The sorted file is replaced atomically, so that it only exists
+    once complete (e.g. a download sorted from its partial file).
+
+    @input:
+    file_name {str}
+    out_file {str} sorted file (default = file_name)
+
+    @return: {bool} whether the file had to be sorted
+    """
+
+    # Initialize
+    previous = None
+    if out_file is None:
+        out_file = file_name
+
+    for line in read_bed_file(file_name):
+        key = bed_key(line)
+        if previous is not None and key < previous:
+            break
+        previous = key
+    else:
+        os.replace(file_name, out_file)
+        return(False)
+
+    lines = sorted(read_bed_file(file_name), key=bed_key)
+    _write_lines(out_file, lines)
+    if out_file != file_name:
+        os.remove(file_name)
+
+    return(True)
+
+
+def remove_partial_files(dummy_dir):
+    """
+    Removes the files left incomplete by an interrupted job, so that a
+    resumed job only reuses the downloads that were completed (i.e. sorted
+    and replaced atomically, see sort_bed_file).
+    """
+
+    for file_name in os.listdir(dummy_dir):
+        if re.search(PARTIAL_FILES, file_name):
+            os.remove(os.path.join(dummy_dir, file_name))
+
+
+def merge_lines(iterables, dummy_dir="/tmp/", fan_in=FAN_IN, key=bed_key):
+    """
+    Merges iterables of sorted BED lines (e.g. from read_bed_file) into a
+    single sorted stream. At most fan_in iterables are open at once (i.e.
+    generators are only started when merged); beyond that, groups of them
+    are first merged into temporary files in dummy_dir.
+
+    @input:
+    iterables {list} of iterables of {str}, each sorted by key
+    dummy_dir {str}
+    fan_in {int} max. number of iterables merged at once
+    key {function} sort key of a line (default = bed_key)
+
+    @yield: {str}
+    @raise: {ValueError} if an iterable is not sorted
+    """
+
+    # Initialize
+    runs = []
+    iterables = list(iterables)
+
+    try:
+
+        while len(iterables) > fan_in:
+            run_files = []
+            for i in range(0, len(iterables), fan_in):
+                run_files.append(_write_run(_merge(iterables[i:i + fan_in], key),
+                                            dummy_dir))
+            runs.extend(run_files)
+            iterables = [read_bed_file(f) for f in run_files]
+
+        for line in _merge(iterables, key):
+            yield(line)
+
+    finally:
+
+        # Remove temporary files
+        for run_file in runs:
+            if os.path.exists(run_file):
+                os.remove(run_file)
+
+
+def sort_lines(lines, dummy_dir="/tmp/", buffer_size=BUFFER_SIZE, key=bed_key):
+    """
+    Sorts BED lines by key (i.e. an external merge sort: buffers of
+    lines are sorted in memory, written as temporary files and merged).
+
+    @input:
+    lines {iterable} of {str}
+    dummy_dir {str}
+    buffer_size {int} max. number of lines in memory
+    key {function} sort key of a line (default = bed_key)
+
+    @yield: {str}
+    """
+
+    # Initialize
+    runs = []
+    buffer = []
+
+    try:
+
+        for line in lines:
+            buffer.append(line)
+            if len(buffer) == buffer_size:
+                buffer.sort(key=key)
+                runs.append(_write_run(buffer, dummy_dir))
+                buffer = []
+        buffer.sort(key=key)
+
+        # i.e. everything fits in memory
+        if not runs:
+            for line in buffer:
+                yield(line)
+            return
+
+        runs.append(_write_run(buffer, dummy_dir))
+        for line in merge_lines([read_bed_file(f) for f in runs], dummy_dir,
+                                key=key):
+            yield(line)
+
+    finally:
+
+        # Remove temporary files
+        for run_file in runs:
+            if os.path.exists(run_file):
+                os.remove(run_file)
+
+
+def _merge(iterables, key):
+
+    # Initialize
+    previous = None
+
+    for k, line in heapq.merge(*[_keyed(i, key) for i in iterables]):
+
+        # i.e. an unsorted input
+        if previous is not None and k < previous:
+            raise ValueError("unsorted BED input: %s" % line)
+        previous = k
+
+        yield(line)
+
+
+def _keyed(lines, key):
+
+    for line in lines:
+        yield(key(line), line)
+
+
+def _write_run(lines, dummy_dir):
+
+    handle, run_file = tempfile.mkstemp(prefix="run.", suffix=".bed", dir=dummy_dir)
+    os.close(handle)
+    _write_lines(run_file, lines)
+
+    return(run_file)
+
+
+def _write_lines(file_name, lines):
+
+    # i.e. replaced atomically
+    dummy_file = "%s.%s" % (file_name, os.getpid())
+
+    if file_name.endswith(".gz"):
+        handle = gzip.open(dummy_file, "wt")
+    else:
+        handle = open(dummy_file, "w")
+
+    try:
+        with handle:
+            for line in lines:
+                handle.write("%s\n" % line)
+    except:
+        os.remove(dummy_file)
+        raise
+    os.replace(dummy_file, file_name)
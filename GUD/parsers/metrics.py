@@ -0,0 +1,391 @@
+"""
+Live ingestion metrics for the parsers (i.e. counters of each worker,
+written to a metrics directory and summarized by the main process)
+"""
+
+import json
+from multiprocessing import current_process
+import os
+import threading
+import time
+
+# Seconds between writes of the counters of a worker and between summaries
+INTERVAL = 30
+
+# Counters of a worker
+COUNTERS = ["parsed", "inserted", "flushes", "flush_seconds",
+            "max_flush_seconds", "db_seconds", "parse_seconds", "retried",
+            "deadlocks"]
+
+# Metrics of the current process (see start)
+_metrics = None
+
+
+class Metrics(object):
+    """
+    Counters of a worker: rows parsed and inserted (i.e. per table), batches
+    flushed and their latency, seconds waiting for the database (i.e.
+    flushes and region lookups) and parsing, and wall and CPU seconds.
+    They are written to "<worker>.json" in the metrics directory at most
+    every interval seconds (i.e. as they are updated) and on close.
+
+    Parsers do not create them: the worker functions of the parallel
+    inserts and of the pipeline start them (see start), and BulkWriter,
+    RegionResolver and the shared ingestion engine update those of their
+    process, if any (see get).
+
+    e.g.
+    metrics = get()
+    if metrics is not None:
+        metrics.parsed(len(rows), seconds)
+    """
+
+    def __init__(self, metrics_dir, name=None, interval=INTERVAL):
+        """
+        @input:
+        metrics_dir {str}
+        name {str} worker name (default = process name and pid)
+        interval {int} min. seconds between writes
+        """
+
+        self.metrics_dir = metrics_dir
+        self.interval = interval
+        if name is None:
+            name = "%s-%s" % (current_process().name, os.getpid())
+        self.name = name
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.tables = {}
+
+        self._start = time.time()
+        self._cpu = time.process_time()
+        self._written = self._start
+
+        if not os.path.isdir(self.metrics_dir):
+            os.makedirs(self.metrics_dir)
+
+    def add(self, counter, value=1):
+
+        self.counters[counter] += value
+        self.write()
+
+    def parsed(self, rows, seconds=0):
+        """
+        Records rows parsed and the seconds spent parsing them.
+        """
+
+        self.counters["parsed"] += rows
+        self.counters["parse_seconds"] += seconds
+        self.write()
+
+    def flushed(self, table, rows, seconds):
+        """
+        Records a batch inserted into a table and its latency.
+        """
+
+        self.counters["inserted"] += rows
+        self.counters["flushes"] += 1
+        self.counters["flush_seconds"] += seconds
+        self.counters["db_seconds"] += seconds
+        if seconds > self.counters["max_flush_seconds"]:
+            self.counters["max_flush_seconds"] = seconds
+        self.tables[table] = self.tables.get(table, 0) + rows
+        self.write()
+
+    def waited(self, seconds):
+        """
+        Records seconds waiting for the database other than flushes (e.g.
+        region lookups).
+        """
+
+        self.counters["db_seconds"] += seconds
+        self.write()
+
+    def timed(self, iterable, counter="parse_seconds", count=None):
+        """
+        Yields the items of an iterable, adding the seconds spent getting
+        each of them to a counter (e.g. chunks read by pandas) and, if
+        given, one per item to another (e.g. "parsed", for parsed rows).
+        """
+
+        iterator = iter(iterable)
+
+        while True:
+            t = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            self.counters[counter] += time.time() - t
+            if count is not None:
+                self.add(count)
+            yield(item)
+
+    def get_values(self):
+
+        values = dict(self.counters)
+        values["name"] = self.name
+        values["seconds"] = time.time() - self._start
+        values["cpu_seconds"] = time.process_time() - self._cpu
+        values["tables"] = self.tables
+
+        return(values)
+
+    def write(self, force=False):
+        """
+        Writes the counters (i.e. replaced atomically) if the interval has
+        elapsed since the last write.
+        """
+
+        if not force and time.time() - self._written < self.interval:
+            return
+
+        metrics_file = os.path.join(self.metrics_dir, "%s.json" % self.name)
+        dummy_file = "%s.tmp" % metrics_file
+        with open(dummy_file, "w") as handle:
+            json.dump(self.get_values(), handle)
+        os.replace(dummy_file, metrics_file)
+        self._written = time.time()
+
+    def close(self):
+
+        self.write(force=True)
+
+
+class Monitor(object):
+    """
+    Summarizes the metrics of the workers of an ingestion job every
+    interval seconds, from a thread of the main process: it prints a
+    summary (i.e. rates since the last one, latencies, the share of worker
+    time spent waiting for the database, parsing and on CPU, queue depths
+    and an ETA) and appends it to "summary.jsonl" in the metrics directory.
+
+    A job waiting for the database most of the time is I/O- or lock-bound
+    (i.e. retried batches and deadlocks tell them apart), and one parsing
+    or on CPU most of the time is CPU-bound.
+
+    e.g.
+    with Monitor(metrics_dir, expected=rows, queues={"files": files.__len__}):
+        ...
+    """
+
+    def __init__(self, metrics_dir, expected=None, queues={},
+                 interval=INTERVAL):
+        """
+        @input:
+        metrics_dir {str}
+        expected {int} rows to parse (i.e. for the ETA; default = unknown)
+        queues {dict} names to functions returning their depths
+        interval {int} seconds between summaries
+        """
+
+        self.metrics_dir = metrics_dir
+        self.expected = expected
+        self.queues = queues
+        self.interval = interval
+
+        self._start = None
+        self._last = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        # i.e. remove the counters of earlier jobs
+        if not os.path.isdir(self.metrics_dir):
+            os.makedirs(self.metrics_dir)
+        for file_name in os.listdir(self.metrics_dir):
+            if file_name.endswith(".json"):
+                os.remove(os.path.join(self.metrics_dir, file_name))
+
+    def __enter__(self):
+
+        self.start()
+
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.stop()
+
+    def start(self):
+
+        self._start = time.time()
+        self._last = (self._start, 0, 0)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the thread and prints a last summary.
+        """
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.summarize()
+
+    def _run(self):
+
+        while not self._stop.wait(self.interval):
+            self.summarize()
+
+    def get_workers(self):
+        """
+        Returns the last counters written by each worker.
+
+        @return: {list} of {dict}
+        """
+
+        # Initialize
+        workers = []
+
+        for file_name in sorted(os.listdir(self.metrics_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, file_name)) as handle:
+                    workers.append(json.load(handle))
+            # i.e. removed meanwhile
+            except (IOError, OSError, ValueError):
+                continue
+
+        return(workers)
+
+    def get_summary(self):
+        """
+        Returns the aggregated counters of the workers, with rates since the
+        last summary.
+
+        @return: {dict}
+        """
+
+        # Initialize
+        now = time.time()
+        workers = self.get_workers()
+        summary = dict((c, sum(w[c] for w in workers)) for c in COUNTERS)
+        summary["max_flush_seconds"] = max([0] + [w["max_flush_seconds"] for w in workers])
+        seconds = sum(w["seconds"] for w in workers)
+
+        summary["time"] = now
+        summary["elapsed"] = now - self._start
+        summary["workers"] = len(workers)
+        summary["cpu_seconds"] = sum(w["cpu_seconds"] for w in workers)
+        summary["queues"] = dict((n, _get_depth(f)) for n, f in self.queues.items())
+
+        # Rates
+        t, parsed, inserted = self._last
+        summary["parsed_per_second"] = (summary["parsed"] - parsed) / max(now - t, 1e-9)
+        summary["inserted_per_second"] = (summary["inserted"] - inserted) / max(now - t, 1e-9)
+        self._last = (now, summary["parsed"], summary["inserted"])
+
+        # Shares of worker time
+        for share in ["db", "parse", "cpu"]:
+            summary["%s_share" % share] = summary["%s_seconds" % share] / max(seconds, 1e-9)
+        summary["flush_latency"] = summary["flush_seconds"] / max(summary["flushes"], 1)
+
+        # ETA (i.e. at the average parse rate)
+        summary["eta"] = None
+        if self.expected is not None and summary["parsed"] > 0:
+            rate = summary["parsed"] / max(summary["elapsed"], 1e-9)
+            summary["eta"] = max(self.expected - summary["parsed"], 0) / rate
+
+        return(summary)
+
+    def summarize(self):
+
+        summary = self.get_summary()
+
+        with open(os.path.join(self.metrics_dir, "summary.jsonl"), "a") as handle:
+            handle.write("%s\n" % json.dumps(summary))
+
+        print(format_summary(summary))
+
+
+def format_summary(summary):
+
+    # Initialize
+    queues = ", ".join("%s %s" % (n, d) for n, d in sorted(summary["queues"].items()))
+    eta = "?"
+    if summary["eta"] is not None:
+        eta = _format_seconds(summary["eta"])
+
+    return("%s: %s workers, parsed %s (%.0f/s), inserted %s (%.0f/s), "
+           "flush %.1f ms (max %.1f ms), db wait %.0f%%, parse %.0f%%, "
+           "cpu %.0f%%, retried %s, deadlocks %s, queues [%s], ETA %s" % (
+        _format_seconds(summary["elapsed"]), summary["workers"],
+        summary["parsed"], summary["parsed_per_second"], summary["inserted"],
+        summary["inserted_per_second"], summary["flush_latency"] * 1000,
+        summary["max_flush_seconds"] * 1000, summary["db_share"] * 100,
+        summary["parse_share"] * 100, summary["cpu_share"] * 100,
+        summary["retried"], summary["deadlocks"], queues, eta))
+
+
+def _format_seconds(seconds):
+
+    seconds = int(seconds)
+
+    return("%02d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60))
+
+
+def _get_depth(function):
+
+    try:
+        return(function())
+    # i.e. Queue.qsize() on macOS
+    except NotImplementedError:
+        return(None)
+
+
+def estimate_lines(data_file, sample_bytes=2**20):
+    """
+    Estimates the lines of an uncompressed file from the average length of
+    its first lines (i.e. for the ETA).
+
+    @return: {int} (i.e. None for compressed files)
+    """
+
+    if data_file.endswith(".gz") or data_file.endswith(".zip"):
+        return(None)
+
+    with open(data_file, "rb") as handle:
+        sample = handle.read(sample_bytes)
+    if not sample:
+        return(0)
+
+    return(int(os.path.getsize(data_file) * max(sample.count(b"\n"), 1) / len(sample)))
+
+
+def get():
+    """
+    Returns the metrics of the current process (i.e. None unless started).
+    """
+
+    return(_metrics)
+
+
+def start(metrics_dir, interval=INTERVAL):
+    """
+    Starts the metrics of the current process (i.e. counters carry over
+    the tasks run by the same process).
+    """
+
+    global _metrics
+
+    if _metrics is None or _metrics.metrics_dir != metrics_dir:
+        _metrics = Metrics(metrics_dir, interval=interval)
+
+    return(_metrics)
+
+
+def run(function, metrics_dir, *args):
+    """
+    Runs a function (e.g. a worker of ParseUtils.insert_data_files_in_parallel)
+    with the metrics of its process started; they are written when it
+    returns.
+    """
+
+    metrics = start(metrics_dir)
+
+    try:
+        return(function(*args))
+    finally:
+        metrics.close()
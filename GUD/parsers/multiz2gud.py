@@ -1,22 +1,19 @@
 #!/usr/bin/env python
 
 import argparse
-from binning import assign_bin
-from functools import partial
 import getpass
 from multiprocessing import cpu_count
 import os
 import re
 import shutil
-import subprocess
 import sys
 
 # Import from GUD module
 from GUD import GUDUtils
 from GUD.ORM.conservation import Conservation
-from GUD.ORM.region import Region
 from GUD.ORM.source import Source
 from GUD.parsers import ParseUtils
+from GUD.parsers.spec import SourceSpec, ingest
 
 usage_msg = """
 usage: %s --genome STR --version STR [-h] [options]
@@ -32,6 +29,9 @@ optional arguments:
   -h, --help          show this help message and exit
   --dummy-dir DIR     dummy directory (default = "/tmp/")
   -r, --remove        remove downloaded files (default = False)
+  --load-data         stage the data in files and load them
+                      with "LOAD DATA LOCAL INFILE" (requires
+                      "local_infile"; default = False)
   -t, --test          limit the total of inserts to ~1K per
                       thread for testing (default = False)
   --threads INT       number of threads to use (default = %s)
@@ -44,6 +44,9 @@ mysql arguments:
   -u STR, --user STR  user name (default = current user)
 """ % (usage_msg, (cpu_count() - 1), GUDUtils.db, GUDUtils.port)
 
+# Columns of the "multiz100way" table
+SPEC = SourceSpec(Conservation, {1: "chrom", 2: "start", 3: "end", 6: "score"})
+
 #-------------#
 # Functions   #
 #-------------#
@@ -63,6 +66,7 @@ def parse_args():
     optional_group = parser.add_argument_group("optional arguments")
     optional_group.add_argument("-h", "--help", action="store_true")
     optional_group.add_argument("--dummy-dir", default="/tmp/")
+    optional_group.add_argument("--load-data", action="store_true")
     optional_group.add_argument("-r", "--remove", action="store_true")
     optional_group.add_argument("-t", "--test", action="store_true")
     optional_group.add_argument("--threads", default=(cpu_count() - 1))
@@ -130,24 +134,13 @@ def main():
     GUDUtils.db = args.db
 
     # Insert conservation data
-    conservation_to_gud(args.genome, args.version, args.dummy_dir, args.remove, args.test, args.threads)
+    conservation_to_gud(args.genome, args.version, args.dummy_dir, args.remove, args.test, args.threads, args.load_data)
 
-def conservation_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False, threads=1):
+def conservation_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False, threads=1, load_data=False):
     """
     python -m GUD.parsers.multiz2gud --genome hg38 --version abcd --test -P 3306
     """
 
-    # Initialize
-    global chroms
-    global engine
-    global Session
-    global source
-
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -197,11 +190,9 @@ def conservation_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=F
     session.close()
     engine.dispose()
 
-    # Split data
-    data_files = _split_data(data_file, threads)
-
-    # Parallelize inserts to the database
-    ParseUtils.insert_data_files_in_parallel(data_files, partial(_insert_data, test=test), threads)
+    # Load data into the database (i.e. or parallelize inserts)
+    ingest(SPEC, data_file, {"source_id": source.uid}, chroms, threads, test,
+           load_data=load_data)
 
     # Remove files
     if remove:
@@ -242,80 +233,6 @@ def _download_data(genome, dummy_dir="/tmp/"):
 
     return(data_file, os.path.join(url, ftp_files[0][1]))
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["zless %s | wc -l" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "zless %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
-
-    # For each split file...
-    for split_file in os.listdir(split_dir):
-
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
-
-    return(split_files)
-
-def _insert_data(data_file, test=False):
-
-    # Initialize
-    session = Session()
-
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
-
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
-
-        # Skip empty lines
-        if not line:
-            continue
-
-        # Upsert region
-        region = Region()
-        region.chrom = str(line[1])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[2])
-        region.end = int(line[3])
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
-
-        # Upsert conservation
-        conservation = Conservation()
-        conservation.region_id = region.uid
-        conservation.source_id = source.uid
-        conservation.score = float(line[-1])
-        ParseUtils.upsert_conservation(session, conservation)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
-
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
-    session.close()
-    engine.dispose()
-
 #-------------#
 # Main        #
 #-------------#
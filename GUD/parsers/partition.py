@@ -0,0 +1,185 @@
+"""
+Partitioning of data files for parallel ingestion (i.e. by chromosome and
+bin range rather than by line count)
+"""
+
+import gzip
+import heapq
+import os
+
+# Partitions are made of cells of 2^23 bp (i.e. 8 Mb, the largest bins of
+# the UCSC binning scheme other than the top one)
+CELL_SHIFT = 23
+
+
+def _open(file_name):
+
+    if file_name.endswith(".gz"):
+        return(gzip.open(file_name, "rb"))
+
+    return(open(file_name, "rb"))
+
+
+def _get_cell(line, chrom_idx=0, start_idx=1):
+
+    fields = line.split(b"\t", max(chrom_idx, start_idx) + 1)
+    chrom = fields[chrom_idx].decode("utf-8")
+
+    # i.e. headers
+    try:
+        cell = int(fields[start_idx]) >> CELL_SHIFT
+    except (IndexError, ValueError):
+        cell = 0
+
+    return(chrom, cell)
+
+
+def _parse_lines(file_name):
+
+    with _open(file_name) as handle:
+        for line in handle:
+            # Skip empty lines and comments
+            if not line.strip() or line.startswith(b"#"):
+                continue
+            yield(line)
+
+
+def get_sizes(data_file, chrom_idx=0, start_idx=1):
+    """
+    Returns the size (i.e. in bytes) of the lines of each cell of a
+    tab-separated file.
+
+    @input:
+    data_file {str} (e.g. gzipped)
+    chrom_idx {int} 0-based index of the chromosome column
+    start_idx {int} 0-based index of the start column
+
+    @return: {dict} (chrom, cell) to {int}
+    """
+
+    # Initialize
+    sizes = {}
+
+    for line in _parse_lines(data_file):
+        cell = _get_cell(line, chrom_idx, start_idx)
+        sizes[cell] = sizes.get(cell, 0) + len(line)
+
+    return(sizes)
+
+
+def get_partitions(sizes, workers=1):
+    """
+    Returns disjoint partitions of the cells: whole chromosomes, unless a
+    chromosome is larger than its share of the data (i.e. 1/workers), in
+    which case it is split into contiguous ranges of cells.
+
+    @input:
+    sizes {dict} (chrom, cell) to {int} (see get_sizes)
+    workers {int}
+
+    @return: {list} of (chrom, first cell, last cell, size)
+    """
+
+    # Initialize
+    cells = {}
+    partitions = []
+    target = sum(sizes.values()) / max(workers, 1)
+
+    for chrom, cell in sizes:
+        cells.setdefault(chrom, []).append(cell)
+
+    for chrom in sorted(cells):
+
+        first, size = None, 0
+
+        for cell in sorted(cells[chrom]):
+            if first is None:
+                first = cell
+            size += sizes[(chrom, cell)]
+            # i.e. split large chromosomes
+            if size >= target:
+                partitions.append((chrom, first, cell, size))
+                first, size = None, 0
+
+        if first is not None:
+            partitions.append((chrom, first, cell, size))
+
+    return(partitions)
+
+
+def schedule(partitions, workers=1):
+    """
+    Assigns partitions to workers so that their loads (i.e. sizes) are
+    balanced: largest partitions first, each to the least loaded worker.
+
+    @input:
+    partitions {list} (see get_partitions)
+    workers {int}
+
+    @return: {list} of {list} of partitions (i.e. one per worker)
+    """
+
+    # Initialize
+    assigned = [[] for i in range(max(workers, 1))]
+    heap = [(0, i) for i in range(len(assigned))]
+
+    for partition in sorted(partitions, key=lambda p: (-p[3], p[:3])):
+        load, i = heapq.heappop(heap)
+        assigned[i].append(partition)
+        heapq.heappush(heap, (load + partition[3], i))
+
+    # i.e. keep the order of the file within each worker
+    for i in range(len(assigned)):
+        assigned[i].sort()
+
+    return(assigned)
+
+
+def split_data(data_file, workers=1, chrom_idx=0, start_idx=1):
+    """
+    Splits a tab-separated file for parallel ingestion into one file per
+    worker (i.e. "{data_file}.00", "{data_file}.01"... in the same
+    directory, uncompressed): each file holds whole partitions (i.e. see
+    get_partitions), so that workers insert disjoint regions and do not
+    contend for the same locks of the regions' unique index. Lines keep
+    their order (i.e. sorted input makes sorted files).
+
+    @input:
+    data_file {str} (e.g. gzipped)
+    workers {int}
+    chrom_idx {int} 0-based index of the chromosome column
+    start_idx {int} 0-based index of the start column
+
+    @return: {list} of {str}
+    """
+
+    # Initialize
+    handles = {}
+    split_files = []
+    routes = {}
+    split_dir = os.path.dirname(os.path.realpath(data_file))
+    prefix = os.path.join(split_dir, "%s." % os.path.basename(data_file))
+
+    # Assign cells to workers
+    sizes = get_sizes(data_file, chrom_idx, start_idx)
+    assigned = schedule(get_partitions(sizes, workers), workers)
+    for i, partitions in enumerate(p for p in assigned if p):
+        split_files.append("%s%02d" % (prefix, i))
+        for chrom, first, last, size in partitions:
+            for cell in range(first, last + 1):
+                routes[(chrom, cell)] = i
+
+    try:
+        for line in _parse_lines(data_file):
+            i = routes[_get_cell(line, chrom_idx, start_idx)]
+            if i not in handles:
+                handles[i] = open(split_files[i], "wb")
+            handles[i].write(line)
+            # i.e. the last line
+            if not line.endswith(b"\n"):
+                handles[i].write(b"\n")
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    return(split_files)
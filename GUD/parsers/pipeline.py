@@ -0,0 +1,301 @@
+"""
+Streaming producer/consumer ingestion pipeline for the parsers
+"""
+
+from multiprocessing import Process, Queue, current_process
+try:
+    from queue import Empty, Full
+# Python 2.7
+except ImportError:
+    from Queue import Empty, Full
+import time
+import traceback
+
+# Import from GUD module
+from GUD.parsers import ParseUtils, metrics
+from GUD.parsers.bulk import BATCH_SIZE
+
+# Defaults
+QUEUE_SIZE = 16
+TIMEOUT = 1
+
+# Passed to insert functions after each batch (i.e. with checkpoints): flush
+# everything, then ask for the next record
+COMMIT = "__commit__"
+
+
+class PipelineError(Exception):
+    """
+    Raised when a process of the pipeline fails.
+    """
+
+    pass
+
+
+def parse_records(data_file, parse_function, limit=None):
+    """
+    Parses a TSV file and yields its records one by one (i.e. the serial
+    counterpart of the pipeline).
+
+    @input:
+    data_file {str} or an iterable of lines (e.g. GUD.parsers.merge)
+    parse_function {function} fields of a line to a record (or None, to
+                               skip the line)
+    limit {int} max. number of lines (default = all)
+
+    @yield: record
+    """
+
+    for batch in _read_batches(data_file, BATCH_SIZE, limit):
+        for record in _parse_batch(batch, parse_function):
+            yield(record)
+
+
+def run_pipeline(data_file, parse_function, insert_function, producers=1,
+                 writers=1, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE,
+                 limit=None, checkpoint=None, key=None, metrics_dir=None):
+    """
+    Streams a TSV file into the database: the main process reads batches
+    of lines, producer processes parse them into records (i.e. compact and
+    picklable, e.g. tuples) and writer processes insert them. Stages are
+    connected by bounded queues (i.e. a stage blocks while the next one
+    is behind) and the failure of any process stops the pipeline and is
+    raised as a {PipelineError}.
+
+    Each writer calls insert_function once with an iterator of all the
+    records it receives (i.e. one session per writer).
+
+    With a {Checkpoint}, the iterator yields COMMIT after each batch and,
+    once the insert function asks for the next record (i.e. after it has
+    flushed), the batch is logged as committed; batches committed by an
+    earlier run of the same key are skipped (i.e. not parsed or inserted).
+    Batches are numbered in the order they are read, so data_file and
+    batch_size must be the same as in that run.
+
+    With a metrics directory, producers and writers record live metrics
+    there and a summary (i.e. with the depths of both queues) is printed
+    periodically (see GUD.parsers.metrics).
+
+    @input:
+    data_file {str} or an iterable of lines (e.g. GUD.parsers.merge)
+    parse_function {function} fields of a line to a record (or None, to
+                               skip the line)
+    insert_function {function} inserts an iterator of records
+    producers {int} number of producer processes
+    writers {int} number of writer processes
+    batch_size {int} lines per batch
+    queue_size {int} max. batches per queue
+    limit {int} max. number of lines (default = all)
+    checkpoint {Checkpoint}
+    key {str} key of the checkpoint (e.g. data_file)
+    metrics_dir {str}
+    """
+
+    # Initialize
+    lines = Queue(queue_size)
+    records = Queue(queue_size)
+    errors = Queue()
+    processes = []
+    committed = set()
+    if checkpoint is not None:
+        committed = checkpoint.get_logged(key)
+
+    monitor = None
+    if metrics_dir is not None:
+        expected = limit
+        if expected is None and isinstance(data_file, str):
+            expected = metrics.estimate_lines(data_file)
+        monitor = metrics.Monitor(metrics_dir, expected,
+                                  {"lines": lines.qsize, "records": records.qsize})
+
+    for i in range(producers):
+        processes.append(Process(target=_run, name="producer-%s" % i,
+            args=(errors, metrics_dir, _produce, lines, records,
+                  parse_function)))
+    for i in range(writers):
+        processes.append(Process(target=_run, name="writer-%s" % i,
+            args=(errors, metrics_dir, _write, records, insert_function,
+                  checkpoint, key)))
+
+    for p in processes:
+        p.start()
+    if monitor is not None:
+        monitor.start()
+
+    try:
+
+        # Read lines
+        for i, batch in enumerate(_read_batches(data_file, batch_size, limit)):
+            if i not in committed:
+                _put(lines, (i, batch), processes, errors)
+        for i in range(producers):
+            _put(lines, None, processes, errors)
+
+        # Wait for producers, then for writers
+        for p in processes[:producers]:
+            _join(p, processes, errors)
+        for i in range(writers):
+            _put(records, None, processes, errors)
+        for p in processes[producers:]:
+            _join(p, processes, errors)
+
+    finally:
+
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        if monitor is not None:
+            monitor.stop()
+
+
+def _read_batches(data_file, batch_size, limit=None):
+    """
+    Yields batches of lines (i.e. no comments or empty lines).
+    """
+
+    # Initialize
+    batch = []
+    n = 0
+    if isinstance(data_file, str):
+        handle = ParseUtils._get_file_handle(data_file)
+    else:
+        handle = iter(data_file)
+
+    for line in handle:
+
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r\n")
+
+        # Skip comments and empty lines
+        if not line or line.startswith("#"):
+            continue
+
+        batch.append(line)
+        n += 1
+
+        if len(batch) == batch_size:
+            yield(batch)
+            batch = []
+
+        if n == limit:
+            break
+
+    if batch:
+        yield(batch)
+
+    if hasattr(handle, "close"):
+        handle.close()
+
+
+def _parse_batch(batch, parse_function):
+
+    # Initialize
+    records = []
+
+    for line in batch:
+        record = parse_function(line.split("\t"))
+        if record is not None:
+            records.append(record)
+
+    return(records)
+
+
+def _run(errors, metrics_dir, function, *args):
+    """
+    Runs the function of a process (i.e. with live metrics, if any); errors
+    are passed to the main process.
+    """
+
+    try:
+        if metrics_dir is not None:
+            metrics.run(function, metrics_dir, *args)
+        else:
+            function(*args)
+    except:
+        errors.put(traceback.format_exc())
+        raise
+
+
+def _produce(lines, records, parse_function):
+
+    while True:
+
+        item = lines.get()
+
+        # i.e. no more lines
+        if item is None:
+            break
+
+        # i.e. empty batches too, for checkpoints
+        i, batch = item
+        t = time.time()
+        parsed = _parse_batch(batch, parse_function)
+        if metrics.get() is not None:
+            metrics.get().parsed(len(batch), time.time() - t)
+        records.put((i, parsed))
+
+
+def _write(records, insert_function, checkpoint=None, key=None):
+
+    insert_function(_get_records(records, checkpoint, key))
+
+
+def _get_records(records, checkpoint=None, key=None):
+
+    # Initialize
+    name = current_process().name
+
+    while True:
+
+        item = records.get()
+
+        # i.e. no more records
+        if item is None:
+            break
+
+        i, batch = item
+        for record in batch:
+            yield(record)
+
+        # i.e. once the batch has been flushed
+        if checkpoint is not None:
+            yield(COMMIT)
+            checkpoint.log(key, name, i)
+
+
+def _check(processes, errors):
+    """
+    Raises a {PipelineError} if any process failed.
+    """
+
+    for p in processes:
+        if p.exitcode not in (None, 0):
+            try:
+                message = errors.get(timeout=TIMEOUT)
+            except Empty:
+                message = "%s exited with code %s" % (p.name, p.exitcode)
+            raise PipelineError(message)
+
+
+def _put(queue, item, processes, errors):
+    """
+    Puts an item in a queue, waiting while it is full (i.e. backpressure)
+    unless a process fails.
+    """
+
+    while True:
+        try:
+            queue.put(item, timeout=TIMEOUT)
+            return
+        except Full:
+            _check(processes, errors)
+
+
+def _join(process, processes, errors):
+
+    while process.is_alive():
+        process.join(TIMEOUT)
+        _check(processes, errors)
+
+    _check(processes, errors)
@@ -1,22 +1,18 @@
 #!/usr/bin/env python
 
 import argparse
-from binning import assign_bin
-from functools import partial
 import getpass
 from multiprocessing import cpu_count
 import os
-import re
 import shutil
-import subprocess
 import sys
 
 # Import from GUD module
 from GUD import GUDUtils
 from GUD.ORM.gene import Gene
-from GUD.ORM.region import Region
 from GUD.ORM.source import Source
 from GUD.parsers import ParseUtils
+from GUD.parsers.spec import Encoded, SourceSpec, ingest
 
 usage_msg = """
 usage: %s --genome STR --version STR [-h] [options]
@@ -46,6 +42,17 @@ mysql arguments:
   -u STR, --user STR  user name (default = current user)
 """ % (usage_msg, (cpu_count() - 1), GUDUtils.db, GUDUtils.port)
 
+# Columns of the "ncbiRefSeq" and "ncbiRefSeqSelect" tables
+SPEC = SourceSpec(Gene,
+    {1: "name", 2: "chrom", 3: "strand", 4: "start", 5: "end",
+     6: "coding_start", 7: "coding_end", 9: "exon_starts", 10: "exon_ends",
+     12: "gene_symbol"},
+    fields={"name": "name", "gene_symbol": "gene_symbol",
+            "coding_start": "coding_start", "coding_end": "coding_end",
+            "exon_starts": Encoded("exon_starts"),
+            "exon_ends": Encoded("exon_ends"), "strand": "strand"},
+    dtypes={"coding_start": "int64", "coding_end": "int64"})
+
 #-------------#
 # Functions   #
 #-------------#
@@ -132,17 +139,6 @@ def refgene_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False,
     e.g. python -m GUD.parsers.refseq2gud --genome hg38 --version abcd --test -P 3306
     """
 
-    # Initialize
-    global chroms
-    global engine
-    global Session
-    global source
-
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -197,11 +193,8 @@ def refgene_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False,
         session.close()
         engine.dispose()
 
-        # Split data
-        data_files = _split_data(data_file, threads)
-
         # Parallelize inserts to the database
-        ParseUtils.insert_data_files_in_parallel(data_files, partial(_insert_data, test=test), threads)
+        ingest(SPEC, data_file, {"source_id": source.uid}, chroms, threads, test)
 
     # Remove files
     if remove:
@@ -230,84 +223,6 @@ def _download_data(genome, table, dummy_dir="/tmp/"):
 
     return(data_file, ftp_file)
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["zless %s | wc -l" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "zless %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
-
-    # For each split file...
-    for split_file in os.listdir(split_dir):
-
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
-
-    return(split_files)
-
-def _insert_data(data_file, test=False):
-
-    # Initialize
-    session = Session()
-
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
-
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
-
-        # Skip empty lines
-        if not line:
-            continue
-
-        # Upsert region
-        region = Region()
-        region.chrom = line[2][3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = line[4]
-        region.end = line[5]
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
-
-        # Upsert gene
-        gene = Gene()
-        gene.name = line[1]
-        gene.gene_symbol = line[12]
-        gene.coding_start = line[6]
-        gene.coding_end = line[7]
-        gene.exon_starts = line[9].encode(encoding="UTF-8")
-        gene.exon_ends = line[10].encode(encoding="UTF-8")
-        gene.strand = line[3]
-        gene.region_id = region.uid
-        gene.source_id = source.uid
-        ParseUtils.upsert_gene(session, gene)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
-
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
-    session.close()
-    engine.dispose()
-
 #-------------#
 # Main        #
 #-------------#
@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import argparse
-from binning import assign_bin
 from functools import partial
 import getpass
 from multiprocessing import Pool, cpu_count
@@ -9,7 +8,6 @@ import os
 import pickle
 import re
 import shutil
-import subprocess
 import sys
 import tarfile
 import warnings
@@ -24,11 +22,18 @@ else:
 from GUD import GUDUtils
 from GUD.ORM.experiment import Experiment
 from GUD.ORM.gene import Gene
-from GUD.ORM.region import Region
 from GUD.ORM.sample import Sample
 from GUD.ORM.source import Source
 from GUD.ORM.tf_binding import TFBinding
 from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.checkpoint import Checkpoint
+from GUD.parsers.liftover import ChainIndex, lift_columns
+from GUD.parsers.load_data import DataLoader
+from GUD.parsers.merge import (merge_lines, read_bed_file,
+                               remove_partial_files, sort_bed_file)
+from GUD.parsers.partition import split_data
+from GUD.parsers.resolver import RegionResolver
 
 usage_msg = """
 usage: %s --genome STR --samples FILE [-h] [options]
@@ -36,6 +41,8 @@ usage: %s --genome STR --samples FILE [-h] [options]
 
 help_msg = """%s
 inserts ReMap 2020 transcription factor ChIP-seq data into GUD.
+Interrupted runs resume from their checkpoints (i.e. in the
+dummy directory).
 
   --genome STR        genome assembly
   --samples FILE      ReMap samples (manually-curated)
@@ -44,6 +51,9 @@ optional arguments:
   -h, --help          show this help message and exit
   --dummy-dir DIR     dummy directory (default = "/tmp/")
   -r, --remove        remove downloaded files (default = False)
+  --load-data         stage the data in files and load them
+                      with "LOAD DATA LOCAL INFILE" (requires
+                      "local_infile"; default = False)
   -t, --test          limit the total of inserts to ~1K per
                       thread for testing (default = False)
   --threads INT       number of threads to use (default = %s)
@@ -76,6 +86,7 @@ def parse_args():
     optional_group = parser.add_argument_group("optional arguments")
     optional_group.add_argument("-h", "--help", action="store_true")
     optional_group.add_argument("--dummy-dir", default="/tmp/")
+    optional_group.add_argument("--load-data", action="store_true")
     optional_group.add_argument("-r", "--remove", action="store_true")
     optional_group.add_argument("-t", "--test", action="store_true")
     optional_group.add_argument("--threads", default=(cpu_count() - 1))
@@ -143,9 +154,9 @@ def main():
     GUDUtils.db = args.db
 
     # Insert ReMap data
-    remap_to_gud(args.genome, args.samples, args.dummy_dir, args.remove, args.test, args.threads)
+    remap_to_gud(args.genome, args.samples, args.dummy_dir, args.remove, args.test, args.threads, args.load_data)
 
-def remap_to_gud(genome, samples_file, dummy_dir="/tmp/", remove=False, test=False, threads=1):
+def remap_to_gud(genome, samples_file, dummy_dir="/tmp/", remove=False, test=False, threads=1, load_data=False):
     """
     e.g. python -m GUD.parsers.remap2gud --genome hg38 --samples ./samples/ReMap.tsv
     """
@@ -171,6 +182,15 @@ def remap_to_gud(genome, samples_file, dummy_dir="/tmp/", remove=False, test=Fal
     if not os.path.isdir(dummy_dir):
         os.makedirs(dummy_dir)
 
+    # Get checkpoint (i.e. not when testing)
+    checkpoint = None
+    if not test:
+        checkpoint = Checkpoint(os.path.join(dummy_dir, "checkpoints"))
+
+        # Remove files left incomplete (i.e. resume only from completed
+        # downloads)
+        remove_partial_files(dummy_dir)
+
     # Unless pickle file exists
     pickle_file = os.path.join(dummy_dir, "datasets.pickle")
     if not os.path.exists(pickle_file):
@@ -238,11 +258,20 @@ def remap_to_gud(genome, samples_file, dummy_dir="/tmp/", remove=False, test=Fal
     grouped_datasets = _group_ReMap_datasets(datasets)
 
     # Partial function to enable parallelization
-    partial_func = partial(_insert_data, test=test, chains_file=chains_file)
+    partial_func = partial(_insert_data, test=test, chains_file=chains_file,
+        checkpoint=checkpoint)
+
+    # Features of all TFs are loaded at once (i.e. in genomic order)
+    loader = None
+    loaded = []
 
     # For each TF...
     for tf in sorted(grouped_datasets):
 
+        # Skip if completed (i.e. resume)
+        if checkpoint is not None and checkpoint.is_done(tf):
+            continue
+
         # Prepare data
         data_file = _preprocess_data(tf, grouped_datasets, datasets, dummy_dir,
             test, threads)
@@ -251,11 +280,44 @@ def remap_to_gud(genome, samples_file, dummy_dir="/tmp/", remove=False, test=Fal
         if not os.path.exists(data_file):
             continue
 
-        # Split data
-        data_files = _split_data(data_file, threads)
+        # Stage data
+        if load_data:
+            if loader is None:
+                loader = DataLoader(Session(), TFBinding, dummy_dir)
+            partial_func(data_file, loader=loader)
+            loaded.append(tf)
+            continue
+
+        else:
+
+            # Split data
+            data_files = _split_data(data_file, threads, checkpoint)
+
+            # Parallelize inserts to the database
+            ParseUtils.insert_data_files_in_parallel(list(data_files), partial_func, threads)
+
+            # i.e. unless an insert failed
+            if checkpoint is not None:
+                if not all(checkpoint.is_done(f) for f in data_files):
+                    continue
+
+        # Checkpoint
+        if checkpoint is not None:
+            checkpoint.done(tf)
+
+    # Load data into the database
+    if loader is not None:
+        loader.resolver.close()
+        loader.close()
+
+        # Checkpoint
+        if checkpoint is not None:
+            for tf in loaded:
+                checkpoint.done(tf)
 
-        # Parallelize inserts to the database
-        ParseUtils.insert_data_files_in_parallel(data_files, partial_func, threads)
+        # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+        loader.session.close()
+        engine.dispose()
 
     # Remove files
     if remove:
@@ -430,86 +492,64 @@ def _preprocess_data(tf, grouped_datasets, datasets, dummy_dir="/tmp/",
     test=False, threads=1):
 
     # Initialize
-    dummy_files = []
+    download_files = []
+    failed = False
+    iterables = []
     label = "ChIP-seq.%s" % tf
 
     # Skip if BED file exists
     bed_file = os.path.join(dummy_dir, "%s.bed" % label)
     if not os.path.exists(bed_file):
 
-        # Skip if BED file exists
-        dummy_file = os.path.join(dummy_dir, "dummy.bed")
-        if not os.path.exists(dummy_file):
-
-            # Get ENCODE BED files
-            pool = Pool(processes=threads)
-            partial_function = partial(_download_ReMap_bed_file, dummy_dir=dummy_dir, test=test)
-            for download_file in pool.imap(partial_function, grouped_datasets[tf]):
-
-                # Skip
-                if download_file is None:
-                    continue
-
-                # Initialize
-                m = re.search("%s/(\S+).bed.gz$" % dummy_dir, download_file)
-                dataset = m.group(1)
-
-                # Concatenate
-                cmd = "zless %s | awk '{print $1\"\t\"$2\"\t\"$3\"\t%s\t\"$7\"\t\"$10}' >> %s" % (download_file, dataset, dummy_file)
-                subprocess.call(cmd, shell=True)
-
-                # Remove downloaded file
-                os.remove(download_file)
-
-            pool.close()
+        # Get ReMap BED files (i.e. sorted)
+        pool = Pool(processes=threads)
+        partial_function = partial(_download_ReMap_bed_file, dummy_dir=dummy_dir, test=test)
+        for download_file in pool.imap(partial_function, grouped_datasets[tf]):
 
-        if os.path.exists(dummy_file):
+            # Skip (i.e. the TF is merged once all its downloads completed)
+            if download_file is None:
+                failed = True
+                continue
 
-            # Add dummy file
-            dummy_files.append(dummy_file)
+            # Initialize
+            m = re.search("%s/(\S+).bed.gz$" % dummy_dir, download_file)
+            dataset = m.group(1)
 
-            # Sort BED
-            dummy_file = os.path.join(dummy_dir, "dummy.sorted.bed")
-            if not os.path.exists(dummy_file):
+            # i.e. chrom, start, end, dataset, score and peak
+            download_files.append(download_file)
+            iterables.append(read_bed_file(download_file, [0, 1, 2, 6, 9], dataset))
 
-                # UNIX parallel sort is more efficient than bedtools
-                cmd = "LC_ALL=C sort --parallel=%s -T %s -k1,1 -k2,2n %s > %s" % (str(threads), dummy_dir, dummy_files[0], dummy_file)
-                subprocess.call(cmd, shell=True)
+        pool.close()
 
-            # Add dummy file
-            dummy_files.append(dummy_file)
+        if iterables and not failed:
 
-            # Copy file
-            shutil.copy(dummy_files[1], bed_file)
+            # Merge BED files (i.e. k-way merge, rather than concatenating
+            # and sorting them)
+            dummy_file = os.path.join(dummy_dir, "dummy.%s.bed" % label)
+            with open(dummy_file, "w") as handle:
+                for line in merge_lines(iterables, dummy_dir):
+                    handle.write("%s\n" % line)
+            os.rename(dummy_file, bed_file)
 
-            # Remove ALL dummy files
-            for dummy_file in dummy_files:
-                os.remove(dummy_file)
+            # Remove downloaded files
+            for download_file in download_files:
+                os.remove(download_file)
 
     return(bed_file)
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["wc -l %s" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
+def _split_data(data_file, threads=1, checkpoint=None):
 
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "split -d -l %s %s %s" % (int(L/threads)+1, data_file, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
+    # Skip if split (i.e. resume; offsets refer to these files)
+    key = "%s.split" % data_file
+    if checkpoint is not None and checkpoint.get(key) is not None:
+        return(checkpoint.get(key))
 
-    # For each split file...
-    for split_file in os.listdir(split_dir):
+    # Split by chromosome and bin range
+    split_files = split_data(data_file, threads)
 
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
+    # Checkpoint
+    if checkpoint is not None:
+        checkpoint.set(key, split_files)
 
     return(split_files)
 
@@ -527,84 +567,103 @@ def _download_ReMap_bed_file(dataset, dummy_dir="/tmp/", test=False):
         # Download BED file
         download_file += ".bed.gz"
         if not os.path.exists(download_file):
-            urlretrieve(dataset["bed_url"], download_file)
+            part_file = "%s.part.bed.gz" % download_file[:-7]
+            urlretrieve(dataset["bed_url"], part_file)
+
+            # Sort BED file (i.e. unless already sorted); the download
+            # file only exists once downloaded and sorted
+            sort_bed_file(part_file, download_file)
 
         return(download_file)
 
     except:
         return(None)
 
-def _insert_data(data_file, test=False, chains_file=None):
+def _insert_data(data_file, test=False, chains_file=None, loader=None,
+    checkpoint=None):
+
+    # Skip if completed (i.e. resume)
+    offset = 0
+    if checkpoint is not None and loader is None:
+        if checkpoint.is_done(data_file):
+            return
+        offset = checkpoint.get(data_file, 0)
 
     # Initialize
     session = Session()
+    if loader is not None:
+        writer = loader
+        resolver = loader.resolver
+    else:
+        writer = BulkWriter(session, TFBinding, dedup=True)
+        resolver = RegionResolver(session, writer)
     if chains_file is not None:
-        from pyliftover import LiftOver
-        lo = LiftOver(chains_file)
+        index = ChainIndex(chains_file)
 
     # Testing
     if test:
         lines = 0
         print(current_process().name)
 
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
+    # For each chunk...
+    columns = {0: "chrom", 1: "start", 2: "end", 3: "name", 4: "score", 5: "peak"}
+    for chunk, offset in ParseUtils.parse_bed_file_from(data_file, columns, offset):
 
-        # Initialize
-        dataset_name = line[3]
-
-        # Upsert region
-        region = Region()
-        region.chrom = str(line[0])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[1])
-        region.end = int(line[2])
-        if chains_file:
-            try:
-                chrom = "chr%s" % region.chrom
-                start = lo.convert_coordinate(chrom, region.start) # i.e. already 0-based
-                region.start = start[0][1]
-                end = lo.convert_coordinate(chrom, region.end - 1) # i.e. requires 0-based
-                region.end = end[0][1] + 1
-            except:
-                msg = "position could not be found in new assembly"
-                warnings.warn("%s: %s" % (msg, line[1]), Warning, stacklevel=2)
-                continue
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
+        # Skip invalid chromosomes
+        chunk = ParseUtils.filter_chroms(chunk, chroms)
 
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
+        # LiftOver (i.e. the whole chunk at once)
+        if chains_file:
+            chunk, unmapped = lift_columns(index, chunk)
+            chunk = ParseUtils.filter_chroms(chunk, chroms)
+            if unmapped:
+                msg = "positions could not be found in new assembly"
+                warnings.warn("%s: %s" % (msg, unmapped), Warning, stacklevel=2)
 
-        # Get sample
-        sample = dataset2samplesNsourcesNtfs[dataset_name][0]
+        # Testing
+        if test:
+            for name in chunk:
+                chunk[name] = chunk[name][:1000 - lines]
+            lines += len(chunk["chrom"])
+
+        # For each line...
+        for chrom, start, end, dataset_name, score, peak in zip(
+            chunk["chrom"].tolist(), chunk["start"].tolist(),
+            chunk["end"].tolist(), chunk["name"].tolist(),
+            chunk["score"].tolist(), chunk["peak"].tolist()):
+
+            # Get sample, source and tf
+            sample, source, tf = dataset2samplesNsourcesNtfs[dataset_name][:3]
+
+            # Upsert tf
+            resolver.add_coords(chrom, start, end, {
+                "sample_id": sample.uid, "experiment_id": experiment.uid,
+                "source_id": source.uid, "score": score, "peak": peak,
+                "tf": tf})
+
+        # Checkpoint (i.e. once the chunk has been committed)
+        if checkpoint is not None and loader is None:
+            resolver.flush()
+            writer.flush()
+            checkpoint.set(data_file, offset)
 
-        # Get source
-        source = dataset2samplesNsourcesNtfs[dataset_name][1]
+        # Testing
+        if test and lines == 1000:
+            break
 
-        # Upsert tf
-        tf = TFBinding()
-        tf.region_id = region.uid
-        tf.sample_id = sample.uid
-        tf.experiment_id = experiment.uid
-        tf.source_id = source.uid
-        tf.score = float(line[4])
-        tf.peak = int(line[5])
-        tf.tf = dataset2samplesNsourcesNtfs[dataset_name][2]
-        ParseUtils.upsert_tf(session, tf)
+    # Insert remaining features (i.e. the loader is closed once all the
+    # data is staged)
+    if loader is None:
+        resolver.close()
+        writer.close()
 
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
+    # Checkpoint
+    if checkpoint is not None and loader is None:
+        checkpoint.done(data_file)
 
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+    # i.e. connections are reused by the next file of the worker and
+    # closed when it exits (see ParseUtils.insert_data_files_in_parallel)
     session.close()
-    engine.dispose()
 
 #-------------#
 # Main        #
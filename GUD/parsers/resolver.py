@@ -0,0 +1,358 @@
+"""
+In-memory region uid resolution for the parsers
+"""
+
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import inspect
+from sqlalchemy.dialects import mysql
+import time
+
+# Import from GUD module
+from GUD.bins import assign_bins
+from GUD.ORM.region import Region
+from GUD.parsers import metrics
+from GUD.parsers.bulk import BATCH_SIZE, BulkWriter
+
+# Chromosomes of region keys (i.e. their order must never change)
+KEY_CHROMS = list(map(str, range(1, 23))) + ["X", "Y", "M"]
+KEY_BITS = 28
+# Chromosomes whose region uids are kept (i.e. unsorted input)
+CHROMS = 4
+# Regions fetched per round trip when preloading a chromosome
+FETCH_SIZE = 100000
+
+_key_chroms = dict((c, i + 1) for i, c in enumerate(KEY_CHROMS))
+_uses_region_keys = {}
+
+
+def pack(start, end):
+    """
+    Packs the coordinates of a region into one {int} (i.e. positions are
+    unsigned 32-bit integers), a more compact key than a {tuple}.
+    """
+
+    return(start << 32 | end)
+
+
+def get_region_key(chrom, start, end):
+    """
+    Returns the deterministic 64-bit uid of a region (i.e. region key): the
+    chromosome (i.e. its 1-based index in KEY_CHROMS), the start and the
+    length packed into 6 + 28 + 28 bits.
+    """
+
+    if chrom not in _key_chroms:
+        raise ValueError("invalid chromosome for region keys: %s" % chrom)
+    if start >= 1 << KEY_BITS or end - start >= 1 << KEY_BITS:
+        raise ValueError("invalid region for region keys: %s:%s-%s" % (chrom, start, end))
+
+    return(_key_chroms[chrom] << 2 * KEY_BITS | start << KEY_BITS | end - start)
+
+
+def uses_region_keys(bind):
+    """
+    Returns whether the database uses region keys (i.e. BIGINT region uids;
+    see GUD.parsers.gud2regionkeys).
+
+    @input:
+    bind {Engine} or {Session}
+    """
+
+    if hasattr(bind, "get_bind"):
+        bind = bind.get_bind()
+
+    url = str(bind.url)
+
+    if url not in _uses_region_keys:
+        columns = dict((c["name"], c["type"]) for c in inspect(bind).get_columns("regions"))
+        _uses_region_keys[url] = isinstance(columns["uid"], mysql.BIGINT)
+
+    return(_uses_region_keys[url])
+
+
+def set_region_key_types(table):
+    """
+    Sets the type of the columns of a {Table} that reference regions to
+    BIGINT (i.e. before creating it in a database with region keys).
+    """
+
+    for column in table.columns:
+        for foreign_key in column.foreign_keys:
+            if foreign_key.target_fullname == "regions.uid":
+                column.type = mysql.BIGINT(unsigned=True)
+
+
+class RegionUids(object):
+    """
+    Uids of the regions of a chromosome keyed by their packed coordinates:
+    those loaded from the database are kept in sorted {numpy} arrays (i.e.
+    16 bytes per region rather than a {dict} entry) and looked up with a
+    binary search, and those added afterwards in a {dict}.
+    """
+
+    def __init__(self, keys=None, uids=None):
+        """
+        @input:
+        keys {numpy.array} of packed coordinates (i.e. int64)
+        uids {numpy.array} of region uids (i.e. int64)
+        """
+
+        if keys is None:
+            keys = np.empty(0, dtype=np.int64)
+            uids = np.empty(0, dtype=np.int64)
+
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.uids = uids[order]
+        self._added = {}
+
+    def get(self, key, default=None):
+
+        uid = self._added.get(key)
+
+        if uid is None:
+            i = np.searchsorted(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                uid = int(self.uids[i])
+            else:
+                uid = default
+
+        return(uid)
+
+    def __contains__(self, key):
+
+        return(self.get(key) is not None)
+
+    def __getitem__(self, key):
+
+        uid = self.get(key)
+
+        if uid is None:
+            raise KeyError(key)
+
+        return(uid)
+
+    def __setitem__(self, key, uid):
+
+        self._added[key] = uid
+
+    def update(self, uids):
+
+        self._added.update(uids)
+
+
+def get_region_uids(session, chrom):
+    """
+    Returns the uids of the regions of a chromosome keyed by their packed
+    coordinates (i.e. {RegionUids}).
+    """
+
+    # Initialize
+    chunks = []
+    rows = []
+
+    q = session.query(Region.start, Region.end, Region.uid)\
+        .filter(Region.chrom == chrom)
+
+    for row in q.yield_per(FETCH_SIZE):
+        rows.append(row)
+        if len(rows) == FETCH_SIZE:
+            chunks.append(np.array(rows, dtype=np.int64))
+            rows = []
+    chunks.append(np.array(rows, dtype=np.int64).reshape(-1, 3))
+    rows = np.concatenate(chunks)
+
+    return(RegionUids(rows[:, 0] << 32 | rows[:, 1], rows[:, 2]))
+
+
+def _waited(seconds):
+
+    # i.e. live metrics of the process, if any
+    if metrics.get() is not None:
+        metrics.get().waited(seconds)
+
+
+def _set_region_id(feature, uid):
+
+    # i.e. ORM object or dict (see BulkWriter)
+    if isinstance(feature, dict):
+        feature["region_id"] = uid
+    else:
+        feature.region_id = uid
+
+
+class RegionResolver(object):
+    """
+    Resolves the region uids of features without querying the database for
+    every line: the regions of a chromosome are preloaded once, and those
+    of the last CHROMS chromosomes kept (i.e. rows should preferably be
+    sorted by chromosome), and features of new regions are held
+    back until a batch of new regions has been inserted (i.e. INSERT IGNORE)
+    and their uids fetched in one query, which also picks up those that
+    other processes inserted meanwhile. Features are then passed, with
+    their region uids, to the writer.
+
+    If the database uses region keys, uids are computed from the
+    coordinates instead (i.e. no lookups): regions are not preloaded and
+    new regions are only inserted (i.e. duplicates are ignored).
+
+    e.g.
+    writer = BulkWriter(session, TFBinding)
+    resolver = RegionResolver(session, writer)
+    for region, tf in tfs:
+        resolver.add(region, tf)
+    resolver.close()
+    writer.close()
+    """
+
+    def __init__(self, session, writer, batch_size=BATCH_SIZE):
+        """
+        @input:
+        session {Session}
+        writer {BulkWriter} features writer
+        batch_size {int} new regions per batch
+        """
+
+        self.session = session
+        self.writer = writer
+        self.batch_size = batch_size
+        self.regions = 0
+        self.retried = 0
+        self.deadlocks = 0
+        self.keyed = session is not None and uses_region_keys(session)
+
+        self.chrom = None
+        self.uids = RegionUids()
+        self._chroms = OrderedDict()
+        self._pending = {}
+
+    def add(self, region, feature):
+        """
+        Sets the region uid of a feature (i.e. region_id) and passes it to
+        the writer; features of new regions are held back until the next
+        batch of new regions is inserted.
+        """
+
+        self.add_coords(region.chrom, region.start, region.end, feature)
+
+    def add_coords(self, chrom, start, end, feature):
+        """
+        Same as add() but from the coordinates of the region (i.e. no
+        {Region} objects; e.g. for column-wise parsers).
+        """
+
+        key = self._key(chrom, start, end)
+        uid = self.uids.get(key)
+
+        if uid is not None:
+            _set_region_id(feature, uid)
+            self.writer.add(feature)
+        else:
+            self._add_new(chrom, start, end, key, feature)
+
+    def get_uid(self, region):
+        """
+        Returns the uid of a region right away (i.e. new regions are
+        inserted along with any pending ones).
+        """
+
+        key = self._key(region.chrom, region.start, region.end)
+
+        if key not in self.uids:
+            self._pending.setdefault(key, [])
+            self.flush()
+
+        return(self.uids[key])
+
+    def _key(self, chrom, start, end):
+
+        # Regions of a new chromosome
+        if chrom != self.chrom:
+            self.flush()
+            self.chrom = chrom
+            if self.writer is not None:
+                self.writer.set_chrom(chrom)
+            self.uids = self._get_uids(chrom)
+
+        return(pack(start, end))
+
+    def _get_uids(self, chrom):
+
+        # i.e. least recently used first
+        if chrom in self._chroms:
+            self._chroms[chrom] = self._chroms.pop(chrom)
+        else:
+            if len(self._chroms) >= CHROMS:
+                self._chroms.popitem(last=False)
+            if self.keyed:
+                self._chroms[chrom] = RegionUids()
+            else:
+                t = time.time()
+                self._chroms[chrom] = get_region_uids(self.session, chrom)
+                _waited(time.time() - t)
+
+        return(self._chroms[chrom])
+
+    def _add_new(self, chrom, start, end, key, feature):
+
+        self._pending.setdefault(key, []).append(feature)
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Inserts the new regions and passes their features to the writer.
+        """
+
+        # Initialize
+        rows = []
+        starts = set()
+
+        if not self._pending:
+            return
+
+        keys = np.fromiter(self._pending, dtype=np.uint64,
+                           count=len(self._pending))
+        bins = assign_bins(keys >> np.uint64(32), keys & np.uint64(0xFFFFFFFF))
+
+        for key, bin in zip(self._pending, bins.tolist()):
+            start, end = key >> 32, key & 0xFFFFFFFF
+            rows.append({"bin": bin, "chrom": self.chrom, "start": start,
+                         "end": end})
+            if self.keyed:
+                rows[-1]["uid"] = get_region_key(self.chrom, start, end)
+                self.uids[key] = rows[-1]["uid"]
+            starts.add(start)
+
+        # Insert regions
+        writer = BulkWriter(self.session, Region, batch_size=len(rows))
+        writer.add_all(rows)
+        writer.close()
+        self.regions += len(rows)
+        self.retried += writer.retried
+        self.deadlocks += writer.deadlocks
+
+        # Get uids
+        if not self.keyed:
+            t = time.time()
+            q = self.session.query(Region.start, Region.end, Region.uid)\
+                .filter(Region.chrom == self.chrom, Region.start.in_(starts))
+            for s, e, u in q:
+                self.uids[pack(s, e)] = u
+            _waited(time.time() - t)
+
+        for key, features in self._pending.items():
+            for feature in features:
+                _set_region_id(feature, self.uids[key])
+                self.writer.add(feature)
+        self._pending = {}
+
+    def close(self):
+        """
+        Inserts any remaining new regions and passes their features to the
+        writer (i.e. close the writer afterwards).
+        """
+
+        self.flush()
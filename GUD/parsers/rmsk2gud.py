@@ -2,13 +2,11 @@
 
 import argparse
 from binning import assign_bin
-from functools import partial
 import getpass
 from multiprocessing import cpu_count
 import os
 import re
 import shutil
-import subprocess
 import sys
 
 # Import from GUD module
@@ -17,6 +15,9 @@ from GUD.ORM.region import Region
 from GUD.ORM.repeat_mask import RepeatMask
 from GUD.ORM.source import Source
 from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.pipeline import run_pipeline
+from GUD.parsers.resolver import RegionResolver
 
 usage_msg = """
 usage: %s --genome STR --version STR [-h] [options]
@@ -32,9 +33,12 @@ optional arguments:
   -h, --help          show this help message and exit
   --dummy-dir DIR     dummy directory (default = "/tmp/")
   -r, --remove        remove downloaded files (default = False)
+  --producers INT     number of processes parsing the data
+                      (default = 1)
   -t, --test          limit the total of inserts to ~1K per
                       thread for testing (default = False)
-  --threads INT       number of threads to use (default = %s)
+  --threads INT       number of threads to use (i.e. to insert
+                      the data; default = %s)
 
 mysql arguments:
   -d STR, --db STR    database name (default = "%s")
@@ -64,6 +68,7 @@ def parse_args():
     optional_group.add_argument("-h", "--help", action="store_true")
     optional_group.add_argument("--dummy-dir", default="/tmp/")
     optional_group.add_argument("-r", "--remove", action="store_true")
+    optional_group.add_argument("--producers", default=1)
     optional_group.add_argument("-t", "--test", action="store_true")
     optional_group.add_argument("--threads", default=(cpu_count() - 1))
     
@@ -105,6 +110,14 @@ def check_args(args):
         print(": ".join(error))
         exit(0)
 
+    # Check "--producers" argument
+    try:
+        args.producers = int(args.producers)
+    except:
+        error = ["%s\n%s" % (usage_msg, os.path.basename(__file__)), "error", "argument \"--producers\"", "invalid int value", "\"%s\"\n" % args.producers]
+        print(": ".join(error))
+        exit(0)
+
     # Check MySQL password
     if not args.pwd:
         args.pwd = ""
@@ -130,9 +143,9 @@ def main():
     GUDUtils.db = args.db
 
     # Insert repeating elements by RepeatMasker
-    rmsk_to_gud(args.genome, args.version, args.dummy_dir, args.remove, args.test, args.threads)
+    rmsk_to_gud(args.genome, args.version, args.dummy_dir, args.remove, args.test, args.threads, args.producers)
 
-def rmsk_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False, threads=1):
+def rmsk_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False, threads=1, producers=1):
     """
     e.g. python -m GUD.parsers.rmsk2gud --genome hg38 --version abcd --test -P 3306
     """
@@ -143,11 +156,6 @@ def rmsk_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False, th
     global Session
     global source
 
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -194,11 +202,14 @@ def rmsk_to_gud(genome, version, dummy_dir="/tmp/", remove=False, test=False, th
     session.close()
     engine.dispose()
 
-    # Split data
-    data_files = _split_data(data_file, threads)
+    # Testing
+    if test:
+        limit = 1000 * threads
+    else:
+        limit = None
 
-    # Parallelize inserts to the database
-    ParseUtils.insert_data_files_in_parallel(data_files, partial(_insert_data, test=test), threads)
+    # Stream data into the database
+    run_pipeline(data_file, _parse_line, _insert_records, producers, threads, limit=limit, metrics_dir=os.path.join(dummy_dir, "metrics"))
 
     # Remove files
     if remove:
@@ -227,79 +238,55 @@ def _download_data(genome, dummy_dir="/tmp/"):
 
     return(data_file, ftp_file)
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["zless %s | wc -l" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "zless %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
+def _parse_line(line):
+    """
+    Returns a record (i.e. chrom, start, end, score, name, class, family
+    and strand) or None.
+    """
 
-    # For each split file...
-    for split_file in os.listdir(split_dir):
+    # Skip empty lines
+    if not line:
+        return(None)
 
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
+    chrom = str(line[5])
+    if chrom.startswith("chr"):
+        chrom = chrom[3:]
+    if chrom not in chroms:
+        return(None)
 
-    return(split_files)
+    return((chrom, int(line[6]), int(line[7]), float(line[1]), line[10],
+            line[11], line[12], line[9]))
 
-def _insert_data(data_file, test=False):
+def _insert_records(records):
 
     # Initialize
     session = Session()
+    writer = BulkWriter(session, RepeatMask, dedup=True)
+    resolver = RegionResolver(session, writer)
 
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
-
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
-
-        # Skip empty lines
-        if not line:
-            continue
+    # For each record...
+    for chrom, start, end, score, name, repeat_class, family, strand in records:
 
         # Upsert region
         region = Region()
-        region.chrom = str(line[5])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[6])
-        region.end = int(line[7])
+        region.chrom = chrom
+        region.start = start
+        region.end = end
         region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
 
         # Upsert CpG island
         repeat = RepeatMask()
-        repeat.score = float(line[1])
-        repeat.name = line[10]
-        repeat.repeat_class = line[11]
-        repeat.family = line[12]
-        repeat.strand = line[9]
-        repeat.region_id = region.uid
+        repeat.score = score
+        repeat.name = name
+        repeat.repeat_class = repeat_class
+        repeat.family = family
+        repeat.strand = strand
         repeat.source_id = source.uid
-        ParseUtils.upsert_rmsk(session, repeat)
+        resolver.add(region, repeat)
 
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
+    # Insert remaining features
+    resolver.close()
+    writer.close()
 
     # This is ABSOLUTELY necessary to prevent MySQL from crashing!
     session.close()
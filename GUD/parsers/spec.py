@@ -0,0 +1,332 @@
+"""
+Declarative source specs and the ingestion engine shared by the parsers
+(i.e. columnar reading, batching, parallelism and checkpoints)
+"""
+
+from functools import partial
+from multiprocessing import current_process
+import os
+from sqlalchemy.orm import Session
+import time
+
+# Import from GUD module
+from GUD.parsers import ParseUtils, metrics
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.load_data import DataLoader
+from GUD.parsers.partition import split_data
+from GUD.parsers.resolver import RegionResolver
+
+# Lines per chunk
+CHUNK_SIZE = 100000
+# Lines per file when testing
+TEST_LIMIT = 1000
+
+
+class Encoded(object):
+    """
+    Field of the UTF-8 encoded values of a column (e.g. for BLOBs).
+
+    e.g.
+    fields = {"exon_starts": Encoded("exon_starts")}
+    """
+
+    def __init__(self, column):
+
+        self.column = column
+
+    def __call__(self, chunk):
+
+        return([v.encode("UTF-8") for v in chunk[self.column].tolist()])
+
+
+class Dimension(object):
+    """
+    Field of the uids of dimension rows (e.g. samples) got from the values
+    of a column, once per value and file (i.e. get_uid is only called for
+    new values).
+
+    e.g.
+    fields = {"sample_id": Dimension("name", _get_sample_uid)}
+    """
+
+    def __init__(self, column, get_uid):
+        """
+        @input:
+        column {str}
+        get_uid {function} session and value to uid (i.e. module-level,
+                           for specs are passed to other processes)
+        """
+
+        self.column = column
+        self.get_uid = get_uid
+        self._uids = {}
+
+    def get_uids(self, session, chunk):
+
+        # Initialize
+        uids = []
+
+        for value in chunk[self.column].tolist():
+            if value not in self._uids:
+                self._uids[value] = self.get_uid(session, value)
+            uids.append(self._uids[value])
+
+        return(uids)
+
+
+class SourceSpec(object):
+    """
+    Declares how the lines of a source map to the rows of a table: the
+    columns to read, the ORM attributes set from them (i.e. columns of
+    the same name, functions of a chunk or dimensions) and whether
+    duplicates of its uniqueness key (i.e. the unique constraint of the
+    table, unless given) are dropped in memory. Sources are then ingested
+    by the shared engine (see ingest).
+
+    e.g.
+    spec = SourceSpec(CpGIsland, {1: "chrom", 2: "start", 3: "end",
+                                  6: "cpgs", 7: "gcs"},
+                      dtypes={"cpgs": "int64", "gcs": "int64"})
+    ingest(spec, data_file, {"source_id": source.uid}, chroms, threads)
+    """
+
+    def __init__(self, table, columns, fields=None, dtypes=None, based=0,
+                 dedup=True, key=None, chunksize=CHUNK_SIZE):
+        """
+        @input:
+        table {DeclarativeMeta} e.g. CpGIsland
+        columns {dict} 0-based column indices to names; requires "chrom",
+                       "start" and "end"
+        fields {dict} ORM attributes to column names, functions of a chunk
+                      (i.e. one value per line) or {Dimension}s (default =
+                      all columns other than the coordinates)
+        dtypes {dict} names to dtypes (default = BED_DTYPES, or str)
+        based {int} 1 for 1-based starts (default = 0)
+        dedup {bool} drop duplicates in memory (default = True)
+        key {list} ORM attributes of the uniqueness key (default = the
+                   unique constraint of the table; see KeySet)
+        chunksize {int} lines per chunk
+        """
+
+        self.table = table
+        self.columns = columns
+        self.dtypes = dtypes
+        self.based = based
+        self.dedup = dedup
+        self.key = key
+        self.chunksize = chunksize
+
+        if fields is None:
+            fields = dict((c, c) for c in columns.values()
+                          if c not in ("chrom", "start", "end"))
+        self.fields = fields
+
+        # i.e. for split_data
+        indices = dict((c, i) for i, c in columns.items())
+        self.chrom_idx = indices["chrom"]
+        self.start_idx = indices["start"]
+
+    def parse(self, data_file, chroms, limit=None):
+        """
+        Yields the chunks of a file (see ParseUtils.parse_bed_file) of
+        valid chromosomes, with 0-based starts.
+
+        @input:
+        data_file {str}
+        chroms {list} valid chromosomes
+        limit {int} max. number of lines (default = all)
+        """
+
+        # Initialize
+        lines = 0
+
+        for chunk in ParseUtils.parse_bed_file(data_file, self.columns,
+                                               self.dtypes, self.chunksize):
+
+            # Skip invalid chromosomes
+            chunk = ParseUtils.filter_chroms(chunk, chroms)
+            if self.based:
+                chunk["start"] = chunk["start"] - self.based
+
+            if limit is not None:
+                for name in chunk:
+                    chunk[name] = chunk[name][:limit - lines]
+            lines += len(chunk["chrom"])
+
+            yield(chunk)
+
+            if lines == limit:
+                break
+
+    def get_features(self, session, chunk, values={}):
+        """
+        Returns the coordinates and features (i.e. {dict}s keyed by ORM
+        attribute) of a chunk.
+
+        @input:
+        session {Session} (i.e. for dimensions)
+        chunk {dict} names to {numpy.ndarray}
+        values {dict} ORM attributes to values of every feature
+                      (e.g. {"source_id": source.uid})
+
+        @return: {list} of (chrom, start, end, {dict})
+        """
+
+        # Initialize
+        features = []
+        names = list(self.fields)
+        columns = []
+
+        for name in names:
+            field = self.fields[name]
+            if isinstance(field, Dimension):
+                columns.append(field.get_uids(session, chunk))
+            elif callable(field):
+                columns.append(field(chunk))
+            else:
+                columns.append(chunk[field].tolist())
+
+        for row in zip(chunk["chrom"].tolist(), chunk["start"].tolist(),
+                       chunk["end"].tolist(), *columns):
+            feature = dict(values)
+            feature.update(zip(names, row[3:]))
+            features.append((row[0], row[1], row[2], feature))
+
+        return(features)
+
+
+def insert_file(spec, data_file, values, chroms, test=False, load_data=False):
+    """
+    Inserts the features of a file (i.e. in one process, with the
+    connections of ParseUtils.engine; see ingest).
+
+    @input:
+    spec {SourceSpec}
+    data_file {str}
+    values {dict} ORM attributes to values of every feature
+    chroms {list} valid chromosomes
+    test {bool} insert ~1K lines (default = False)
+    load_data {bool} with LOAD DATA (see DataLoader; default = False)
+
+    @return: {dict} rows, duplicates and regions inserted
+    """
+
+    # Initialize
+    session = Session(bind=ParseUtils.engine)
+    if load_data:
+        writer = DataLoader(session, spec.table, os.path.dirname(data_file),
+                            key=spec.key)
+        resolver = writer.resolver
+    else:
+        writer = BulkWriter(session, spec.table, dedup=spec.dedup,
+                            key=spec.key)
+        resolver = RegionResolver(session, writer)
+
+    # Testing
+    if test:
+        limit = TEST_LIMIT
+        print(current_process().name)
+    else:
+        limit = None
+
+    # For each chunk...
+    chunks = spec.parse(data_file, chroms, limit)
+    if metrics.get() is not None:
+        chunks = metrics.get().timed(chunks)
+    for chunk in chunks:
+        t = time.time()
+        features = spec.get_features(session, chunk, values)
+        if metrics.get() is not None:
+            metrics.get().parsed(len(features), time.time() - t)
+        for chrom, start, end, feature in features:
+            resolver.add_coords(chrom, start, end, feature)
+
+    # Insert remaining features
+    resolver.close()
+    writer.close()
+
+    # i.e. connections are reused by the next file of the worker and
+    # closed when it exits (see ParseUtils.insert_data_files_in_parallel)
+    session.close()
+
+    return({"rows": writer.rows, "duplicates": writer.duplicates,
+            "regions": resolver.regions})
+
+
+def _insert_file(data_file, spec, values, chroms, test=False, checkpoint=None):
+
+    insert_file(spec, data_file, values, chroms, test)
+
+    if checkpoint is not None:
+        checkpoint.done(data_file)
+
+
+def ingest(spec, data_file, values, chroms, threads=1, test=False,
+           load_data=False, checkpoint=None):
+    """
+    Ingests a source: its file is split by chromosome and bin range (see
+    GUD.parsers.partition) and the parts are inserted in parallel, or, with
+    load_data, loaded in one process.
+
+    With a {Checkpoint}, the split files are recorded and each of them is
+    marked as completed once inserted, so that a restarted job skips them.
+
+    Live metrics are recorded in the "metrics" folder next to the file and
+    summarized periodically (see GUD.parsers.metrics).
+
+    @input:
+    spec {SourceSpec}
+    data_file {str}
+    values {dict} ORM attributes to values of every feature
+                  (e.g. {"source_id": source.uid})
+    chroms {list} valid chromosomes
+    threads {int}
+    test {bool} insert ~1K lines per process (default = False)
+    load_data {bool} with LOAD DATA (default = False)
+    checkpoint {Checkpoint}
+    """
+
+    # Initialize
+    metrics_dir = os.path.join(os.path.dirname(data_file), "metrics")
+
+    if load_data:
+        with metrics.Monitor(metrics_dir, _get_expected([data_file], test)):
+            metrics.run(partial(insert_file, load_data=True), metrics_dir,
+                        spec, data_file, values, chroms, test)
+
+        # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+        ParseUtils.engine.dispose()
+
+        return
+
+    # Split data (i.e. unless resuming)
+    key = "%s.split" % data_file
+    if checkpoint is not None and checkpoint.get(key) is not None:
+        data_files = checkpoint.get(key)
+    else:
+        data_files = split_data(data_file, threads, spec.chrom_idx,
+                                spec.start_idx)
+        if checkpoint is not None:
+            checkpoint.set(key, data_files)
+
+    # Skip completed files
+    if checkpoint is not None:
+        data_files = [f for f in data_files if not checkpoint.is_done(f)]
+
+    # Parallelize inserts to the database
+    ParseUtils.insert_data_files_in_parallel(data_files,
+        partial(_insert_file, spec=spec, values=values, chroms=chroms,
+                test=test, checkpoint=checkpoint), threads,
+        metrics_dir=metrics_dir, expected=_get_expected(data_files, test))
+
+
+def _get_expected(data_files, test=False):
+
+    # i.e. rows to parse, for the ETA
+    lines = [metrics.estimate_lines(f) for f in data_files]
+    if None in lines:
+        return(None)
+    if test:
+        return(sum(min(l, TEST_LIMIT) for l in lines))
+
+    return(sum(lines))
@@ -1,20 +1,16 @@
 #!/usr/bin/env python
 
 from GUD.parsers import ParseUtils
+from GUD.parsers.spec import SourceSpec, ingest
 from GUD.ORM.short_tandem_repeat import ShortTandemRepeat
 from GUD.ORM.source import Source
-from GUD.ORM.region import Region
 from GUD import GUDUtils
-from binning import assign_bin
-from functools import partial
 import getpass
 from multiprocessing import Pool, cpu_count
 from numpy import isnan
 import os
 import sys
-import re
 import shutil
-import subprocess
 import warnings
 import argparse
 
@@ -38,6 +34,8 @@ into GUD.
 
 optional arguments:
   -h, --help          show this help message and exit
+  --dummy-dir DIR     dummy directory (default = "/tmp/")
+  -r, --remove        remove downloaded files (default = False)
   -t, --test          limit the total of inserts to ~1K per
                       thread for testing (default = False)
   --threads INT       number of threads to use (default = %s)
@@ -71,6 +69,8 @@ def parse_args():
     # Optional args
     optional_group = parser.add_argument_group("optional arguments")
     optional_group.add_argument("-h", "--help", action="store_true")
+    optional_group.add_argument("--dummy-dir", default="/tmp/")
+    optional_group.add_argument("-r", "--remove", action="store_true")
     optional_group.add_argument("-t", "--test", action="store_true")
     optional_group.add_argument("--threads", default=(cpu_count() - 1))
 
@@ -163,25 +163,15 @@ def main():
 
     # Insert short tandem repeats
     str_to_gud(args.genome, args.source_name, args.str_file,
-               args.based, args.test, args.threads)
+               args.based, args.test, args.threads, args.dummy_dir,
+               args.remove)
 
 
-def str_to_gud(genome, source_name, str_file, based, test=False, threads=1):
+def str_to_gud(genome, source_name, str_file, based, test=False, threads=1, dummy_dir="/tmp/", remove=False):
     """
     python -m GUD.parsers.str2gud --genome hg38 --source_name <name> --str_file <FILE> --based <0|1>
     """
 
-    # Initialize
-    global chroms
-    global engine
-    global Session
-    global source
-
-    # Testing
-    if test:
-        global current_process
-        from multiprocessing import current_process
-
     # Create dummy dir
     subdir = "%s.%s" % (genome, os.path.basename(__file__))
     dummy_dir = os.path.join(dummy_dir, subdir)
@@ -221,12 +211,11 @@ def str_to_gud(genome, source_name, str_file, based, test=False, threads=1):
     session.close()
     engine.dispose()
 
-    # Split data
-    data_files = _split_data(str_file, threads)
-
     # Parallelize inserts to the database
-    ParseUtils.insert_data_files_in_parallel(
-        data_files, partial(_insert_data, based=based, test=test), threads)
+    spec = SourceSpec(ShortTandemRepeat,
+        {0: "chrom", 1: "start", 2: "end", 3: "motif", 4: "pathogenicity"},
+        dtypes={"pathogenicity": "int64"}, based=based)
+    ingest(spec, str_file, {"source_id": source.uid}, chroms, threads, test)
 
     # Remove files
     if remove:
@@ -236,77 +225,6 @@ def str_to_gud(genome, source_name, str_file, based, test=False, threads=1):
     Session.remove()
 
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["wc -l %s" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "less %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
-
-    # For each split file...
-    for split_file in os.listdir(split_dir):
-
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
-
-    return(split_files)
-
-def _insert_data(data_file, based=1, test=False):
-
-    # Initialize
-    session = Session()
-
-    # Testing
-    if test:
-        lines = 0
-        print(current_process().name)
-
-    # For each line...
-    for line in ParseUtils.parse_tsv_file(data_file):
-
-        # Upsert region
-        region = Region()
-        region.chrom = str(line[0])
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(line[1]) - based
-        region.end = int(line[2])
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
-        # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
-
-        # Upsert short tandem repeat
-        STR = ShortTandemRepeat()
-        STR.region_id = region.uid
-        STR.source_id = source.uid
-        STR.motif = line[3]
-        STR.pathogenicity = int(line[4])
-        ParseUtils.upsert_str(session, STR)
-
-        # Testing
-        if test:
-            lines += 1
-            if lines == 1000:
-                break
-
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
-    session.close()
-    engine.dispose()
-
 #-------------#
 # Main        #
 #-------------#
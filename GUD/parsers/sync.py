@@ -0,0 +1,117 @@
+"""
+Incremental updates (i.e. keyed diffs between a new release and what is
+already loaded) for the parsers
+"""
+
+from sqlalchemy import bindparam, text
+
+# Import from GUD module
+from GUD.parsers.bulk import BATCH_SIZE
+from GUD.parsers.dedup import hash_key
+
+
+def get_digest(values):
+    """
+    Returns a 64-bit digest of the values of a row (i.e. to compare rows
+    parsed from a release with those read from the database): bytes are
+    decoded and floats rounded to 6 significant digits (i.e. as stored by
+    MySQL FLOAT columns).
+
+    @input:
+    values {list} or {tuple}
+
+    @return: {int}
+    """
+
+    # Initialize
+    normalized = []
+
+    for value in values:
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        elif isinstance(value, float):
+            if value != value:
+                value = None
+            else:
+                value = float("%.6g" % value)
+        normalized.append(value)
+
+    return(hash_key(normalized))
+
+
+class Diff(object):
+    """
+    Keyed diff between the rows of a release and those loaded (i.e. {dict}
+    of keys, e.g. clinvar_variation_ID or accession, to digests): keys only
+    in the release are inserted, keys whose digests differ are updated and
+    keys no longer in the release are deleted.
+
+    e.g.
+    diff = Diff(loaded, release)
+    print(diff)
+    """
+
+    def __init__(self, old, new):
+        """
+        @input:
+        old {dict} keys to digests of the loaded rows
+        new {dict} keys to digests of the rows of the release
+        """
+
+        self.inserts = sorted(k for k in new if k not in old)
+        self.updates = sorted(k for k in new if k in old and new[k] != old[k])
+        self.deletes = sorted(k for k in old if k not in new)
+        self.unchanged = len(new) - len(self.inserts) - len(self.updates)
+
+    def __len__(self):
+
+        return(len(self.inserts) + len(self.updates) + len(self.deletes))
+
+    def __str__(self):
+
+        return("%s inserts, %s updates, %s deletes (%s unchanged)" % \
+            (len(self.inserts), len(self.updates), len(self.deletes),
+             self.unchanged))
+
+    def get_changed(self):
+        """
+        Returns the keys to (re-)insert (i.e. inserts and updates).
+
+        @return: {set}
+        """
+
+        return(set(self.inserts) | set(self.updates))
+
+
+def delete_rows(session, table, column, values, batch_size=BATCH_SIZE):
+    """
+    Deletes the rows of a table whose column is any of the values, in
+    batches (i.e. one DELETE of at most batch_size rows and one commit at a
+    time, so that locks are short-lived).
+
+    @input:
+    session {Session}
+    table {Table}
+    column {str} e.g. "uid" or "sourceID"
+    values {list}
+    batch_size {int}
+
+    @return: {int} number of rows deleted
+    """
+
+    # Initialize
+    deleted = 0
+    values = list(values)
+    stmt = text("DELETE FROM `%s` WHERE `%s` IN :values LIMIT %s" % \
+        (table.name, column, batch_size))
+    stmt = stmt.bindparams(bindparam("values", expanding=True))
+
+    for i in range(0, len(values), batch_size):
+        while True:
+            rows = session.execute(stmt, {"values": values[i:i + batch_size]}).rowcount
+            session.commit()
+            deleted += rows
+            if rows < batch_size:
+                break
+
+    return(deleted)
@@ -0,0 +1,222 @@
+"""
+Streaming VCF reader for the parsers (i.e. only the INFO keys and ANN
+subfields needed, one chromosome at a time)
+"""
+
+import gzip
+import os
+import shutil
+
+# Optional: tabix/CSI indices of bgzipped files
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+
+def get_info(info, keys):
+    """
+    Returns the values of the given keys of an INFO field (i.e. the values
+    of other keys are discarded as they are found).
+
+    @input:
+    info {str} e.g. "ALLELEID=15041;CLNSIG=Pathogenic;ANN=..."
+    keys {set} e.g. set(["CLNSIG", "ANN"])
+
+    @return: {dict} (i.e. flags and missing keys are absent)
+    """
+
+    # Initialize
+    values = {}
+
+    for pair in info.split(";"):
+        key, sep, value = pair.partition("=")
+        if sep and key in keys:
+            values[key] = value
+
+    return(values)
+
+
+def get_ann(ann, indices):
+    """
+    Returns the subfields of the first annotation of an ANN value (i.e.
+    split up to the last subfield needed).
+
+    @input:
+    ann {str} e.g. "A|missense_variant|MODERATE|BRCA2|..."
+    indices {list} of {int} 0-based indices of the subfields
+
+    @return: {list} of {str} (i.e. all None if ANN is absent or short)
+    """
+
+    if ann is None:
+        return([None] * len(indices))
+
+    fields = ann.split("|", max(indices) + 1)
+    if len(fields) <= max(indices):
+        return([None] * len(indices))
+
+    return([fields[i] for i in indices])
+
+
+class VCFReader(object):
+    """
+    Reads the variants of a VCF file one chromosome at a time, so that
+    chromosomes can be processed in parallel: through a tabix/CSI index if
+    there is one (i.e. bgzipped file, requires pysam) or through the byte
+    ranges of each chromosome found in one pass over the file (i.e. other
+    compressed files are decompressed first).
+
+    Only the first eight columns are split, and only the given INFO keys
+    and ANN subfields are extracted.
+
+    e.g.
+    reader = VCFReader(vcf_file, ["CLNSIG"], [1, 2])
+    for chrom in reader.get_chroms():
+        for chrom, pos, id, ref, alt, values in reader.parse_chrom(chrom):
+            ...
+    """
+
+    def __init__(self, vcf_file, info_keys=[], ann_indices=[],
+                 dummy_dir="/tmp/"):
+        """
+        @input:
+        vcf_file {str}
+        info_keys {list} of {str} e.g. ["CLNSIG", "CADD"]
+        ann_indices {list} of {int} 0-based indices of ANN subfields
+        dummy_dir {str} where to decompress files without indices
+        """
+
+        self.file_name = vcf_file
+        self.info_keys = list(info_keys)
+        self.ann_indices = list(ann_indices)
+        self._keys = set(self.info_keys + ["ANN"])
+        self._ranges = None
+
+        # Index (if any)
+        self.tabix = pysam is not None and \
+            (os.path.exists("%s.tbi" % vcf_file) or os.path.exists("%s.csi" % vcf_file))
+
+        if not self.tabix:
+            if vcf_file.endswith(".gz"):
+                self.file_name = self._decompress(vcf_file, dummy_dir)
+            self._ranges = self._get_ranges()
+
+    def _decompress(self, vcf_file, dummy_dir="/tmp/"):
+
+        file_name = os.path.join(dummy_dir, os.path.basename(vcf_file)[:-3])
+
+        with gzip.open(vcf_file, "rb") as f_in:
+            with open(file_name, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+
+        return(file_name)
+
+    def _get_ranges(self):
+        """
+        Returns the byte ranges of the lines of each chromosome (i.e. one
+        range per chromosome if sorted).
+
+        @return: {dict} chromosome to {list} of [start, end]
+        """
+
+        # Initialize
+        ranges = {}
+        offset = 0
+        chrom = None
+
+        with open(self.file_name, "rb") as handle:
+
+            for line in handle:
+
+                if line.strip() and not line.startswith(b"#"):
+                    c = line[:line.find(b"\t")]
+                    if c != chrom:
+                        if chrom is not None:
+                            ranges[chrom.decode("utf-8")][-1][1] = offset
+                        chrom = c
+                        ranges.setdefault(c.decode("utf-8"), []).append([offset, None])
+
+                offset += len(line)
+
+        if chrom is not None:
+            ranges[chrom.decode("utf-8")][-1][1] = offset
+
+        return(ranges)
+
+    def get_chroms(self):
+        """
+        Returns the chromosomes of the file, largest first if their sizes
+        are known (i.e. to balance parallel workers).
+
+        @return: {list} of {str}
+        """
+
+        if self.tabix:
+            with pysam.TabixFile(self.file_name) as tbx:
+                return(list(tbx.contigs))
+
+        sizes = dict((c, sum(e - s for s, e in r)) for c, r in self._ranges.items())
+
+        return(sorted(sizes, key=lambda c: -sizes[c]))
+
+    def _get_lines(self, chrom):
+
+        if self.tabix:
+            with pysam.TabixFile(self.file_name) as tbx:
+                for line in tbx.fetch(chrom):
+                    yield(line)
+            return
+
+        with open(self.file_name, "rb") as handle:
+            for start, end in self._ranges.get(chrom, []):
+                handle.seek(start)
+                offset = start
+                while offset < end:
+                    line = handle.readline()
+                    offset += len(line)
+                    # Skip empty lines
+                    if line.strip():
+                        yield(line.decode("utf-8"))
+
+    def parse_line(self, line):
+        """
+        Returns a variant (i.e. chrom, 1-based position, ID, ref, alt and
+        the values of the INFO keys followed by those of the ANN subfields).
+
+        @return: {tuple}
+        """
+
+        chrom, pos, vid, ref, alt, qual, flt, info = line.rstrip("\r\n").split("\t", 8)[:8]
+        info = get_info(info, self._keys)
+        values = [info.get(k) for k in self.info_keys]
+        if self.ann_indices:
+            values += get_ann(info.get("ANN"), self.ann_indices)
+
+        return((chrom, int(pos), vid, ref, alt, values))
+
+    def parse_chrom(self, chrom, limit=None):
+        """
+        Yields the variants of a chromosome (see parse_line).
+
+        @input:
+        chrom {str} e.g. "1" or "chr1" (i.e. as in the file)
+        limit {int} max. number of variants (default = all)
+        """
+
+        for i, line in enumerate(self._get_lines(chrom)):
+            if i == limit:
+                break
+            yield(self.parse_line(line))
+
+    def parse(self, limit=None):
+        """
+        Yields the variants of all the chromosomes (i.e. serially).
+
+        @input:
+        limit {int} max. number of variants per chromosome (default = all)
+        """
+
+        for chrom in self.get_chroms():
+            for variant in self.parse_chrom(chrom, limit):
+                yield(variant)
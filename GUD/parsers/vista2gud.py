@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 
 import argparse
-from binning import assign_bin
 import getpass
+import numpy as np
 import os
 import re
 import shutil
@@ -14,10 +14,12 @@ import warnings
 from GUD import GUDUtils
 from GUD.ORM.enhancer import Enhancer
 from GUD.ORM.experiment import Experiment
-from GUD.ORM.region import Region
 from GUD.ORM.sample import Sample
 from GUD.ORM.source import Source
 from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.liftover import ChainIndex, lift_columns
+from GUD.parsers.resolver import RegionResolver
 
 usage_msg = """
 usage: %s --genome STR [-h] [options]
@@ -237,9 +239,9 @@ def _insert_data(genome, data_file, chains_file=None):
 
     # Initialize
     samples = {}
-    if chains_file is not None:
-        from pyliftover import LiftOver
-        lo = LiftOver(chains_file)
+    enhancers = []
+    writer = BulkWriter(session, Enhancer, dedup=True)
+    resolver = RegionResolver(session, writer)
 
     # For each SeqRecord...
     for seq_record in ParseUtils.parse_fasta_file(data_file, True):
@@ -256,35 +258,34 @@ def _insert_data(genome, data_file, chains_file=None):
             if genome == "hg19" or genome == "hg38":
                 continue
 
-        # Upsert region
-        region = Region()
-        m = re.search("(chr\S+):(\d+)-(\d+)", line[1])
-        region.chrom = m.group(1)
-        if region.chrom.startswith("chr"):
-            region.chrom = region.chrom[3:]
-        if region.chrom not in chroms:
-            continue
-        region.start = int(m.group(2)) - 1 # i.e. 1-based
-        region.end = int(m.group(3))
-        if chains_file:
-            try:
-                chrom = "chr%s" % region.chrom
-                start = lo.convert_coordinate(chrom, region.start) # i.e. already 0-based
-                region.start = start[0][1]
-                end = lo.convert_coordinate(chrom, region.end - 1) # i.e. requires 0-based
-                region.end = end[0][1] + 1
-            except:
-                msg = "position could not be found in new assembly"
-                warnings.warn("%s: %s" % (msg, line[1]), Warning, stacklevel=2)
-                continue
-        region.bin = assign_bin(region.start, region.end)
-        ParseUtils.upsert_region(session, region)
-
         # Get region
-        region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
+        m = re.search("(chr\S+):(\d+)-(\d+)", line[1])
+        enhancers.append((m.group(1), int(m.group(2)) - 1, int(m.group(3)), line[4:])) # i.e. 1-based
+
+    # Get regions
+    regions = {
+        "chrom": np.array([e[0] for e in enhancers], dtype=object),
+        "start": np.array([e[1] for e in enhancers], dtype=np.int64),
+        "end": np.array([e[2] for e in enhancers], dtype=np.int64),
+        "row": np.arange(len(enhancers)),
+    }
+    regions = ParseUtils.filter_chroms(regions, chroms)
+
+    # LiftOver (i.e. all regions at once)
+    if chains_file:
+        regions, unmapped = lift_columns(ChainIndex(chains_file), regions)
+        regions = ParseUtils.filter_chroms(regions, chroms)
+        if unmapped:
+            msg = "positions could not be found in new assembly"
+            warnings.warn("%s: %s" % (msg, unmapped), Warning, stacklevel=2)
+
+    # For each region...
+    for chrom, start, end, row in zip(regions["chrom"].tolist(),
+        regions["start"].tolist(), regions["end"].tolist(),
+        regions["row"].tolist()):
 
         # For each sample...
-        for s in line[4:]:
+        for s in enhancers[row][3]:
 
             if s not in samples:
 
@@ -303,11 +304,14 @@ def _insert_data(genome, data_file, chains_file=None):
     
             # Upsert enhancer
             enhancer = Enhancer()
-            enhancer.region_id = region.uid
             enhancer.experiment_id = experiment.uid
             enhancer.source_id = source.uid
             enhancer.sample_id = samples[s].uid
-            ParseUtils.upsert_enhancer(session, enhancer)
+            resolver.add_coords(chrom, start, end, enhancer)
+
+    # Insert remaining features
+    resolver.close()
+    writer.close()
 
 #-------------#
 # Main        #
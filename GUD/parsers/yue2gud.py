@@ -8,10 +8,8 @@ from multiprocessing import Pool, cpu_count
 from numpy import isnan
 import os
 import pickle
-import re
 import requests
 import shutil
-import subprocess
 import sys
 import warnings
 from zipfile import ZipFile
@@ -30,6 +28,9 @@ from GUD.ORM.sample import Sample
 from GUD.ORM.source import Source
 from GUD.ORM.tad import TAD
 from GUD.parsers import ParseUtils
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.partition import split_data
+from GUD.parsers.resolver import RegionResolver
 
 usage_msg = """
 usage: %s --genome STR --samples FILE --feature STR [-h] [options]
@@ -275,7 +276,7 @@ def yue_to_gud(genome, samples_file, feat_type, dummy_dir="/tmp/", remove=False,
         extracted_file = "/".join(extracted_file)
 
         # Split data
-        data_files = _split_data(extracted_file, threads)
+        data_files = split_data(extracted_file, threads)
 
         # Skip        
         if tdgenbrow.add:
@@ -406,35 +407,12 @@ def _extract_data(data_file, samples, dummy_dir):
 
     return(extracted_files)
 
-def _split_data(data_file, threads=1):
-
-    # Initialize
-    split_files = []
-    split_dir = os.path.dirname(os.path.realpath(data_file))
-
-    # Get number of lines
-    output = subprocess.check_output(["zless %s | wc -l" % data_file], shell=True)
-    m = re.search("(\d+)", str(output))
-    L = float(m.group(1))
-
-    # Split
-    prefix = "%s." % data_file.split("/")[-1]
-    cmd = "zless %s | split -d -l %s - %s" % (data_file, int(L/threads)+1, os.path.join(split_dir, prefix))
-    subprocess.run(cmd, shell=True)
-
-    # For each split file...
-    for split_file in os.listdir(split_dir):
-
-        # Append split file
-        if split_file.startswith(prefix):
-            split_files.append(os.path.join(split_dir, split_file))
-
-    return(split_files)
-
 def _insert_data(data_file, experiment, sample, source, test=False):
 
     # Initialize
     session = Session()
+    writer = BulkWriter(session, TAD, dedup=True)
+    resolver = RegionResolver(session, writer)
 
     # Testing
     if test:
@@ -460,18 +438,13 @@ def _insert_data(data_file, experiment, sample, source, test=False):
             region.start = int(line[1])
             region.end = int(line[2])
             region.bin = assign_bin(region.start, region.end)
-            ParseUtils.upsert_region(session, region)
-
-            # Get region
-            region = ParseUtils.get_region(session, region.chrom, region.start, region.end)
 
             # Upsert feature
             feature = Feature()
-            feature.region_id = region.uid
             feature.sample_id = sample.uid
             feature.experiment_id = experiment.uid
             feature.source_id = source.uid
-            ParseUtils.upsert_tad(session, feature)
+            resolver.add(region, feature)
 
         else:
             pass
@@ -482,9 +455,13 @@ def _insert_data(data_file, experiment, sample, source, test=False):
             if lines == 1000:
                 break
 
-    # This is ABSOLUTELY necessary to prevent MySQL from crashing!
+    # Insert remaining features
+    resolver.close()
+    writer.close()
+
+    # i.e. connections are reused by the next file of the worker and
+    # closed when it exits (see ParseUtils.insert_data_files_in_parallel)
     session.close()
-    engine.dispose()
 
 #-------------#
 # Main        #
@@ -74,6 +74,38 @@ class STRTests(unittest.TestCase):
         self.assertEqual(len(data["results"]), 20)
         self.assertEqual(data["next"], 'http://localhost/api/v1/test_hg38_chr22/short_tandem_repeats?last_uid=258787')
 
+    def test_stream(self):
+        resp = self.app.get('/api/v1/test_hg38_chr22/short_tandem_repeats/stream?chrom=22&start=40008264&end=50808291&location=overlapping')
+        self.assertEqual(resp.status_code, 200)
+        results = [json.loads(line) for line in resp.data.splitlines()]
+        self.assertTrue(len(results) > 1000)
+        self.assertTrue(all(r["end"] > 40008263 and r["start"] < 50808291 for r in results))
+        self.assertEqual(len(set(r["id"] for r in results)), len(results))
+        resp = self.app.get('/api/v1/test_hg38_chr22/short_tandem_repeats/stream?chrom=22&start=50008264&end=50808291&location=within&uids=318236,318244')
+        self.assertEqual(len(resp.data.splitlines()), 2)
+
+    def test_stream_whole_chrom(self):
+        resp = self.app.get('/api/v1/test_hg38_chr22/short_tandem_repeats/stream?chrom=22')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(len(resp.data.splitlines()) > 1000)
+        resp = self.app.get('/api/v1/test_hg38_chr22/chroms/stream?chrom=22')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_partitions(self):
+        url = '/api/v1/test_hg38_chr22/short_tandem_repeats?chrom=22&start=50008264&end=50808291&location=overlapping'
+        resp = self.app.get(url.replace('?', '/partitions?k=4&'))
+        data = json.loads(resp.data)
+        self.assertEqual(len(data["partitions"]), 4)
+        self.assertEqual(sum(p["estimated_size"] for p in data["partitions"]), data["count"])
+        ids = []
+        for p in data["partitions"]:
+            next_page = p["url"]
+            while next_page is not None:
+                page = json.loads(self.app.get(next_page).data)
+                ids += [r["id"] for r in page["results"]]
+                next_page = page.get("next")
+        self.assertEqual(len(set(ids)), data["count"])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,49 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.parsers import ParseUtils
+
+
+class BedReaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.dir, "multiz.txt.gz")
+        lines = ["#bin\tchrom\tchromStart\tchromEnd\textFile\toffset\tscore",
+                 "585\tchr1\t10\t20\t1\t0\t0.5",
+                 "585\tchrUn_KI270302v1\t10\t20\t1\t0\t0.1",
+                 "585\tchrX\t30\t45\t1\t0\t1"]
+        with gzip.open(self.file_name, "wt") as handle:
+            handle.write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_parse_bed_file(self):
+        columns = {1: "chrom", 2: "start", 3: "end", 6: "score"}
+        chunks = list(ParseUtils.parse_bed_file(self.file_name, columns,
+                                                chunksize=2))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(sorted(chunks[0]), ["chrom", "end", "score", "start"])
+        self.assertEqual(chunks[0]["start"].dtype.name, "int64")
+        self.assertEqual(chunks[1]["score"].dtype.name, "float64")
+        self.assertEqual(chunks[1]["score"].tolist(), [1.0])
+
+    def test_filter_chroms(self):
+        columns = {1: "chrom", 2: "start", 3: "end", 6: "score"}
+        chunk = next(ParseUtils.parse_bed_file(self.file_name, columns))
+        chunk = ParseUtils.filter_chroms(chunk, ["1", "X"])
+        self.assertEqual(chunk["chrom"].tolist(), ["1", "X"])
+        self.assertEqual(chunk["end"].tolist(), [20, 45])
+        self.assertEqual(chunk["score"].tolist(), [0.5, 1.0])
+
+    def test_parse_tsv_file(self):
+        lines = list(ParseUtils.parse_tsv_file(self.file_name))
+        self.assertEqual(lines[0], [585, "chr1", 10, 20, 1, 0, 0.5])
+        self.assertEqual(len(lines), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import binning
+import numpy as np
+import unittest
+from GUD.bins import assign_bins, contained_bins, containing_bins
+
+
+def intervals():
+    """intervals around every bin boundary, of lengths around every bin size"""
+    boundaries = set([0, binning.MAX_POSITION + 1])
+    for shift in range(binning.SHIFT_FIRST, 30, binning.SHIFT_NEXT):
+        for position in range(0, binning.MAX_POSITION + 1, 1 << shift):
+            for delta in (-1, 0, 1):
+                boundaries.add(position + delta)
+    lengths = set([0, 1, 2])
+    for shift in range(binning.SHIFT_FIRST, 30, binning.SHIFT_NEXT):
+        for delta in (-1, 0, 1):
+            lengths.add((1 << shift) + delta)
+    for position in sorted(boundaries):
+        for length in sorted(lengths):
+            # i.e. intervals starting and ending at a boundary
+            for start in (position, position - length):
+                end = start + length
+                if start >= 0 and end <= binning.MAX_POSITION + 1:
+                    yield start, end
+
+
+class BinsTests(unittest.TestCase):
+
+    def test_assign_bins(self):
+        starts, ends = zip(*intervals())
+        expected = [binning.assign_bin(s, e) for s, e in zip(starts, ends)]
+        self.assertEqual(assign_bins(starts, ends).tolist(), expected)
+
+    def test_assign_bins_small_positions(self):
+        # i.e. every interval of the first bins
+        starts, ends = zip(*[(s, e) for s in range(0, 1 << 19, 997)
+                             for e in range(s, s + (1 << 19), 4099)])
+        expected = [binning.assign_bin(s, e) for s, e in zip(starts, ends)]
+        self.assertEqual(assign_bins(starts, ends).tolist(), expected)
+
+    def test_query_bins(self):
+        for start, end in list(intervals())[::97]:
+            self.assertEqual(containing_bins([start], [end]).tolist(),
+                             sorted(binning.containing_bins(start, end)))
+            self.assertEqual(contained_bins([start], [end]).tolist(),
+                             sorted(binning.contained_bins(start, end)))
+
+    def test_query_bins_union(self):
+        windows = [(0, 10), (1 << 17, (1 << 17) + 10), (5000000, 9000000)]
+        starts, ends = zip(*windows)
+        containing, contained = set(), set()
+        for start, end in windows:
+            containing.update(binning.containing_bins(start, end))
+            contained.update(binning.contained_bins(start, end))
+        self.assertEqual(containing_bins(starts, ends).tolist(), sorted(containing))
+        self.assertEqual(contained_bins(starts, ends).tolist(), sorted(contained))
+
+    def test_uint64(self):
+        starts = np.array([10, 1 << 20], dtype=np.uint64)
+        ends = np.array([20, 1 << 21], dtype=np.uint64)
+        self.assertEqual(assign_bins(starts, ends).tolist(),
+                         [binning.assign_bin(10, 20),
+                          binning.assign_bin(1 << 20, 1 << 21)])
+
+    def test_out_of_range(self):
+        self.assertRaises(binning.OutOfRangeError, assign_bins, [-1], [10])
+        self.assertRaises(binning.OutOfRangeError, assign_bins, [0],
+                          [binning.MAX_POSITION + 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import OperationalError
+from GUD.ORM.conservation import Conservation
+from GUD.parsers.bulk import BulkWriter
+
+
+class RecordingSession(object):
+    """records executed statements; raises the given errors first"""
+
+    def __init__(self, errors=[]):
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.errors = list(errors)
+
+    def execute(self, stmt):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.statements.append(str(stmt.compile(dialect=mysql.dialect())))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class BulkWriterTests(unittest.TestCase):
+
+    def _feature(self, region_id):
+        conservation = Conservation()
+        conservation.region_id = region_id
+        conservation.source_id = 1
+        conservation.score = 0.5
+        return conservation
+
+    def test_batches(self):
+        session = RecordingSession()
+        writer = BulkWriter(session, Conservation, batch_size=2)
+        writer.add(self._feature(1))
+        self.assertEqual(session.statements, [])
+        writer.add({"region_id": 2, "source_id": 1, "score": 0.5})
+        writer.add(self._feature(3))
+        writer.close()
+        self.assertEqual(writer.rows, 3)
+        self.assertEqual(writer.batches, 2)
+        self.assertEqual(session.commits, 2)
+        self.assertTrue(session.statements[0].startswith("INSERT IGNORE INTO conservation"))
+        self.assertEqual(session.statements[0].count("(%s, %s, %s)"), 2)
+        self.assertNotIn("uid", session.statements[0])
+
+    def test_update(self):
+        session = RecordingSession()
+        with BulkWriter(session, Conservation, update=["score"]) as writer:
+            writer.add(self._feature(1))
+        self.assertTrue(session.statements[0].endswith("ON DUPLICATE KEY UPDATE score = VALUES(score)"))
+
+    def test_retry(self):
+        deadlock = OperationalError("INSERT", {}, Exception(1213, "Deadlock found"))
+        session = RecordingSession([deadlock])
+        writer = BulkWriter(session, Conservation)
+        writer.add(self._feature(1))
+        writer.close()
+        self.assertEqual(session.rollbacks, 1)
+        self.assertEqual(len(session.statements), 1)
+        self.assertEqual((writer.retried, writer.deadlocks), (1, 1))
+        error = OperationalError("INSERT", {}, Exception(1146, "Table doesn't exist"))
+        session = RecordingSession([error])
+        writer = BulkWriter(session, Conservation)
+        writer.add(self._feature(1))
+        self.assertRaises(OperationalError, writer.close)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.parsers import ParseUtils
+from GUD.parsers.checkpoint import Checkpoint
+from GUD.parsers.pipeline import COMMIT, PipelineError, run_pipeline
+
+out_dir = tempfile.mkdtemp()
+
+
+def parse(fields):
+    return (fields[0], int(fields[1]))
+
+
+def insert(records, fail_at=None):
+    buffer = []
+    for record in records:
+        if record is COMMIT:
+            with open(os.path.join(out_dir, str(os.getpid())), "a") as handle:
+                handle.write("".join("%s\n" % r[1] for r in buffer))
+            buffer = []
+            continue
+        if record[1] == fail_at:
+            raise ValueError("killed")
+        buffer.append(record)
+
+
+def insert_and_fail(records):
+    insert(records, fail_at=6543)
+
+
+class CheckpointTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.checkpoint = Checkpoint(os.path.join(self.dir, "checkpoints"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_values(self):
+        self.assertEqual(self.checkpoint.get("/tmp/a.bed", 0), 0)
+        self.checkpoint.set("/tmp/a.bed", 1024)
+        self.assertEqual(self.checkpoint.get("/tmp/a.bed"), 1024)
+        self.checkpoint.log("a.bed", "writer-0", 1)
+        self.checkpoint.log("a.bed", "writer-1", 3)
+        self.checkpoint.log("a.bed.00", "writer-0", 7)
+        self.assertEqual(self.checkpoint.get_logged("a.bed"), set([1, 3]))
+        self.assertFalse(self.checkpoint.is_done("a.bed"))
+        self.checkpoint.done("a.bed")
+        self.assertTrue(self.checkpoint.is_done("a.bed"))
+        self.assertEqual(self.checkpoint.get("a.bed"), None)
+        self.assertEqual(self.checkpoint.get_logged("a.bed"), set())
+        self.assertEqual(self.checkpoint.get_logged("a.bed.00"), set([7]))
+
+    def test_keys(self):
+        # i.e. same file name, or same name once sanitized
+        keys = ["/tmp/a/chr1.bed", "/tmp/b/chr1.bed", "chr1.bed", "chr1 bed", "chr1_bed"]
+        for value, key in enumerate(keys):
+            self.checkpoint.set(key, value)
+            self.checkpoint.log(key, "writer-0", value)
+        self.checkpoint.done("chr1.bed")
+        for value, key in enumerate(keys):
+            self.assertEqual(self.checkpoint.is_done(key), key == "chr1.bed")
+            if key != "chr1.bed":
+                self.assertEqual(self.checkpoint.get(key), value)
+                self.assertEqual(self.checkpoint.get_logged(key), set([value]))
+
+    def test_resume_pipeline(self):
+        data_file = os.path.join(self.dir, "test.bed")
+        with open(data_file, "w") as handle:
+            for i in range(10000):
+                handle.write("chr1\t%s\n" % i)
+        with self.assertRaises(PipelineError):
+            run_pipeline(data_file, parse, insert_and_fail, producers=2,
+                         writers=1, batch_size=100, checkpoint=self.checkpoint,
+                         key="test")
+        run_pipeline(data_file, parse, insert, producers=2, writers=2,
+                     batch_size=100, checkpoint=self.checkpoint, key="test")
+        starts = []
+        for file_name in os.listdir(out_dir):
+            with open(os.path.join(out_dir, file_name)) as handle:
+                starts += [int(s) for s in handle.read().split()]
+        # i.e. every record committed exactly once
+        self.assertEqual(sorted(starts), list(range(10000)))
+
+    def test_parse_bed_file_from(self):
+        data_file = os.path.join(self.dir, "test.bed")
+        with open(data_file, "w") as handle:
+            handle.write("#chrom\tstart\tend\n")
+            for i in range(1000):
+                handle.write("chr1\t%s\t%s\n" % (i, i + 10))
+        columns = {0: "chrom", 1: "start"}
+        chunks = list(ParseUtils.parse_bed_file_from(data_file, columns,
+                                                     chunk_bytes=1000))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum([c["start"].tolist() for c, o in chunks], []),
+                         list(range(1000)))
+        self.assertEqual(chunks[-1][1], os.path.getsize(data_file))
+        # i.e. resume after the first chunk
+        chunk, offset = chunks[0]
+        rest = ParseUtils.parse_bed_file_from(data_file, columns, offset)
+        self.assertEqual(next(rest)[0]["start"][0], len(chunk["start"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
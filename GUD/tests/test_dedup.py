@@ -0,0 +1,149 @@
+import unittest
+import numpy as np
+from sqlalchemy.dialects import mysql
+from GUD.ORM.copy_number_variant import CNV
+from GUD.ORM.source import Source
+from GUD.ORM.tf_binding import TFBinding
+from GUD.ORM.tss import TSS
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.dedup import KeySet, hash_key
+
+
+class FakeResult(object):
+    """returns the given rows in one fetch"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """returns the given rows for selects; records everything else"""
+
+    def __init__(self, rows=[]):
+        self.rows = rows
+        self.selects = []
+        self.statements = []
+
+    def execute(self, stmt):
+        sql = str(stmt.compile(dialect=mysql.dialect()))
+        if sql.startswith("SELECT"):
+            self.selects.append(sql)
+            return FakeResult(self.rows)
+        self.statements.append(sql)
+
+    def commit(self):
+        pass
+
+
+class KeySetTests(unittest.TestCase):
+
+    def _tf(self, region_id, tf="CTCF"):
+        return {"region_id": region_id, "sample_id": 1, "experiment_id": 2,
+                "source_id": 3, "tf": tf, "peak": 10}
+
+    def test_add(self):
+        keys = KeySet(TFBinding)
+        self.assertEqual(keys.columns, ["regionID", "sampleID", "experimentID",
+                                        "sourceID", "tf", "peak"])
+        self.assertTrue(keys.add(self._tf(1)))
+        self.assertFalse(keys.add(self._tf(1)))
+        self.assertTrue(keys.add(self._tf(1, "REST")))
+        # i.e. column names, ORM objects and numpy scalars
+        row = {"regionID": np.int64(2), "sampleID": 1, "experimentID": 2,
+               "sourceID": 3, "tf": "CTCF", "peak": np.int64(10)}
+        self.assertTrue(keys.add(row))
+        tf = TFBinding()
+        for key, value in self._tf(2).items():
+            setattr(tf, key, value)
+        self.assertIn(tf, keys)
+        self.assertEqual(len(keys), 3)
+
+    def test_preload(self):
+        session = FakeSession([(1, 1, 2, 3, "CTCF", 10)])
+        keys = KeySet(TFBinding)
+        keys.preload(session, "1", 3)
+        keys.preload(session, "1", 3)
+        self.assertEqual(len(session.selects), 1)
+        self.assertIn("JOIN regions ON regions.uid = tf_binding.`regionID`",
+                      session.selects[0])
+        self.assertIn("`sourceID` = %s", session.selects[0])
+        self.assertFalse(keys.add(self._tf(1)))
+        # Keys of a new chromosome
+        keys.preload(session, "2", 3)
+        self.assertEqual(len(session.selects), 2)
+        self.assertEqual(len(keys), 1)
+        # i.e. tables without regions
+        keys = KeySet(Source)
+        keys.preload(session, "1")
+        self.assertNotIn("JOIN", session.selects[-1])
+        self.assertEqual(hash_key(("a", None)), hash_key(("a", None)))
+
+    def test_cnv(self):
+        # i.e. no unique constraint: as CNV.is_unique
+        keys = KeySet(CNV)
+        self.assertEqual(keys.columns, ["regionID", "sourceID", "copy_number_change"])
+        cnv = {"region_id": 1, "source_id": 3, "copy_number_change": -1,
+               "clinical_assertion": b"Benign,"}
+        self.assertTrue(keys.add(cnv))
+        self.assertFalse(keys.add(dict(cnv, clinical_assertion=b"Pathogenic,")))
+        self.assertTrue(keys.add(dict(cnv, copy_number_change=1)))
+        session = FakeSession([(2, 3, -1)])
+        keys.preload(session, "1", 3)
+        self.assertIn("copy_number_change", session.selects[0])
+        self.assertFalse(keys.add(dict(cnv, region_id=2)))
+        # i.e. given keys (e.g. ORM attributes)
+        keys = KeySet(CNV, ["region_id", "source_id"])
+        self.assertEqual(keys.columns, ["regionID", "sourceID"])
+        self.assertTrue(keys.add(cnv))
+        self.assertFalse(keys.add(dict(cnv, copy_number_change=1)))
+
+    def test_null(self):
+        # i.e. TSSs without gene, which INSERT IGNORE would re-insert
+        keys = KeySet(TSS)
+        tss = {"region_id": 1, "experiment_id": 1, "source_id": 2, "gene": None,
+               "tss": 1, "strand": "+"}
+        self.assertTrue(keys.add(tss))
+        self.assertFalse(keys.add(dict(tss)))
+        # i.e. already in the table
+        session = FakeSession([(2, 1, 2, None, 1, "+")])
+        keys.preload(session, "1", 2)
+        self.assertFalse(keys.add(dict(tss, region_id=2)))
+
+    def test_chroms(self):
+        session = FakeSession([(1, 1, 2, 3, "CTCF", 10)])
+        keys = KeySet(TFBinding)
+        keys.preload(session, "1", 3)
+        self.assertTrue(keys.add(self._tf(5)))
+        keys.preload(session, "2", 3)
+        # i.e. unsorted rows: the keys of recent chromosomes are kept
+        keys.preload(session, "1", 3)
+        self.assertEqual(len(session.selects), 2)
+        self.assertFalse(keys.add(self._tf(5)))
+        for chrom in ["3", "4", "5", "6", "1"]:
+            keys.preload(session, chrom, 3)
+        self.assertEqual(len(session.selects), 7)
+        self.assertTrue(keys.add(self._tf(5)))
+
+    def test_writer(self):
+        session = FakeSession([(1, 1, 2, 3, "CTCF", 10)])
+        writer = BulkWriter(session, TFBinding, dedup=True)
+        writer.set_chrom("1")
+        for region_id in [1, 2, 2, 3]:
+            writer.add(self._tf(region_id))
+        writer.close()
+        self.assertEqual(writer.rows, 2)
+        self.assertEqual(writer.duplicates, 2)
+        self.assertEqual(len(session.statements), 1)
+        self.assertRaises(ValueError, BulkWriter, session, TFBinding,
+                          update=["tf"], dedup=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import types
+import unittest
+import numpy as np
+from GUD.parsers import fantom2gud
+
+
+class RecordingResolver(object):
+    """records the features passed to it with their coordinates"""
+
+    def __init__(self):
+        self.features = []
+
+    def add_coords(self, chrom, start, end, feature):
+        self.features.append((chrom, start, end, feature))
+
+
+class FantomTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fantom2gud.chroms = ["1", "2"]
+        fantom2gud.experiment = types.SimpleNamespace(uid=1)
+        fantom2gud.source = types.SimpleNamespace(uid=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_enhancers(self):
+        bed_file = os.path.join(self.dir, "CAGE.enhancer.bed")
+        with open(bed_file, "w") as handle:
+            handle.write("chr1\t10\t20\t.\t0\t3\t1\n")
+            handle.write("chrUn\t10\t20\t.\t1\t1\t1\n")
+            handle.write("chr2\t30\t40\t.\t2\t0\t0\n")
+        columns = {0: "chrom", 1: "start", 2: "end", 3: "strand"}
+        # i.e. samples 0 and 1 (but not 2)
+        chunks = list(fantom2gud._parse_matrix(bed_file, columns, [0, 1]))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0]["chrom"].tolist(), ["1", "2"])
+        self.assertTrue(np.array_equal(chunks[0]["matrix"], [[0, 3], [2, 0]]))
+        resolver = RecordingResolver()
+        fantom2gud._insert_enhancers(resolver, chunks[0], np.array([7, 8]))
+        self.assertEqual([(f[0], f[1], f[3]["sample_id"]) for f in resolver.features],
+                         [("1", 10, 8), ("2", 30, 7)])
+        self.assertEqual(resolver.features[0][3]["experiment_id"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from GUD.parsers.liftover import ChainIndex, lift_columns
+from pyliftover import LiftOver
+
+# i.e. chain 3 overlaps chain 1 with a lower score; chain 4 is reverse strand
+CHAINS = """chain 1000 chr1 1000 + 100 400 chr1 1200 + 150 460 1
+100\t50\t60
+150
+
+chain 500 chr1 1000 + 200 300 chr5 800 + 0 100 3
+100
+
+chain 800 chr2 500 + 0 200 chr2 600 - 10 210 4
+50\t10\t10
+140
+
+chain 2000 chr1 1000 + 500 600 chrX 900 + 300 400 5
+100
+"""
+
+
+class ChainIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.chains_file = os.path.join(self.dir, "aToB.over.chain")
+        with open(self.chains_file, "w") as handle:
+            handle.write(CHAINS)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_convert_coordinates(self):
+        lo = LiftOver(self.chains_file)
+        positions = [(c, p) for c in ["chr1", "chr2", "chr3"] for p in range(0, 1000)]
+        chroms, lifted = zip(*positions)
+        for cache in (False, True, True):
+            index = ChainIndex(self.chains_file, cache=cache)
+            targets, targets_positions, mapped = index.convert_coordinates(chroms, lifted)
+            for i, (chrom, position) in enumerate(positions):
+                expected = lo.convert_coordinate(chrom, position)
+                if expected:
+                    self.assertTrue(mapped[i])
+                    self.assertEqual((targets[i], targets_positions[i]),
+                                     expected[0][:2])
+                else:
+                    self.assertFalse(mapped[i])
+        self.assertTrue(os.path.exists("%s.v1.npz" % self.chains_file))
+
+    def test_lift_regions(self):
+        index = ChainIndex(self.chains_file, cache=False)
+        chroms, starts, ends, mapped = index.lift_regions(
+            ["chr1", "chr1", "chr1", "chr2", "chr3"],
+            [100, 190, 220, 0, 0], [110, 260, 520, 10, 10])
+        # i.e. the third region spans chains to different chromosomes
+        self.assertEqual(mapped.tolist(), [True, True, False, True, False])
+        self.assertEqual((chroms[0], starts[0], ends[0]), ("chr1", 150, 160))
+        # i.e. reverse strand
+        self.assertEqual((chroms[3], starts[3], ends[3]), ("chr2", 580, 590))
+
+    def test_lift_columns(self):
+        index = ChainIndex(self.chains_file, cache=False)
+        columns = {"chrom": np.array(["1", "chr1", "3"], dtype=object),
+                   "start": np.array([100, 220, 0]),
+                   "end": np.array([110, 520, 10]),
+                   "score": np.array([1.0, 2.0, 3.0])}
+        columns, unmapped = lift_columns(index, columns)
+        self.assertEqual(unmapped, 2)
+        self.assertEqual(columns["chrom"].tolist(), ["chr1"])
+        self.assertEqual(columns["start"].tolist(), [150])
+        self.assertEqual(columns["score"].tolist(), [1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.ORM.conservation import Conservation
+from GUD.ORM.copy_number_variant import CNV
+from GUD.parsers.load_data import DataLoader, format_value
+
+
+class DataLoaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_format_value(self):
+        self.assertEqual(format_value(None), "\\N")
+        self.assertEqual(format_value(float("nan")), "\\N")
+        self.assertEqual(format_value(True), "1")
+        self.assertEqual(format_value(0.5), "0.5")
+        self.assertEqual(format_value(12), "12")
+        self.assertEqual(format_value("a\tb\nc\\d"), "a\\tb\\nc\\\\d")
+
+    def test_staging(self):
+        loader = DataLoader(None, Conservation, self.dir, sort=False)
+        for region_id, score in [(1, 0.5), (2, None), (1, 0.7)]:
+            conservation = Conservation()
+            conservation.region_id = region_id
+            conservation.source_id = 3
+            conservation.score = score
+            loader.add(conservation)
+        loader.flush()
+        loader._regions_handle.close()
+        loader._features_handle.close()
+        self.assertEqual(loader._load_columns, ["score", "regionID", "sourceID"])
+        with open(loader.features_file) as handle:
+            self.assertEqual(handle.read(), "0.5\t1\t3\n\\N\t2\t3\n")
+        self.assertEqual(loader.rows, 2)
+        self.assertEqual(os.path.getsize(loader.regions_file), 0)
+
+    def test_sorting(self):
+        loader = DataLoader(None, Conservation, self.dir)
+        conservation = Conservation()
+        conservation.source_id = 3
+        self.assertRaises(ValueError, loader.add, conservation)
+        for region_id, region in [(1, ("2", 5, 10)), (2, ("10", 50, 60)),
+                                  (3, ("2", 5, 8)), (4, ("2", 1, 100))]:
+            loader.region = region
+            loader.add({"region_id": region_id, "source_id": 3, "score": 0.5})
+        loader.flush()
+        loader._features_handle.close()
+        self.assertEqual(loader._sort_features(), loader.sorted_file)
+        # i.e. offset by the max. uid as they are loaded
+        with open(loader.sorted_file) as handle:
+            self.assertEqual(handle.read(), "1\t0.5\t2\t3\n2\t0.5\t4\t3\n3\t0.5\t3\t3\n4\t0.5\t1\t3\n")
+
+    def test_provisional_uids(self):
+        loader = DataLoader(None, Conservation, self.dir, sort=False)
+        resolver = loader.resolver
+        # i.e. preloaded
+        resolver.chrom = "1"
+        for start, end in [(10, 20), (30, 40), (10, 20)]:
+            resolver.add_coords("1", start, end, {"source_id": 3, "score": 0.5})
+        resolver.add_coords("1", 50, 60, {"source_id": 4, "score": 0.5})
+        loader.flush()
+        loader._regions_handle.close()
+        loader._features_handle.close()
+        # i.e. no lock is taken while staging
+        with open(loader.regions_file) as handle:
+            self.assertEqual([l.split("\t")[0] for l in handle], ["-1", "-2", "-3"])
+        with open(loader.features_file) as handle:
+            self.assertEqual(handle.read(), "0.5\t-1\t3\n0.5\t-2\t3\n0.5\t-3\t4\n")
+        self.assertEqual(loader.duplicates, 1)
+        conn = RecordingConnection([])
+        loader._load_file(conn, loader.regions_file, "regions", loader._region_columns,
+                          loader._get_region_uids(100))
+        self.assertTrue(conn.statements[-1].endswith(
+            "(@uid, `bin`, `chrom`, `start`, `end`) SET `uid` = IF(@uid < 0, 100 - @uid, @uid)"))
+
+    def test_unique_index(self):
+        # i.e. LOAD DATA IGNORE skips duplicates, unless no unique index
+        self.assertTrue(DataLoader(None, Conservation, self.dir)._unique_index)
+        loader = DataLoader(None, CNV, self.dir)
+        self.assertFalse(loader._unique_index)
+        self.assertEqual(loader._unique, ["regionID", "sourceID", "copy_number_change"])
+
+    def test_drop_indexes(self):
+        loader = DataLoader(None, Conservation, self.dir, sort=False)
+        conn = RecordingConnection([
+            {"Key_name": "PRIMARY", "Column_name": "uid", "Sub_part": None},
+            {"Key_name": "regionID", "Column_name": "regionID", "Sub_part": None},
+            {"Key_name": "regionID", "Column_name": "sourceID", "Sub_part": None},
+            {"Key_name": "ix_join", "Column_name": "sourceID", "Sub_part": None},
+            {"Key_name": "ix_join", "Column_name": "regionID", "Sub_part": None}])
+        # i.e. ix_join is the only index starting with sourceID
+        self.assertEqual(loader._drop_indexes(conn), [])
+        conn.rows.append({"Key_name": "sourceID", "Column_name": "sourceID",
+                          "Sub_part": None})
+        self.assertEqual(loader._drop_indexes(conn),
+                         [("ix_join", "`sourceID`, `regionID`")])
+        self.assertEqual(conn.statements[-1],
+                         "ALTER TABLE `conservation` DROP INDEX `ix_join`")
+
+
+class RecordingConnection(object):
+    """returns the given rows for SHOW INDEX; records everything else"""
+
+    rowcount = 0
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, stmt):
+        if stmt.startswith("SHOW INDEX"):
+            return list(self.rows)
+        self.statements.append(stmt)
+        return self
+
+
+if __name__ == '__main__':
+    unittest.main()
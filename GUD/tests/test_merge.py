@@ -0,0 +1,123 @@
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from GUD.parsers import remap2gud
+from GUD.parsers.merge import (_write_lines, bed_key, merge_lines,
+                               read_bed_file, remove_partial_files,
+                               sort_bed_file, sort_lines)
+from GUD.parsers.pipeline import parse_records
+
+
+class MergeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.lines = ["chr%s\t%s\t%s" % (random.choice(["1", "10", "2", "X"]), s, s + 100)
+                      for s in random.sample(range(1000000), 2000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _bed_file(self, name, lines):
+        file_name = os.path.join(self.dir, name)
+        with gzip.open(file_name, "wt") as handle:
+            handle.write("#comment\n" + "\n".join(lines) + "\n")
+        return file_name
+
+    def test_read_bed_file(self):
+        file_name = self._bed_file("a.bed.gz", ["chr1\t10\t20\t.\t0\t.\t5.5\t-1\t-1\t50"])
+        self.assertEqual(list(read_bed_file(file_name, [0, 1, 2, 6, 9], "ENCFF1")),
+                         ["chr1\t10\t20\tENCFF1\t5.5\t50"])
+
+    def test_merge_lines(self):
+        files = [self._bed_file("%s.bed.gz" % i, sorted(self.lines[i::7], key=bed_key))
+                 for i in range(7)]
+        for fan_in in (2, 3, 256):
+            merged = list(merge_lines([read_bed_file(f) for f in files],
+                                      self.dir, fan_in=fan_in))
+            self.assertEqual(merged, sorted(self.lines, key=bed_key))
+        # i.e. temporary files are removed
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         sorted(os.path.basename(f) for f in files))
+
+    def test_unsorted_input(self):
+        merged = merge_lines([iter(["chr1\t20\t30", "chr1\t10\t20"])], self.dir)
+        self.assertRaises(ValueError, list, merged)
+
+    def test_sort_bed_file(self):
+        file_name = self._bed_file("a.bed.gz", self.lines)
+        self.assertTrue(sort_bed_file(file_name))
+        self.assertFalse(sort_bed_file(file_name))
+        self.assertEqual(list(read_bed_file(file_name)),
+                         sorted(self.lines, key=bed_key))
+
+    def test_sort_into(self):
+        # i.e. a download sorted from its partial file
+        for lines in (self.lines, sorted(self.lines, key=bed_key)):
+            part_file = self._bed_file("a.part.bed.gz", lines)
+            file_name = os.path.join(self.dir, "a.bed.gz")
+            sort_bed_file(part_file, file_name)
+            self.assertFalse(os.path.exists(part_file))
+            self.assertEqual(list(read_bed_file(file_name)),
+                             sorted(self.lines, key=bed_key))
+            os.remove(file_name)
+
+    def test_interrupted_write(self):
+        def lines():
+            yield "chr1\t10\t20"
+            raise KeyboardInterrupt()
+        file_name = os.path.join(self.dir, "a.bed.gz")
+        self.assertRaises(KeyboardInterrupt, _write_lines, file_name, lines())
+        # i.e. neither a truncated file nor a temporary one
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_remove_partial_files(self):
+        names = ["a.bed.gz", "a.part.bed.gz", "b.bed.gz.123", "run.x1.bed",
+                 "run.x1.bed.123", "ChIP-seq.TF.bed", "ChIP-seq.TF.bed.00"]
+        for name in names:
+            open(os.path.join(self.dir, name), "w").close()
+        remove_partial_files(self.dir)
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ["ChIP-seq.TF.bed", "ChIP-seq.TF.bed.00", "a.bed.gz"])
+
+    def test_resume_download(self):
+        dataset = {"dataset_name": "a", "bed_url": "a.bed.gz"}
+        def interrupted(url, file_name):
+            with gzip.open(file_name, "wt") as handle:
+                handle.write("\n".join(self.lines[:10]) + "\n")
+            raise IOError("interrupted")
+        def download(url, file_name):
+            with gzip.open(file_name, "wt") as handle:
+                handle.write("\n".join(self.lines) + "\n")
+        urlretrieve = remap2gud.urlretrieve
+        try:
+            remap2gud.urlretrieve = interrupted
+            self.assertIsNone(remap2gud._download_ReMap_bed_file(dataset, self.dir))
+            # i.e. only the partial file, which a resumed job removes
+            self.assertEqual(os.listdir(self.dir), ["a.part.bed.gz"])
+            remove_partial_files(self.dir)
+            remap2gud.urlretrieve = download
+            file_name = remap2gud._download_ReMap_bed_file(dataset, self.dir)
+        finally:
+            remap2gud.urlretrieve = urlretrieve
+        self.assertEqual(os.listdir(self.dir), ["a.bed.gz"])
+        self.assertEqual(list(read_bed_file(file_name)),
+                         sorted(self.lines, key=bed_key))
+
+    def test_sort_lines(self):
+        for buffer_size in (100, 10000):
+            self.assertEqual(list(sort_lines(self.lines, self.dir, buffer_size)),
+                             sorted(self.lines, key=bed_key))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_parse_records(self):
+        records = parse_records(iter(self.lines[:10]), lambda line: line[0])
+        self.assertEqual(list(records), [l.split("\t")[0] for l in self.lines[:10]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.ORM.conservation import Conservation
+from GUD.parsers import metrics
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.pipeline import run_pipeline
+from GUD.tests.test_bulk import RecordingSession
+
+
+def parse(fields):
+    return (fields[0], int(fields[1]), int(fields[2]))
+
+
+def insert(records):
+    for record in records:
+        pass
+
+
+class MetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        metrics._metrics = None
+        shutil.rmtree(self.dir)
+
+    def test_counters(self):
+        m = metrics.start(self.dir, interval=3600)
+        self.assertIs(metrics.get(), m)
+        # i.e. counters carry over the tasks of the same process
+        self.assertIs(metrics.start(self.dir), m)
+        writer = BulkWriter(RecordingSession(), Conservation, batch_size=2)
+        for i in range(3):
+            writer.add({"region_id": i, "source_id": 1, "score": 0.5})
+        writer.close()
+        self.assertEqual(list(m.timed(range(4), count="parsed")), [0, 1, 2, 3])
+        m.waited(1)
+        self.assertEqual((m.counters["inserted"], m.counters["flushes"],
+                          m.counters["parsed"]), (3, 2, 4))
+        self.assertEqual(m.tables, {"conservation": 3})
+        self.assertGreaterEqual(m.counters["db_seconds"], 1)
+        # i.e. not written until the interval has elapsed, or on close
+        self.assertEqual(os.listdir(self.dir), [])
+        m.close()
+        with open(os.path.join(self.dir, "%s.json" % m.name)) as handle:
+            self.assertEqual(json.load(handle)["inserted"], 3)
+
+    def test_summary(self):
+        m = metrics.Metrics(self.dir, name="worker-0")
+        m.flushed("conservation", 2, 0.25)
+        m.flushed("regions", 1, 0.75)
+        m.parsed(4, 0.5)
+        m.add("retried")
+        monitor = metrics.Monitor(self.dir, expected=8, queues={"files": lambda: 2})
+        m.close()
+        monitor.start()
+        monitor.stop()
+        summary = json.loads(open(os.path.join(self.dir, "summary.jsonl")).read())
+        self.assertEqual((summary["parsed"], summary["inserted"], summary["flushes"],
+                          summary["retried"], summary["workers"]), (4, 3, 2, 1, 1))
+        self.assertEqual(summary["flush_latency"], 0.5)
+        self.assertEqual(summary["max_flush_seconds"], 0.75)
+        self.assertEqual(summary["queues"], {"files": 2})
+        self.assertIsNotNone(summary["eta"])
+        self.assertIn("inserted 3", metrics.format_summary(summary))
+
+    def test_pipeline(self):
+        data_file = os.path.join(self.dir, "test.bed.gz")
+        with gzip.open(data_file, "wt") as handle:
+            for i in range(1000):
+                handle.write("chr1\t%s\t%s\n" % (i, i + 10))
+        metrics_dir = os.path.join(self.dir, "metrics")
+        run_pipeline(data_file, parse, insert, producers=2, writers=2,
+                     batch_size=100, metrics_dir=metrics_dir)
+        with open(os.path.join(metrics_dir, "summary.jsonl")) as handle:
+            summary = json.loads(handle.readlines()[-1])
+        # i.e. 2 producers and 2 writers
+        self.assertEqual(summary["workers"], 4)
+        self.assertEqual(summary["parsed"], 1000)
+        self.assertIn("lines", summary["queues"])
+
+    def test_estimate(self):
+        data_file = os.path.join(self.dir, "test.bed")
+        with open(data_file, "w") as handle:
+            for i in range(1000):
+                handle.write("chr1\t100\t200\n")
+        self.assertEqual(metrics.estimate_lines(data_file, 130), 1000)
+        self.assertIsNone(metrics.estimate_lines(data_file + ".gz"))
+
+
+if __name__ == '__main__':
+    unittest.main()
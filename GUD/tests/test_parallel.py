@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.parsers import InsertError, ParseUtils
+
+out_dir = tempfile.mkdtemp()
+
+
+def insert(data_file):
+    # i.e. one line per file, with the pid of its worker
+    with open(os.path.join(out_dir, "inserted"), "a") as handle:
+        handle.write("%s\t%s\n" % (os.path.basename(data_file), os.getpid()))
+
+
+def insert_or_fail_once(data_file):
+    failed_file = "%s.failed" % data_file
+    if not os.path.exists(failed_file):
+        open(failed_file, "w").close()
+        raise ValueError("transient error")
+    insert(data_file)
+
+
+def fail(data_file):
+    raise ValueError("invalid file")
+
+
+def die(data_file):
+    # i.e. a worker killed (e.g. by the OOM killer)
+    if data_file.endswith("03"):
+        os._exit(1)
+    insert(data_file)
+
+
+class ParallelTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = []
+        for i, size in enumerate([10, 1000, 100, 10000, 1]):
+            self.files.append(os.path.join(self.dir, "data.%02d" % i))
+            with open(self.files[-1], "w") as handle:
+                handle.write("x" * size)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        if os.path.exists(os.path.join(out_dir, "inserted")):
+            os.remove(os.path.join(out_dir, "inserted"))
+
+    def _get_inserted(self):
+        with open(os.path.join(out_dir, "inserted")) as handle:
+            return [l.split() for l in handle]
+
+    def test_insert(self):
+        ParseUtils.insert_data_files_in_parallel(list(self.files), insert, 1)
+        inserted = self._get_inserted()
+        # i.e. largest first
+        self.assertEqual([f for f, pid in inserted],
+                         ["data.03", "data.01", "data.02", "data.00", "data.04"])
+        # i.e. one persistent worker
+        self.assertEqual(len(set(pid for f, pid in inserted)), 1)
+        # i.e. not files
+        ParseUtils.insert_data_files_in_parallel(["1", "2"], insert, 2)
+        self.assertEqual(len(self._get_inserted()), 7)
+
+    def test_retries(self):
+        ParseUtils.insert_data_files_in_parallel(list(self.files),
+                                                 insert_or_fail_once, 2)
+        self.assertEqual(sorted(f for f, pid in self._get_inserted()),
+                         sorted(os.path.basename(f) for f in self.files))
+        with self.assertRaises(InsertError) as context:
+            ParseUtils.insert_data_files_in_parallel(list(self.files), fail, 2,
+                                                     retries=1)
+        self.assertIn("invalid file", str(context.exception))
+        self.assertIn("2 attempts", str(context.exception))
+
+    def test_dead_worker(self):
+        # i.e. rather than waiting forever
+        with self.assertRaises(InsertError) as context:
+            ParseUtils.insert_data_files_in_parallel(list(self.files), die, 2)
+        self.assertIn("exited unexpectedly", str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
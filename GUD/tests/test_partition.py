@@ -0,0 +1,82 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.parsers.partition import (CELL_SHIFT, get_partitions, get_sizes,
+                                   schedule, split_data)
+
+
+class PartitionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, lines, file_name="data.bed.gz"):
+        data_file = os.path.join(self.dir, file_name)
+        with gzip.open(data_file, "wt") as handle:
+            handle.write("".join(lines))
+        return data_file
+
+    def test_sizes(self):
+        cell = 1 << CELL_SHIFT
+        data_file = self._write(["# comment\n", "1\t10\t20\n", "1\t%s\t%s\n" % (cell, cell + 10),
+                                 "\n", "X\t5\t10\n"])
+        sizes = get_sizes(data_file)
+        self.assertEqual(sizes, {("1", 0): 8, ("1", 1): 18, ("X", 0): 7})
+
+    def test_partitions(self):
+        sizes = {("1", 0): 40, ("1", 1): 40, ("1", 3): 40, ("2", 0): 30,
+                 ("3", 0): 10}
+        # i.e. whole chromosomes
+        self.assertEqual(get_partitions(sizes, 1), [("1", 0, 3, 120),
+                                                    ("2", 0, 0, 30),
+                                                    ("3", 0, 0, 10)])
+        # i.e. chromosome 1 is larger than its share (i.e. 80)
+        self.assertEqual(get_partitions(sizes, 2), [("1", 0, 1, 80),
+                                                    ("1", 3, 3, 40),
+                                                    ("2", 0, 0, 30),
+                                                    ("3", 0, 0, 10)])
+
+    def test_schedule(self):
+        partitions = [("1", 0, 0, 50), ("2", 0, 0, 40), ("3", 0, 0, 30),
+                      ("4", 0, 0, 30), ("5", 0, 0, 20)]
+        assigned = schedule(partitions, 2)
+        loads = sorted(sum(p[3] for p in a) for a in assigned)
+        self.assertEqual(loads, [80, 90])
+        self.assertEqual(sorted(p for a in assigned for p in a), partitions)
+        # i.e. more workers than partitions
+        self.assertEqual(schedule(partitions[:1], 3),
+                         [[("1", 0, 0, 50)], [], []])
+
+    def test_split(self):
+        lines = []
+        for chrom in ["1", "2", "3", "4"]:
+            for start in range(0, 100, 10):
+                lines.append("chr%s\t%s\t%s\n" % (chrom, start, start + 10))
+        data_file = self._write(lines)
+        split_files = split_data(data_file, 2)
+        self.assertEqual(split_files, [data_file + ".00", data_file + ".01"])
+        chroms = []
+        split_lines = []
+        for split_file in split_files:
+            with open(split_file) as handle:
+                content = handle.readlines()
+            chroms.append(set(l.split("\t")[0] for l in content))
+            split_lines.extend(content)
+            # i.e. order is kept
+            self.assertEqual(content, [l for l in lines if l in content])
+        # i.e. disjoint chromosomes
+        self.assertEqual(len(chroms[0] & chroms[1]), 0)
+        self.assertEqual(sorted(split_lines), sorted(lines))
+        # i.e. other columns
+        data_file = self._write(["585\tNR_1\tchr2\t+\t100\t200\n"], "refGene.txt.gz")
+        split_files = split_data(data_file, 4, chrom_idx=2, start_idx=4)
+        self.assertEqual(len(split_files), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.parsers.pipeline import PipelineError, parse_records, run_pipeline
+
+out_dir = tempfile.mkdtemp()
+
+
+def parse(fields):
+    start = int(fields[1])
+    if start % 2:
+        return None
+    return (fields[0], start, int(fields[2]))
+
+
+def insert(records):
+    starts = [r[1] for r in records]
+    with open(os.path.join(out_dir, str(os.getpid())), "w") as handle:
+        handle.write("\n".join(map(str, starts)))
+
+
+def fail(records):
+    for record in records:
+        if record[1] > 500:
+            raise ValueError("invalid record")
+
+
+class PipelineTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.data_file = os.path.join(cls.dir, "test.bed.gz")
+        with gzip.open(cls.data_file, "wt") as handle:
+            handle.write("#chrom\tstart\tend\n\n")
+            for i in range(10000):
+                handle.write("chr1\t%s\t%s\n" % (i, i + 10))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+        shutil.rmtree(out_dir)
+
+    def test_parse_records(self):
+        records = list(parse_records(self.data_file, parse, limit=10))
+        self.assertEqual(records, [("chr1", i, i + 10) for i in range(0, 10, 2)])
+
+    def test_pipeline(self):
+        run_pipeline(self.data_file, parse, insert, producers=3, writers=2,
+                     batch_size=100, queue_size=2)
+        starts = []
+        for file_name in os.listdir(out_dir):
+            with open(os.path.join(out_dir, file_name)) as handle:
+                starts += [int(s) for s in handle.read().split()]
+        self.assertEqual(sorted(starts), list(range(0, 10000, 2)))
+
+    def test_errors(self):
+        with self.assertRaises(PipelineError) as context:
+            run_pipeline(self.data_file, parse, fail, producers=2, writers=2,
+                         batch_size=100, queue_size=2)
+        self.assertIn("invalid record", str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
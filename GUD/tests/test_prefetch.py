@@ -0,0 +1,137 @@
+import json
+import unittest
+import threading
+import time
+from GUD.api.prefetch import NoPrefetcher, Prefetcher
+
+
+class FakeRow(object):
+    """serializes to its uid"""
+
+    def __init__(self, uid):
+        self.uid = uid
+
+    def serialize(self):
+        return {"uid": self.uid}
+
+
+class FakeStatement(object):
+
+    def compile(self, **kwargs):
+        return ""
+
+
+class FakeQuery(object):
+    """returns the given rows"""
+
+    statement = FakeStatement()
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def limit(self, n):
+        return FakeQuery(self.rows[:n])
+
+    def __getitem__(self, i):
+        return self.rows[i]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeEngine(object):
+    """every table exists"""
+
+    class dialect(object):
+
+        @staticmethod
+        def has_table(engine, table_name):
+            return True
+
+
+class PrefetchTests(unittest.TestCase):
+
+    def _wait(self, prefetcher):
+        prefetcher.shutdown()
+
+    def test_prefetch(self):
+        prefetcher = Prefetcher()
+        self.assertIsNone(prefetcher.get("page2"))
+        self.assertTrue(prefetcher.prefetch("page2", "client", lambda: "result"))
+        self._wait(prefetcher)
+        self.assertEqual(prefetcher.get("page2"), "result")
+        # already cached
+        self.assertFalse(prefetcher.prefetch("page2", "client", lambda: "result"))
+
+    def test_not_cached(self):
+        def error():
+            raise ValueError()
+        prefetcher = Prefetcher()
+        prefetcher.prefetch("page2", "client", lambda: None)
+        prefetcher.prefetch("page3", "other", error)
+        self._wait(prefetcher)
+        self.assertIsNone(prefetcher.get("page2"))
+        self.assertIsNone(prefetcher.get("page3"))
+
+    def test_limits(self):
+        event = threading.Event()
+        def func():
+            event.wait(5)
+            return "result"
+        prefetcher = Prefetcher(workers=1, max_pending=2, max_pending_per_client=1)
+        self.assertTrue(prefetcher.prefetch("page2", "client1", func))
+        self.assertFalse(prefetcher.prefetch("page2", "client2", func))  # in flight
+        self.assertFalse(prefetcher.prefetch("page3", "client1", func))  # per client
+        self.assertTrue(prefetcher.prefetch("page3", "client2", func))
+        self.assertFalse(prefetcher.prefetch("page4", "client3", func))  # global
+        event.set()
+        self._wait(prefetcher)
+        self.assertEqual(prefetcher.get("page3"), "result")
+        self.assertIsNone(prefetcher.get("page4"))
+
+    def test_expiration(self):
+        prefetcher = Prefetcher(workers=1, cache_size=2, ttl=0.2)
+        for key in ["page2", "page3", "page4"]:
+            prefetcher.prefetch(key, key, lambda: "result")
+        self._wait(prefetcher)
+        self.assertIsNone(prefetcher.get("page2"))  # least recently used
+        self.assertEqual(prefetcher.get("page3"), "result")
+        time.sleep(0.3)
+        self.assertIsNone(prefetcher.get("page4"))
+
+    def test_disabled(self):
+        prefetcher = NoPrefetcher()
+        self.assertFalse(prefetcher.prefetch("page2", "client", lambda: "result"))
+        self.assertIsNone(prefetcher.get("page2"))
+
+
+class RunQueryTests(unittest.TestCase):
+
+    def _run(self, rows):
+        from GUD.api import app
+        from GUD.api.api_helpers import get_result_from_query
+        from GUD.api.routes_api import run_query
+        from GUD.ORM import Source
+        def func(request, session):
+            return get_result_from_query(FakeQuery(rows), request, Source(), page_size=2)
+        with app.test_request_context("/api/v1/test/sources?names=a"):
+            return run_query(func, "sources", FakeEngine(), None)
+
+    def test_next_page(self):
+        data, status, mimetype, next_page = self._run([FakeRow(1), FakeRow(2), FakeRow(3)])
+        self.assertEqual(status, 200)
+        # i.e. as in the page
+        self.assertEqual(next_page, "http://localhost/api/v1/test/sources?names=a&last_uid=2")
+        self.assertEqual(json.loads(data)["next"], next_page)
+        data, status, mimetype, next_page = self._run([FakeRow(1)])
+        self.assertIsNone(next_page)
+
+
+if __name__ == '__main__':
+    unittest.main()
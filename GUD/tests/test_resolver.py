@@ -0,0 +1,105 @@
+import unittest
+import numpy as np
+from GUD.ORM.conservation import Conservation
+from GUD.ORM.region import Region
+from GUD.parsers import resolver as resolver_module
+from GUD.parsers.resolver import (CHROMS, KEY_BITS, RegionResolver, RegionUids,
+                                  get_region_key, pack, set_region_key_types)
+from sqlalchemy import Column, ForeignKey, MetaData, Table
+from sqlalchemy.dialects import mysql
+
+
+class RecordingWriter(object):
+    """records added rows"""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, row):
+        self.rows.append(row)
+
+
+class RegionResolverTests(unittest.TestCase):
+
+    def _region(self, chrom, start, end):
+        region = Region()
+        region.chrom = chrom
+        region.start = start
+        region.end = end
+        return region
+
+    def test_pack(self):
+        key = pack(248956421, 248956422)
+        self.assertEqual((key >> 32, key & 0xFFFFFFFF), (248956421, 248956422))
+        self.assertNotEqual(pack(1, 2), pack(2, 1))
+
+    def test_known_and_new_regions(self):
+        writer = RecordingWriter()
+        resolver = RegionResolver(None, writer)
+        # i.e. preloaded
+        resolver.chrom = "22"
+        resolver.uids = {pack(100, 200): 7}
+        known, new = Conservation(), Conservation()
+        resolver.add(self._region("22", 100, 200), known)
+        resolver.add(self._region("22", 300, 400), new)
+        self.assertEqual(writer.rows, [known])
+        self.assertEqual(known.region_id, 7)
+        self.assertIsNone(new.region_id)
+        self.assertEqual(resolver._pending, {pack(300, 400): [new]})
+
+    def test_region_uids(self):
+        keys = np.array([pack(300, 400), pack(100, 200), pack(100, 150)], dtype=np.int64)
+        uids = RegionUids(keys, np.array([3, 1, 2], dtype=np.int64))
+        self.assertEqual([uids.get(pack(100, 150)), uids.get(pack(100, 200)),
+                          uids.get(pack(300, 400))], [2, 1, 3])
+        self.assertIsNone(uids.get(pack(100, 300)))
+        self.assertIsNone(uids.get(pack(400, 500)))
+        self.assertNotIn(pack(0, 1), uids)
+        uids[pack(0, 1)] = 4
+        self.assertEqual(uids[pack(0, 1)], 4)
+        self.assertRaises(KeyError, uids.__getitem__, pack(0, 2))
+
+    def test_cached_chroms(self):
+        loads = []
+        def get_region_uids(session, chrom):
+            loads.append(chrom)
+            return RegionUids()
+        get = resolver_module.get_region_uids
+        resolver_module.get_region_uids = get_region_uids
+        try:
+            resolver = RegionResolver(None, None)
+            # i.e. unsorted input
+            for chrom in ["1", "2", "1", "3", "4", "2", "5", "1"]:
+                resolver._key(chrom, 0, 1)
+        finally:
+            resolver_module.get_region_uids = get
+        # i.e. the least recently used is evicted
+        self.assertEqual(CHROMS, 4)
+        self.assertEqual(loads, ["1", "2", "3", "4", "5", "1"])
+
+    def test_region_key(self):
+        keys = set()
+        for chrom in ["1", "22", "X", "M"]:
+            for start, end in [(0, 1), (0, 2), (1, 2), (248956421, 248956422)]:
+                keys.add(get_region_key(chrom, start, end))
+        self.assertEqual(len(keys), 16)
+        key = get_region_key("22", 1000, 1500)
+        self.assertEqual(key >> 2 * KEY_BITS, 22)
+        self.assertEqual((key >> KEY_BITS) & ((1 << KEY_BITS) - 1), 1000)
+        self.assertEqual(key & ((1 << KEY_BITS) - 1), 500)
+        self.assertLess(get_region_key("M", 2 ** KEY_BITS - 1, 2 ** (KEY_BITS + 1) - 2), 2 ** 63)
+        self.assertRaises(ValueError, get_region_key, "chr1", 0, 1)
+        self.assertRaises(ValueError, get_region_key, "1", 0, 2 ** KEY_BITS)
+
+    def test_region_key_types(self):
+        metadata = MetaData()
+        Table("regions", metadata, Column("uid", mysql.INTEGER(unsigned=True), primary_key=True))
+        table = Table("features", metadata, Column("uid", mysql.INTEGER(unsigned=True), primary_key=True),
+                      Column("regionID", ForeignKey("regions.uid")))
+        set_region_key_types(table)
+        self.assertIsInstance(table.c.regionID.type, mysql.BIGINT)
+        self.assertNotIsInstance(table.c.uid.type, mysql.BIGINT)
+
+
+if __name__ == '__main__':
+    unittest.main()
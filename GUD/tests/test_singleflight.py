@@ -0,0 +1,125 @@
+import fcntl
+import os
+import shutil
+import unittest
+import tempfile
+import threading
+import time
+from functools import partial
+from multiprocessing import Process, Queue, Semaphore, Value
+from GUD.api.singleflight import ProcessSingleFlight, SingleFlight, query_key
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import NotFound
+
+
+def leader_call(calls, waiting, n):
+    with calls.get_lock():
+        calls.value += 1
+    # i.e. until the other processes wait for the leader
+    for i in range(n - 1):
+        waiting.acquire(timeout=10)
+    return "result"
+
+
+def call(lock_dir, calls, waiting, n, queue):
+    # i.e. module-level targets (e.g. spawn)
+    flock = fcntl.flock
+    def counting_flock(handle, operation):
+        # i.e. a follower, about to wait for the leader
+        if operation == fcntl.LOCK_EX:
+            waiting.release()
+        flock(handle, operation)
+    fcntl.flock = counting_flock
+    queue.put(ProcessSingleFlight(lock_dir).do("key", partial(leader_call, calls, waiting, n)))
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _run_concurrently(self, flight, func, n=8):
+        results = []
+        errors = []
+        def call():
+            try:
+                results.append(flight.do("key", func))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def _slow_func(self, calls, result="result"):
+        def func():
+            calls.append(1)
+            time.sleep(0.2)
+            return result
+        return func
+
+    def test_query_key(self):
+        a = query_key("hg38", "tf_binding", MultiDict([("chrom", "22"), ("start", "1"), ("end", "10")]))
+        b = query_key("hg38", "tf_binding", MultiDict([("end", "10"), ("start", "1 "), ("chrom", "22")]))
+        c = query_key("hg38", "tf_binding", MultiDict([("chrom", "22"), ("start", "1"), ("end", "11")]))
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_coalesce_threads(self):
+        calls = []
+        results, errors = self._run_concurrently(SingleFlight(), self._slow_func(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 8)
+        self.assertEqual(errors, [])
+
+    def test_propagate_errors(self):
+        def func():
+            time.sleep(0.2)
+            raise NotFound('No results from this query')
+        results, errors = self._run_concurrently(SingleFlight(), func)
+        self.assertEqual(len(errors), 8)
+        self.assertTrue(all(isinstance(e, NotFound) for e in errors))
+
+    def test_sequential_calls(self):
+        calls = []
+        flight = SingleFlight()
+        flight.do("key", self._slow_func(calls))
+        flight.do("key", self._slow_func(calls))
+        self.assertEqual(len(calls), 2)
+
+    def test_coalesce_processes(self):
+        calls = Value("i", 0)
+        waiting = Semaphore(0)
+        queue = Queue()
+        processes = [Process(target=call, args=(self.dir, calls, waiting, 4, queue)) for i in range(4)]
+        for p in processes:
+            p.start()
+        results = [queue.get(timeout=10) for p in processes]
+        for p in processes:
+            p.join()
+        self.assertEqual(calls.value, 1)
+        self.assertEqual(results, ["result"] * 4)
+
+    def test_sweep(self):
+        lock_dir = self.dir
+        flight = ProcessSingleFlight(lock_dir)
+        self.assertEqual(flight.do("key", lambda: "result"), "result")
+        # i.e. kept for the waiting processes
+        self.assertEqual(len(os.listdir(lock_dir)), 2)
+        flight.grace = 0
+        with open(os.path.join(lock_dir, "other.lock"), "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            flight.sweep()
+        # i.e. locked files are kept
+        self.assertEqual(os.listdir(lock_dir), ["other.lock"])
+        flight.sweep()
+        self.assertEqual(os.listdir(lock_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
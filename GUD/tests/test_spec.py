@@ -0,0 +1,168 @@
+import gzip
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from GUD.ORM.copy_number_variant import CNV
+from GUD.ORM.gene import Gene
+from GUD.ORM.short_tandem_repeat import ShortTandemRepeat
+from GUD.parsers import cnv2gud, str2gud
+from GUD.parsers.bulk import BulkWriter
+from GUD.parsers.spec import Dimension, Encoded, SourceSpec
+
+
+class RecordingGetUid(object):
+    """returns a new uid per call and records the values it is called with"""
+
+    def __init__(self):
+        self.values = []
+
+    def __call__(self, session, value):
+        self.values.append(value)
+        return len(self.values)
+
+
+class FakeSession(object):
+    """a session (i.e. and its factory and engine) that does nothing"""
+
+    def __call__(self):
+        return self
+
+    def close(self):
+        pass
+
+    def dispose(self):
+        pass
+
+    def remove(self):
+        pass
+
+
+class FakeGUDUtils(object):
+
+    def _get_db_name(self):
+        return "db"
+
+    def get_engine_session(self, db_name):
+        return FakeSession(), FakeSession()
+
+
+class FakeParseUtils(object):
+    """records the tables created (i.e. instead of a database)"""
+
+    def __init__(self):
+        self.tables = []
+
+    def initialize_gud_db(self):
+        pass
+
+    def create_table(self, table):
+        self.tables.append(table)
+
+    def get_chroms(self, session):
+        return {"chr1": 248956422}
+
+    def upsert_source(self, session, source):
+        pass
+
+    def get_source(self, session, source_name):
+        source = type("Source", (object,), {})()
+        source.uid = 1
+        return source
+
+
+class SpecTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, lines, file_name="data.txt.gz"):
+        data_file = os.path.join(self.dir, file_name)
+        with gzip.open(data_file, "wt") as handle:
+            handle.write("".join(lines))
+        return data_file
+
+    def test_parse(self):
+        data_file = self._write(["chr1\t11\t20\tAT\t1\n", "chrUn\t11\t20\tAT\t0\n",
+                                 "2\t31\t40\tCAG\t0\n", "3\t51\t60\tG\t1\n"])
+        spec = SourceSpec(ShortTandemRepeat,
+            {0: "chrom", 1: "start", 2: "end", 3: "motif", 4: "pathogenicity"},
+            dtypes={"pathogenicity": "int64"}, based=1, chunksize=2)
+        self.assertEqual((spec.chrom_idx, spec.start_idx), (0, 1))
+        self.assertEqual(spec.fields, {"motif": "motif",
+                                       "pathogenicity": "pathogenicity"})
+        chunks = list(spec.parse(data_file, ["1", "2", "3"]))
+        # i.e. invalid chromosomes are skipped, starts are 0-based
+        self.assertEqual([c["chrom"].tolist() for c in chunks], [["1"], ["2", "3"]])
+        self.assertEqual(chunks[1]["start"].tolist(), [30, 50])
+        # i.e. the limit is on valid lines
+        chunks = list(spec.parse(data_file, ["1", "2", "3"], limit=2))
+        self.assertEqual(sum(len(c["chrom"]) for c in chunks), 2)
+        features = spec.get_features(None, chunks[1], {"source_id": 1})
+        self.assertEqual(features, [("2", 30, 40, {"source_id": 1, "motif": "CAG",
+                                                   "pathogenicity": 0})])
+
+    def test_features(self):
+        data_file = self._write(["585\tNR_1\tchr1\t+\t10\t90\t20\t80\t2\t10,50,\t30,90,\tx\tA\n",
+                                 "585\tNR_2\tchr1\t-\t10\t90\t90\t90\t1\t10,\t90,\tx\tB\n"])
+        get_uid = RecordingGetUid()
+        spec = SourceSpec(Gene,
+            {1: "name", 2: "chrom", 3: "strand", 4: "start", 5: "end",
+             9: "exon_starts", 12: "gene_symbol"},
+            fields={"name": "name", "exon_starts": Encoded("exon_starts"),
+                    "sample_id": Dimension("strand", get_uid),
+                    "upper": lambda chunk: [v.upper() for v in chunk["name"].tolist()]})
+        # i.e. for split_data
+        self.assertEqual((spec.chrom_idx, spec.start_idx), (2, 4))
+        chunk, = list(spec.parse(data_file, ["1"]))
+        features = spec.get_features(None, chunk, {"source_id": 1})
+        self.assertEqual(features[0], ("1", 10, 90, {"source_id": 1, "name": "NR_1",
+                                                     "exon_starts": b"10,50,",
+                                                     "sample_id": 1, "upper": "NR_1"}))
+        self.assertEqual(features[1][3]["sample_id"], 2)
+        # i.e. uids are only got once per value
+        spec.get_features(None, chunk)
+        self.assertEqual(get_uid.values, ["+", "-"])
+
+    def test_key(self):
+        data_file = self._write(["#chrom\tstart\tend\tcopy_number_change\n",
+                                 "chr1\t10\t20\t-1\tPathogenic;Benign\tRCV1\t\n"])
+        chunk, = list(cnv2gud.SPEC.parse(data_file, ["1"]))
+        features = cnv2gud.SPEC.get_features(None, chunk, {"source_id": 1})
+        self.assertEqual(features, [("1", 10, 20, {"source_id": 1, "copy_number_change": -1,
+                                                   "clinical_assertion": b"Pathogenic,Benign,",
+                                                   "clinvar_accession": b"RCV1,",
+                                                   "dbVar_accession": b","})])
+        # i.e. passed to other processes
+        spec = pickle.loads(pickle.dumps(cnv2gud.SPEC))
+        writer = BulkWriter(None, spec.table, dedup=spec.dedup, key=spec.key)
+        self.assertEqual(writer.keys.columns, ["regionID", "sourceID", "copy_number_change"])
+
+    def test_to_gud(self):
+        ingested = []
+        def ingest(spec, data_file, values, chroms, threads, test):
+            ingested.append((spec.table, data_file, values))
+        for module, call in [
+                (cnv2gud, lambda: cnv2gud.cnv_to_gud("hg38", "dbVar", "cnv.tsv", dummy_dir=self.dir, remove=True)),
+                (str2gud, lambda: str2gud.str_to_gud("hg38", "STR", "str.tsv", 0, dummy_dir=self.dir))]:
+            stubs = {"GUDUtils": FakeGUDUtils(), "ParseUtils": FakeParseUtils(), "ingest": ingest}
+            originals = dict((name, getattr(module, name)) for name in stubs)
+            try:
+                for name in stubs:
+                    setattr(module, name, stubs[name])
+                call()
+            finally:
+                for name in originals:
+                    setattr(module, name, originals[name])
+        self.assertEqual(ingested, [(CNV, "cnv.tsv", {"source_id": 1}),
+                                    (ShortTandemRepeat, "str.tsv", {"source_id": 1})])
+        # i.e. removed unless kept
+        self.assertEqual(os.listdir(self.dir), ["hg38.str2gud.py"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from GUD.api.api_helpers import get_stream_windows
+
+
+class StreamWindowsTests(unittest.TestCase):
+    features = [(0, 10), (5, 2**17), (2**17 - 1, 2**17 + 5), (2**17, 2**18),
+                (99999, 100001), (100000, 100001), (150000, 3 * 2**17 + 7),
+                (3 * 2**17 + 6, 3 * 2**17 + 8), (4 * 2**17, 4 * 2**17 + 1)]
+
+    def _stream(self, start, end, location):
+        found = []
+        for window_start, window_end, bins in get_stream_windows(start, end, location):
+            self.assertTrue(window_start < window_end)
+            for s, e in self.features:
+                if not window_start <= s < window_end:
+                    continue
+                if location == "overlapping" and s < end and e > start:
+                    found.append((s, e))
+                elif location == "within" and s >= start and e <= end:
+                    found.append((s, e))
+                elif location == "exact" and s == start and e == end:
+                    found.append((s, e))
+        return found
+
+    def test_windows(self):
+        windows = list(get_stream_windows(100000, 3 * 2**17 + 7, "within"))
+        self.assertEqual([w[:2] for w in windows],
+                         [(100000, 2**17), (2**17, 2**18), (2**18, 3 * 2**17),
+                          (3 * 2**17, 3 * 2**17 + 7)])
+
+    def test_each_feature_once(self):
+        for start, end in [(0, 2**19), (100000, 3 * 2**17 + 7), (2**17, 2**17 + 1)]:
+            for location in ["overlapping", "within", "exact"]:
+                expected = []
+                for s, e in self.features:
+                    if location == "overlapping" and s < end and e > start:
+                        expected.append((s, e))
+                    elif location == "within" and s >= start and e <= end:
+                        expected.append((s, e))
+                    elif location == "exact" and s == start and e == end:
+                        expected.append((s, e))
+                self.assertEqual(sorted(self._stream(start, end, location)), sorted(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from GUD.ORM.clinvar import ClinVar
+from GUD.parsers.sync import Diff, delete_rows, get_digest
+
+
+class Result(object):
+
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+
+
+class DeletingSession(object):
+    """deletes from the given rows; records statements and commits"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, stmt, params):
+        sql = str(stmt)
+        self.statements.append((sql, params["values"]))
+        limit = int(sql.rsplit(" ", 1)[1])
+        deleted = [r for r in self.rows if r in params["values"]][:limit]
+        for r in deleted:
+            self.rows.remove(r)
+        return Result(len(deleted))
+
+    def commit(self):
+        self.commits += 1
+
+
+class SyncTests(unittest.TestCase):
+
+    def test_digest(self):
+        # i.e. parsed values against those read from MySQL
+        self.assertEqual(get_digest(["1", 100, b"A", 23.4, None]),
+                         get_digest(["1", 100, "A", 23.3999996185, None]))
+        self.assertEqual(get_digest([float("nan")]), get_digest([None]))
+        self.assertNotEqual(get_digest(["1", 100]), get_digest(["1", 101]))
+
+    def test_diff(self):
+        old = {1: 10, 2: 20, 3: 30}
+        new = {2: 20, 3: 31, 4: 40, 5: 50}
+        diff = Diff(old, new)
+        self.assertEqual(diff.inserts, [4, 5])
+        self.assertEqual(diff.updates, [3])
+        self.assertEqual(diff.deletes, [1])
+        self.assertEqual(diff.unchanged, 1)
+        self.assertEqual(len(diff), 4)
+        self.assertEqual(diff.get_changed(), set([3, 4, 5]))
+        self.assertEqual(str(diff), "2 inserts, 1 updates, 1 deletes (1 unchanged)")
+
+    def test_delete_rows(self):
+        session = DeletingSession([1, 1, 1, 2, 3, 4])
+        deleted = delete_rows(session, ClinVar.__table__, "sourceID",
+                              [1, 2, 4], batch_size=2)
+        self.assertEqual(deleted, 5)
+        self.assertEqual(session.rows, [3])
+        # i.e. batches of values, each until fewer rows than the limit
+        self.assertEqual(len(session.statements), 4)
+        self.assertEqual(session.statements[0],
+                         ("DELETE FROM `clinvar` WHERE `sourceID` IN ([EXPANDING_values]) LIMIT 2",
+                          [1, 2]))
+        self.assertEqual(session.commits, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from GUD.benchmarks import CHROM_SIZES
+from GUD.benchmarks import synthetic
+from GUD.parsers import ParseUtils, clinvar2gud, fantom2gud, refgene2gud, rmsk2gud
+from GUD.parsers.vcf import VCFReader
+
+
+class SyntheticTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _get_chunks(self, table, scale=0.1):
+        return list(synthetic.generate(table, ["22"], scale, samples=10))
+
+    def test_generate(self):
+        chunks = self._get_chunks("conservation")
+        # i.e. one per window
+        self.assertEqual(len(chunks), CHROM_SIZES["22"] // synthetic.WINDOW + 1)
+        starts = np.concatenate([c["start"] for c in chunks])
+        ends = np.concatenate([c["end"] for c in chunks])
+        self.assertTrue((np.diff(starts) >= 0).all())
+        self.assertTrue((ends > starts).all() and ends.max() <= CHROM_SIZES["22"])
+        # i.e. ~320 per Mb at scale 0.1
+        expected = 3200 * 0.1 * CHROM_SIZES["22"] / 1e6
+        self.assertLess(abs(len(starts) - expected) / expected, 0.05)
+        # i.e. deterministic, and independent of other chromosomes
+        chunk = list(synthetic.generate("conservation", ["21", "22"], 0.1, samples=10))[-1]
+        self.assertEqual(chunk["start"].tolist(), chunks[-1]["start"].tolist())
+        chunk = list(synthetic.generate("conservation", ["22"], 0.1, samples=10, seed=1))[-1]
+        self.assertNotEqual(chunk["start"].tolist(), chunks[-1]["start"].tolist())
+
+    def test_features(self):
+        chunk = [c for c in self._get_chunks("enhancers", 1) if len(c["start"])][0]
+        features = synthetic.get_features("enhancers", chunk)
+        # i.e. one per expressed enhancer and sample
+        self.assertEqual(len(features), (chunk["matrix"] > 0).sum())
+        self.assertTrue(all(1 <= f[3]["sample_id"] <= 10 for f in features))
+        chunk = [c for c in self._get_chunks("transcription_start_sites", 1) if len(c["start"])][0]
+        features = synthetic.get_features("transcription_start_sites", chunk)
+        self.assertEqual(len(features), len(chunk["start"]))
+        genic = [f for f in features if f[3]["gene"] is not None]
+        self.assertTrue(genic and all(f[3]["gene"].startswith("GENE") for f in genic))
+        # i.e. comma-terminated lists, with Python values
+        feature = genic[0][3]
+        self.assertEqual(feature["sample_id"].count(","), feature["expression_level"].count(","))
+        self.assertIsInstance(feature["tss"], int)
+        chunk = self._get_chunks("tf_binding", 0.01)[0]
+        chrom, start, end, feature = synthetic.get_features("tf_binding", chunk)[0]
+        self.assertEqual(set(feature), set(["source_id", "tf", "sample_id",
+                                            "experiment_id", "score", "peak"]))
+        self.assertTrue(0 <= feature["peak"] < end - start)
+
+    def test_native(self):
+        tables = ["genes", "rmsk", "clinvar", "transcription_start_sites", "tf_binding", "tads"]
+        synthetic.write_synthetic_data(self.dir, tables, ["22"], 0.1, samples=10)
+        # i.e. TADs have no parser
+        self.assertNotIn("tads", os.listdir(self.dir))
+        # i.e. as read by the parsers
+        chunks = list(refgene2gud.SPEC.parse(os.path.join(self.dir, "refGene.txt.gz"), ["22"]))
+        genes = self._get_chunks("genes")
+        self.assertEqual(sum(len(c["chrom"]) for c in chunks),
+                         sum(len(c["start"]) for c in genes))
+        rmsk2gud.chroms = ["22"]
+        record = rmsk2gud._parse_line(next(ParseUtils.parse_tsv_file(
+            os.path.join(self.dir, "rmsk.txt.gz"))))
+        self.assertEqual(record[0], "22")
+        reader = VCFReader(os.path.join(self.dir, "clinvar.vcf.gz"), clinvar2gud.INFO_KEYS,
+                           sorted(clinvar2gud.ANN_FIELDS), dummy_dir=self.dir)
+        chrom, pos, variation_ID, ref, alt, values = next(reader.parse())
+        self.assertEqual(chrom, "22")
+        self.assertNotEqual(ref, alt)
+        self.assertIsNotNone(values[clinvar2gud.INFO_KEYS.index("CLNSIG")])
+        fantom2gud.chroms = ["22"]
+        chunk = next(fantom2gud._parse_matrix(os.path.join(self.dir, "CAGE.tss.bed"),
+            {0: "chrom", 1: "start", 2: "end", 3: "strand", 4: "name"}, list(range(10))))
+        self.assertEqual(chunk["matrix"].shape[1], 10)
+        # i.e. merged ENCODE peaks, with their accessions
+        with open(os.path.join(self.dir, "tf_binding.accessions.tsv")) as handle:
+            accessions = dict((l.split("\t")[0], l.split("\t")[1:]) for l in handle)
+        line = next(ParseUtils.parse_tsv_file(os.path.join(self.dir, "tf_binding.bed.gz")))
+        self.assertEqual(len(line), 6)
+        self.assertEqual(accessions[line[3]][1], "ChIP-seq")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import shutil
+import unittest
+import numpy as np
+import tempfile
+from GUD.ORM.conservation import Conservation
+from GUD.ORM.dna_accessibility import DNAAccessibility
+from GUD.parsers import gud2tiles
+from GUD.tiles import TileStore, compute_tiles, get_zoom_levels
+
+
+class FakeQuery(object):
+    """returns the given rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def join(self, *args):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def execution_options(self, **kwargs):
+        return self
+
+    def yield_per(self, count):
+        return self
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession(object):
+    """queries return the given rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, *args):
+        return FakeQuery(self.rows)
+
+
+class TilesTests(unittest.TestCase):
+    chrom_size = 10500
+    tile_size = 1000
+    starts = np.array([0, 500, 900, 2500, 2600, 9999, 10400])
+    ends = np.array([100, 1200, 1000, 5500, 2700, 10200, 10500])
+    scores = np.array([1.0, 3.0, np.nan, 2.0, 8.0, 4.0, 5.0])
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _brute_force(self, tile_size):
+        covered = np.zeros(self.chrom_size, dtype=bool)
+        for s, e in zip(self.starts, self.ends):
+            covered[s:e] = True
+        tiles = []
+        for t in range(0, self.chrom_size, tile_size):
+            inside = (self.starts >= t) & (self.starts < t + tile_size)
+            scores = self.scores[inside & ~np.isnan(self.scores)]
+            width = min(tile_size, self.chrom_size - t)
+            tiles.append((inside.sum(), covered[t:t + tile_size].sum() / width,
+                          scores.mean() if len(scores) else np.nan,
+                          scores.max() if len(scores) else np.nan))
+        return tiles
+
+    def test_zoom_levels(self):
+        self.assertEqual(get_zoom_levels(1000, 1000), 1)
+        self.assertEqual(get_zoom_levels(1001, 1000), 2)
+        self.assertEqual(get_zoom_levels(self.chrom_size, 1000), 5)
+
+    def test_compute_tiles(self):
+        levels = compute_tiles(self.starts, self.ends, self.scores,
+                               self.chrom_size, self.tile_size)
+        self.assertEqual(len(levels), 5)
+        for zoom, tiles in enumerate(levels):
+            expected = self._brute_force(self.tile_size << zoom)
+            self.assertEqual(len(tiles), len(expected))
+            for tile, exp in zip(tiles, expected):
+                self.assertEqual(tile["count"], exp[0])
+                np.testing.assert_allclose(
+                    [tile["coverage"], tile["mean"], tile["max"]], exp[1:],
+                    rtol=1e-6)
+
+    def test_clip(self):
+        # i.e. features past the end of the chromosome
+        levels = compute_tiles([10000, 10400], [10800, 11000], [1.0, 2.0],
+                               self.chrom_size, self.tile_size)
+        self.assertEqual(levels[0]["count"][-1], 2)
+        self.assertEqual(levels[0]["coverage"][-1], 1)
+        for tiles in levels:
+            self.assertLessEqual(tiles["coverage"].max(), 1)
+
+    def test_features(self):
+        rows = [(1, 2, 100, 200, 0.5), (1, 3, 300, 400, None),
+                (1, 2, 500, 600, 1.5), (2, 2, 700, 800, 2.0)]
+        chunk_size = gud2tiles.chunk_size
+        gud2tiles.chunk_size = 2
+        try:
+            features = gud2tiles._get_features(FakeSession(rows), DNAAccessibility, "22")
+        finally:
+            gud2tiles.chunk_size = chunk_size
+        self.assertEqual(sorted(features), ["1.2", "1.3", "2.2"])
+        starts, ends, scores = features["1.2"]
+        self.assertEqual(starts.dtype, np.int64)
+        self.assertEqual(starts.tolist(), [100, 500])
+        self.assertEqual(ends.tolist(), [200, 600])
+        self.assertEqual(scores.tolist(), [0.5, 1.5])
+        self.assertTrue(np.isnan(features["1.3"][2][0]))
+        rows = [(1, 0, 100, 200, 0.5)]
+        features = gud2tiles._get_features(FakeSession(rows), Conservation, "22")
+        self.assertEqual(list(features), ["1.0"])
+
+    def test_store(self):
+        store = TileStore(self.dir)
+        levels = compute_tiles(self.starts, self.ends, self.scores,
+                               self.chrom_size, self.tile_size)
+        store.write_tiles("test", "conservation", "1.0", "22", levels)
+        store.write_index("test", "conservation", self.tile_size, len(levels),
+                          {"22": self.chrom_size},
+                          {"1.0": {"source": "phastCons", "sample": None}})
+        self.assertEqual(store.get_index("test", "conservation")["zooms"], 5)
+        first, tiles = store.read_tiles("test", "conservation", "1.0", "22", 0,
+                                        2500, 5000)
+        self.assertEqual(first, 2)
+        self.assertEqual(len(tiles), 3)
+        self.assertEqual(tiles[0]["count"], 2)
+        first, tiles = store.read_tiles("test", "conservation", "1.0", "Y", 0,
+                                        0, 5000)
+        self.assertEqual(len(tiles), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from GUD.parsers.vcf import VCFReader, get_ann, get_info
+
+HEADER = "##fileformat=VCFv4.1\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+ANN = "ANN=A|missense_variant|MODERATE|BRCA2|675|transcript|NM_000059.3|protein_coding"
+
+
+class VCFTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, lines, file_name="clinvar.vcf"):
+        vcf_file = os.path.join(self.dir, file_name)
+        if file_name.endswith(".gz"):
+            handle = gzip.open(vcf_file, "wt")
+        else:
+            handle = open(vcf_file, "w")
+        handle.write(HEADER + "".join(lines))
+        handle.close()
+        return vcf_file
+
+    def test_info(self):
+        info = "ALLELEID=1;ONCCLNSIG=x;CLNSIG=Benign;CADD=1.5;DB;ANN=a=b"
+        self.assertEqual(get_info(info, set(["CLNSIG", "CADD", "CLNDN", "DB", "ANN"])),
+                         {"CLNSIG": "Benign", "CADD": "1.5", "ANN": "a=b"})
+        self.assertEqual(get_ann(ANN[4:] + ",T|synonymous", [1, 3]),
+                         ["missense_variant", "BRCA2"])
+        self.assertEqual(get_ann("A|x", [1, 3]), [None, None])
+        self.assertEqual(get_ann(None, [1]), [None])
+
+    def test_reader(self):
+        lines = ["1\t10\t100\tA\tG\t.\t.\tCLNSIG=Benign;%s\n" % ANN,
+                 "1\t20\t101\tAT\tA\t.\t.\tCADD=2\n",
+                 "2\t30\t102\tC\tT\t.\t.\tCLNSIG=Pathogenic\n",
+                 "1\t40\t103\tG\tC\t.\t.\t.\n", "\n"]
+        for file_name in ["clinvar.vcf", "clinvar.vcf.gz"]:
+            reader = VCFReader(self._write(lines, file_name), ["CLNSIG", "CADD"],
+                               [1, 3], self.dir)
+            # i.e. largest first
+            self.assertEqual(reader.get_chroms(), ["1", "2"])
+            variants = list(reader.parse_chrom("1"))
+            self.assertEqual(variants[0], ("1", 10, "100", "A", "G",
+                                           ["Benign", None, "missense_variant", "BRCA2"]))
+            self.assertEqual(variants[1][5], [None, "2", None, None])
+            # i.e. unsorted files
+            self.assertEqual([v[1] for v in variants], [10, 20, 40])
+            self.assertEqual(len(list(reader.parse_chrom("1", limit=1))), 1)
+            self.assertEqual(len(list(reader.parse())), 4)
+            self.assertEqual(list(reader.parse_chrom("X")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
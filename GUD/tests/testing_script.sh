@@ -10,6 +10,28 @@ coverage run -m -a GUD.tests.test_api_cnv
 coverage run -m -a GUD.tests.test_api_conservation
 coverage run -m -a GUD.tests.test_api_gene
 coverage run -m -a GUD.tests.test_api_str
+coverage run -m -a GUD.tests.test_singleflight
+coverage run -m -a GUD.tests.test_tiles
+coverage run -m -a GUD.tests.test_stream
+coverage run -m -a GUD.tests.test_prefetch
+coverage run -m -a GUD.tests.test_bulk
+coverage run -m -a GUD.tests.test_load_data
+coverage run -m -a GUD.tests.test_resolver
+coverage run -m -a GUD.tests.test_pipeline
+coverage run -m -a GUD.tests.test_bed
+coverage run -m -a GUD.tests.test_bins
+coverage run -m -a GUD.tests.test_merge
+coverage run -m -a GUD.tests.test_liftover
+coverage run -m -a GUD.tests.test_checkpoint
+coverage run -m -a GUD.tests.test_dedup
+coverage run -m -a GUD.tests.test_sync
+coverage run -m -a GUD.tests.test_partition
+coverage run -m -a GUD.tests.test_vcf
+coverage run -m -a GUD.tests.test_fantom
+coverage run -m -a GUD.tests.test_spec
+coverage run -m -a GUD.tests.test_metrics
+coverage run -m -a GUD.tests.test_parallel
+coverage run -m -a GUD.tests.test_synthetic
 coverage report GUD/ORM/*.py
 coverage report GUD/api/*.py
 coverage html
\ No newline at end of file
@@ -0,0 +1,257 @@
+"""
+Multi-resolution summary tiles for dense tracks (e.g. conservation)
+
+Tiles are stored per database, table and track (i.e. source and sample) as
+one binary file per chromosome and zoom level, where the tile at index i
+covers [i * tile_size, (i + 1) * tile_size) and tile_size doubles with each
+zoom level. Tiles are fixed-width records, so any tile can be read in O(1)
+from a memory-mapped file.
+
+root/
+    {db}/
+        {table}/
+            index.json
+            {sourceID}.{sampleID}/
+                {chrom}.{zoom}.tiles
+"""
+
+import json
+import math
+import numpy as np
+import os
+
+# Defaults
+TILE_SIZE = 1000
+TILE_DTYPE = np.dtype([("count", "<u4"), ("coverage", "<f4"),
+                       ("mean", "<f4"), ("max", "<f4")])
+
+
+class TileStore(object):
+    """
+    Reads and writes summary tiles.
+    """
+
+    def __init__(self, root):
+
+        self.root = root
+        self._indexes = {}
+
+    #--------------#
+    # Paths        #
+    #--------------#
+
+    def _table_dir(self, db, table):
+
+        return(os.path.join(self.root, db, table))
+
+    def _tile_file(self, db, table, track, chrom, zoom):
+
+        return(os.path.join(self._table_dir(db, table), track,
+                            "%s.%s.tiles" % (chrom, zoom)))
+
+    #--------------#
+    # Index        #
+    #--------------#
+
+    def get_index(self, db, table):
+        """
+        Returns the index of a table (i.e. tile size, number of zoom levels,
+        chromosome sizes and tracks) or None if the table has no tiles.
+        """
+
+        index_file = os.path.join(self._table_dir(db, table), "index.json")
+
+        if not os.path.exists(index_file):
+            return(None)
+
+        # Reload the index if the tiler has rewritten it
+        mtime = os.path.getmtime(index_file)
+        if (db, table) not in self._indexes or \
+           self._indexes[(db, table)][0] != mtime:
+            with open(index_file) as handle:
+                self._indexes[(db, table)] = (mtime, json.load(handle))
+
+        return(self._indexes[(db, table)][1])
+
+    def write_index(self, db, table, tile_size, zooms, chroms, tracks):
+
+        table_dir = self._table_dir(db, table)
+        if not os.path.isdir(table_dir):
+            os.makedirs(table_dir)
+
+        index = {
+            "tile_size": tile_size,
+            "zooms": zooms,
+            "chroms": chroms,
+            "tracks": tracks
+        }
+
+        # Write atomically
+        index_file = os.path.join(table_dir, "index.json")
+        with open("%s.tmp" % index_file, "w") as handle:
+            json.dump(index, handle)
+        os.replace("%s.tmp" % index_file, index_file)
+
+    #--------------#
+    # Tiles        #
+    #--------------#
+
+    def write_tiles(self, db, table, track, chrom, levels):
+        """
+        Writes the tiles of a track for each zoom level.
+
+        @input:
+        levels {list} of {numpy.ndarray} of TILE_DTYPE (i.e. one per zoom)
+        """
+
+        track_dir = os.path.join(self._table_dir(db, table), track)
+        if not os.path.isdir(track_dir):
+            os.makedirs(track_dir)
+
+        for zoom, tiles in enumerate(levels):
+            tile_file = self._tile_file(db, table, track, chrom, zoom)
+            tiles.astype(TILE_DTYPE).tofile("%s.tmp" % tile_file)
+            os.replace("%s.tmp" % tile_file, tile_file)
+
+    def read_tiles(self, db, table, track, chrom, zoom, start, end):
+        """
+        Returns the tiles of a track overlapping [start, end) at a given zoom
+        level as a tuple (first tile index, {numpy.ndarray}).
+        """
+
+        index = self.get_index(db, table)
+        tile_size = index["tile_size"] << zoom
+        tile_file = self._tile_file(db, table, track, chrom, zoom)
+
+        if not os.path.exists(tile_file) or \
+           os.path.getsize(tile_file) == 0:
+            return(0, np.zeros(0, dtype=TILE_DTYPE))
+
+        tiles = np.memmap(tile_file, dtype=TILE_DTYPE, mode="r")
+        first = max(0, start // tile_size)
+        last = min(len(tiles), int(math.ceil(end / float(tile_size))))
+
+        return(first, np.array(tiles[first:last]))
+
+
+def get_zoom_levels(chrom_size, tile_size=TILE_SIZE):
+    """
+    Returns the number of zoom levels needed for a single tile to cover a
+    chromosome.
+    """
+
+    zooms = 1
+    while (tile_size << (zooms - 1)) < chrom_size:
+        zooms += 1
+
+    return(zooms)
+
+
+def compute_tiles(starts, ends, scores, chrom_size, tile_size=TILE_SIZE,
+                  zooms=None):
+    """
+    Summarizes the features of a track on a chromosome into tiles at zoom
+    levels doubling from tile_size. Features are counted (and their scores
+    summarized) in the tile where they start; coverage is the fraction of
+    the tile covered by the union of features (i.e. clipped to the end of
+    the chromosome).
+
+    @input:
+    starts, ends {numpy.ndarray} 0-based feature coordinates
+    scores {numpy.ndarray} feature scores (NaN for none)
+    chrom_size {int}
+
+    @return: {list} of {numpy.ndarray} of TILE_DTYPE (i.e. one per zoom)
+    """
+
+    # Initialize
+    if zooms is None:
+        zooms = get_zoom_levels(chrom_size, tile_size)
+    starts = np.minimum(np.asarray(starts, dtype=np.int64), chrom_size)
+    ends = np.minimum(np.asarray(ends, dtype=np.int64), chrom_size)
+    scores = np.asarray(scores, dtype=np.float64)
+    n = int(math.ceil(chrom_size / float(tile_size)))
+
+    # Counts and scores
+    idx = np.minimum(starts // tile_size, n - 1)
+    scored = ~np.isnan(scores)
+    count = np.bincount(idx, minlength=n).astype(np.float64)
+    scored_count = np.bincount(idx[scored], minlength=n).astype(np.float64)
+    score_sum = np.bincount(idx[scored], weights=scores[scored], minlength=n)
+    score_max = np.full(n, -np.inf)
+    np.maximum.at(score_max, idx[scored], scores[scored])
+
+    # Covered bases
+    covered = _covered_bases(starts, ends, tile_size, n)
+
+    # Tile widths (i.e. the last tile may be partial)
+    widths = np.full(n, tile_size, dtype=np.float64)
+    widths[-1] = chrom_size - (n - 1) * tile_size
+
+    levels = []
+    for zoom in range(zooms):
+        tiles = np.zeros(len(count), dtype=TILE_DTYPE)
+        tiles["count"] = count
+        tiles["coverage"] = covered / widths
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tiles["mean"] = np.where(scored_count > 0,
+                                     score_sum / scored_count, np.nan)
+        tiles["max"] = np.where(np.isinf(score_max), np.nan, score_max)
+        levels.append(tiles)
+        # Aggregate pairs of tiles into the next zoom level
+        count, scored_count, score_sum, covered, widths = \
+            [_pairs(a).sum(axis=1) for a in (count, scored_count, score_sum,
+                                             covered, widths)]
+        score_max = _pairs(score_max, -np.inf).max(axis=1)
+
+    return(levels)
+
+
+def _pairs(a, fill=0):
+
+    if len(a) % 2:
+        a = np.append(a, fill)
+
+    return(a.reshape(-1, 2))
+
+
+def _covered_bases(starts, ends, tile_size, n):
+    """
+    Returns the number of bases covered by the union of features per tile.
+    """
+
+    covered = np.zeros(n, dtype=np.float64)
+
+    if len(starts) == 0:
+        return(covered)
+
+    # Merge overlapping features
+    order = np.argsort(starts, kind="mergesort")
+    starts = starts[order]
+    ends = ends[order]
+    running_end = np.maximum.accumulate(ends)
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > running_end[:-1]
+    merged_starts = starts[new]
+    merged_ends = np.maximum.reduceat(ends, np.flatnonzero(new))
+
+    # Features within a single tile
+    first = np.minimum(merged_starts // tile_size, n - 1)
+    last = np.minimum((merged_ends - 1) // tile_size, n - 1)
+    same = first == last
+    covered += np.bincount(first[same], minlength=n,
+                           weights=(merged_ends - merged_starts)[same])
+
+    # Features spanning multiple tiles (i.e. partial first and last tiles;
+    # full tiles in between)
+    span = ~same
+    covered += np.bincount(first[span], minlength=n,
+                           weights=((first[span] + 1) * tile_size -
+                                    merged_starts[span]))
+    covered += np.bincount(last[span], minlength=n,
+                           weights=merged_ends[span] - last[span] * tile_size)
+    full = np.bincount(first[span] + 1, minlength=n + 1) - \
+        np.bincount(last[span], minlength=n + 1)
+    covered += np.cumsum(full)[:n] * tile_size
+
+    return(covered)